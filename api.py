@@ -18,6 +18,25 @@ def ping():
     return {"ok": True}
 
 
+@router.get("/openai/estado")
+def estado_openai():
+    """Estadísticas en vivo: limitador, multiplexor de runs, cache, vuelo único, digests y rechazos de contenido"""
+    from app.services.openai_limitador import limitador_openai
+    from app.services.openai_multiplexor import multiplexor_runs
+    from app.services.cache_generaciones import cache_generaciones
+    from app.services.vuelo_unico import vuelo_unico
+    from app.services.esquemas import metricas_rechazo
+    from app.services.digest_corpus import digests_corpus
+    return {
+        "limitador": limitador_openai.estadisticas(),
+        "multiplexor": multiplexor_runs.estadisticas(),
+        "cache_generaciones": cache_generaciones.estadisticas(),
+        "vuelo_unico": vuelo_unico.estadisticas(),
+        "digest_corpus": digests_corpus.estadisticas(),
+        "rechazos": metricas_rechazo.estadisticas(),
+    }
+
+
 import asyncio
 import re
 import time
@@ -48,6 +67,16 @@ instrucciones = os.getenv("INSTRUCCIONES", "")
 PROMPT_1 = os.getenv("PROMPT_1", "")
 PROMPT_2 = os.getenv("PROMPT_2", "")
 
+# Versión de los prompts de cada material generado. Subir la versión al
+# cambiar un prompt invalida las entradas del cache de generaciones.
+VERSIONES_PROMPT = {
+    "resumen": "v2",
+    "mapa_conceptual": "v2",
+    "flashcards": "v2",
+    "glosario": "v2",
+    "digest_corpus": "v1",
+}
+
 # =========================================================
 # 3) Validaciones mínimas (fail fast con mensaje claro)
 # =========================================================
@@ -63,20 +92,28 @@ if not OPENAI_API_KEY:
 
 # =========================================================
 # 4) Cliente OpenAI (UNA sola vez)
+#    - `aclient` (AsyncOpenAI) para todo lo que corre dentro de rutas async
+#    - `client` (sync) solo para scripts / código que no corre en el event loop
 # ==============================================
 client = OpenAI(api_key=OPENAI_API_KEY)
+from app.services.openai_cliente import aclient
+from app.services.openai_runs import ejecutar_run, esperar_run_completado
+from app.services.extractor_json import ExtractorJSONIncremental, extraer_json
+from app.services.esquemas import (
+    configuracion_run, desactivar_esquemas, metricas_rechazo, response_format_de, validar_esquema,
+)
 
 # =========================================================
 # 5) Router FastAPI
 # =========================================================
 router = APIRouter()
 
-def mostrar_mensajes_assistant(messages):
+async def mostrar_mensajes_assistant(messages):
     ''''
     fUNCION AUXILIAR Para obtener el resultado del prompt como texto plano
     '''
 
-    mensajes_assistant = [message for message in messages if message.role == "assistant"]
+    mensajes_assistant = [message for message in messages.data if message.role == "assistant"]
     mensajes_texto = []
 
     for message in mensajes_assistant:
@@ -93,7 +130,7 @@ def mostrar_mensajes_assistant(messages):
                             print(f"Annotation Text: {annotation.text}")
                             if hasattr(annotation, 'file_path') and hasattr(annotation.file_path, 'file_id'):
                                 print(f"File_Id: {annotation.file_path.file_id}")
-                                annotation_data = client.files.content(annotation.file_path.file_id)
+                                annotation_data = await aclient.files.content(annotation.file_path.file_id)
                                 annotation_data_bytes = annotation_data.read()
 
                                 filename = annotation.text.split('/')[-1]
@@ -117,7 +154,7 @@ def mostrar_mensajes_assistant(messages):
 ### AGREGAR Asistente
 @router.post("/create-assistant/")
 async def create_assistant(name: str):  
-    assistant = client.beta.assistants.create(
+    assistant = await aclient.beta.assistants.create(
         name=name,
         instructions=instrucciones,
         model=modelo,
@@ -130,7 +167,7 @@ async def create_assistant(name: str):
 ### ACTUALIZAR Asistente
 @router.put("/update-assistant/{assistant_id}/{vector_id}")
 async def update_assistant(assistant_id: str, vector_id: str):
-    assistant = client.beta.assistants.update(
+    assistant = await aclient.beta.assistants.update(
         assistant_id=assistant_id,
         tool_resources={"file_search": {"vector_store_ids": [vector_id]}},
     )
@@ -141,7 +178,7 @@ async def update_assistant(assistant_id: str, vector_id: str):
 async def delete_assistant( assistant_id: str):
     try:
         ### Llama a la API de OpenAI para eliminar el archivo
-        respuesta = client.beta.assistants.delete(assistant_id)
+        respuesta = await aclient.beta.assistants.delete(assistant_id)
         
     except Exception as e:
         print("Error deleting file:", e)
@@ -158,7 +195,7 @@ async def delete_assistant( assistant_id: str):
 ### AGREGAR Vector
 @router.post("/create-vector/{assistant_id}")
 async def create_vector(assistant_id: str):
-    vector_store = client.beta.vector_stores.create()
+    vector_store = await aclient.beta.vector_stores.create()
     await update_assistant(assistant_id, vector_store.id)
 
     return vector_store.id
@@ -167,7 +204,7 @@ async def create_vector(assistant_id: str):
 ### ACTUALIZAR Vector
 @router.put("/update-vector/{assistant_id}/{vector_id}/{file_id}")
 async def update_vector(assistant_id: str, vector_id: str, file_id: str):
-    batch_add = client.beta.vector_stores.file_batches.create(
+    batch_add = await aclient.beta.vector_stores.file_batches.create(
         vector_store_id=vector_id,
         file_ids=[file_id]
     )
@@ -185,7 +222,7 @@ async def update_vector(assistant_id: str, vector_id: str, file_id: str):
 @router.delete("/delete-vector/{vector_id}/")
 async def delete_vector(vector_id: str):
     try:
-        respuesta = client.beta.vector_stores.delete(vector_id)
+        respuesta = await aclient.beta.vector_stores.delete(vector_id)
 
     except Exception as e:
         print("Error deleting file:", e)
@@ -210,7 +247,7 @@ async def upload_file( assistant_id: str, vector_id: str, archivo: UploadFile =
         ### 
         archivo_contenido = await archivo.read()
         ### Llama a la API de OpenAI para subir el archivo
-        respuesta = client.files.create(
+        respuesta = await aclient.files.create(
             file=(archivo.filename, archivo_contenido),
             purpose=proposito,
         )
@@ -249,7 +286,7 @@ async def update_file(assistant_id: str, vector_id: str, file_id: str, archivo:
 async def delete_file( file_id: str):
     try:
         ### Llama a la API de OpenAI para eliminar el archivo
-        respuesta = client.files.delete(id=file_id)
+        respuesta = await aclient.files.delete(id=file_id)
         
     
     except Exception as e:
@@ -293,7 +330,7 @@ async def obtener_feedback(
         print("si funciona ")
 
         # Crear un thread con el archivo adjunto
-        thread = client.beta.threads.create(
+        thread = await aclient.beta.threads.create(
             messages=[
                 {
                     "role": "user",
@@ -304,19 +341,15 @@ async def obtener_feedback(
         )
         
         # Ejecutar el thread y esperar su finalización
-        run = client.beta.threads.runs.create(thread_id=thread.id, assistant_id=assistant_id)
-        
-        while run.status not in ["completed", "failed"]:
-            run = client.beta.threads.runs.retrieve(thread_id=thread.id, run_id=run.id)
-            print(run.status)
-            await asyncio.sleep(1)
+        resultado = await ejecutar_run(thread.id, assistant_id, nombre_fase="feedback")
+        print(resultado["status"])
         
         # Obtener los mensajes del thread
-        messages = client.beta.threads.messages.list(thread_id=thread.id)
-        mensaje = mostrar_mensajes_assistant(messages)
+        messages = await aclient.beta.threads.messages.list(thread_id=thread.id)
+        mensaje = await mostrar_mensajes_assistant(messages)
         print("mensaje",mensaje)
         # Limpiar recursos: borrar thread y archivo subido
-        client.beta.threads.delete(thread_id=thread.id)
+        await aclient.beta.threads.delete(thread_id=thread.id)
         return mensaje
     except Exception as e:
         print(f"Error: {e}")
@@ -358,32 +391,17 @@ async def crear_preguntas(assistant_id: str, vf: str, desarrollo: str, alternati
         while retries < max_retries:
             if thread_retries == 0 or thread_retries >= 2:
                 # Crear hilo inicial
-                thread = client.beta.threads.create(
+                thread = await aclient.beta.threads.create(
                     messages=[{"role": "user", "content": prompt}],
                 )
                 thread_retries = 0
 
-            run = client.beta.threads.runs.create(
-                thread_id=thread.id,
-                assistant_id=assistant_id
-            )
-
-            # Esperar a que la ejecución se complete
-            while run.status not in ["completed", "failed"]:
-                run = client.beta.threads.runs.retrieve(
-                    thread_id=thread.id,
-                    run_id=run.id
-                )
-                print(run.status)
-                await asyncio.sleep(1)
-
-            # Obtener los mensajes del hilo
-            messages = client.beta.threads.messages.list(
-                thread_id=thread.id,
-            )
+            # Ejecutar y esperar a que la ejecución se complete
+            resultado = await ejecutar_run(thread.id, assistant_id, nombre_fase="crear_preguntas")
+            print(resultado["status"])
 
             # Interpretar el contenido del mensaje
-            preguntas = obtener_mensaje_del_run(messages, run.id)
+            preguntas = resultado["texto"]
             #print("PRIMERA GENERACION:"+ preguntas)
             # Verificar si se generaron preguntas válidas con los prefijos actualizados
             if preguntas and re.search(r"(Pregunta_vf:|Pregunta_desarrollo:|Pregunta_alternativas:)", preguntas):
@@ -391,7 +409,7 @@ async def crear_preguntas(assistant_id: str, vf: str, desarrollo: str, alternati
                 return preguntas, thread.id
 
             print("No se encontraron preguntas válidas, enviando el prompt nuevamente...")
-            client.beta.threads.messages.create(
+            await aclient.beta.threads.messages.create(
                 thread_id=thread.id,
                 content=prompt,
                 role="user"
@@ -435,39 +453,23 @@ async def regenerar_preguntas(assistant_id: str, thread_id: str, pregunta_tipo:
 
     try:
         # Crear hilo inicial metodo parche
-        thread = client.beta.threads.create(
+        thread = await aclient.beta.threads.create(
             messages=[{"role": "user", "content": prompt}],
         )
         while retries < max_retries:
-            # Ejecutar el hilo ya existente
-            run = client.beta.threads.runs.create(
-                thread_id=thread.id,
-                assistant_id=assistant_id
-            )
-
-            # Esperar a que la ejecución se complete
-            while run.status not in ["completed", "failed"]:
-                run = client.beta.threads.runs.retrieve(
-                    thread_id=thread.id,
-                    run_id=run.id
-                )
-                print(run.status)
-                await asyncio.sleep(1)
-
-            # Obtener los mensajes del hilo para obtener las preguntas generadas
-            messages = client.beta.threads.messages.list(
-                thread_id=thread.id,
-            )
+            # Ejecutar el hilo ya existente y esperar a que se complete
+            resultado = await ejecutar_run(thread.id, assistant_id, nombre_fase="regenerar_preguntas")
+            print(resultado["status"])
 
             # Interpretar el contenido del mensaje
-            preguntas = obtener_mensaje_del_run(messages, run.id)
+            preguntas = resultado["texto"]
             # Verificar si se generaron preguntas válidas con los prefijos correctos
             if preguntas and re.search(r"(Pregunta_vf:|Pregunta_desarrollo:|Pregunta_alternativas:)", preguntas):
                 print("Pregunta regenerada correctamente: " + preguntas)
                 return preguntas
 
             print("No se encontraron preguntas válidas, enviando el prompt nuevamente...")
-            client.beta.threads.messages.create(
+            await aclient.beta.threads.messages.create(
                 thread_id=thread.id,
                 content=prompt,
                 role="user"
@@ -486,36 +488,8 @@ async def regenerar_preguntas(assistant_id: str, thread_id: str, pregunta_tipo:
 #########################################
 ###  Generacion De Guiones de Clases  ###
 #########################################
-async def esperar_run_completado(thread_id, run_id, timeout=120):
-    """
-    Espera activamente a que un run termine, con timeout
-    """
-    start_time = time.time()
-    
-    while True:
-        try:
-            run = client.beta.threads.runs.retrieve(
-                thread_id=thread_id,
-                run_id=run_id
-            )
-            
-            print(f"⏳ Estado actual del run: {run.status}")
-            
-            if run.status in ["completed", "failed", "cancelled", "expired"]:
-                return run
-                
-            if time.time() - start_time > timeout:
-                print(f"❌ Timeout después de {timeout} segundos")
-                return None
-                
-            await asyncio.sleep(2)
-            
-        except Exception as e:
-            print(f"❌ Error consultando run: {e}")
-            await asyncio.sleep(2)
-
-
-
+# La espera de runs (streaming + fallback por polling) vive en
+# app/services/openai_runs.py: ejecutar_run / esperar_run_completado
 
 
 @router.post("/crear_guion/{assistant_id}")
@@ -533,7 +507,7 @@ async def crear_guion(
 
     # 🔗 Vincular assistant al vector store
     try:
-        client.beta.assistants.update(
+        await aclient.beta.assistants.update(
             assistant_id=assistant_id,
             tools=[{"type": "file_search"}],
             tool_resources={"file_search": {"vector_store_ids": [vector_id]}},
@@ -544,8 +518,9 @@ async def crear_guion(
         # seguimos igual, solo que sin corpus
 
     # Crear thread único para TODO el proceso (2 pasos)
-    thread = client.beta.threads.create()
+    thread = await aclient.beta.threads.create()
     print(f"🧵 Thread creado: {thread.id}")
+    tiempos_fases = {}
 
     try:
         # ================================================================
@@ -583,6 +558,7 @@ REGLAS:
             assistant_id=assistant_id,
             prompt=prompt_analisis_ra,
             nombre_fase="analisis_ra",
+            tiempos_fases=tiempos_fases,
             estructura_esperada={
                 "analisis_ra": {
                     "verbos_clave": list,
@@ -775,6 +751,7 @@ REGLAS PARA ESTRATEGIAS DIDÁCTICAS (OBLIGATORIO):
             assistant_id=assistant_id,
             prompt=prompt_guion,
             nombre_fase="guion_clase",
+            tiempos_fases=tiempos_fases,
             estructura_esperada={
                 "identificacion_clase": dict,
                 "secuencia_actividades": dict,
@@ -821,6 +798,7 @@ REGLAS PARA ESTRATEGIAS DIDÁCTICAS (OBLIGATORIO):
                 "fecha_generacion": datetime.now().isoformat(),
                 "version_guion": "v1.1-2pasos-docente",
                 "fases_completadas": ["analisis_ra_simple", "guion_formato_docente"],
+                "tiempos_fases": tiempos_fases,
             },
             "thread_id": thread.id,
         }
@@ -834,31 +812,51 @@ REGLAS PARA ESTRATEGIAS DIDÁCTICAS (OBLIGATORIO):
             "thread_id": thread.id if "thread" in locals() else None,
         }
 
-async def llamada_ia_estructurada(thread_id, assistant_id, prompt, nombre_fase, estructura_esperada=None, timeout=60):
+async def ejecutar_run_estructurado(thread_id, assistant_id, tipo, **kwargs):
+    """
+    ejecutar_run con el JSON schema del tipo como response_format
+    (Structured Outputs). Si la API no acepta el esquema, se desactiva para
+    esa configuración (modelo + herramientas) y se repite el run en texto
+    libre. `resultado["con_esquema"]` indica cuál corrió.
+    """
+    configuracion = configuracion_run(kwargs)
+    response_format = response_format_de(tipo, configuracion)
+    if response_format is not None:
+        resultado = await ejecutar_run(thread_id, assistant_id, response_format=response_format, **kwargs)
+        if resultado["status"] != "error" or "response_format" not in (resultado.get("error") or ""):
+            resultado["con_esquema"] = True
+            return resultado
+        desactivar_esquemas(resultado["error"], configuracion)
+
+    resultado = await ejecutar_run(thread_id, assistant_id, **kwargs)
+    resultado["con_esquema"] = False
+    return resultado
+
+
+async def llamada_ia_estructurada(thread_id, assistant_id, prompt, nombre_fase, estructura_esperada=None, timeout=60, tiempos_fases=None, esquema=None):
     print(f"  📤 Enviando {nombre_fase} ({len(prompt)} caracteres)")
 
     try:
-        client.beta.threads.messages.create(
+        await aclient.beta.threads.messages.create(
             thread_id=thread_id,
             role="user",
             content=prompt
         )
 
-        run = client.beta.threads.runs.create(
-            thread_id=thread_id,
-            assistant_id=assistant_id,
+        extractor = ExtractorJSONIncremental()
+        resultado = await ejecutar_run_estructurado(
+            thread_id, assistant_id, esquema or nombre_fase,
+            timeout=timeout, nombre_fase=nombre_fase, extractor_json=extractor
         )
+        if tiempos_fases is not None:
+            tiempos_fases[nombre_fase] = resultado["tiempos"]
 
-        completed_run = await esperar_run_completado(thread_id, run.id, timeout)
-
-        if not completed_run or completed_run.status != "completed":
-            status = completed_run.status if completed_run else "timeout"
-            error_msg = f"Run no completado en {nombre_fase}: {status}"
+        if resultado["status"] != "completed":
+            error_msg = f"Run no completado en {nombre_fase}: {resultado['status']}"
             print(f"  ❌ {error_msg}")
             return {"error": error_msg}
 
-        messages = client.beta.threads.messages.list(thread_id=thread_id)
-        respuesta_texto = obtener_mensaje_del_run(messages, completed_run.id)
+        respuesta_texto = resultado["texto"]
 
         if not respuesta_texto:
             error_msg = f"Respuesta vacía en {nombre_fase}"
@@ -867,7 +865,10 @@ async def llamada_ia_estructurada(thread_id, assistant_id, prompt, nombre_fase,
 
         print(f"  🔍 Respuesta recibida ({len(respuesta_texto)} chars): {respuesta_texto[:200]}...")
 
-        respuesta_json = extraer_json_del_texto(respuesta_texto)
+        # Si el JSON ya se parseó mientras llegaba el stream no se vuelve a recorrer el texto
+        respuesta_json = resultado.get("json")
+        if respuesta_json is None:
+            respuesta_json = extraer_json_del_texto(respuesta_texto)
 
         if not respuesta_json:
             print(f"  ❌ No se pudo extraer JSON en {nombre_fase}")
@@ -878,8 +879,16 @@ async def llamada_ia_estructurada(thread_id, assistant_id, prompt, nombre_fase,
         if isinstance(respuesta_json, dict) and nombre_fase in respuesta_json and isinstance(respuesta_json[nombre_fase], (dict, list)):
             respuesta_json = respuesta_json[nombre_fase]
 
-        # ✅ (Opcional) Validación muy ligera si te sirve:
-        if isinstance(estructura_esperada, dict) and isinstance(respuesta_json, dict):
+        # ✅ Validación contra el esquema Pydantic (con Structured Outputs casi nunca falla)
+        tipo_esquema = esquema or nombre_fase
+        es_valido, mensaje = validar_esquema(
+            tipo_esquema,
+            {nombre_fase: respuesta_json} if tipo_esquema == "analisis_ra" else respuesta_json
+        )
+        metricas_rechazo.registrar(tipo_esquema, es_valido, resultado["con_esquema"], mensaje)
+        if not es_valido:
+            print(f"  ⚠️ {nombre_fase}: {mensaje}")
+        elif isinstance(estructura_esperada, dict) and isinstance(respuesta_json, dict):
             claves_faltantes = [k for k in estructura_esperada.keys() if k not in respuesta_json]
             if claves_faltantes:
                 print(f"  ⚠️ {nombre_fase}: faltan claves {claves_faltantes}")
@@ -896,49 +905,7 @@ async def llamada_ia_estructurada(thread_id, assistant_id, prompt, nombre_fase,
 
 def extraer_json_robusto(texto):
     """Extrae JSON incluso si viene con texto adicional o formato incorrecto"""
-    if not texto:
-        return None
-    
-    # 1. Intentar extraer con tu función existente
-    try:
-        json_obj = extraer_json_del_texto(texto)
-        if json_obj:
-            return json_obj
-    except:
-        pass
-    
-    # 2. Buscar entre ```json ``` o ``` ```
-    import re
-    json_patterns = [
-        r'```json\s*(\{.*?\})\s*```',  # ```json { ... } ```
-        r'```\s*(\{.*?\})\s*```',      # ``` { ... } ```
-        r'```(\{.*?\})```',            # ```{ ... }```
-        r'(\{.*\})',                   # Cualquier JSON
-    ]
-    
-    for pattern in json_patterns:
-        match = re.search(pattern, texto, re.DOTALL)
-        if match:
-            json_str = match.group(1).strip()
-            try:
-                # Limpiar caracteres problemáticos
-                json_str = json_str.replace('\n', ' ').replace('\t', ' ')
-                return json.loads(json_str)
-            except json.JSONDecodeError:
-                continue
-    
-    # 3. Si aún no funciona, intentar encontrar el primer { y último }
-    start = texto.find('{')
-    end = texto.rfind('}') + 1
-    
-    if start >= 0 and end > start:
-        json_str = texto[start:end]
-        try:
-            return json.loads(json_str)
-        except json.JSONDecodeError:
-            pass
-    
-    return None
+    return extraer_json(texto)
 def imprimir_resultado_final(guion_final: str):
     """Imprime el resultado final formateado"""
     print("\n" + "="*80)
@@ -972,53 +939,19 @@ def imprimir_resultado_final(guion_final: str):
 
 
 def extraer_json_del_texto(texto):
-    if not texto:
-        return None
-
-    texto = texto.strip()
-
-    # 1. Intento directo
-    try:
-        return json.loads(texto)
-    except json.JSONDecodeError:
-        pass
-
-    # 2. Buscar desde el primer { hasta el último }
-    inicio = texto.find("{")
-    fin = texto.rfind("}")
-
-    if inicio == -1 or fin == -1 or fin <= inicio:
-        return None
-
-    candidato = texto[inicio:fin + 1]
-
-    try:
-        return json.loads(candidato)
-    except json.JSONDecodeError as e:
-        print("❌ JSON inválido, NO se rescata parcialmente")
-        print("🔎 Error:", e)
-        print("🔎 Inicio del JSON:")
-        print(candidato[:500])
-        return None
+    """Primer objeto/array JSON del texto (ver app/services/extractor_json.py)"""
+    json_obj = extraer_json(texto)
+    if json_obj is None and texto:
+        print("❌ No se encontró JSON válido en la respuesta")
+        print("🔎 Inicio del texto:")
+        print(texto[:500])
+    return json_obj
 
 def buscar_json_especifico(texto):
     """Busca estructuras JSON específicas en el texto"""
-    # Buscar el JSON que contiene TODOS los campos que necesitamos
-    patrones = [
-        r'\{[^{}]*"evaluaciones_formativas"[^{}]*"frameworks"[^{}]*"materiales_apoyo"[^{}]*\}',
-        r'\{.*"frameworks".*\}',
-        r'\{.*"evaluaciones_formativas".*\}',
-    ]
-    
-    for patron in patrones:
-        match = re.search(patron, texto, re.DOTALL)
-        if match:
-            json_str = match.group(0)
-            try:
-                return json.loads(json_str)
-            except:
-                continue
-    
+    json_obj = extraer_json(texto, aperturas="{")
+    if isinstance(json_obj, dict) and ("frameworks" in json_obj or "evaluaciones_formativas" in json_obj):
+        return json_obj
     return None
 def limpiar_caracteres_json(texto):
     """Limpia caracteres problemáticos en JSON"""
@@ -1043,59 +976,130 @@ def limpiar_caracteres_json(texto):
     return texto
 
 def limpiar_json_agresivamente(texto):
-    """Limpieza más agresiva para JSON problemático"""
-    import json
-    import re
-    
-    # 1. Encontrar y corregir strings mal formadas
-    lines = texto.split('\n')
-    cleaned_lines = []
-    
-    for line in lines:
-        # Buscar strings que cruzan múltiples líneas
-        line = line.strip()
-        if line:
-            # Escapar comillas dobles dentro de strings
-            in_string = False
-            result = []
-            i = 0
-            while i < len(line):
-                char = line[i]
-                if char == '"' and (i == 0 or line[i-1] != '\\'):
-                    in_string = not in_string
-                    result.append(char)
-                elif in_string and char in ['\n', '\r', '\t']:
-                    # Escapar caracteres de control dentro de strings
-                    escape_map = {'\n': '\\n', '\r': '\\r', '\t': '\\t'}
-                    result.append(escape_map.get(char, char))
-                else:
-                    result.append(char)
-                i += 1
-            cleaned_lines.append(''.join(result))
-    
-    texto = '\n'.join(cleaned_lines)
-    
-    # 2. Intentar reparar JSON incompleto
-    # Contar llaves para ver si está balanceado
-    open_braces = texto.count('{')
-    close_braces = texto.count('}')
-    
-    if open_braces > close_braces:
-        # Agregar llaves de cierre faltantes
-        texto += '}' * (open_braces - close_braces)
-    elif close_braces > open_braces:
-        # Remover llaves de cierre extras al final
-        while close_braces > open_braces and texto.endswith('}'):
-            texto = texto[:-1]
-            close_braces -= 1
-    
-    return texto
+    """Limpieza más agresiva para JSON problemático (incluye JSON truncado)"""
+    json_obj = extraer_json(texto)
+    if json_obj is None:
+        return texto
+    return json.dumps(json_obj, ensure_ascii=False)
+
+# =========================================================
+# Digest del corpus: UNA lectura del vector_store compartida por
+# resumen, glosario, flashcards y mapa conceptual
+# =========================================================
+PROMPT_DIGEST_CORPUS = """Eres un experto en análisis de textos académicos, pedagogía y diseño instruccional.
+
+Lee TODO el contenido disponible en el vector_store y construye un DIGEST del corpus: una
+representación compacta pero completa de su contenido, que luego se usará (sin volver a leer
+los archivos) para generar un resumen, un glosario, flashcards y un mapa conceptual.
+
+EL DIGEST DEBE INCLUIR:
+1. tema_central → el foco central del corpus, en una frase
+2. estructura → las secciones o bloques temáticos del material, en orden, cada uno con sus
+   ideas principales (frases completas y autoexplicativas)
+3. conceptos → entre 20 y 60 conceptos nucleares del material:
+   - nombre: denominación estable y literal (se reutiliza tal cual en los materiales)
+   - definicion: definición precisa en 1-2 frases
+   - nivel: "raiz" (solo el tema central), "principal", "secundario" o "terciario"
+   - padre: nombre literal del concepto del que depende (null para la raíz)
+   - categoria: concepto | tecnico | proceso | principio | marco_teorico | herramienta
+   - ejemplo: ejemplo tomado o inspirado en el material (null si no hay)
+4. relaciones → relaciones significativas entre conceptos (origen, destino y el verbo o frase
+   que las une), además de las jerárquicas
+5. conclusiones → 2-5 síntesis integradoras con relevancia educativa
+
+REGLAS:
+- Usa únicamente contenido del vector_store; no inventes.
+- NO incluyas citas de fuentes como 【4:13†source】 ni marcadores de referencia.
+- Un concepto PRINCIPAL debe poder existir como categoría autónoma; las propiedades de otro
+  concepto van como secundarias o terciarias.
+- Ningún concepto puede repetirse en dos niveles.
+
+FORMATO DE SALIDA: SOLO JSON, sin texto adicional:
+{
+  "tema_central": "...",
+  "estructura": [{"titulo": "...", "ideas": ["...", "..."]}],
+  "conceptos": [{"nombre": "...", "definicion": "...", "nivel": "principal", "padre": "...", "categoria": "concepto", "ejemplo": null}],
+  "relaciones": [{"origen": "...", "destino": "...", "tipo": "..."}],
+  "conclusiones": ["..."]
+}"""
+
+# Los materiales que reciben el digest corren sin file_search: todo lo que
+# necesitan del corpus ya viene en el prompt
+SIN_FILE_SEARCH = {"tools": []}
+
+
+def prompt_desde_digest(prompt, digest):
+    """Antepone el digest al prompt de un material (reemplaza la lectura del vector_store)."""
+    return f"""DIGEST DEL CORPUS (extraído previamente de TODO el material del vector_store).
+Es la ÚNICA fuente de contenido para esta tarea: cuando las instrucciones hablen del
+vector_store, del documento, del corpus, del contenido educativo o del thread, se refieren
+a este digest. No inventes contenido que no esté en él.
+
+--- INICIO DIGEST ---
+{digest}
+--- FIN DIGEST ---
+
+{prompt}"""
+
+
+@router.post("/generar_digest/{assistant_id}")
+async def generar_digest_corpus_api(
+    assistant_id: str,
+    vector_id: str = Form(...)
+):
+    print(f"🧾 Generando digest del corpus para assistant_id={assistant_id}, vector_id={vector_id}")
+    thread_id = None
+
+    try:
+        nuevo_thread = await aclient.beta.threads.create()
+        thread_id = nuevo_thread.id
+
+        await aclient.beta.threads.messages.create(
+            thread_id=thread_id,
+            role="user",
+            content=PROMPT_DIGEST_CORPUS
+        )
+
+        extractor = ExtractorJSONIncremental("{")
+        resultado = await ejecutar_run_estructurado(
+            thread_id, assistant_id, "digest_corpus",
+            timeout=180, nombre_fase="digest_corpus", extractor_json=extractor
+        )
+
+        if resultado["status"] != "completed":
+            return {"error": "El run del digest no completó correctamente"}
+
+        digest = resultado.get("json")
+        if digest is None:
+            digest = extraer_json(resultado["texto"], aperturas="{")
+
+        es_valido, mensaje = validar_esquema("digest_corpus", digest)
+        metricas_rechazo.registrar("digest_corpus", es_valido, resultado["con_esquema"], mensaje)
+        if not es_valido:
+            print(f"⚠️ Digest del corpus inválido: {mensaje}")
+            return {"error": f"Digest inválido: {mensaje}"}
+
+        print(f"✅ Digest del corpus generado ({len(digest['conceptos'])} conceptos)")
+        return {"digest": digest, "tiempos": resultado["tiempos"], "uso": resultado["uso"], "con_esquema": resultado["con_esquema"]}
+
+    except Exception as e:
+        print("❌ Error generando digest del corpus:", e)
+        return {"error": f"Fallo generando digest: {str(e)}"}
+
+    finally:
+        if thread_id:
+            try:
+                await aclient.beta.threads.delete(thread_id)
+            except Exception as e:
+                print(f"⚠️ No se pudo eliminar thread del digest: {e}")
+
 
 @router.post("/generar_resumen/{assistant_id}")
 async def generar_resumen_api(
     assistant_id: str,
     thread_id: str = Form(...),
-    vector_id: str = Form(...)
+    vector_id: str = Form(...),
+    digest: Optional[str] = Form(None)
 ):
     print(f"🧠 Generando resumen para assistant_id={assistant_id}, thread_id={thread_id}, vector_id={vector_id}")
     
@@ -1134,36 +1138,37 @@ FORMATO DE SALIDA (JSON):
 
 IMPORTANTE: Los conceptos clave deben seguir el formato "Concepto: descripción" para que sean útiles para el docente."""
 
+    if digest:
+        prompt = prompt_desde_digest(prompt, digest)
+
     try:
         # Enviar el prompt dentro del mismo thread
-        client.beta.threads.messages.create(
+        await aclient.beta.threads.messages.create(
             thread_id=thread_id,
             role="user",
             content=prompt
         )
 
-        # Crear run
-        run = client.beta.threads.runs.create(
-            thread_id=thread_id,
-            assistant_id=assistant_id,
+        # Crear run y esperar su término (streaming)
+        resultado = await ejecutar_run_estructurado(
+            thread_id, assistant_id, "resumen", timeout=90, nombre_fase="resumen",
+            **(SIN_FILE_SEARCH if digest else {})
         )
-        
-        # ✅ OPCIÓN MÁS LIMPIA: Usar tu función esperar_run_completado
-        completed_run = await esperar_run_completado(thread_id, run.id, timeout=90)
 
-        if not completed_run or completed_run.status != "completed":
+        if resultado["status"] != "completed":
             return {"error": "El run no completó correctamente"}
 
-        # Obtener mensajes del hilo
-        messages = client.beta.threads.messages.list(thread_id=thread_id)
-        resumen = obtener_mensaje_del_run(messages, completed_run.id)
+        resumen = resultado["texto"]
         print("resumen : ", resumen)
         if not resumen or len(resumen.strip()) < 20:
             print("⚠️ No se obtuvo resumen válido del modelo.")
             return {"error": "No se pudo generar un resumen válido."}
 
         print("✅ Resumen generado correctamente.")
-        return {"resumen": resumen, "thread": thread_id}
+        return {
+            "resumen": resumen, "thread": thread_id, "tiempos": resultado["tiempos"], "uso": resultado["uso"],
+            "con_esquema": resultado["con_esquema"], "desde_digest": bool(digest),
+        }
 
     except Exception as e:
         print("❌ Error generando resumen:", e)
@@ -1176,7 +1181,8 @@ async def generar_mapa_conceptual_api(
     assistant_id: str,
     thread_id: str = Form(...),
     vector_id: str = Form(...),
-    titulo_guion: str = Form(...)
+    titulo_guion: str = Form(...),
+    digest: Optional[str] = Form(None)
 ):
     print(f"🧠 Generando mapa conceptual (3 fases pedagogicas) para assistant_id={assistant_id}")
 
@@ -1184,12 +1190,14 @@ async def generar_mapa_conceptual_api(
         # -----------------------------------------------------------------------
         # 🧹 1. Esperar cualquier run previo activo
         # -----------------------------------------------------------------------
-        active_runs = client.beta.threads.runs.list(thread_id=thread_id)
-        for run in active_runs:
+        active_runs = await aclient.beta.threads.runs.list(thread_id=thread_id)
+        for run in active_runs.data:
             if run.status in ["queued", "in_progress"]:
                 print(f"⏳ Esperando run previo: {run.id}")
                 await esperar_run_completado(thread_id, run.id)
 
+        tiempos_fases = {}
+
         # -----------------------------------------------------------------------
         # 📘 FASE 1 → EXTRACCIÓN PEDAGÓGICA DEL CONTENIDO
         # -----------------------------------------------------------------------
@@ -1233,31 +1241,33 @@ Ejemplo:
 
 """
 
-        client.beta.threads.messages.create(
-            thread_id=thread_id,
-            role="user",
-            content=prompt_fase1
-        )
+        if digest:
+            # El digest ya es la extracción de la Fase 1: no se vuelve a leer el corpus
+            fase1_data = digest
+            tiempos_fases["fase1"] = {"total": 0.0, "desde_digest": True}
+            print("⚡ Fase 1 omitida: se usa el digest del corpus")
+        else:
+            await aclient.beta.threads.messages.create(
+                thread_id=thread_id,
+                role="user",
+                content=prompt_fase1
+            )
 
-        run1 = client.beta.threads.runs.create(
-            thread_id=thread_id,
-            assistant_id=assistant_id
-        )
+            resultado1 = await ejecutar_run(thread_id, assistant_id, nombre_fase="mapa_fase1")
+            tiempos_fases["fase1"] = resultado1["tiempos"]
 
-        completed_run1 = await esperar_run_completado(thread_id, run1.id)
+            if resultado1["status"] != "completed":
+                return {"error": f"Fase 1: el run no completó correctamente ({resultado1['status']})"}
 
-        fase1_data = obtener_mensaje_del_run(
-            client.beta.threads.messages.list(thread_id=thread_id),
-            completed_run1.id
-        )
+            fase1_data = resultado1["texto"]
 
-        if not fase1_data:
-            return {"error": "Fase 1 no devolvió información"}
-        print("✅ Fase 1 completada")
-        print("📄 Fase 1 output (primeros 500 chars):")
-        print(fase1_data[:50000])
-        print("-" * 80)
-        print("✅ Fase 1 pedagógica completada")
+            if not fase1_data:
+                return {"error": "Fase 1 no devolvió información"}
+            print("✅ Fase 1 completada")
+            print("📄 Fase 1 output (primeros 500 chars):")
+            print(fase1_data[:50000])
+            print("-" * 80)
+            print("✅ Fase 1 pedagógica completada")
 
         # -----------------------------------------------------------------------
         # 🟦 FASE 1.5 → ORGANIZACIÓN JERÁRQUICA PEDAGÓGICA
@@ -1384,29 +1394,27 @@ Tectología como Teoría del Pensamiento Sistémico
 NO generes JSON todavía.
 """
  
-        client.beta.threads.messages.create(
+        await aclient.beta.threads.messages.create(
             thread_id=thread_id,
             role="user",
-            content=prompt_fase15
+            content=prompt_desde_digest(prompt_fase15, digest) if digest else prompt_fase15
         )
 
-        run15 = client.beta.threads.runs.create(
-            thread_id=thread_id,
-            assistant_id=assistant_id
+        resultado15 = await ejecutar_run(
+            thread_id, assistant_id, nombre_fase="mapa_fase15", **(SIN_FILE_SEARCH if digest else {})
         )
+        tiempos_fases["fase15"] = resultado15["tiempos"]
 
-        completed_run15 = await esperar_run_completado(thread_id, run15.id)
+        if resultado15["status"] != "completed":
+            return {"error": f"Fase 1.5: el run no completó correctamente ({resultado15['status']})"}
 
-        fase15_data = obtener_mensaje_del_run(
-            client.beta.threads.messages.list(thread_id=thread_id),
-            completed_run15.id
-        )
+        fase15_data = resultado15["texto"]
+        if not fase15_data:
+            return {"error": "Fase 1.5 no devolvió información"}
         print("✅ Fase 15 completada")
         print("📄 Fase 15 output (primeros 500 chars):")
         print(fase15_data[:50000])
         print("-" * 80)
-        if not fase15_data:
-            return {"error": "Fase 1.5 no devolvió información"}
 
         print("✅ Fase 1.5 pedagógica completada")
 
@@ -1549,32 +1557,34 @@ VERIFICACIÓN FINAL:
 
 ENTREGA ÚNICAMENTE EL JSON SIN NADA MÁS.
 """
-        client.beta.threads.messages.create(
+        await aclient.beta.threads.messages.create(
             thread_id=thread_id,
             role="user",
             content=prompt_fase2
         )
 
-        run2 = client.beta.threads.runs.create(
-            thread_id=thread_id,
-            assistant_id=assistant_id
+        resultado2 = await ejecutar_run_estructurado(
+            thread_id, assistant_id, "mapa_conceptual", nombre_fase="mapa_fase2",
+            **(SIN_FILE_SEARCH if digest else {})
         )
+        tiempos_fases["fase2"] = resultado2["tiempos"]
 
-        completed_run2 = await esperar_run_completado(thread_id, run2.id)
+        if resultado2["status"] != "completed":
+            return {"error": f"Fase 2: el run no completó correctamente ({resultado2['status']})"}
 
-        final_json = obtener_mensaje_del_run(
-            client.beta.threads.messages.list(thread_id=thread_id),
-            completed_run2.id
-        )
+        final_json = resultado2["texto"]
+        if not final_json:
+            return {"error": "Fase 2 no devolvió el JSON"}
         print("✅ Fase 2 completada")
         print("📄 Fase 2 output (primeros 500 chars):")
         print(final_json[:50000])
         print("-" * 80)
-        if not final_json:
-            return {"error": "Fase 2 no devolvió el JSON"}
 
         print("✅ Fase 2 completada → JSON pedagógico listo")
-        return {"mapa_conceptual": final_json, "thread": thread_id}
+        return {
+            "mapa_conceptual": final_json, "thread": thread_id, "tiempos": tiempos_fases,
+            "con_esquema": resultado2["con_esquema"], "desde_digest": bool(digest),
+        }
 
     except Exception as e:
         print("❌ Error en proceso 3-fases pedagógicas:", e)
@@ -1600,7 +1610,8 @@ def obtener_mensaje_del_run(messages, run_id):
 async def generar_flashcards_api(
     assistant_id: str,
     thread_id: str = Form(...),
-    vector_id: str = Form(...)
+    vector_id: str = Form(...),
+    digest: Optional[str] = Form(None)
 ):
     
     print(f"🎴 Generando flashcards para assistant_id={assistant_id}, thread_id={thread_id}, vector_id={vector_id}")
@@ -1631,33 +1642,35 @@ EJEMPLO DE FORMATO CORRECTO:
 
 SOLO devuelve el JSON, sin texto adicional."""
 
+        if digest:
+            prompt = prompt_desde_digest(prompt, digest)
+
         # Enviar mensaje
-        client.beta.threads.messages.create(
+        await aclient.beta.threads.messages.create(
             thread_id=thread_id,
             role="user",
             content=prompt
         )
 
-        # Crear run
-        run = client.beta.threads.runs.create(
-            thread_id=thread_id,
-            assistant_id=assistant_id,
+        # Crear run y esperar finalización
+        resultado = await ejecutar_run_estructurado(
+            thread_id, assistant_id, "flashcards", timeout=90, nombre_fase="flashcards",
+            **(SIN_FILE_SEARCH if digest else {})
         )
 
-        # Esperar finalización
-        completed_run = await esperar_run_completado(thread_id, run.id, timeout=90)
-
-        if not completed_run or completed_run.status != "completed":
+        if resultado["status"] != "completed":
             return {"error": "El run no completó correctamente"}
 
-        # Obtener solo el mensaje correcto
-        messages = client.beta.threads.messages.list(thread_id=thread_id)
-        flashcards_data = obtener_mensaje_del_run(messages, completed_run.id)
+        # Texto del mensaje generado por este run
+        flashcards_data = resultado["texto"]
 
         if not flashcards_data or len(flashcards_data.strip()) < 20:
             return {"error": "No se pudieron generar flashcards válidas."}
 
-        return {"flashcards": flashcards_data, "thread": thread_id}
+        return {
+            "flashcards": flashcards_data, "thread": thread_id, "tiempos": resultado["tiempos"], "uso": resultado["uso"],
+            "con_esquema": resultado["con_esquema"], "desde_digest": bool(digest),
+        }
 
     except Exception as e:
         print("❌ Error generando flashcards:", e)
@@ -1668,15 +1681,16 @@ SOLO devuelve el JSON, sin texto adicional."""
 async def generar_glosario_api(
     assistant_id: str,
     thread_id: str = Form(...),
-    vector_id: str = Form(...)
+    vector_id: str = Form(...),
+    digest: Optional[str] = Form(None)
 ):
     
     print(f"📚 Generando glosario para assistant_id={assistant_id}, thread_id={thread_id}, vector_id={vector_id}")
     
     try:
         # ✅ PRIMERO: Verificar y esperar runs activos
-        active_runs = client.beta.threads.runs.list(thread_id=thread_id)
-        active_runs_list = list(active_runs)
+        active_runs = await aclient.beta.threads.runs.list(thread_id=thread_id)
+        active_runs_list = active_runs.data
         
         print(f"🔍 Runs activos en thread: {len(active_runs_list)}")
         
@@ -1735,37 +1749,36 @@ FORMATO DE RESPUESTA OBLIGATORIO — Devuelve SOLO JSON válido:
 }
 
 No incluyas explicaciones, texto adicional ni markdown. Devuelve solo el JSON."""
+        if digest:
+            prompt = prompt_desde_digest(prompt, digest)
+
         # Enviar el prompt dentro del mismo thread
-        client.beta.threads.messages.create(
+        await aclient.beta.threads.messages.create(
             thread_id=thread_id,
             role="user",
             content=prompt
         )
 
-        # Crear run
-        run = client.beta.threads.runs.create(
-            thread_id=thread_id,
-            assistant_id=assistant_id,
+        # Crear run y esperar su término (streaming)
+        resultado = await ejecutar_run_estructurado(
+            thread_id, assistant_id, "glosario", timeout=90, nombre_fase="glosario",
+            **(SIN_FILE_SEARCH if digest else {})
         )
-        
-        # ✅ USAR FUNCIÓN ESPERAR_RUN_COMPLETADO
-        completed_run = await esperar_run_completado(thread_id, run.id, timeout=90)
 
-        if not completed_run or completed_run.status != "completed":
+        if resultado["status"] != "completed":
             return {"error": "El run no completó correctamente"}
 
-        # Obtener mensajes del hilo
-        messages = client.beta.threads.messages.list(thread_id=thread_id)
-        
-        # ✅ USAR OBTENER_MENSAJE_DEL_RUN EN LUGAR DE INTERPRETAR_MENSAJES_ASSISTANT
-        glosario_data = obtener_mensaje_del_run(messages, completed_run.id)
+        glosario_data = resultado["texto"]
 
         if not glosario_data or len(glosario_data.strip()) < 20:
             print("⚠️ No se obtuvo glosario válido del modelo.")
             return {"error": "No se pudo generar un glosario válido."}
 
         print("✅ Glosario generado correctamente.")
-        return {"glosario": glosario_data, "thread": thread_id}
+        return {
+            "glosario": glosario_data, "thread": thread_id, "tiempos": resultado["tiempos"], "uso": resultado["uso"],
+            "con_esquema": resultado["con_esquema"], "desde_digest": bool(digest),
+        }
 
     except Exception as e:
         print("❌ Error generando glosario:", e)
@@ -2039,26 +2052,19 @@ async def procesar_con_gpt(thread_id: str, assistant_id: str, prompt: str) -> st
     """Procesa con GPT con manejo de errores"""
     try:
         # Crear mensaje
-        client.beta.threads.messages.create(
+        await aclient.beta.threads.messages.create(
             thread_id=thread_id,
             role="user",
             content=prompt
         )
 
         # Ejecutar run
-        run = client.beta.threads.runs.create(
-            thread_id=thread_id,
-            assistant_id=assistant_id,
-        )
-        
-        completed_run = await esperar_run_completado(thread_id, run.id, timeout=45)
+        resultado = await ejecutar_run(thread_id, assistant_id, timeout=45, nombre_fase="infografia_prompt")
 
-        if not completed_run or completed_run.status != "completed":
+        if resultado["status"] != "completed":
             raise Exception("Run no completó correctamente")
 
-        # Obtener respuesta
-        messages = client.beta.threads.messages.list(thread_id=thread_id)
-        respuesta = obtener_mensaje_del_run(messages, completed_run.id)
+        respuesta = resultado["texto"]
 
         if not respuesta or len(respuesta.strip()) < 10:
             raise Exception("No se pudo obtener respuesta válida")
@@ -5,9 +5,8 @@ load_dotenv()
 from pydantic import BaseModel
 from fastapi import HTTPException
 from fastapi.responses import JSONResponse
-import psycopg2
-from psycopg2.extras import RealDictCursor
 import os
+from app.services.pool_bd import pool_bd
 DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
     print("⚠️ DATABASE_URL no está definida. Usando SQLite local para desarrollo.")
@@ -18,14 +17,15 @@ class LoginBody(BaseModel):
 app = FastAPI()
 
 def connect_db():
-    return psycopg2.connect(
-        DATABASE_URL,
-        cursor_factory=RealDictCursor
-    )
+    # Conexión prestada por el pool compartido con app/main.py
+    if not pool_bd.dsn:
+        pool_bd.configurar(DATABASE_URL)
+    return pool_bd.conectar()
 
 # Función para autenticar un usuario y obtener cursos inscritos
 def login(correo: str, clave: str):
     try:
+        # Al salir del with la conexión vuelve al pool (también si hay error)
         with connect_db() as connection:
             cursor = connection.cursor()
 
@@ -32,6 +32,9 @@ el aprendizaje y el desarrollo de habilidades.
 Aparte si te lo piden debes generar preguntas para evaluar a tus alumnos basado en los archivos que contengas. Estas preguntas pueden ser de desarrollo, alternativas, o verdadero y falso dependiendo de lo solicitado. 
 '''
 
+# Modelo de los assistants de cada guion (también entra en la clave del cache de generaciones)
+MODELO_ASSISTANT = os.getenv("MODELO_ASSISTANT", "gpt-4o-mini")
+
 '''
 UPLOAD_FOLDER = 'uploads'
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)'
@@ -79,26 +82,31 @@ if not openai_key:
 # Configurar el cliente OpenAI con tu clave API para iniciar sesion
 client = OpenAI(api_key=openai_key)
 
+# Cliente async compartido por el proceso: es el que usan todas las funciones
+# async de este módulo para no bloquear el event loop
+from .services.openai_cliente import aclient
+from .services.openai_runs import ejecutar_run
+
 #NOGPT
 async def crear_prompt(texto):
     # Crear el nuevo prompt con el texto recibido entre prompt1 y prompt2
     nuevo_prompt = f"{prompt1}\n{texto}\n{prompt2}"
     return nuevo_prompt
 
-def crear_assistant():
+async def crear_assistant():
     '''
     Función para crear un asistente con vector store
     Retorna: assistant_id, vector_store_id
     '''
     try:
         # Primero crear el vector store
-        vector_store = client.beta.vector_stores.create(
+        vector_store = await aclient.beta.vector_stores.create(
             name=f"VectorStore_{int(time.time())}"
         )
         print(f"🗂️ Vector Store creado: {vector_store.id}")
 
         # Luego crear el assistant con el vector store
-        assistant = client.beta.assistants.create(
+        assistant = await aclient.beta.assistants.create(
             instructions=instructions,
             tools=[{"type": "file_search"}],
             tool_resources={
@@ -106,7 +114,7 @@ def crear_assistant():
                     "vector_store_ids": [vector_store.id]
                 }
             },
-            model="gpt-4o-mini",
+            model=MODELO_ASSISTANT,
         )
         print(f"👨‍💼 Assistant creado: {assistant.id}")
 
@@ -123,14 +131,14 @@ async def verificar_estado_vector_store(vector_store_id: str):
     """
     try:
         # Verificar vector store
-        vs = client.beta.vector_stores.retrieve(vector_store_id)
+        vs = await aclient.beta.vector_stores.retrieve(vector_store_id)
         print(f"🔍 Vector Store: {vs.id}")
         print(f"   - Estatus: {vs.status}")
         print(f"   - Uso: {vs.usage_bytes} bytes")
         print(f"   - Archivos: {vs.file_counts}")
 
         # Listar archivos en el vector store
-        files = client.beta.vector_stores.files.list(vector_store_id=vector_store_id)
+        files = await aclient.beta.vector_stores.files.list(vector_store_id=vector_store_id)
         
         print(f"   - Archivos presentes: {len(files.data)}")
         for file in files.data:
@@ -144,12 +152,12 @@ async def verificar_estado_vector_store(vector_store_id: str):
 async def limpiar_vector_store(vector_store_id: str):
     """Elimina todos los archivos de un vector store y espera a que se complete"""
     try:
-        files = client.beta.vector_stores.files.list(vector_store_id=vector_store_id)
+        files = await aclient.beta.vector_stores.files.list(vector_store_id=vector_store_id)
         print(f"🗑️ Eliminando {len(files.data)} archivos...")
         
         # Eliminar todos los archivos
         for file in files.data:
-            client.beta.vector_stores.files.delete(
+            await aclient.beta.vector_stores.files.delete(
                 vector_store_id=vector_store_id,
                 file_id=file.id
             )
@@ -162,7 +170,7 @@ async def limpiar_vector_store(vector_store_id: str):
         # Verificar periódicamente hasta que esté vacío
         max_attempts = 10
         for attempt in range(max_attempts):
-            remaining_files = client.beta.vector_stores.files.list(vector_store_id=vector_store_id)
+            remaining_files = await aclient.beta.vector_stores.files.list(vector_store_id=vector_store_id)
             
             if len(remaining_files.data) == 0:
                 print("✅ Vector store completamente limpiado")
@@ -187,15 +195,15 @@ async def actualizar_vector_store(vector_store_id, archivo):
     Retorna: file_id, batch_id
     '''
     # Subir archivo a OpenAI
-    nuevo_archivo = client.files.create(
+    nuevo_archivo = await aclient.files.create(
         file=archivo,
         purpose='assistants'
     )
 
     # Crear batch con el archivo subido
-    batch_add = client.beta.vector_stores.file_batches.upload_and_poll(
+    batch_add = await aclient.beta.vector_stores.file_batches.create_and_poll(
         vector_store_id=vector_store_id,
-        files=[nuevo_archivo.id]
+        file_ids=[nuevo_archivo.id]
     )
 
     print(f"📦 Batch creado: {batch_add.id} para vector {vector_store_id}")
@@ -214,7 +222,7 @@ async def subir_corpus(assistant_id: str, upload_file: UploadFile, vector_store_
         from io import BytesIO
         file_like_object = BytesIO(file_content)
         
-        uploaded_file = client.files.create(
+        uploaded_file = await aclient.files.create(
             file=(upload_file.filename, file_like_object, upload_file.content_type),
             purpose="assistants"
         )
@@ -222,7 +230,7 @@ async def subir_corpus(assistant_id: str, upload_file: UploadFile, vector_store_
         print(f"📄 Archivo subido a OpenAI: {uploaded_file.id}")
 
         # 2️⃣ Agregar archivo al vector store
-        vector_store_file = client.beta.vector_stores.files.create(
+        vector_store_file = await aclient.beta.vector_stores.files.create(
             vector_store_id=vector_store_id,
             file_id=uploaded_file.id
         )
@@ -235,7 +243,7 @@ async def subir_corpus(assistant_id: str, upload_file: UploadFile, vector_store_
 
         # Verificación rápida final (opcional)
         try:
-            file_status = client.beta.vector_stores.files.retrieve(
+            file_status = await aclient.beta.vector_stores.files.retrieve(
                 vector_store_id=vector_store_id,
                 file_id=vector_store_file.id
             )
@@ -264,19 +272,19 @@ async def eliminar_archivo(archivo_id):
         dict: La respuesta de la API de OpenAI.
     """
     try:
-        response = await asyncio.to_thread(client.files.delete, archivo_id)
+        response = await aclient.files.delete(archivo_id)
         print(f"Archivo {archivo_id} eliminado correctamente.")
         return response
 
     except Exception as e:
         print(f"Error al eliminar el archivo: {e}")
 
-def mostrar_mensajes_assistant(messages):
+async def mostrar_mensajes_assistant(messages):
     ''''
     fUNCION AUXILIAR Para obtener el resultado del prompt como texto plano
     '''
 
-    mensajes_assistant = [message for message in messages if message.role == "assistant"]
+    mensajes_assistant = [message for message in messages.data if message.role == "assistant"]
     mensajes_texto = []
 
     for message in mensajes_assistant:
@@ -293,7 +301,7 @@ def mostrar_mensajes_assistant(messages):
                             print(f"Annotation Text: {annotation.text}")
                             if hasattr(annotation, 'file_path') and hasattr(annotation.file_path, 'file_id'):
                                 print(f"File_Id: {annotation.file_path.file_id}")
-                                annotation_data = client.files.content(annotation.file_path.file_id)
+                                annotation_data = await aclient.files.content(annotation.file_path.file_id)
                                 annotation_data_bytes = annotation_data.read()
 
                                 filename = annotation.text.split('/')[-1]
@@ -319,8 +327,8 @@ def obtener_prompt(messages):
             return(content_item.text.value)
 
 async def obtener_feedback(assistant_id, archivo, prompt):
-    archivo = client.files.create(file=archivo, purpose='assistants')
-    thread = client.beta.threads.create(
+    archivo = await aclient.files.create(file=archivo, purpose='assistants')
+    thread = await aclient.beta.threads.create(
         messages=[
             {
                 "role": "user",
@@ -334,25 +342,15 @@ async def obtener_feedback(assistant_id, archivo, prompt):
             }
         ]
     )
-    run = client.beta.threads.runs.create(
-        thread_id=thread.id,
-        assistant_id=assistant_id
-    )
-    
-    while run.status not in ["completed", "failed"]:
-        run = client.beta.threads.runs.retrieve(
-            thread_id=thread.id,
-            run_id=run.id
-        )
-        print(run.status)
-        await asyncio.sleep(1)  # Use asyncio.sleep to not block the event loop
+    resultado = await ejecutar_run(thread.id, assistant_id, nombre_fase="feedback_archivo")
+    print(resultado["status"])
 
-    messages = client.beta.threads.messages.list(
+    messages = await aclient.beta.threads.messages.list(
         thread_id=thread.id,
     )
     id = archivo.id
     #client.files.delete(archivo.id) ahora se borra al borrar la actividad pero se podria eliminar altok
-    return mostrar_mensajes_assistant(messages), id
+    return await mostrar_mensajes_assistant(messages), id
 
 # Para ejecutar la función asincrónica desde un contexto sincrónico
 def obtener_feedback_sync(archivo, prompt):
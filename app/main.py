@@ -44,11 +44,11 @@ from email.mime.text import MIMEText
 from email.mime.image import MIMEImage
 from email.mime.multipart import MIMEMultipart
 
-from fastapi.responses import JSONResponse, HTMLResponse
+from fastapi.responses import JSONResponse, HTMLResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi import (
     FastAPI, HTTPException, Request, Depends, Response,
-    UploadFile, File, Form, BackgroundTasks
+    UploadFile, File, Form, BackgroundTasks, Query
 )
 from psycopg2.extras import RealDictCursor
 
@@ -60,6 +60,30 @@ from googleapiclient.http import MediaIoBaseUpload
 # 2) Imports internos del proyecto
 # =========================
 from .gpt_api import *               # si lo usas aquí
+from .services.openai_cliente import aclient, cerrar_aclient
+from .services.trabajos import cola_trabajos
+from .services.pool_bd import pool_bd
+from .services.repositorio import repositorio
+from .services.migraciones import MIGRAR_AL_INICIAR, migraciones
+from .services.escucha_bd import escucha_bd
+from .services.cache_metadatos import cache_metadatos
+from .services.planificador_actividades import planificador_actividades
+from .services.notificaciones_push import notificaciones_push
+from .services.borrado_cascada import borrar_en_cascada, borrar_recursos
+from .services.materiales_estudio import estado_material, guardar_material, obtener_material
+from .services.planificacion_json import (
+    IDENTIFICACION_CLASE, SQL_EVALUACION_FORMATIVA, leer_campos, sql_planificacion,
+)
+from .services.recursos_openai import recursos_openai
+from .services.reconciliar_recursos import REFERENCIAS, reconciliar_recursos
+from .services.paginacion import PAGINA_MAXIMA, Columna, exportar_ndjson, leer_cursor, orden_sql, paginar
+from .services.lecturas_json import (
+    SQL_EVALUACION_PREGUNTAS, SQL_EXPORTAR_USUARIOS_CON_CURSOS, SQL_PREGUNTAS_ALUMNO,
+    SQL_USUARIOS_CON_CURSOS, SQL_USUARIOS_CON_CURSOS_IDS, envolver_json, respuesta_json,
+)
+from .services.extractor_json import extraer_json, reparar_json
+from .services.esquemas import ESQUEMAS, metricas_rechazo, validar_esquema
+from .services.grafo_mapa import analizar_mapa, tiene_ciclo
 from .autenticacion import login
 from .services.google_drive_oauth import GoogleDriveOAuth
 from api import router as api_router
@@ -70,6 +94,35 @@ from api import router as api_router
 app = FastAPI()
 app.include_router(api_router, prefix="/api")
 
+
+@app.on_event("startup")
+async def aplicar_migraciones():
+    if not MIGRAR_AL_INICIAR:
+        return
+    try:
+        await asyncio.to_thread(migraciones.aplicar)
+    except Exception as e:
+        # Sin migrar el servidor igual arranca (las tablas existentes siguen sirviendo)
+        print(f"❌ Error aplicando migraciones: {e}")
+
+
+@app.on_event("startup")
+async def iniciar_cola_trabajos():
+    await cola_trabajos.iniciar()
+    planificador_actividades.iniciar()
+    recursos_openai.iniciar()
+    escucha_bd.iniciar()
+
+
+@app.on_event("shutdown")
+async def cerrar_clientes_openai():
+    await cola_trabajos.detener()
+    await planificador_actividades.detener()
+    await recursos_openai.detener()
+    escucha_bd.detener()
+    await cerrar_aclient()
+    pool_bd.cerrar()
+
 # =========================
 # 4) Modelos (ANTES de endpoints)
 # =========================
@@ -136,12 +189,14 @@ app.add_middleware(
 )
 
 # =========================
-# 8) DB helper
+# 8) DB helper (pool de conexiones: conn.close() devuelve la conexión)
 # =========================
+pool_bd.configurar(DATABASE_URL)
+escucha_bd.configurar(pool_bd.conectar_directo)
+
+
 def connect_db():
-    if not DATABASE_URL:
-        raise RuntimeError("DATABASE_URL no configurada")
-    return psycopg2.connect(DATABASE_URL, cursor_factory=RealDictCursor)
+    return pool_bd.conectar()
 
 is_local = os.getenv("IS_LOCAL", "1") == "1"
 
@@ -202,10 +257,19 @@ async def subir_a_drive(
 
 @app.get("/health")
 def health():
-    return {"status": "ok"}
+    return {
+        "status": "ok",
+        "pool_bd": pool_bd.estadisticas(),
+        "repositorio": repositorio.estadisticas(),
+        "cache_metadatos": cache_metadatos.estadisticas(),
+        "escucha_bd": escucha_bd.estadisticas(),
+        "planificador_actividades": planificador_actividades.estadisticas(),
+        "notificaciones_push": notificaciones_push.estadisticas(),
+        "recursos_openai": recursos_openai.estadisticas(),
+    }
 # ==========================
 @app.get("/api/test-drive")
-async def test_drive():
+def test_drive():
     try:
         if not drive_service:
             return {"success": False, "error": "Servicio de Drive no inicializado"}
@@ -224,14 +288,14 @@ async def test_drive():
 
 
 @app.get("/api/drive-status")
-async def drive_status():
+def drive_status():
     return {"service_available": drive_service is not None, "timestamp": datetime.now().isoformat()}
 
 
 #########################
 # Ruta para crear un nuevo usuario
 @app.post("/registro")
-async def crear_usuario(usuario: UsuarioCreate):
+def crear_usuario(usuario: UsuarioCreate):
     try:
         conn = connect_db()
         cursor = conn.cursor()
@@ -271,20 +335,13 @@ async def update_profile(user_id: int, request: Request):
     numero_cel = data.get('numero_cel')
 
     try:
-        conn = connect_db()
-        cursor = conn.cursor()
-
         # Consulta para actualizar los datos del usuario
         update_query = """
             UPDATE usuario
             SET direccion = %s, numero_cel = %s
             WHERE id = %s
         """
-        cursor.execute(update_query, (direccion, numero_cel, user_id))
-
-        conn.commit()
-        cursor.close()
-        conn.close()
+        await repositorio.ejecutar(update_query, (direccion, numero_cel, user_id))
 
         return {"message": "Perfil actualizado exitosamente"}
 
@@ -306,7 +363,7 @@ async def get_user_id(request: Request):
 from fastapi.responses import JSONResponse
 
 @app.post("/login")
-async def user_login(body: LoginBody):
+def user_login(body: LoginBody):
     user = login(body.correo, body.clave)
 
     IS_PROD = os.getenv("ENV") == "prod"
@@ -338,21 +395,13 @@ async def get_current_user(request: Request):
 @app.get("/usuario/{user_id}/cursos")
 async def get_user_courses(user_id: int):
     try:
-        conn = connect_db()
-        cursor = conn.cursor()
-
-        
         # Consulta para obtener los cursos en los que está inscrito el usuario
-        cursor.execute("""
+        cursos = await repositorio.todos("""
             SELECT c.id, c.nombre 
             FROM curso c 
             JOIN usuario_curso uc ON c.id = uc.id_curso 
             WHERE uc.id_usuario = %s
         """, (user_id,))
-        cursos = cursor.fetchall()
-        
-        cursor.close()
-        conn.close()
         
         return cursos
     
@@ -364,16 +413,10 @@ async def get_user_courses(user_id: int):
 @app.get("/curso/{curso_id}/nombre")
 async def get_curso_nombre(curso_id: int):
     try:
-        conn = connect_db()
-        cursor = conn.cursor()
-
-        
-        # Obtener el nombre del curso
-        cursor.execute("SELECT nombre FROM curso WHERE id = %s", (curso_id,))
-        curso = cursor.fetchone()
-        
-        cursor.close()
-        conn.close()
+        # Obtener el nombre del curso (cache de metadatos)
+        curso = await cache_metadatos.obtener(
+            "curso", curso_id, lambda: repositorio.uno("SELECT nombre FROM curso WHERE id = %s", (curso_id,))
+        )
         
         if not curso:
             raise HTTPException(status_code=404, detail="Curso no encontrado")
@@ -388,16 +431,10 @@ async def get_curso_nombre(curso_id: int):
 @app.get("/curso-profesor/{curso_id}/nombre")
 async def get_curso_profesor_nombre(curso_id: int):
     try:
-        conn = connect_db()
-        cursor = conn.cursor()
-
-        
-        # Obtener el nombre del curso
-        cursor.execute("SELECT nombre FROM curso WHERE id = %s", (curso_id,))
-        curso = cursor.fetchone()
-        
-        cursor.close()
-        conn.close()
+        # Obtener el nombre del curso (cache de metadatos)
+        curso = await cache_metadatos.obtener(
+            "curso", curso_id, lambda: repositorio.uno("SELECT nombre FROM curso WHERE id = %s", (curso_id,))
+        )
         
         if not curso:
             raise HTTPException(status_code=404, detail="Curso no encontrado")
@@ -412,16 +449,10 @@ async def get_curso_profesor_nombre(curso_id: int):
 @app.get("/curso/{curso_id}/unidades")
 async def get_unidades_curso_alumno(curso_id: int):
     try:
-        conn = connect_db()
-        cursor = conn.cursor()
-
-        
-        # Obtener las unidades asociadas al curso
-        cursor.execute("SELECT id, nombre FROM unidad WHERE id_curso = %s", (curso_id,))
-        unidades = cursor.fetchall()
-        
-        cursor.close()
-        conn.close()
+        # Obtener las unidades asociadas al curso (cache de metadatos)
+        unidades = await cache_metadatos.obtener(
+            "unidades_curso", curso_id, lambda: repositorio.todos("SELECT id, nombre FROM unidad WHERE id_curso = %s", (curso_id,))
+        )
         
         # Retornar las unidades asociadas al curso
         return {"unidades": unidades}
@@ -434,16 +465,10 @@ async def get_unidades_curso_alumno(curso_id: int):
 @app.get("/curso-profesor/{curso_id}/unidades")
 async def get_unidades_curso_profesor(curso_id: int):
     try:
-        conn = connect_db()
-        cursor = conn.cursor()
-
-        
-        # Obtener las unidades asociadas al curso
-        cursor.execute("SELECT id, nombre FROM unidad WHERE id_curso = %s", (curso_id,))
-        unidades = cursor.fetchall()
-        
-        cursor.close()
-        conn.close()
+        # Obtener las unidades asociadas al curso (cache de metadatos)
+        unidades = await cache_metadatos.obtener(
+            "unidades_curso", curso_id, lambda: repositorio.todos("SELECT id, nombre FROM unidad WHERE id_curso = %s", (curso_id,))
+        )
         
         # Retornar las unidades asociadas al curso
         return {"unidades": unidades}
@@ -454,6 +479,31 @@ async def get_unidades_curso_profesor(curso_id: int):
 
 from app.services.openai_assistants import create_assistant_fn, create_vector_fn
 
+def _insertar_curso(cursor, nombre_curso, id_usuario, assistant_id, vector_id):
+    cursor.execute(
+        "INSERT INTO curso (nombre) VALUES (%s) RETURNING id",
+        (nombre_curso,)
+    )
+    curso_id = cursor.fetchone()["id"]
+
+    cursor.execute(
+        """
+        INSERT INTO unidad (nombre, id_curso, assistant_id, vector_id)
+        VALUES (%s, %s, %s, %s)
+        """,
+        ('Unidad 1', curso_id, assistant_id, vector_id)
+    )
+
+    cursor.execute(
+        """
+        INSERT INTO usuario_curso (id_usuario, id_curso)
+        VALUES (%s, %s)
+        """,
+        (id_usuario, curso_id)
+    )
+    return curso_id
+
+
 @app.post("/curso")
 async def crear_curso(request: Request):
     data = await request.json()
@@ -479,44 +529,17 @@ async def crear_curso(request: Request):
         raise HTTPException(status_code=500, detail=f"Error al crear vector: {e}")
     #------
 
-    try:
-        conn = connect_db()
-        cursor = conn.cursor()
-
-        cursor.execute(
-            "INSERT INTO curso (nombre) VALUES (%s) RETURNING id",
-            (nombre_curso,)
-        )
-        curso_id = cursor.fetchone()["id"]
-
-        cursor.execute(
-            """
-            INSERT INTO unidad (nombre, id_curso, assistant_id, vector_id)
-            VALUES (%s, %s, %s, %s)
-            """,
-            ('Unidad 1', curso_id, assistant_id, vector_id)
-        )
-
-        cursor.execute(
-            """
-            INSERT INTO usuario_curso (id_usuario, id_curso)
-            VALUES (%s, %s)
-            """,
-            (id_usuario, curso_id)
-        )
+    curso_id = await repositorio.transaccion(_insertar_curso, nombre_curso, id_usuario, assistant_id, vector_id)
+    return JSONResponse(
+        status_code=200,
+        content={"message": "Curso creado exitosamente", "curso_id": curso_id}
+    )
 
-        conn.commit()
-        return JSONResponse(
-            status_code=200,
-            content={"message": "Curso creado exitosamente", "curso_id": curso_id}
-        )
 
-    finally:
-        try:
-            cursor.close()
-            conn.close()
-        except:
-            pass
+def _renombrar(cursor, tipo, id_, nombre):
+    """UPDATE del nombre de un curso o unidad y aviso al cache de metadatos."""
+    cursor.execute(f"UPDATE {tipo} SET nombre = %s WHERE id = %s", (nombre, id_))
+    cache_metadatos.publicar({"tipo": tipo, "id": id_}, cursor)
 
 
 # Nueva ruta para actualizar el nombre del curso
@@ -529,15 +552,8 @@ async def actualizar_curso(curso_id: int, request: Request):
         raise HTTPException(status_code=400, detail="El nombre del curso es requerido")
 
     try:
-        conn = connect_db()
-        cursor = conn.cursor()
-
         # Actualizar el nombre del curso
-        cursor.execute("UPDATE curso SET nombre = %s WHERE id = %s", (nuevo_nombre, curso_id))
-
-        conn.commit()
-        cursor.close()
-        conn.close()
+        await repositorio.transaccion(_renombrar, "curso", curso_id, nuevo_nombre)
 
         return JSONResponse(status_code=200, content={"message": "Curso actualizado exitosamente"})
 
@@ -550,13 +566,8 @@ async def actualizar_curso(curso_id: int, request: Request):
 @app.get("/unidad/{unidad_id}/actividades")
 async def get_actividades_por_unidad(unidad_id: int):
     try:
-        conn = connect_db()
-        cursor = conn.cursor()
-
-        
         # Consulta para obtener las actividades de la unidad especificada
-        cursor.execute("SELECT id, titulo, descripcion, estado, fecha_inicio, fecha_cierre, hora_inicio, hora_cierre FROM actividad WHERE id_unidad = %s", (unidad_id,))
-        actividades = cursor.fetchall()
+        actividades = await repositorio.todos("SELECT id, titulo, descripcion, estado, fecha_inicio, fecha_cierre, hora_inicio, hora_cierre FROM actividad WHERE id_unidad = %s", (unidad_id,))
         
         # Formatear la hora_cierre
         for actividad in actividades:
@@ -575,9 +586,6 @@ async def get_actividades_por_unidad(unidad_id: int):
                 seconds = int(seconds % 60)
                 actividad['hora_inicio'] = f"{hours:02}:{minutes:02}:{seconds:02}"
 
-        cursor.close()
-        conn.close()
-        
         # Verificar si se encontraron actividades
         if not actividades:
             return {"message": "No se encontraron actividades para la unidad especificada"}
@@ -589,12 +597,9 @@ async def get_actividades_por_unidad(unidad_id: int):
     except Exception as e:
         print(f"Error al obtener actividades por unidad: {e}")
         raise HTTPException(status_code=500, detail="Error interno del servidor")
-from app.services.openai_assistants import delete_assistant_fn, delete_vector_fn
-
-# Ruta para eliminar un curso
 # Ruta para eliminar un curso
 @app.delete("/curso/{curso_id}")
-async def eliminar_curso(curso_id: int):
+def eliminar_curso(curso_id: int):
     conn = None
     cursor = None
 
@@ -602,49 +607,21 @@ async def eliminar_curso(curso_id: int):
         conn = connect_db()
         cursor = conn.cursor()
 
-        # Obtener todas las unidades vinculadas a este curso
-        cursor.execute(
-            "SELECT id, assistant_id, vector_id FROM unidad WHERE id_curso = %s",
-            (curso_id,)
-        )
-        unidades = cursor.fetchall()
-
-        # Recorre todas las unidades vinculadas para eliminar sus asistentes y vectores
-        for unidad in unidades:
-            # soporta cursor que devuelve tuplas o dicts
-            if isinstance(unidad, dict):
-                unidad_id = unidad.get("id")
-                assistant_id = unidad.get("assistant_id")
-                vector_id = unidad.get("vector_id")
-            else:
-                unidad_id, assistant_id, vector_id = unidad
-
-            # Eliminar el asistente asociado (SIN HTTP)
-            if assistant_id:
-                try:
-                    await delete_assistant_fn(assistant_id)
-                    print(f"Asistente {assistant_id} eliminado correctamente")
-                except Exception as e:
-                    print(f"Error al eliminar el asistente {assistant_id}: {e}")
-
-            # Eliminar el vector asociado (SIN HTTP)
-            if vector_id:
-                try:
-                    await delete_vector_fn(vector_id)
-                    print(f"Vector {vector_id} eliminado correctamente")
-                except Exception as e:
-                    print(f"Error al eliminar el vector {vector_id}: {e}")
-
-        # Eliminar todas las unidades vinculadas al curso
-        cursor.execute("DELETE FROM unidad WHERE id_curso = %s", (curso_id,))
-
-        # Eliminar el curso de la tabla curso
-        cursor.execute("DELETE FROM curso WHERE id = %s", (curso_id,))
+        # Curso, inscripciones, unidades y todo lo que cuelga de ellas en una
+        # transacción; los asistentes y vectores de OpenAI quedan encolados
+        # y se borran en segundo plano después del commit
+        borrado = borrar_en_cascada(cursor, "curso", curso_id)
+        cache_metadatos.publicar({"tipo": "curso", "id": curso_id}, cursor)
 
         conn.commit()
         return JSONResponse(
             status_code=200,
-            content={"message": "Curso y sus datos vinculados eliminados correctamente"}
+            content={
+                "message": "Curso y sus datos vinculados eliminados correctamente",
+                "filas_eliminadas": borrado["filas"],
+                "recursos_en_cola": borrado["recursos"],
+                "trabajo_id": borrado["trabajo_id"],
+            }
         )
 
     except Exception as e:
@@ -664,6 +641,21 @@ async def eliminar_curso(curso_id: int):
 
 from app.services.openai_assistants import create_assistant_fn, create_vector_fn
 
+def _insertar_unidad(cursor, nombre_unidad, curso_id, assistant_id, vector_id):
+    cursor.execute(
+        """
+        INSERT INTO unidad (nombre, id_curso, assistant_id, vector_id)
+        VALUES (%s, %s, %s, %s)
+        RETURNING id
+        """,
+        (nombre_unidad, curso_id, assistant_id, vector_id)
+    )
+
+    unidad_id = cursor.fetchone()["id"]
+    cache_metadatos.publicar({"tipo": "unidad", "id": unidad_id, "curso": curso_id}, cursor)
+    return unidad_id
+
+
 @app.post("/curso/{curso_id}/unidad")
 async def crear_unidad(curso_id: int, request: Request):
     data = await request.json()
@@ -687,38 +679,16 @@ async def crear_unidad(curso_id: int, request: Request):
         raise HTTPException(status_code=500, detail=f"Error creando vector: {e}")
     # ------
 
-    try:
-        conn = connect_db()
-        cursor = conn.cursor()
-
-        cursor.execute(
-            """
-            INSERT INTO unidad (nombre, id_curso, assistant_id, vector_id)
-            VALUES (%s, %s, %s, %s)
-            RETURNING id
-            """,
-            (nombre_unidad, curso_id, assistant_id, vector_id)
-        )
-
-        unidad_id = cursor.fetchone()["id"]
-
-        conn.commit()
-        return JSONResponse(
-            status_code=201,
-            content={
-                "message": "Unidad creada exitosamente",
-                "unidad_id": unidad_id,
-                "assistant_id": assistant_id,
-                "vector_id": vector_id,
-            }
-        )
-
-    finally:
-        try:
-            cursor.close()
-            conn.close()
-        except:
-            pass
+    unidad_id = await repositorio.transaccion(_insertar_unidad, nombre_unidad, curso_id, assistant_id, vector_id)
+    return JSONResponse(
+        status_code=201,
+        content={
+            "message": "Unidad creada exitosamente",
+            "unidad_id": unidad_id,
+            "assistant_id": assistant_id,
+            "vector_id": vector_id,
+        }
+    )
 
 
 # Ruta para actualizar el nombre de una unidad
@@ -731,15 +701,8 @@ async def actualizar_nombre_unidad(unidad_id: int, request: Request):
         raise HTTPException(status_code=400, detail="El nombre de la unidad es requerido")
 
     try:
-        conn = connect_db()
-        cursor = conn.cursor()
-
         # Actualizar el nombre de la unidad
-        cursor.execute("UPDATE unidad SET nombre = %s WHERE id = %s", (nuevo_nombre, unidad_id))
-
-        conn.commit()
-        cursor.close()
-        conn.close()
+        await repositorio.transaccion(_renombrar, "unidad", unidad_id, nuevo_nombre)
 
         return JSONResponse(status_code=200, content={"message": "Nombre de la unidad actualizado exitosamente"})
 
@@ -757,15 +720,8 @@ async def actualizar_nombre_unidad(unidad_id: int, request: Request):
         raise HTTPException(status_code=400, detail="El nombre de la unidad es requerido")
 
     try:
-        conn = connect_db()
-        cursor = conn.cursor()
-
         # Actualizar el nombre de la unidad
-        cursor.execute("UPDATE unidad SET nombre = %s WHERE id = %s", (nuevo_nombre, unidad_id))
-
-        conn.commit()
-        cursor.close()
-        conn.close()
+        await repositorio.transaccion(_renombrar, "unidad", unidad_id, nuevo_nombre)
 
         return JSONResponse(status_code=200, content={"message": "Nombre de la unidad actualizado exitosamente"})
 
@@ -774,10 +730,8 @@ async def actualizar_nombre_unidad(unidad_id: int, request: Request):
         raise HTTPException(status_code=500, detail="Error interno del servidor")
     
 
-from app.services.openai_assistants import delete_assistant_fn, delete_vector_fn
-
 @app.delete("/unidad/{unidad_id}")
-async def eliminar_unidad(unidad_id: int):
+def eliminar_unidad(unidad_id: int):
     conn = None
     cursor = None
 
@@ -785,46 +739,24 @@ async def eliminar_unidad(unidad_id: int):
         conn = connect_db()
         cursor = conn.cursor()
 
-        # Obtener assistant_id y vector_id
-        cursor.execute(
-            "SELECT assistant_id, vector_id FROM unidad WHERE id = %s",
-            (unidad_id,)
-        )
-        result = cursor.fetchone()
+        # Unidad, actividades, corpus, evaluaciones, foros y guiones en una
+        # transacción; sus recursos de OpenAI se borran en segundo plano
+        borrado = borrar_en_cascada(cursor, "unidad", unidad_id)
 
-        if not result:
+        if not borrado["filas"]:
             return JSONResponse(status_code=404, content={"message": "Unidad no encontrada"})
 
-        # soporta dict o tupla
-        if isinstance(result, dict):
-            assistant_id = result.get("assistant_id")
-            vector_id = result.get("vector_id")
-        else:
-            assistant_id, vector_id = result
-
-        # Eliminar el asistente (SIN HTTP)
-        if assistant_id:
-            try:
-                await delete_assistant_fn(assistant_id)
-                print(f"Asistente {assistant_id} eliminado correctamente")
-            except Exception as e:
-                print(f"Error al eliminar el asistente {assistant_id}: {e}")
-
-        # Eliminar el vector (SIN HTTP)
-        if vector_id:
-            try:
-                await delete_vector_fn(vector_id)
-                print(f"Vector {vector_id} eliminado correctamente")
-            except Exception as e:
-                print(f"Error al eliminar el vector {vector_id}: {e}")
-
-        # Eliminar la unidad (y cascada si aplica)
-        cursor.execute("DELETE FROM unidad WHERE id = %s", (unidad_id,))
+        cache_metadatos.publicar({"tipo": "unidad", "id": unidad_id}, cursor)
         conn.commit()
 
         return JSONResponse(
             status_code=200,
-            content={"message": "Unidad, actividades, asistente, y vector eliminados correctamente"}
+            content={
+                "message": "Unidad, actividades, asistente, y vector eliminados correctamente",
+                "filas_eliminadas": borrado["filas"],
+                "recursos_en_cola": borrado["recursos"],
+                "trabajo_id": borrado["trabajo_id"],
+            }
         )
 
     except Exception as e:
@@ -842,6 +774,28 @@ async def eliminar_unidad(unidad_id: int):
         except:
             pass
 
+def _insertar_actividad(cursor, unidad_id, titulo, descripcion, estado,
+                        fecha_inicio, fecha_cierre, hora_inicio, hora_cierre, requerimientos_json):
+    cursor.execute(
+        """
+        INSERT INTO actividad (
+            titulo, descripcion, id_unidad, estado,
+            fecha_inicio, fecha_cierre, hora_inicio, hora_cierre, requerimientos
+        )
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+        RETURNING id
+        """,
+        (
+            titulo, descripcion, unidad_id, estado,
+            fecha_inicio, fecha_cierre, hora_inicio, hora_cierre, requerimientos_json
+        )
+    )
+
+    actividad_id = cursor.fetchone()["id"]
+    planificador_actividades.publicar(actividad_id, cursor)
+    return actividad_id
+
+
 # Ruta para crear una nueva actividad en una unidad específica
 # Ruta para crear una nueva actividad en una unidad específica con un archivo PDF
 @app.post("/unidad/{unidad_id}/actividad")
@@ -857,10 +811,11 @@ async def crear_actividad(unidad_id: int, titulo: str = Form(...), descripcion:
     archivo_pdf_bytes = await archivo_pdf.read()
 
     # Extraer el texto del PDF directamente desde los bytes del archivo
-    texto_pdf = extract_text_from_pdf(archivo_pdf_bytes)
+    texto_pdf = await asyncio.to_thread(extract_text_from_pdf, archivo_pdf_bytes)
 
     # Enviar el texto extraído al modelo GPT para obtener los requerimientos
-    requerimientos_text = req_desafio_to_json(texto_pdf)
+    # (cliente síncrono: en un hilo para no frenar el loop mientras responde)
+    requerimientos_text = await asyncio.to_thread(req_desafio_to_json, texto_pdf)
 
     # Procesar el texto devuelto para extraer solo el JSON
     try:
@@ -879,43 +834,24 @@ async def crear_actividad(unidad_id: int, titulo: str = Form(...), descripcion:
 
 
     # Insertar en la base de datos
-    try:
-        conn = connect_db()
-        cursor = conn.cursor()
-
-        cursor.execute(
-            """
-            INSERT INTO actividad (
-                titulo, descripcion, id_unidad, estado,
-                fecha_inicio, fecha_cierre, hora_inicio, hora_cierre, requerimientos
-            )
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-            RETURNING id
-            """,
-            (
-                titulo, descripcion, unidad_id, estado,
-                fecha_inicio, fecha_cierre, hora_inicio, hora_cierre, requerimientos_json
-            )
-        )
-
-        actividad_id = cursor.fetchone()["id"]
+    actividad_id = await repositorio.transaccion(
+        _insertar_actividad, unidad_id, titulo, descripcion, estado,
+        fecha_inicio, fecha_cierre, hora_inicio, hora_cierre, requerimientos_json
+    )
+    return JSONResponse(
+        status_code=201,
+        content={"message": "Actividad creada exitosamente", "actividad_id": actividad_id}
+    )
+  
 
-        conn.commit()
-        return JSONResponse(
-            status_code=201,
-            content={"message": "Actividad creada exitosamente", "actividad_id": actividad_id}
-        )
 
-    finally:
-        try:
-            cursor.close()
-            conn.close()
-        except:
-            pass
-  
 
 
 
+def _actualizar_actividad(cursor, actividad_id, titulo, descripcion, estado):
+    cursor.execute("UPDATE actividad SET titulo = %s, descripcion = %s, estado = %s WHERE id = %s", (titulo, descripcion, estado, actividad_id))
+    # El estado decide si la actividad todavía se abre o se cierra sola
+    planificador_actividades.publicar(actividad_id, cursor)
 
 
 # Ruta para actualizar una actividad
@@ -930,15 +866,8 @@ async def actualizar_actividad(actividad_id: int, request: Request):
         raise HTTPException(status_code=400, detail="Se requieren tanto título como descripción para actualizar una actividad")
 
     try:
-        conn = connect_db()
-        cursor = conn.cursor()
-
         # Actualizar la actividad en la base de datos
-        cursor.execute("UPDATE actividad SET titulo = %s, descripcion = %s, estado = %s WHERE id = %s", (nuevo_titulo, nueva_descripcion, nuevo_estado, actividad_id))
-
-        conn.commit()
-        cursor.close()
-        conn.close()
+        await repositorio.transaccion(_actualizar_actividad, actividad_id, nuevo_titulo, nueva_descripcion, nuevo_estado)
 
         return JSONResponse(status_code=200, content={"message": "Actividad actualizada exitosamente"})
 
@@ -948,13 +877,14 @@ async def actualizar_actividad(actividad_id: int, request: Request):
 
 # Ruta para eliminar una actividad
 @app.delete("/actividad/{actividad_id}")
-async def eliminar_actividad(actividad_id: int):
+def eliminar_actividad(actividad_id: int):
     try:
         conn = connect_db()
         cursor = conn.cursor()
 
         # Eliminar la actividad de la base de datos
         cursor.execute("DELETE FROM actividad WHERE id = %s", (actividad_id,))
+        planificador_actividades.publicar(actividad_id, cursor)
 
         conn.commit()
         cursor.close()
@@ -967,7 +897,7 @@ async def eliminar_actividad(actividad_id: int):
         raise HTTPException(status_code=500, detail="Error interno del servidor")
 
 @app.delete("/respuesta/{respuesta_id}")
-async def eliminar_respuesta(respuesta_id: int):
+def eliminar_respuesta(respuesta_id: int):
     try:
         conn = mysql.connector.connect(**db_config)
         cursor = conn.cursor()
@@ -989,25 +919,43 @@ async def eliminar_respuesta(respuesta_id: int):
 ###############################################################3
 #se agrega el manejo de la fecha de solicitud
 # Ruta para obtener respuestas de una actividad específica
+SELECT_RESPUESTAS_ACTIVIDAD = """
+    SELECT respuesta.id, respuesta.archivo, respuesta.feedback, respuesta.fecha, usuario.nombre AS nombre_usuario, actividad.id_unidad, unidad.id_curso
+    FROM respuesta
+    JOIN usuario ON respuesta.id_usuario = usuario.id
+    JOIN actividad ON respuesta.id_actividad = actividad.id
+    JOIN unidad ON actividad.id_unidad = unidad.id
+"""
+ORDEN_RESPUESTAS_ACTIVIDAD = (
+    Columna("usuario.nombre", "nombre_usuario", False, "text"),
+    Columna("respuesta.fecha", "fecha", True, "timestamp"),
+    Columna("respuesta.id", "id", True),
+)
+
+
 @app.get("/actividad/{actividad_id}/respuestas")
-async def get_respuestas_actividad(actividad_id: int):
+def get_respuestas_actividad(
+    actividad_id: int,
+    limite: Optional[int] = Query(None, ge=1, le=PAGINA_MAXIMA),
+    despues: Optional[str] = Query(None, alias="cursor"),
+    formato: str = Query("json", pattern="^(json|ndjson)$"),
+):
+    if formato == "ndjson":
+        return exportar_ndjson(
+            SELECT_RESPUESTAS_ACTIVIDAD + f" WHERE respuesta.id_actividad = %s ORDER BY {orden_sql(ORDEN_RESPUESTAS_ACTIVIDAD)}",
+            (actividad_id,), nombre=f"respuestas_actividad_{actividad_id}",
+        )
+    despues = leer_cursor(despues, ORDEN_RESPUESTAS_ACTIVIDAD)
     try:
         conn = connect_db()
         cursor = conn.cursor()
 
         
-        # Consulta para obtener las respuestas de la actividad, el nombre de usuario, el ID del curso y la fecha
-        cursor.execute("""
-            SELECT respuesta.id, respuesta.archivo, respuesta.feedback, respuesta.fecha, usuario.nombre AS nombre_usuario, actividad.id_unidad, unidad.id_curso
-            FROM respuesta
-            JOIN usuario ON respuesta.id_usuario = usuario.id
-            JOIN actividad ON respuesta.id_actividad = actividad.id
-            JOIN unidad ON actividad.id_unidad = unidad.id
-            WHERE respuesta.id_actividad = %s
-            ORDER BY usuario.nombre, respuesta.fecha DESC
-        """, (actividad_id,))
-        
-        respuestas = cursor.fetchall()
+        # Respuestas de la actividad con el nombre de usuario, el ID del curso y la fecha (keyset si se pagina)
+        respuestas, siguiente_cursor = paginar(
+            cursor, SELECT_RESPUESTAS_ACTIVIDAD, "respuesta.id_actividad = %s", (actividad_id,),
+            ORDEN_RESPUESTAS_ACTIVIDAD, limite, despues,
+        )
         
         # Consulta para obtener el ID del curso asociado a la actividad
         cursor.execute("""
@@ -1021,10 +969,10 @@ async def get_respuestas_actividad(actividad_id: int):
         
         # Si no se encontraron respuestas, devolver una lista vacía
         if not respuestas:
-            return {"respuestas": [], "curso_id": curso_id}
+            return {"respuestas": [], "curso_id": curso_id, "siguiente_cursor": None}
         
         # Retornar las respuestas como JSON con los nombres de usuario incluidos
-        return {"respuestas": respuestas, "curso_id": curso_id}
+        return {"respuestas": respuestas, "curso_id": curso_id, "siguiente_cursor": siguiente_cursor}
     
     except Exception as e:
         print(f"Error al obtener respuestas de la actividad: {e}")
@@ -1037,7 +985,7 @@ async def get_respuestas_actividad(actividad_id: int):
 
 ############################################################
 @app.put("/respuesta/{respuesta_id}")
-async def actualizar_feedback(respuesta_id: int, feedback: str = Form(...)):
+def actualizar_feedback(respuesta_id: int, feedback: str = Form(...)):
     try:
         conn = connect_db()
         cursor = conn.cursor()
@@ -1067,7 +1015,7 @@ async def actualizar_feedback(respuesta_id: int, feedback: str = Form(...)):
 
 
 @app.get("/unidad/{unidad_id}/corpus")
-async def get_corpus_unidad(unidad_id: int):
+def get_corpus_unidad(unidad_id: int):
     try:
         conn = connect_db()
         cursor = conn.cursor()
@@ -1113,7 +1061,7 @@ from fastapi import Query
 #############################################################################3
 # Ruta para obtener la respuesta de una actividad específica por usuario y actividad
 @app.get("/respuestas/{usuario_id}/{actividad_id}")
-async def obtener_respuestas(usuario_id: int, actividad_id: int):
+def obtener_respuestas(usuario_id: int, actividad_id: int):
     try:
         conn = connect_db()
         cursor = conn.cursor()
@@ -1145,6 +1093,25 @@ async def obtener_respuestas(usuario_id: int, actividad_id: int):
         raise HTTPException(status_code=500, detail="Error interno del servidor")
 ########################################################################################
 
+def _insertar_corpus(cursor, titulo, file_id, unidad_id, batch_id):
+    cursor.execute(
+        """
+        INSERT INTO corpus (titulo, material, id_unidad)
+        VALUES (%s, %s, %s)
+        RETURNING id
+        """,
+        (titulo, file_id, unidad_id)
+    )
+    corpus_id = cursor.fetchone()["id"]
+
+    # Actualizar la unidad con el último batch
+    cursor.execute(
+        "UPDATE unidad SET batch_id = %s WHERE id = %s",
+        (batch_id, unidad_id)
+    )
+    return corpus_id
+
+
 @app.post("/upload-and-create-assistant/{unidadId}")
 async def upload_and_create_assistant(
     unidadId: int, 
@@ -1152,25 +1119,18 @@ async def upload_and_create_assistant(
 ):
     corpus_ids = []
 
-    conn = connect_db()
-    if conn is None:
-        raise HTTPException(status_code=500, detail="Error al conectar con la base de datos")
-
-    cursor = conn.cursor()
-    
     try:
         # Obtener vector y assistant de la unidad
-        cursor.execute("SELECT vector_id, assistant_id FROM unidad WHERE id = %s", (unidadId,))
-        result = cursor.fetchone()
+        result = await repositorio.uno("SELECT vector_id, assistant_id FROM unidad WHERE id = %s", (unidadId,))
         if result is None:
             raise HTTPException(status_code=404, detail="Unidad no encontrada")
 
-        vector_store_id, assistant_id = result
+        vector_store_id, assistant_id = result["vector_id"], result["assistant_id"]
 
         print(f"🔄 Procesando {len(files)} archivos para vector store: {vector_store_id}")
         
         # ✅ VERIFICAR SI HAY ARCHIVOS EXISTENTES ANTES DE LIMPIAR
-        files_existentes = client.beta.vector_stores.files.list(vector_store_id=vector_store_id)
+        files_existentes = await aclient.beta.vector_stores.files.list(vector_store_id=vector_store_id)
         
         if len(files_existentes.data) > 0:
             print(f"🗑️ Limpiando {len(files_existentes.data)} archivos existentes...")
@@ -1190,40 +1150,16 @@ async def upload_and_create_assistant(
 
             print(f"✅ Archivo {file.filename} subido exitosamente. File ID: {file_id}")
 
-            # Insertar el corpus en la base de datos
-            cursor.execute(
-                """
-                INSERT INTO corpus (titulo, material, id_unidad)
-                VALUES (%s, %s, %s)
-                RETURNING id
-                """,
-                (file.filename, file_id, unidadId)
-            )
-            corpus_id = cursor.fetchone()["id"]
+            # Insertar el corpus y dejar en la unidad el último batch
+            corpus_id = await repositorio.transaccion(_insertar_corpus, file.filename, file_id, unidadId, batch_id)
             corpus_ids.append(corpus_id)
 
-            conn.commit()
-
-            # Actualizar la unidad con el último batch
-            cursor.execute(
-                "UPDATE unidad SET batch_id = %s WHERE id = %s",
-                (batch_id, unidadId)
-            )
-            conn.commit()
-
         # Verificar estado final
         await verificar_estado_vector_store(vector_store_id)
 
 
     except Exception as e:
-        conn.rollback()
         raise HTTPException(status_code=500, detail=f"Error al insertar en la base de datos: {e}")
-    except Exception as e:
-        conn.rollback()
-        raise HTTPException(status_code=500, detail=f"Error procesando archivos: {e}")
-    finally:
-        cursor.close()
-        conn.close()
 
     return {
         "message": "Corpus agregado exitosamente", 
@@ -1242,29 +1178,20 @@ async def agregar_respuesta(
     file: UploadFile = File(...)
 ):
     try:
-        # Conectar a la base de datos 
-        conn = connect_db()
-        if conn is None:
-            raise HTTPException(status_code=500, detail="Error al conectar con la base de datos")
-        
-        cursor = conn.cursor()
-
         # Recuperar el assistant_id usando el unidad_id
-        cursor.execute("SELECT assistant_id FROM unidad WHERE id = %s", (unidad_id,))
-        result = cursor.fetchone()
+        result = await repositorio.uno("SELECT assistant_id FROM unidad WHERE id = %s", (unidad_id,))
         if result is None:
             raise HTTPException(status_code=404, detail="Unidad no encontrada")
         
-        assistant_id = result[0]
+        assistant_id = result["assistant_id"]
 
         # Obtener la descripción de la actividad como prompt base
-        cursor.execute("SELECT requerimientos FROM actividad WHERE id = %s", (actividad_id,))
-        actividad_info = cursor.fetchone()
+        actividad_info = await repositorio.uno("SELECT requerimientos FROM actividad WHERE id = %s", (actividad_id,))
         if actividad_info is None:
             raise HTTPException(status_code=404, detail="Actividad no encontrada")
         
         # Desempaquetar el resultado de la consulta
-        requerimientos_json = actividad_info[0]
+        requerimientos_json = actividad_info["requerimientos"]
         
         # Procesar el archivo usando la función que convierte el archivo a texto
         desarrollo = await procesar_archivo_tar(file)
@@ -1275,36 +1202,25 @@ async def agregar_respuesta(
             "desarrollo": desarrollo,
         }
 
-        response = requests.post(url, data=data)
+        # requests es síncrono: en un hilo para no frenar el loop mientras responde
+        response = await asyncio.to_thread(requests.post, url, data=data)
         respuesta_texto = response.text
 
         fecha_actual = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         
         try:
-            cursor.execute(
+            await repositorio.ejecutar(
                 """
                 INSERT INTO respuesta (archivo, feedback, id_usuario, id_actividad, fecha)
                 VALUES (%s, %s, %s, %s, %s)
-                RETURNING id
                 """,
                 (file.filename, respuesta_texto, usuario_id, actividad_id, fecha_actual)
             )
 
-            respuesta_id = cursor.fetchone()["id"]
-            conn.commit()
-
         except Exception as e:
             print("Error al insertar en Postgres", e)
-            conn.rollback()
             raise HTTPException(status_code=500, detail="Error al insertar en la base de datos")
 
-        finally:
-            try:
-                cursor.close()
-                conn.close()
-            except:
-                pass
-
     except Exception as e:
         print(f"Error processing file or getting feedback: {e}")
         raise HTTPException(status_code=500, detail="Error procesando el archivo o obteniendo el feedback")
@@ -1317,23 +1233,16 @@ async def agregar_respuesta(
 @app.delete("/corpus/{corpus_id}")
 async def eliminar_corpus(corpus_id: int):
     try:
-        conn = connect_db()
-        cursor = conn.cursor()
-        cursor.execute("SELECT material FROM corpus WHERE id = %s", (corpus_id,))
-        corpus = cursor.fetchone()
+        corpus = await repositorio.uno("SELECT material FROM corpus WHERE id = %s", (corpus_id,))
         if not corpus:
             raise HTTPException(status_code=404, detail="Corpus no encontrado")
         # Imprimir el tipo y contenido de 'corpus' para depuración
         print("Tipo de 'corpus':", type(corpus))
         print("Contenido de 'corpus':", corpus)
-        file_id = corpus[0]  # Asumiendo que 'material' almacena el file_id
+        file_id = corpus["material"]  # 'material' almacena el file_id
         await eliminar_archivo(file_id)
         # Eliminar el corpus de la tabla corpus
-        cursor.execute("DELETE FROM corpus WHERE id = %s", (corpus_id,))
-
-        conn.commit()
-        cursor.close()
-        conn.close()
+        await repositorio.ejecutar("DELETE FROM corpus WHERE id = %s", (corpus_id,))
 
         return JSONResponse(status_code=200, content={"message": "Corpus eliminado correctamente"})
 
@@ -1343,31 +1252,37 @@ async def eliminar_corpus(corpus_id: int):
 ##################################################################3
 
 #################################################################
+def _actualizar_corpus(cursor, corpus_id, titulo, file_id, unidad_id, batch_id):
+    cursor.execute(
+        "UPDATE corpus SET titulo = %s, material = %s WHERE id = %s",
+        (titulo, file_id, corpus_id)
+    )
+    cursor.execute(
+        "UPDATE unidad SET batch_id = %s WHERE id = %s",
+        (batch_id, unidad_id)
+    )
+
+
 @app.put("/corpus/{corpus_id}")
 async def reemplazar_corpus(corpus_id: int, request: Request, file: UploadFile = File(...)):
     try:
         form_data = await request.form()
         unidadId = form_data.get('unidadId')
 
-        conn = connect_db()
-        cursor = conn.cursor()
-
         # Obtener file_id actual
-        cursor.execute("SELECT material FROM corpus WHERE id = %s", (corpus_id,))
-        corpus = cursor.fetchone()
+        corpus = await repositorio.uno("SELECT material FROM corpus WHERE id = %s", (corpus_id,))
         if not corpus:
             raise HTTPException(status_code=404, detail="Corpus no encontrado")
 
         # Obtener vector y assistant de unidad
-        cursor.execute("SELECT vector_id, assistant_id FROM unidad WHERE id = %s", (unidadId,))
-        result = cursor.fetchone()
+        result = await repositorio.uno("SELECT vector_id, assistant_id FROM unidad WHERE id = %s", (unidadId,))
         if not result:
             raise HTTPException(status_code=404, detail="Unidad no encontrada")
 
-        vector_store_id, assistant_id = result
+        vector_store_id, assistant_id = result["vector_id"], result["assistant_id"]
 
         # Eliminar archivo anterior
-        await eliminar_archivo(corpus[0])
+        await eliminar_archivo(corpus["material"])
 
         # Subir el nuevo
         archivo_contenido = await file.read()
@@ -1376,22 +1291,8 @@ async def reemplazar_corpus(corpus_id: int, request: Request, file: UploadFile =
         nuevo_file_id = result["file_id"]
         batch_id = result["batch_id"]
 
-        # Actualizar corpus
-        cursor.execute(
-            "UPDATE corpus SET titulo = %s, material = %s WHERE id = %s",
-            (file.filename, nuevo_file_id, corpus_id)
-        )
-        conn.commit()
-
-        # Actualizar batch en unidad
-        cursor.execute(
-            "UPDATE unidad SET batch_id = %s WHERE id = %s",
-            (batch_id, unidadId)
-        )
-        conn.commit()
-
-        cursor.close()
-        conn.close()
+        # Actualizar corpus y batch en unidad
+        await repositorio.transaccion(_actualizar_corpus, corpus_id, file.filename, nuevo_file_id, unidadId, batch_id)
 
         return JSONResponse(status_code=200, content={"message": "Corpus reemplazado correctamente", "nuevo_file_id": nuevo_file_id})
 
@@ -1406,7 +1307,7 @@ async def reemplazar_corpus(corpus_id: int, request: Request, file: UploadFile =
 ########################################
 # Ruta para eliminar el perfil del usuario
 @app.delete("/perfil/{user_id}")
-async def delete_profile(user_id: int):
+def delete_profile(user_id: int):
     try:
         conn = connect_db()
         cursor = conn.cursor()
@@ -1414,6 +1315,7 @@ async def delete_profile(user_id: int):
         # Consulta para eliminar el usuario de la base de datos
         delete_query = "DELETE FROM usuario WHERE id = %s"
         cursor.execute(delete_query, (user_id,))
+        cache_metadatos.publicar({"tipo": "usuarios"}, cursor)
 
         conn.commit()
         cursor.close()
@@ -1428,6 +1330,45 @@ async def delete_profile(user_id: int):
 
 
 ############################################################
+def _actualizar_feedback(cursor, respuesta_id, nuevo_feedback):
+    # Actualizar la respuesta en la base de datos
+    print(f"Actualizando respuesta en la base de datos para respuesta_id: {respuesta_id}")
+    cursor.execute("UPDATE respuesta SET feedback = %s WHERE id = %s", (nuevo_feedback, respuesta_id))
+
+    # Obtener información adicional para la notificación
+    cursor.execute("""
+        SELECT r.id_usuario, u.id_curso, a.titulo, a.id 
+        FROM respuesta r 
+        JOIN actividad a ON r.id_actividad = a.id
+        JOIN unidad u ON a.id_unidad = u.id
+        WHERE r.id = %s
+    """, (respuesta_id,))
+    result = cursor.fetchone()
+
+    # Verificar el resultado de la consulta
+    if result:
+        id_usuario = result["id_usuario"]
+        id_curso = result["id_curso"]
+        actividad_nombre = result["titulo"]
+        actividad_id = result["id"]  # Aquí se obtiene el ID de la actividad
+
+        print(f"ID del usuario: {id_usuario}, ID del curso: {id_curso}, Nombre de la actividad: {actividad_nombre}, ID de la actividad: {actividad_id}")
+
+        # Insertar notificación en la tabla notificacion
+        fecha_actual = datetime.now().date()
+        hora_actual = datetime.now().time()
+        titulo = "Actualización de feedback"
+        comentario = f"El feedback de su respuesta en la actividad '{actividad_nombre}' ha sido actualizado"
+        leido = 0
+
+        print(f"Insertando notificación para el usuario {id_usuario} en el curso {id_curso} para la actividad {actividad_nombre}")
+
+        cursor.execute("""
+            INSERT INTO notificacion (titulo, comentario, fecha, hora, leido, id_usuario, id_curso, id_actividad, id_respuesta)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+        """, (titulo, comentario, fecha_actual, hora_actual, leido, id_usuario, id_curso, actividad_id, respuesta_id))
+
+
 @app.put("/respuestas/{respuesta_id}")
 async def actualizar_respuesta(respuesta_id: int, request: Request):
     # Imprimir el ID de la respuesta y datos iniciales
@@ -1443,56 +1384,11 @@ async def actualizar_respuesta(respuesta_id: int, request: Request):
     print(f"Nuevo feedback recibido: {nuevo_feedback}")
 
     try:
-        conn = connect_db()
-        cursor = conn.cursor()
-
-        # Actualizar la respuesta en la base de datos
-        print(f"Actualizando respuesta en la base de datos para respuesta_id: {respuesta_id}")
-        cursor.execute("UPDATE respuesta SET feedback = %s WHERE id = %s", (nuevo_feedback, respuesta_id))
-        conn.commit()
-
-        # Obtener información adicional para la notificación
-        cursor.execute("""
-            SELECT r.id_usuario, u.id_curso, a.titulo, a.id 
-            FROM respuesta r 
-            JOIN actividad a ON r.id_actividad = a.id
-            JOIN unidad u ON a.id_unidad = u.id
-            WHERE r.id = %s
-        """, (respuesta_id,))
-        result = cursor.fetchone()
-
-        # Verificar el resultado de la consulta
-        if result:
-            id_usuario = result[0]
-            id_curso = result[1]
-            actividad_nombre = result[2]
-            actividad_id = result[3]  # Aquí se obtiene el ID de la actividad
-
-            print(f"ID del usuario: {id_usuario}, ID del curso: {id_curso}, Nombre de la actividad: {actividad_nombre}, ID de la actividad: {actividad_id}")
-
-            # Insertar notificación en la tabla notificacion
-            fecha_actual = datetime.now().date()
-            hora_actual = datetime.now().time()
-            titulo = "Actualización de feedback"
-            comentario = f"El feedback de su respuesta en la actividad '{actividad_nombre}' ha sido actualizado"
-            leido = 0
-
-            print(f"Insertando notificación para el usuario {id_usuario} en el curso {id_curso} para la actividad {actividad_nombre}")
-
-            cursor.execute("""
-                INSERT INTO notificacion (titulo, comentario, fecha, hora, leido, id_usuario, id_curso, id_actividad, id_respuesta)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """, (titulo, comentario, fecha_actual, hora_actual, leido, id_usuario, id_curso, actividad_id, respuesta_id))
-            conn.commit()  # Esto es crucial para aplicar los cambios en la base de datos.
+        await repositorio.transaccion(_actualizar_feedback, respuesta_id, nuevo_feedback)
     except Exception as e:
         print(f"Error al actualizar la respuesta o insertar la notificación: {e}")
         raise HTTPException(status_code=500, detail="Error interno del servidor")
 
-    finally:
-        print(f"Cerrando la conexión a la base de datos para respuesta_id: {respuesta_id}")
-        cursor.close()
-        conn.close()
-
     print(f"Respuesta y notificación actualizadas exitosamente para respuesta_id: {respuesta_id}")
     return {"message": "Respuesta y notificación actualizadas exitosamente"}
 
@@ -1516,51 +1412,12 @@ async def actualizar_respuesta(respuesta_id: int, request: Request):
     return {"message": "Assistant created and file uploaded successfully", "file_id": file_id}
 '''
 
-async def actualizar_estados_periodicamente():
-    while True:
-        now = datetime.now()
-        try:
-            conn = connect_db()
-            cursor = conn.cursor()
-
-            # Actualizar estados a 1 para actividades que están pendientes (estado 2) y cuya fecha y hora han llegado
-            cursor.execute("""
-                UPDATE actividad
-                SET estado = 1,
-                    fecha_inicio = NULL,
-                    hora_inicio = NULL
-                WHERE fecha_inicio <= %s AND hora_inicio <= %s AND estado = 2
-            """, (now.date(), now.time()))
-
-            # Actualizar estados a 3 para actividades que están activas (estado 1) y cuya fecha y hora de cierre han llegado
-            cursor.execute("""
-                UPDATE actividad
-                SET estado = 3,
-                    fecha_cierre = NULL,
-                    hora_cierre = NULL
-                WHERE fecha_cierre <= %s AND hora_cierre <= %s AND estado = 1
-            """, (now.date(), now.time()))
-
-            conn.commit()
-            cursor.close()
-            conn.close()
-
-        except Exception as e:
-            print(f"Error al actualizar estados: {e}")
-
-        # Espera 60 segundos antes de ejecutar nuevamente
-        await asyncio.sleep(60)
-
-#@app.on_event("startup")
-#async def startup_event():
-#    asyncio.create_task(actualizar_estados_periodicamente())
-
 @app.get("/")
 async def root():
     return {"message": "Servidor en ejecución"}
 
 @app.get("/unidad/{unidad_id}/evaluaciones")
-async def get_evaluaciones_por_unidad(unidad_id: int):
+def get_evaluaciones_por_unidad(unidad_id: int):
     try:
         conn = connect_db()
         cursor = conn.cursor()
@@ -1606,6 +1463,39 @@ async def get_evaluaciones_por_unidad(unidad_id: int):
         raise HTTPException(status_code=500, detail="Error interno del servidor")
 
 
+def _insertar_evaluacion(cursor, unidad_id, titulo, descripcion,
+                         preguntas_desarrollo, preguntas_alternativas, preguntas_vf,
+                         puntaje_total, versiones, dificultad, preguntas, thread_id):
+    # Insertar la evaluación
+    cursor.execute(
+        """
+        INSERT INTO evaluacion (
+            titulo, descripcion, id_unidad,
+            preguntas_desarrollo, preguntas_alternativas, preguntas_vf,
+            puntaje_total, versiones, dificultad
+        )
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+        RETURNING id
+        """,
+        (
+            titulo, descripcion, unidad_id,
+            preguntas_desarrollo, preguntas_alternativas, preguntas_vf,
+            puntaje_total, versiones, dificultad
+        )
+    )
+
+    evaluacion_id = cursor.fetchone()["id"]
+
+    # Insertar las preguntas en la base de datos
+    generar_e_insertar_preguntas_por_tipo(cursor, preguntas, evaluacion_id, puntaje=None)
+
+    # Actualizar la evaluación para incluir el thread ID
+    cursor.execute("""
+        UPDATE evaluacion SET thread = %s WHERE id = %s
+    """, (thread_id, evaluacion_id))
+    return evaluacion_id
+
+
 @app.post("/unidad/{unidad_id}/evaluacion")
 async def crear_evaluacion(unidad_id: int, request: Request):
     data = await request.json()
@@ -1634,54 +1524,20 @@ async def crear_evaluacion(unidad_id: int, request: Request):
     if curso_id in ['1', 1] and unidad_id in ['1', 1]:
         assistant_id = 'asst_pCKuTpobSzVJFnLQ5IBTrMb5'
     else:
-        # Conectar a la base de datos para obtener el assistant_id
-        conn = connect_db()
-        
-        if conn is None:
-            raise HTTPException(status_code=500, detail="Error al conectar a la base de datos")
-        cursor = conn.cursor()
-        print(conn, cursor)
+        # Consultar la base de datos para obtener el assistant_id
         try:
-            print("hola popos ")
-            cursor.execute("SELECT assistant_id FROM unidad WHERE id = %s", (unidad_id,))
-            result = cursor.fetchone()
+            result = await repositorio.uno("SELECT assistant_id FROM unidad WHERE id = %s", (unidad_id,))
             print(f"Resultado de la consulta: {result}")
             if result:
-                assistant_id = result[0]
+                assistant_id = result["assistant_id"]
             else:
                 raise HTTPException(status_code=404, detail="Curso no encontrado")
         except Exception as e:
-            print("es la coneccion culia")
             raise HTTPException(status_code=500, detail=f"Error al consultar la base de datos: {e}")
-        finally:
-            cursor.close()
-            conn.close()
     #--------------------
     try:
-        conn = connect_db()
-        cursor = conn.cursor()
-
-        # Insertar la evaluación
-        cursor.execute(
-            """
-            INSERT INTO evaluacion (
-                titulo, descripcion, id_unidad,
-                preguntas_desarrollo, preguntas_alternativas, preguntas_vf,
-                puntaje_total, versiones, dificultad
-            )
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-            RETURNING id
-            """,
-            (
-                titulo, descripcion, unidad_id,
-                preguntas_desarrollo, preguntas_alternativas, preguntas_vf,
-                puntaje_total, versiones, dificultad
-            )
-        )
-
-        evaluacion_id = cursor.fetchone()["id"]
-
-        # Llamada a la API para crear-preguntas
+        # Llamada a la API para crear-preguntas (antes de abrir la transacción:
+        # requests es síncrono y la respuesta puede tardar)
         url = f"{url_api}/crear-preguntas/{assistant_id}"
         params = {
             'vf': preguntas_vf,
@@ -1689,27 +1545,20 @@ async def crear_evaluacion(unidad_id: int, request: Request):
             'alternativas': preguntas_alternativas,
             'dificultad': dificultad
         }
-        response = requests.post(url, params=params)
-
-
-        if response.status_code == 200:
-            preguntas, thread_id = response.json()  # Ajuste aquí para capturar thread_id
-            # Insertar las preguntas en la base de datos
-            print("PREGUNTAS\n" + preguntas)
-            generar_e_insertar_preguntas_por_tipo(cursor, preguntas, evaluacion_id, puntaje=None)
-
-            # Actualizar la evaluación para incluir el thread ID
-            cursor.execute("""
-                UPDATE evaluacion SET thread = %s WHERE id = %s
-            """, (thread_id, evaluacion_id))
+        response = await asyncio.to_thread(requests.post, url, params=params)
 
-        else:
+        if response.status_code != 200:
             print(f"Error {response.status_code}: {response.text}")
             raise HTTPException(status_code=response.status_code, detail=response.text)
-        
-        conn.commit()
-        cursor.close()
-        conn.close()
+
+        preguntas, thread_id = response.json()  # Ajuste aquí para capturar thread_id
+        print("PREGUNTAS\n" + preguntas)
+
+        evaluacion_id = await repositorio.transaccion(
+            _insertar_evaluacion, unidad_id, titulo, descripcion,
+            preguntas_desarrollo, preguntas_alternativas, preguntas_vf,
+            puntaje_total, versiones, dificultad, preguntas, thread_id
+        )
 
         return JSONResponse(status_code=201, content={"message": "Evaluación creada exitosamente", "evaluacion_id": evaluacion_id})
 
@@ -1722,7 +1571,7 @@ async def crear_evaluacion(unidad_id: int, request: Request):
     
 # Ruta para eliminar una evaluacion
 @app.delete("/evaluacion/{evaluacion_id}")
-async def eliminar_evaluacion(evaluacion_id: int):
+def eliminar_evaluacion(evaluacion_id: int):
     try:
         conn = connect_db()
         cursor = conn.cursor()
@@ -1743,66 +1592,17 @@ async def eliminar_evaluacion(evaluacion_id: int):
 @app.get("/evaluacion/{evaluacion_id}/preguntas")
 async def get_evaluacion_preguntas(evaluacion_id: int):
     try:
-        conn = connect_db()
-        cursor = conn.cursor()
-
-
-        # Obtener título, descripción y versiones de la evaluación
-        cursor.execute("""
-            SELECT titulo, descripcion, versiones, thread
-            FROM evaluacion
-            WHERE id = %s
-        """, (evaluacion_id,))
-        evaluacion = cursor.fetchone()
+        # Evaluación (título, descripción, versiones, thread) y sus preguntas
+        # alternativas / vf / desarrollo, en un solo documento JSON armado por Postgres
+        fila = await repositorio.uno(SQL_EVALUACION_PREGUNTAS, (evaluacion_id,))
 
-        if not evaluacion:
+        if not fila:
             raise HTTPException(status_code=404, detail="Evaluación no encontrada")
 
-        # Obtener preguntas alternativas
-        cursor.execute("""
-            SELECT 'alternativa' AS tipo, id, enunciado, respuesta_a, respuesta_b, respuesta_c, 
-                respuesta_d, respuesta_e, correcta, puntaje
-            FROM alternativas
-            WHERE id_evaluacion = %s
-        """, (evaluacion_id,))
-        alternativas = cursor.fetchall()
-
-        # Obtener preguntas de verdadero/falso
-        cursor.execute("""
-            SELECT 'vf' AS tipo, id, enunciado, correcta, puntaje
-            FROM vf
-            WHERE id_evaluacion = %s
-        """, (evaluacion_id,))
-        vf_preguntas = cursor.fetchall()
-
-        # Obtener preguntas de desarrollo
-        cursor.execute("""
-            SELECT 'desarrollo' AS tipo, id, enunciado, respuesta, puntaje
-            FROM desarrollo
-            WHERE id_evaluacion = %s
-        """, (evaluacion_id,))
-        desarrollo_preguntas = cursor.fetchall()
-
-        # Agrupar todas las preguntas y la información de la evaluación
-        resultado = {
-            "evaluacion": {
-                "titulo": evaluacion["titulo"],
-                "descripcion": evaluacion["descripcion"],
-                "versiones": str(evaluacion["versiones"]) if evaluacion["versiones"] else "" , # Convertir a string vacío si versiones es None o 0
-                "thread": evaluacion["thread"],  # Ajustar aquí para incluir el thread ID         
-            },
-            "preguntas": {
-                "alternativas": alternativas,
-                "vf": vf_preguntas,
-                "desarrollo": desarrollo_preguntas
-            }
-        }
-
-        cursor.close()
-        conn.close()
-
-        return resultado
+        return respuesta_json(fila["json"])
 
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error al obtener preguntas de la evaluación: {e}")
         raise HTTPException(status_code=500, detail="Error interno del servidor")
@@ -1810,7 +1610,7 @@ async def get_evaluacion_preguntas(evaluacion_id: int):
 
 # Ruta para eliminar una pregunta de alternativas
 @app.delete("/pregunta/alternativa/{pregunta_id}")
-async def eliminar_pregunta_alternativa(pregunta_id: int):
+def eliminar_pregunta_alternativa(pregunta_id: int):
     try:
         conn = connect_db()
         cursor = conn.cursor()
@@ -1825,7 +1625,7 @@ async def eliminar_pregunta_alternativa(pregunta_id: int):
 
 # Ruta para eliminar una pregunta de Verdadero/Falso
 @app.delete("/pregunta/vf/{pregunta_id}")
-async def eliminar_pregunta_vf(pregunta_id: int):
+def eliminar_pregunta_vf(pregunta_id: int):
     try:
         conn = connect_db()
         cursor = conn.cursor()
@@ -1840,7 +1640,7 @@ async def eliminar_pregunta_vf(pregunta_id: int):
 
 # Ruta para eliminar una pregunta de desarrollo
 @app.delete("/pregunta/desarrollo/{pregunta_id}")
-async def eliminar_pregunta_desarrollo(pregunta_id: int):
+def eliminar_pregunta_desarrollo(pregunta_id: int):
     try:
         conn = connect_db()
         cursor = conn.cursor()
@@ -1854,7 +1654,7 @@ async def eliminar_pregunta_desarrollo(pregunta_id: int):
         raise HTTPException(status_code=500, detail="Error interno del servidor")
 
 @app.put("/alternativa/{pregunta_id}")
-async def actualizar_alternativa(pregunta_id: int, pregunta: dict):
+def actualizar_alternativa(pregunta_id: int, pregunta: dict):
     try:
         conn = connect_db()
         cursor = conn.cursor()
@@ -1879,7 +1679,7 @@ async def actualizar_alternativa(pregunta_id: int, pregunta: dict):
         raise HTTPException(status_code=500, detail="Error interno del servidor")
 
 @app.put("/vf/{pregunta_id}")
-async def actualizar_vf(pregunta_id: int, pregunta: dict):
+def actualizar_vf(pregunta_id: int, pregunta: dict):
     try:
         conn = connect_db()
         cursor = conn.cursor()
@@ -1899,7 +1699,7 @@ async def actualizar_vf(pregunta_id: int, pregunta: dict):
         print(f"Error al actualizar pregunta de verdadero/falso: {e}")
         raise HTTPException(status_code=500, detail="Error interno del servidor")
 @app.put("/desarrollo/{pregunta_id}")
-async def actualizar_desarrollo(pregunta_id: int, pregunta: dict):
+def actualizar_desarrollo(pregunta_id: int, pregunta: dict):
     print(f"Datos de pregunta: {pregunta}")
     try:
         conn = connect_db()
@@ -1922,8 +1722,35 @@ async def actualizar_desarrollo(pregunta_id: int, pregunta: dict):
 
 
 
+SELECT_FOROS = """
+    SELECT foro.id, foro.titulo, foro.descripcion, foro.fecha, foro.hora, 
+        foro.id_usuario,
+        usuario.nombre AS nombre_usuario, 
+        usuario.tipo AS tipo_usuario
+    FROM foro
+    JOIN usuario ON foro.id_usuario = usuario.id
+"""
+# Fecha y hora más recientes primero; id desempata
+ORDEN_FOROS = (
+    Columna("foro.fecha", "fecha", True, "date"),
+    Columna("foro.hora", "hora", True, "time"),
+    Columna("foro.id", "id", True),
+)
+
+
 @app.get("/unidad/{unidad_id}/foro")
-async def get_foro_unidad(unidad_id: int):
+def get_foro_unidad(
+    unidad_id: int,
+    limite: Optional[int] = Query(None, ge=1, le=PAGINA_MAXIMA),
+    despues: Optional[str] = Query(None, alias="cursor"),
+    formato: str = Query("json", pattern="^(json|ndjson)$"),
+):
+    if formato == "ndjson":
+        return exportar_ndjson(
+            SELECT_FOROS + f" WHERE foro.id_unidad = %s ORDER BY {orden_sql(ORDEN_FOROS)}",
+            (unidad_id,), nombre=f"foros_unidad_{unidad_id}",
+        )
+    despues = leer_cursor(despues, ORDEN_FOROS)
     try:
         conn = connect_db()  # Asegúrate de definir esta función en tu código
         cursor = conn.cursor()
@@ -1943,19 +1770,10 @@ async def get_foro_unidad(unidad_id: int):
         
         curso_id = unidad['id_curso']
         
-        # Consulta para obtener los foros de la unidad junto con el nombre y tipo de usuario
-        cursor.execute(""" 
-            SELECT foro.id, foro.titulo, foro.descripcion, foro.fecha, foro.hora, 
-                foro.id_usuario,  -- Asegúrate de seleccionar el id_usuario
-                usuario.nombre AS nombre_usuario, 
-                usuario.tipo AS tipo_usuario
-            FROM foro
-            JOIN usuario ON foro.id_usuario = usuario.id
-            WHERE foro.id_unidad = %s
-            ORDER BY foro.fecha DESC, foro.hora DESC  -- Ordenar por fecha y hora más recientes
-        """, (unidad_id,))
-
-        foro = cursor.fetchall()
+        # Foros de la unidad junto con el nombre y tipo de usuario (keyset si se pagina)
+        foro, siguiente_cursor = paginar(
+            cursor, SELECT_FOROS, "foro.id_unidad = %s", (unidad_id,), ORDEN_FOROS, limite, despues
+        )
 
         # Transformar la hora en formato "HH:MM:SS" si es timedelta
         for discusion in foro:
@@ -1967,7 +1785,7 @@ async def get_foro_unidad(unidad_id: int):
                 discusion['hora'] = f"{hours:02}:{minutes:02}:{seconds:02}"
 
         # Retornar los foros y el curso_id, aunque foros esté vacío
-        return {"foro": foro, "curso_id": curso_id}
+        return {"foro": foro, "curso_id": curso_id, "siguiente_cursor": siguiente_cursor}
     
     except Exception as e:
         print(f"Error al obtener foro de la unidad: {e}")
@@ -1993,23 +1811,15 @@ async def regenerar_pregunta(pregunta_tipo: str, request: Request):
         if unidad_id in ['1', 1]:
             assistant_id = 'asst_pCKuTpobSzVJFnLQ5IBTrMb5'
         else:
-            # Conectar a la base de datos para obtener el assistant_id
-            conn = connect_db()
-            if conn is None:
-                raise HTTPException(status_code=500, detail="Error al conectar a la base de datos")
-            cursor = conn.cursor()
+            # Consultar la base de datos para obtener el assistant_id
             try:
-                cursor.execute("SELECT assistant_id FROM unidad WHERE id = %s", (unidad_id,))
-                result = cursor.fetchone()
+                result = await repositorio.uno("SELECT assistant_id FROM unidad WHERE id = %s", (unidad_id,))
                 if result:
-                    assistant_id = result[0]
+                    assistant_id = result["assistant_id"]
                 else:
                     raise HTTPException(status_code=404, detail="Curso no encontrado")
             except Exception as e:
                 raise HTTPException(status_code=500, detail=f"Error al consultar la base de datos: {e}")
-            finally:
-                cursor.close()
-                conn.close()  # Cerrar conexión
 
         # Llamada a la API para regenerar-preguntas
         url = f"{url_api}/regenerar-preguntas/{assistant_id}"
@@ -2018,31 +1828,25 @@ async def regenerar_pregunta(pregunta_tipo: str, request: Request):
             'thread_id': thread,  # Aquí incluimos el thread en los parámetros
             'pregunta_tipo': pregunta_tipo,
         }
-        response = requests.post(url, params=params)
+        # requests es síncrono: en un hilo para no frenar el loop mientras responde
+        response = await asyncio.to_thread(requests.post, url, params=params)
 
         if response.status_code == 200:
             preguntas = response.json()
 
-            conn = connect_db()
-            cursor = conn.cursor()
-            
             # Verificar el tipo de pregunta y llamar a la función adecuada
             if pregunta_tipo == 'desarrollo':
                 pregunta_nueva = parse_desarrollo(preguntas)
-                insertar_desarrollo(cursor, pregunta_nueva, evaluacion_id,pregunta_id)
+                await repositorio.transaccion(insertar_desarrollo, pregunta_nueva, evaluacion_id, pregunta_id)
             elif pregunta_tipo == 'alternativa':
                 pregunta_nueva = parse_alternativas(preguntas)
-                insertar_alternativa(cursor, pregunta_nueva, evaluacion_id,pregunta_id)
+                await repositorio.transaccion(insertar_alternativa, pregunta_nueva, evaluacion_id, pregunta_id)
             elif pregunta_tipo == 'vf':
                 pregunta_nueva = parse_vf(preguntas)
-                insertar_vf(cursor, pregunta_nueva, evaluacion_id,pregunta_id)
+                await repositorio.transaccion(insertar_vf, pregunta_nueva, evaluacion_id, pregunta_id)
             else:
                 raise HTTPException(status_code=400, detail="Tipo de pregunta no válido")
 
-            conn.commit()
-            cursor.close()
-            conn.close()
-
             # Devolver la nueva pregunta generada
             print(f"Pregunta DEVUELTA: {preguntas}")
             return {"nueva_pregunta": preguntas}
@@ -2055,6 +1859,57 @@ async def regenerar_pregunta(pregunta_tipo: str, request: Request):
 
 
 
+def _insertar_foro(cursor, unidad_id, titulo, descripcion, id_usuario, fecha_actual, hora_actual):
+    # Insertar el nuevo foro
+    cursor.execute(
+        """
+        INSERT INTO foro (titulo, descripcion, fecha, hora, id_usuario, id_unidad)
+        VALUES (%s, %s, %s, %s, %s, %s)
+        RETURNING id
+        """,
+        (titulo, descripcion, fecha_actual, hora_actual, id_usuario, unidad_id)
+    )
+
+    foro_id = cursor.fetchone()["id"]
+
+    # Obtener el ID del curso al que pertenece la unidad
+    cursor.execute(
+        "SELECT id_curso FROM unidad WHERE id = %s",
+        (unidad_id,)
+    )
+    curso_result = cursor.fetchone()
+    if not curso_result:
+        raise HTTPException(status_code=404, detail="Unidad no encontrada")
+
+    id_curso = curso_result["id_curso"]
+
+    # Obtener a todos los participantes del curso
+    cursor.execute("""
+        SELECT id_usuario FROM usuario_curso WHERE id_curso = %s
+    """, (id_curso,))
+    participantes = cursor.fetchall()
+
+    # Insertar notificación para todos los participantes excepto el creador del foro
+    for participante in participantes:
+        id_participante = participante["id_usuario"]
+        if id_participante != id_usuario:  # No enviar notificación a sí mismo
+            cursor.execute("""
+                INSERT INTO notificacion (titulo, comentario, fecha, hora, leido, id_usuario, id_curso, id_actividad, id_respuesta)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+            """, (
+                "Nuevo foro creado",
+                f"Se ha creado el foro '{titulo}'",
+                fecha_actual,
+                hora_actual,
+                0,  # No leído
+                id_participante,
+                id_curso,
+                None,
+                None
+            ))
+    return foro_id
+
+
 #crear un foro 
 @app.post("/unidad/{unidad_id}/foro")
 async def crear_foro(unidad_id: int, request: Request):
@@ -2073,64 +1928,10 @@ async def crear_foro(unidad_id: int, request: Request):
         fecha_actual = datetime.now().date()  # Fecha en formato YYYY-MM-DD
         hora_actual = datetime.now().time()  # Hora en formato HH:MM:SS
 
-        # Conectar a la base de datos
-        conn = connect_db()
-        cursor = conn.cursor()
-
-        # Insertar el nuevo foro
-        cursor.execute(
-            """
-            INSERT INTO foro (titulo, descripcion, fecha, hora, id_usuario, id_unidad)
-            VALUES (%s, %s, %s, %s, %s, %s)
-            RETURNING id
-            """,
-            (titulo, descripcion, fecha_actual, hora_actual, id_usuario, unidad_id)
-        )
-
-        foro_id = cursor.fetchone()["id"]
-
-        # Obtener el ID del curso al que pertenece la unidad
-        cursor.execute(
-            "SELECT id_curso FROM unidad WHERE id = %s",
-            (unidad_id,)
+        # Foro y notificaciones en una transacción
+        foro_id = await repositorio.transaccion(
+            _insertar_foro, unidad_id, titulo, descripcion, id_usuario, fecha_actual, hora_actual
         )
-        curso_result = cursor.fetchone()
-        if not curso_result:
-            raise HTTPException(status_code=404, detail="Unidad no encontrada")
-
-
-        id_curso = curso_result[0]
-
-        # Obtener a todos los participantes del curso
-        cursor.execute("""
-            SELECT id_usuario FROM usuario_curso WHERE id_curso = %s
-        """, (id_curso,))
-        participantes = cursor.fetchall()
-
-        # Insertar notificación para todos los participantes excepto el creador del foro
-        for (id_participante,) in participantes:
-            if id_participante != id_usuario:  # No enviar notificación a sí mismo
-                cursor.execute("""
-                    INSERT INTO notificacion (titulo, comentario, fecha, hora, leido, id_usuario, id_curso, id_actividad, id_respuesta)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-                """, (
-                    "Nuevo foro creado",
-                    f"Se ha creado el foro '{titulo}'",
-                    fecha_actual,
-                    hora_actual,
-                    0,  # No leído
-                    id_participante,
-                    id_curso,
-                    None,
-                    None
-                ))
-
-        # Confirmar la transacción
-        conn.commit()
-
-        # Cerrar el cursor y la conexión
-        cursor.close()
-        conn.close()
 
         # Devolver una respuesta con el ID del foro recién creado
         return JSONResponse(status_code=201, content={"message": "Foro creado exitosamente", "foro_id": foro_id})
@@ -2141,7 +1942,7 @@ async def crear_foro(unidad_id: int, request: Request):
     
 # Ruta para eliminar un foro
 @app.delete("/foro/{foro_id}")
-async def eliminar_foro(foro_id: int):
+def eliminar_foro(foro_id: int):
     try:
         conn = connect_db()
         cursor = conn.cursor()
@@ -2165,27 +1966,45 @@ async def eliminar_foro(foro_id: int):
         cursor.close()
         conn.close()
 
+SELECT_RESPUESTAS_FORO = """
+    SELECT respuesta_foro.id, respuesta_foro.comentario, 
+           respuesta_foro.fecha, respuesta_foro.hora,
+           respuesta_foro.id_usuario, 
+           usuario.nombre AS nombre_usuario,
+           usuario.tipo AS tipo_usuario
+    FROM respuesta_foro
+    JOIN usuario ON respuesta_foro.id_usuario = usuario.id
+"""
+ORDEN_RESPUESTAS_FORO = (
+    Columna("respuesta_foro.fecha", "fecha", True, "date"),
+    Columna("respuesta_foro.hora", "hora", True, "time"),
+    Columna("respuesta_foro.id", "id", True),
+)
+
+
 @app.get("/foro/{foro_id}/respuestas")
-async def get_respuestas_foro(foro_id: int):
+def get_respuestas_foro(
+    foro_id: int,
+    limite: Optional[int] = Query(None, ge=1, le=PAGINA_MAXIMA),
+    despues: Optional[str] = Query(None, alias="cursor"),
+    formato: str = Query("json", pattern="^(json|ndjson)$"),
+):
+    if formato == "ndjson":
+        return exportar_ndjson(
+            SELECT_RESPUESTAS_FORO + f" WHERE respuesta_foro.id_foro = %s ORDER BY {orden_sql(ORDEN_RESPUESTAS_FORO)}",
+            (foro_id,), nombre=f"respuestas_foro_{foro_id}",
+        )
+    despues = leer_cursor(despues, ORDEN_RESPUESTAS_FORO)
     try:
         conn = connect_db()
         cursor = conn.cursor()
 
 
-        # Consulta para obtener las respuestas del foro
-        cursor.execute("""
-            SELECT respuesta_foro.id, respuesta_foro.comentario, 
-                   respuesta_foro.fecha, respuesta_foro.hora,
-                   respuesta_foro.id_usuario, 
-                   usuario.nombre AS nombre_usuario,
-                   usuario.tipo AS tipo_usuario
-            FROM respuesta_foro
-            JOIN usuario ON respuesta_foro.id_usuario = usuario.id
-            WHERE respuesta_foro.id_foro = %s
-            ORDER BY respuesta_foro.fecha DESC, respuesta_foro.hora DESC
-        """, (foro_id,))
-
-        respuestas = cursor.fetchall()
+        # Consulta para obtener las respuestas del foro (keyset si se pagina)
+        respuestas, siguiente_cursor = paginar(
+            cursor, SELECT_RESPUESTAS_FORO, "respuesta_foro.id_foro = %s", (foro_id,),
+            ORDEN_RESPUESTAS_FORO, limite, despues,
+        )
 
         # Transformar la hora en formato "HH:MM:SS" si es timedelta
         for respuesta in respuestas:
@@ -2197,7 +2016,7 @@ async def get_respuestas_foro(foro_id: int):
                 respuesta['hora'] = f"{hours:02}:{minutes:02}:{seconds:02}"
 
         # Retornar las respuestas (puede estar vacío)
-        return {"respuestas": respuestas}
+        return {"respuestas": respuestas, "siguiente_cursor": siguiente_cursor}
 
     except Exception as e:
         print(f"Error al obtener respuestas del foro: {e}")
@@ -2207,6 +2026,63 @@ async def get_respuestas_foro(foro_id: int):
         cursor.close()
         conn.close()
 
+def _insertar_respuesta_foro(cursor, id_foro, comentario, id_usuario, fecha_actual, hora_actual):
+    # Insertar la nueva respuesta en la tabla respuesta_foro
+    cursor.execute(
+        """
+        INSERT INTO respuesta_foro (comentario, fecha, hora, id_usuario, id_foro)
+        VALUES (%s, %s, %s, %s, %s)
+        RETURNING id
+        """,
+        (comentario, fecha_actual, hora_actual, id_usuario, id_foro)
+    )
+
+    respuesta_id = cursor.fetchone()["id"]
+
+    # Obtener la información del foro y su curso asociado
+    cursor.execute(
+        """
+        SELECT f.titulo, f.id_usuario, u.id_curso
+        FROM foro f
+        JOIN unidad u ON f.id_unidad = u.id
+        WHERE f.id = %s
+        """,
+        (id_foro,)
+    )
+    foro_result = cursor.fetchone()
+
+    if foro_result:
+        foro_titulo = foro_result["titulo"]
+        id_usuario_creador_foro = foro_result["id_usuario"]
+        id_curso = foro_result["id_curso"]
+
+        # Obtener a todos los participantes del curso
+        cursor.execute("""
+            SELECT id_usuario FROM usuario_curso WHERE id_curso = %s
+        """, (id_curso,))
+        participantes = cursor.fetchall()
+
+        # Insertar notificación para todos los participantes excepto el creador de la respuesta
+        for participante in participantes:
+            id_participante = participante["id_usuario"]
+            if id_participante != id_usuario:  # No enviar notificación a sí mismo
+                cursor.execute("""
+                    INSERT INTO notificacion (titulo, comentario, fecha, hora, leido, id_usuario, id_curso, id_actividad, id_respuesta)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+                """, (
+                    "Nuevo comentario en el foro",
+                    f"Un usuario ha comentado en el foro '{foro_titulo}'",
+                    fecha_actual,
+                    hora_actual,
+                    0,  # No leído
+                    id_participante,
+                    id_curso,
+                    None,
+                    None
+                ))
+    return respuesta_id
+
+
 @app.post("/foro/{id_foro}/respuesta")
 async def crear_respuesta(id_foro: int, request: Request):
     try:
@@ -2225,94 +2101,50 @@ async def crear_respuesta(id_foro: int, request: Request):
         fecha_actual = datetime.now().date()
         hora_actual = datetime.now().time()
 
-        conn = connect_db()
-        cursor = conn.cursor()
-
-        # Insertar la nueva respuesta en la tabla respuesta_foro
-        cursor.execute(
-            """
-            INSERT INTO respuesta_foro (comentario, fecha, hora, id_usuario, id_foro)
-            VALUES (%s, %s, %s, %s, %s)
-            RETURNING id
-            """,
-            (comentario, fecha_actual, hora_actual, id_usuario, id_foro)
-        )
-
-        respuesta_id = cursor.fetchone()["id"]
-
-        # Obtener la información del foro y su curso asociado
-        cursor.execute(
-            """
-            SELECT f.titulo, f.id_usuario, u.id_curso
-            FROM foro f
-            JOIN unidad u ON f.id_unidad = u.id
-            WHERE f.id = %s
-            """,
-            (id_foro,)
+        # Respuesta y notificaciones en una transacción
+        respuesta_id = await repositorio.transaccion(
+            _insertar_respuesta_foro, id_foro, comentario, id_usuario, fecha_actual, hora_actual
         )
-        foro_result = cursor.fetchone()
 
-        if foro_result:
-            foro_titulo = foro_result[0]
-            id_usuario_creador_foro = foro_result[1]
-            id_curso = foro_result[2]
-
-            # Obtener a todos los participantes del curso
-            cursor.execute("""
-                SELECT id_usuario FROM usuario_curso WHERE id_curso = %s
-            """, (id_curso,))
-            participantes = cursor.fetchall()
-
-            # Insertar notificación para todos los participantes excepto el creador de la respuesta
-            for (id_participante,) in participantes:
-                if id_participante != id_usuario:  # No enviar notificación a sí mismo
-                    cursor.execute("""
-                        INSERT INTO notificacion (titulo, comentario, fecha, hora, leido, id_usuario, id_curso, id_actividad, id_respuesta)
-                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-                    """, (
-                        "Nuevo comentario en el foro",
-                        f"Un usuario ha comentado en el foro '{foro_titulo}'",
-                        fecha_actual,
-                        hora_actual,
-                        0,  # No leído
-                        id_participante,
-                        id_curso,
-                        None,
-                        None
-                    ))
-
-        # Confirmar la transacción
-        conn.commit()
-
-        # Cerrar el cursor y la conexión
-        cursor.close()
-        conn.close()
-
-        # Devolver una respuesta con el ID de la respuesta recién creada
-        return JSONResponse(status_code=201, content={"message": "Respuesta y notificación creadas exitosamente", "respuesta_id": respuesta_id})
+        # Devolver una respuesta con el ID de la respuesta recién creada
+        return JSONResponse(status_code=201, content={"message": "Respuesta y notificación creadas exitosamente", "respuesta_id": respuesta_id})
 
     except Exception as e:
         print(f"Error al crear la respuesta o la notificación: {e}")
         raise HTTPException(status_code=500, detail="Error interno del servidor")
-@app.get("/notificaciones/{user_id}")
-async def get_notificaciones(user_id: int):
-    try:
-        conn = connect_db()
-        cursor = conn.cursor()
-
+SELECT_NOTIFICACIONES = """
+    SELECT notificacion.id, notificacion.titulo, notificacion.comentario, 
+           notificacion.fecha, notificacion.hora, notificacion.leido,
+           notificacion.id_actividad, actividad.titulo AS actividad_titulo
+    FROM notificacion
+    LEFT JOIN actividad ON notificacion.id_actividad = actividad.id
+"""
+ORDEN_NOTIFICACIONES = (
+    Columna("notificacion.fecha", "fecha", True, "date"),
+    Columna("notificacion.hora", "hora", True, "time"),
+    Columna("notificacion.id", "id", True),
+)
 
-        # Consulta para obtener las notificaciones del usuario
-        cursor.execute("""
-            SELECT notificacion.id, notificacion.titulo, notificacion.comentario, 
-                   notificacion.fecha, notificacion.hora, notificacion.leido,
-                   notificacion.id_actividad, actividad.titulo AS actividad_titulo
-            FROM notificacion
-            LEFT JOIN actividad ON notificacion.id_actividad = actividad.id
-            WHERE notificacion.id_usuario = %s
-            ORDER BY notificacion.fecha DESC, notificacion.hora DESC
-        """, (user_id,))
 
-        notificaciones = cursor.fetchall()
+@app.get("/notificaciones/{user_id}")
+async def get_notificaciones(
+    user_id: int,
+    limite: Optional[int] = Query(None, ge=1, le=PAGINA_MAXIMA),
+    despues: Optional[str] = Query(None, alias="cursor"),
+    formato: str = Query("json", pattern="^(json|ndjson)$"),
+):
+    if formato == "ndjson":
+        return exportar_ndjson(
+            SELECT_NOTIFICACIONES + f" WHERE notificacion.id_usuario = %s ORDER BY {orden_sql(ORDEN_NOTIFICACIONES)}",
+            (user_id,), nombre=f"notificaciones_{user_id}",
+        )
+    despues = leer_cursor(despues, ORDEN_NOTIFICACIONES)
+    try:
+        # Notificaciones del usuario, más recientes primero (keyset si se pagina)
+        notificaciones, siguiente_cursor = await repositorio.transaccion(
+            paginar, SELECT_NOTIFICACIONES, "notificacion.id_usuario = %s", (user_id,),
+            ORDEN_NOTIFICACIONES, limite, despues,
+        )
 
         # Transformar la hora en formato "HH:MM:SS" si es timedelta
         for notificacion in notificaciones:
@@ -2324,59 +2156,52 @@ async def get_notificaciones(user_id: int):
                 notificacion['hora'] = f"{hours:02}:{minutes:02}:{seconds:02}"
 
         # Retornar las notificaciones (puede estar vacío)
-        return {"notificaciones": notificaciones}
+        return {"notificaciones": notificaciones, "siguiente_cursor": siguiente_cursor}
 
     except Exception as e:
         print(f"Error al obtener notificaciones del usuario: {e}")
         raise HTTPException(status_code=500, detail="Error interno del servidor")
 
-    finally:
-        cursor.close()
-        conn.close()
+async def _cargar_notificaciones(ids):
+    """Filas de /notificaciones para las notificaciones nuevas que se empujan por SSE."""
+    return await repositorio.todos(
+        SELECT_NOTIFICACIONES + f" WHERE notificacion.id = ANY(%s) ORDER BY {orden_sql(ORDEN_NOTIFICACIONES)}",
+        (list(ids),),
+    )
+
+
+@app.get("/notificaciones/{user_id}/stream")
+async def stream_notificaciones(user_id: int):
+    # Server-Sent Events: contador de no leídas al conectar, luego cada
+    # notificación nueva y cada cambio del contador (reemplaza el polling)
+    return StreamingResponse(
+        notificaciones_push.eventos(user_id, _cargar_notificaciones),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 
 @app.get("/notificaciones/tiene-no-leidas/{user_id}")
 async def tiene_notificaciones_no_leidas(user_id: int):
     try:
-        conn = connect_db()
-        cursor = conn.cursor()
-
-        # Consulta para verificar si hay notificaciones no leídas (leido = 0)
-        cursor.execute("""
-            SELECT EXISTS (
-                SELECT 1 
-                FROM notificacion 
-                WHERE id_usuario = %s AND leido = 0
-            ) AS tiene_no_leidas
-        """, (user_id,))
-
-        resultado = cursor.fetchone()
+        # Contador en memoria (se mueve con los NOTIFY de notificacion); solo va a la BD si no está
+        no_leidas = await notificaciones_push.no_leidas(user_id)
 
         # Retornar un objeto con la información
-        return {"tiene_no_leidas": bool(resultado[0])}
+        return {"tiene_no_leidas": no_leidas > 0, "no_leidas": no_leidas}
 
     except Exception as e:
         print(f"Error al comprobar notificaciones no leídas del usuario: {e}")
         raise HTTPException(status_code=500, detail="Error interno del servidor")
 
-    finally:
-        cursor.close()
-        conn.close()
-
 @app.put("/notificaciones/{notificacion_id}")
 async def actualizar_notificacion(notificacion_id: int):
     try:
-        conn = connect_db()
-        cursor = conn.cursor()
-
         # Actualiza el estado de la notificación a leída (leido = 1)
-        cursor.execute("""
+        await repositorio.ejecutar("""
             UPDATE notificacion SET leido = 1 WHERE id = %s
         """, (notificacion_id,))
 
-        conn.commit()
-        cursor.close()
-        conn.close()
-
         return JSONResponse(status_code=200, content={"message": "Notificación actualizada correctamente"})
 
     except Exception as e:
@@ -2384,127 +2209,8 @@ async def actualizar_notificacion(notificacion_id: int):
         raise HTTPException(status_code=500, detail="Error interno del servidor")
 
 
-def enviar_notificacion(id_usuario, id_curso, id_actividad, comentario):
-    conn = connect_db()
-    cursor = conn.cursor()
-    fecha_actual = datetime.now().date()
-    hora_actual = datetime.now().time()
-
-    try:
-        cursor.execute("""INSERT INTO notificacion (titulo, comentario, fecha, hora, leido, id_usuario, id_curso, id_actividad, id_respuesta)
-                          VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)""",
-                       ("24 horas para cierre de actividad" if "24" in comentario else "1 hora para cierre de actividad", 
-                        comentario, 
-                        fecha_actual, 
-                        hora_actual, 
-                        0,  
-                        id_usuario, 
-                        id_curso, 
-                        id_actividad, 
-                        None))
-
-        conn.commit()
-        print("Notificación enviada: ", comentario)  # Debugging
-    except Exception as e:
-        print(f"Ocurrió un error al enviar la notificación: {e}")  # Debugging
-    finally:
-        cursor.close()
-        conn.close()
-
-
-
-
-def verificar_actividades():
-    # Conectar a la base de datos
-    conn = connect_db()
-    cursor = conn.cursor()
-
-    ahora = datetime.now()
-
-    # Rango para actividades que cierran entre 59 minutos y 1 hora
-    hora_cierre_inicio_1h = ahora + timedelta(minutes=59)  # 59 minutos a partir de ahora
-    hora_cierre_fin_1h = ahora + timedelta(hours=1)  # 1 hora a partir de ahora
-
-    # Imprimir los rangos para depuración
-    print(f"Buscando actividades que cierran entre: {hora_cierre_inicio_1h.time()} y {hora_cierre_fin_1h.time()} en la fecha: {ahora.date()}")
-
-    cursor.execute("""
-        SELECT a.id, a.titulo, c.id AS id_curso, uc.id_usuario
-        FROM actividad a
-        JOIN unidad u ON a.id_unidad = u.id
-        JOIN curso c ON u.id_curso = c.id
-        JOIN usuario_curso uc ON uc.id_curso = c.id
-        WHERE a.fecha_cierre = %s AND a.hora_cierre BETWEEN %s AND %s
-    """, (ahora.date(), hora_cierre_inicio_1h.time(), hora_cierre_fin_1h.time()))
-
-    actividades_1_hora = cursor.fetchall()
-    print(f"Actividades a 1 hora de cierre: {actividades_1_hora}")
-
-    for actividad in actividades_1_hora:
-        id_actividad = actividad[0]
-        nombre_actividad = actividad[1]
-        id_curso = actividad[2]
-        id_usuario = actividad[3]
-
-        comentario = f"Queda 1 hora para el cierre de la actividad {nombre_actividad}."
-        enviar_notificacion(id_usuario, id_curso, id_actividad, comentario)
-
-    # Rango para actividades que cierran entre ahora y 1 minuto antes en 24 horas
-    hora_cierre_inicio_24h = ahora - timedelta(minutes=1)  # Hora actual menos 1 minuto
-    hora_cierre_fin_24h = ahora + timedelta(hours=24)  # Hora actual más 24 horas
-
-    # Imprimir los rangos para depuración
-    print(f"Buscando actividades que cierran entre: {hora_cierre_inicio_24h.time()} y {hora_cierre_fin_24h.time()} en la fecha: {(ahora + timedelta(days=1)).date()}")
-
-    cursor.execute("""
-        SELECT a.id, a.titulo, c.id AS id_curso, uc.id_usuario
-        FROM actividad a
-        JOIN unidad u ON a.id_unidad = u.id
-        JOIN curso c ON u.id_curso = c.id
-        JOIN usuario_curso uc ON uc.id_curso = c.id
-        WHERE (a.fecha_cierre = %s AND a.hora_cierre BETWEEN %s AND %s)
-        OR (a.fecha_cierre = %s AND a.hora_cierre BETWEEN %s AND %s)
-    """, (
-        ahora.date(), hora_cierre_inicio_24h.time(), hora_cierre_fin_24h.time(),  # Día actual
-        (ahora + timedelta(days=1)).date(), hora_cierre_inicio_24h.time(), hora_cierre_fin_24h.time()  # Día siguiente
-    ))
-
-    actividades_24_horas = cursor.fetchall()
-    print(f"Actividades a 24 horas de cierre: {actividades_24_horas}")
-
-    for actividad in actividades_24_horas:
-        id_actividad = actividad[0]
-        nombre_actividad = actividad[1]
-        id_curso = actividad[2]
-        id_usuario = actividad[3]
-
-        comentario = f"Quedan 24 horas para el cierre de la actividad {nombre_actividad}."
-        enviar_notificacion(id_usuario, id_curso, id_actividad, comentario)
-
-    cursor.close()
-    conn.close()
-
-
-
-def run_verificar_actividades():
-    while True:
-        print("Iniciando verificación de actividades...")  # Debugging
-        try:
-            verificar_actividades()
-        except Exception as e:
-            print(f"Ocurrió un error: {e}")
-        time.sleep(60)
-
-
-#@app.on_event("startup")
-#async def startup_event():
-#    t = threading.Thread(target=run_verificar_actividades)
-#    t.daemon = True
-#    t.start()
-
-
 @app.get("/unidad/{unidadId}/verificar-corpus")
-async def verificar_corpus(unidadId: int):
+def verificar_corpus(unidadId: int):
     try:
         print("unidadId=",unidadId)
         conn = connect_db()
@@ -2643,52 +2349,62 @@ async def procesar_archivo_tar(archivo_tar: UploadFile):
     # Convertir la lista a formato JSON
     return json.dumps(contenido_json, ensure_ascii=False, indent=2)
 
+ORDEN_USUARIOS = (Columna("u.id", "id"),)
+
+
+def _usuarios_y_cursos(cursor, limite, despues):
+    """
+    JSON (bytes) de usuarios con sus cursos armado por Postgres. Sin paginar,
+    la lista completa; paginando, una página por keyset sobre u.id.
+    """
+    if limite is None and despues is None:
+        cursor.execute(SQL_USUARIOS_CON_CURSOS)
+        return cursor.fetchone()["json"].encode("utf-8"), None
+    usuarios, siguiente_cursor = paginar(
+        cursor, "SELECT u.id FROM usuario u", None, (), ORDEN_USUARIOS, limite, despues
+    )
+    cursor.execute(SQL_USUARIOS_CON_CURSOS_IDS, ([u["id"] for u in usuarios],))
+    return cursor.fetchone()["json"].encode("utf-8"), siguiente_cursor
+
+
 @app.get("/usuarios-cursos")
-async def get_users_with_courses():
+async def get_users_with_courses(
+    limite: Optional[int] = Query(None, ge=1, le=PAGINA_MAXIMA),
+    despues: Optional[str] = Query(None, alias="cursor"),
+    formato: str = Query("json", pattern="^(json|ndjson)$"),
+):
+    if formato == "ndjson":
+        # Una línea por usuario con sus cursos ya agrupados por Postgres
+        return exportar_ndjson(SQL_EXPORTAR_USUARIOS_CON_CURSOS, nombre="usuarios_cursos")
+    despues = leer_cursor(despues, ORDEN_USUARIOS)
+    paginado = limite is not None or despues is not None
     try:
-        conn = connect_db()  # Conexión a la base de datos
-        cursor = conn.cursor()
-
-        
-        # Consulta para obtener todos los usuarios y sus cursos
-        cursor.execute("""
-            SELECT u.id AS usuario_id, u.nombre AS usuario_nombre, u.tipo, u.correo, u.direccion, u.numero_cel,
-                   c.id AS curso_id, c.nombre AS curso_nombre
-            FROM usuario u
-            LEFT JOIN usuario_curso uc ON u.id = uc.id_usuario
-            LEFT JOIN curso c ON uc.id_curso = c.id
-        """)
-        usuarios_con_cursos = cursor.fetchall()  # Obtenemos los resultados
-        
-        cursor.close()
-        conn.close()
-        # Agrupar los usuarios con sus cursos
-        usuarios = {}
-        for item in usuarios_con_cursos:
-            # Si el usuario ya existe en el diccionario, agregamos el curso a su lista
-            if item['usuario_id'] not in usuarios:
-                usuarios[item['usuario_id']] = {
-                    'id': item['usuario_id'],  # Aseguramos que el id del usuario esté en la respuesta
-                    'nombre': item['usuario_nombre'],
-                    'tipo': item['tipo'],
-                    'correo': item['correo'],
-                    'direccion': item['direccion'],
-                    'numero_cel': item['numero_cel'],
-                    'cursos': []
-                }
-            if item['curso_id']:
-                usuarios[item['usuario_id']]['cursos'].append({
-                    'curso_id': item['curso_id'],
-                    'curso_nombre': item['curso_nombre']
-                })
-        
-        # Convertimos el diccionario de usuarios en una lista
-        usuarios_lista = list(usuarios.values())
+        # Usuarios con sus cursos, ya serializados: se responden sin pasar por Python
+        usuarios_json, siguiente_cursor = await repositorio.transaccion(
+            _usuarios_y_cursos, limite, despues
+        )
         
-        return usuarios_lista  # Devolvemos los usuarios con sus cursos
+        # Sin paginar se mantiene la lista sola que esperan los clientes actuales
+        if paginado:
+            return respuesta_json(envolver_json({"usuarios": usuarios_json, "siguiente_cursor": siguiente_cursor}))
+        return respuesta_json(usuarios_json)  # Devolvemos los usuarios con sus cursos
     except Exception as e:
         print(f"Error al obtener usuarios y cursos: {e}")
         raise HTTPException(status_code=500, detail="Error interno del servidor")
+def _actualizar_usuario(cursor, user_id, nombre, tipo, correo, direccion, numero_cel):
+    # Consulta para actualizar los datos del usuario (sin cambiar id ni clave)
+    update_query = """
+        UPDATE usuario
+        SET nombre = %s, tipo = %s, correo = %s, direccion = %s, numero_cel = %s
+        WHERE id = %s
+    """
+    cursor.execute(update_query, (nombre, tipo, correo, direccion, numero_cel, user_id))
+    # Verificar si se actualizó el usuario
+    if cursor.rowcount == 0:
+        raise HTTPException(status_code=404, detail="Usuario no encontrado")
+    cache_metadatos.publicar({"tipo": "usuarios"}, cursor)
+
+
 @app.put("/editar_usuario/{user_id}")
 async def update_user(user_id: int, request: Request):
     data = await request.json()
@@ -2701,21 +2417,7 @@ async def update_user(user_id: int, request: Request):
     if not nombre or not correo or not tipo:
         raise HTTPException(status_code=400, detail="Nombre, correo y tipo son requeridos")
     try:
-        conn = connect_db()
-        cursor = conn.cursor()
-        # Consulta para actualizar los datos del usuario (sin cambiar id ni clave)
-        update_query = """
-            UPDATE usuario
-            SET nombre = %s, tipo = %s, correo = %s, direccion = %s, numero_cel = %s
-            WHERE id = %s
-        """
-        cursor.execute(update_query, (nombre, tipo, correo, direccion, numero_cel, user_id))
-        # Verificar si se actualizó el usuario
-        if cursor.rowcount == 0:
-            raise HTTPException(status_code=404, detail="Usuario no encontrado")
-        conn.commit()
-        cursor.close()
-        conn.close()
+        await repositorio.transaccion(_actualizar_usuario, user_id, nombre, tipo, correo, direccion, numero_cel)
         return {"message": "Usuario actualizado exitosamente"}
     except Exception as e:
         print(f"Error al actualizar el usuario: {e}")
@@ -2725,19 +2427,14 @@ async def update_user(user_id: int, request: Request):
 @app.get("/cursos")
 async def obtener_todos_los_cursos():
     try:
-        conn = connect_db()
-        cursor = conn.cursor()
         # Consulta para obtener todos los cursos
-        cursor.execute("SELECT id, nombre FROM curso")
-        cursos = cursor.fetchall()
-        cursor.close()
-        conn.close()
+        cursos = await repositorio.todos("SELECT id, nombre FROM curso")
         if cursos:
             # Devolver todos los cursos en una lista
             return [
                 {
-                    "curso_id": curso[0],
-                    "nombre": curso[1]
+                    "curso_id": curso["id"],
+                    "nombre": curso["nombre"]
                 }
                 for curso in cursos
             ]
@@ -2747,6 +2444,21 @@ async def obtener_todos_los_cursos():
         print(f"Error al obtener los cursos: {e}")
         raise HTTPException(status_code=500, detail="Error interno del servidor")
     
+def _inscribir(cursor, id_usuario, id_curso):
+    cursor.execute(
+        """
+        INSERT INTO usuario_curso (id_usuario, id_curso)
+        VALUES (%s, %s)
+        RETURNING id
+        """,
+        (id_usuario, id_curso)
+    )
+
+    usuario_curso_id = cursor.fetchone()["id"]
+    cache_metadatos.publicar({"tipo": "curso", "id": id_curso}, cursor)
+    return usuario_curso_id
+
+
 @app.post("/inscribir-curso")
 async def inscribir_curso(request: Request):
     try:
@@ -2763,28 +2475,8 @@ async def inscribir_curso(request: Request):
                 detail="Faltan parámetros: id_usuario o id_curso"
             )
         
-        # Conectar a la base de datos
-        conn = connect_db()
-        if conn is None:
-            raise HTTPException(
-                status_code=500,
-                detail="Error al conectar con la base de datos"
-            )
-        
-        cursor = conn.cursor()
-        
         try:
-            cursor.execute(
-                """
-                INSERT INTO usuario_curso (id_usuario, id_curso)
-                VALUES (%s, %s)
-                RETURNING id
-                """,
-                (id_usuario, id_curso)
-            )
-
-            usuario_curso_id = cursor.fetchone()[0]
-            conn.commit()
+            usuario_curso_id = await repositorio.transaccion(_inscribir, id_usuario, id_curso)
 
             return {
                 "message": "Usuario inscrito en el curso exitosamente",
@@ -2793,7 +2485,6 @@ async def inscribir_curso(request: Request):
 
         except Exception as e:
             print("❌ Error al insertar los datos en Postgres:", e)
-            conn.rollback()
             raise HTTPException(
                 status_code=500,
                 detail="Error al insertar en la base de datos"
@@ -2810,7 +2501,7 @@ async def inscribir_curso(request: Request):
         )
 
 @app.delete("/desinscribir-curso/{id_usuario}/{id_curso}")
-async def desinscribir_curso(id_usuario: int, id_curso: int):
+def desinscribir_curso(id_usuario: int, id_curso: int):
     try:
         # Conectar a la base de datos
         conn = connect_db()
@@ -2820,6 +2511,7 @@ async def desinscribir_curso(id_usuario: int, id_curso: int):
             DELETE FROM usuario_curso
             WHERE id_usuario = %s AND id_curso = %s
         """, (id_usuario, id_curso))
+        cache_metadatos.publicar({"tipo": "curso", "id": id_curso}, cursor)
         # Asegúrate de hacer commit para guardar los cambios
         conn.commit()
         # Verificar si se eliminó algún registro
@@ -2834,23 +2526,14 @@ async def desinscribir_curso(id_usuario: int, id_curso: int):
 @app.get("/curso/{curso_id}/usuarios")
 async def get_users_in_course(curso_id: int):
     try:
-        conn = connect_db()  # Conexión a la base de datos
-        cursor = conn.cursor()
-
-        
         # Consulta para obtener los usuarios inscritos en el curso con curso_id específico
-        cursor.execute("""
+        usuarios_en_curso = await repositorio.todos("""
             SELECT u.id AS usuario_id, u.nombre AS usuario_nombre, u.tipo, u.correo, u.direccion, u.numero_cel
             FROM usuario u
             JOIN usuario_curso uc ON u.id = uc.id_usuario
             JOIN curso c ON uc.id_curso = c.id
             WHERE c.id = %s
         """, (curso_id,))
-        
-        usuarios_en_curso = cursor.fetchall()  # Obtenemos los resultados
-        
-        cursor.close()
-        conn.close()
         # Si no hay usuarios inscritos en ese curso
         if not usuarios_en_curso:
             raise HTTPException(status_code=404, detail="No hay usuarios inscritos en este curso.")
@@ -2861,7 +2544,7 @@ async def get_users_in_course(curso_id: int):
         raise HTTPException(status_code=500, detail="Error interno del servidor")
 
 @app.get("/usuario/{user_id}/actividades")
-async def get_user_activities(user_id: int):
+def get_user_activities(user_id: int):
     try:
         conn = connect_db()
         cursor = conn.cursor()
@@ -2949,26 +2632,39 @@ async def reportedeerror(
         print(f"Error al enviar el correo: {e}")
         raise HTTPException(status_code=500, detail="Error al enviar el correo.")
 #---------------------------------------- THESIS
+ORDEN_EVALUACIONES = (Columna("id", "id"),)
+
+
 @app.get("/evaluaciones")
-async def obtener_evaluaciones():
+def obtener_evaluaciones(
+    limite: Optional[int] = Query(None, ge=1, le=PAGINA_MAXIMA),
+    despues: Optional[str] = Query(None, alias="cursor"),
+    formato: str = Query("json", pattern="^(json|ndjson)$"),
+):
+    if formato == "ndjson":
+        return exportar_ndjson(
+            f"SELECT id, titulo, dificultad FROM evaluacion ORDER BY {orden_sql(ORDEN_EVALUACIONES)}",
+            nombre="evaluaciones",
+        )
+    despues = leer_cursor(despues, ORDEN_EVALUACIONES)
     try:
         conn = connect_db()
         cursor = conn.cursor()
 
 
-        cursor.execute("""
-            SELECT id, titulo, dificultad 
-            FROM evaluacion
-        """)
-        evaluaciones = cursor.fetchall()
+        evaluaciones, siguiente_cursor = paginar(
+            cursor, "SELECT id, titulo, dificultad FROM evaluacion", None, (),
+            ORDEN_EVALUACIONES, limite, despues,
+        )
 
         cursor.close()
         conn.close()
 
-        if not evaluaciones:
+        # Pasada la última página se responde vacío, no 404
+        if not evaluaciones and despues is None:
             raise HTTPException(status_code=404, detail="No hay evaluaciones disponibles.")
 
-        return {"evaluaciones": evaluaciones}
+        return {"evaluaciones": evaluaciones, "siguiente_cursor": siguiente_cursor}
     except Exception as e:
         print(f"Error al obtener evaluaciones: {e}")
         raise HTTPException(status_code=500, detail="Error interno del servidor")
@@ -2979,63 +2675,25 @@ class EvaluationResponse(BaseModel):
 @app.get("/evaluaciones/{evaluacion_id}/preguntas")
 async def obtener_preguntas(evaluacion_id: int):
     try:
-        conn = connect_db()
-        cursor = conn.cursor()
-
-
-        # Recuperar la dificultad de la evaluación
-        cursor.execute("""
-            SELECT dificultad 
-            FROM evaluacion
-            WHERE id = %s
-        """, (evaluacion_id,))
-        evaluacion = cursor.fetchone()
-        if not evaluacion:
+        # Nivel de dificultad y preguntas de desarrollo, verdadero/falso y
+        # opción múltiple (sin las correctas), armados por Postgres
+        fila = await repositorio.uno(SQL_PREGUNTAS_ALUMNO, (evaluacion_id,))
+        if not fila:
             raise HTTPException(status_code=404, detail="Evaluación no encontrada.")
 
-        # Recuperar preguntas de tipo desarrollo
-        cursor.execute("""
-            SELECT id, enunciado 
-            FROM desarrollo 
-            WHERE id_evaluacion = %s
-        """, (evaluacion_id,))
-        preguntas_desarrollo = cursor.fetchall()
-
-        # Recuperar preguntas de tipo verdadero/falso
-        cursor.execute("""
-            SELECT id, enunciado 
-            FROM vf 
-            WHERE id_evaluacion = %s
-        """, (evaluacion_id,))
-        preguntas_vf = cursor.fetchall()
-
-        # Recuperar preguntas de opción múltiple
-        cursor.execute("""
-            SELECT id, enunciado, respuesta_a, respuesta_b, respuesta_c, respuesta_d, respuesta_e 
-            FROM alternativas 
-            WHERE id_evaluacion = %s
-        """, (evaluacion_id,))
-        preguntas_alternativas = cursor.fetchall()
-
-        cursor.close()
-        conn.close()
-
-        if not (preguntas_desarrollo or preguntas_vf or preguntas_alternativas):
+        if not fila["hay_preguntas"]:
             raise HTTPException(status_code=404, detail="No hay preguntas para esta evaluación.")
 
-        return {
-            "nivel": evaluacion["dificultad"],  # Agregamos el nivel de dificultad
-            "desarrollo": preguntas_desarrollo,
-            "vf": preguntas_vf,
-            "alternativas": preguntas_alternativas
-        }
+        return respuesta_json(fila["json"])
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error al obtener preguntas: {e}")
         raise HTTPException(status_code=500, detail="Error interno del servidor")
 
 
 @app.post("/evaluaciones/{evaluacion_id}/evaluar")
-async def evaluar_respuestas(evaluacion_id: int, respuestas: dict):
+def evaluar_respuestas(evaluacion_id: int, respuestas: dict):
     try:
         conn = connect_db()
         cursor = conn.cursor()
@@ -3142,24 +2800,15 @@ async def generar_preguntas(unidad_id: int, request: Request):
     print(f"Datos recibidos: VF={preguntas_vf}, Desarrollo={preguntas_desarrollo}, Alternativas={preguntas_alternativas}, Dificultad={dificultad}")
 
     # Obtener assistant_id basado en unidad_id
-    conn = connect_db()
-    if conn is None:
-        raise HTTPException(status_code=500, detail="Error al conectar a la base de datos")
-    cursor = conn.cursor()
-
     try:
-        cursor.execute("SELECT assistant_id FROM unidad WHERE id = %s", (unidad_id,))
-        result = cursor.fetchone()
+        result = await repositorio.uno("SELECT assistant_id FROM unidad WHERE id = %s", (unidad_id,))
 
         if not result:
             raise HTTPException(status_code=404, detail="Unidad no encontrada")
         
-        assistant_id = result[0]
+        assistant_id = result["assistant_id"]
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al consultar la base de datos: {e}")
-    finally:
-        cursor.close()
-        conn.close()
 
     # Llamada a la API de OpenAI para generar preguntas
     try:
@@ -3173,7 +2822,8 @@ async def generar_preguntas(unidad_id: int, request: Request):
 
         print(f"Parámetros enviados a la API: {params}")  # Verifica que los parámetros sean correctos
 
-        response = requests.post(url, params=params)
+        # requests es síncrono: en un hilo para no frenar el loop mientras responde
+        response = await asyncio.to_thread(requests.post, url, params=params)
 
         if response.status_code == 200:
             preguntas, thread_id = response.json()  # Solo devolvemos preguntas
@@ -3246,6 +2896,55 @@ async def procesar_pdf(archivo: UploadFile):
 from app.services.openai_assistants import crear_guion_fn
 
 
+async def obtener_info_unidad(unidad_id):
+    """Unidad, curso y profesor (tipo = 2) de una unidad, vía cache de metadatos. None si falta alguno."""
+    return await cache_metadatos.obtener("info_unidad", unidad_id, lambda: repositorio.uno("""
+        SELECT
+            u.id_curso,
+            u.nombre as nombre_unidad,
+            c.nombre as nombre_curso,
+            us.nombre as nombre_profesor
+        FROM unidad u
+        JOIN curso c ON u.id_curso = c.id
+        JOIN usuario_curso uc ON c.id = uc.id_curso
+        JOIN usuario us ON uc.id_usuario = us.id
+        WHERE u.id = %s
+        AND us.tipo = 2
+        LIMIT 1
+    """, (unidad_id,)))
+
+
+async def obtener_info_guion(guion_id):
+    """
+    Datos del guion para generar materiales, con unidad, curso y profesor
+    desde el cache de metadatos. None si falta el guion o su profesor.
+    """
+    guion = await repositorio.uno(f"""
+        SELECT
+            g.vector_id,
+            g.assistant_id,
+            g.file_id,
+            g.titulo,
+            g.id_unidad,
+            {IDENTIFICACION_CLASE}
+        FROM guion_clase g
+        LEFT JOIN planificacion p ON p.id_guion_clase = g.id
+        WHERE g.id = %s
+        LIMIT 1
+    """, (guion_id,))
+    if not guion:
+        return None
+    info = await obtener_info_unidad(guion["id_unidad"])
+    if not info:
+        return None
+    return {
+        **guion,
+        "unidad_nombre": info["nombre_unidad"],
+        "profesor": info["nombre_profesor"],
+        "nombre_curso": info["nombre_curso"],
+    }
+
+
 @app.post("/unidad/{unidad_id}/crear-guion")
 async def crear_guion(
     unidad_id: int,
@@ -3255,7 +2954,8 @@ async def crear_guion(
     estilo: str = Form(...),
     duracion: str = Form(...),
     semana: str = Form(...),
-    archivo: UploadFile = File(...)
+    archivo: UploadFile = File(...),
+    asincrono: bool = Query(False, description="Si es true responde 202 con el id del trabajo")
 ):
     print("📥 Recibiendo solicitud para crear guion de clase...")
     print(f"📋 Nuevos campos - Duración: {duracion}, Semana: {semana}")
@@ -3272,26 +2972,8 @@ async def crear_guion(
 
     # -------------------- Obtener datos de unidad, curso y profesor --------------------
     try:
-        conn = connect_db()
-        cursor = conn.cursor()
-
-        
-        # Obtener información de unidad, curso y profesor
-        cursor.execute("""
-            SELECT 
-                u.nombre as nombre_unidad,
-                c.nombre as nombre_curso,
-                us.nombre as nombre_profesor
-            FROM unidad u
-            JOIN curso c ON u.id_curso = c.id
-            JOIN usuario_curso uc ON c.id = uc.id_curso
-            JOIN usuario us ON uc.id_usuario = us.id
-            WHERE u.id = %s
-            AND us.tipo = 2
-            LIMIT 1
-        """, (unidad_id,))
-        
-        info_data = cursor.fetchone()
+        # Obtener información de unidad, curso y profesor (cache de metadatos)
+        info_data = await obtener_info_unidad(unidad_id)
         
         if not info_data:
             raise HTTPException(status_code=404, detail="No se encontró la unidad, curso o profesor")
@@ -3309,7 +2991,7 @@ async def crear_guion(
     # -------------------- Crear assistant y vector --------------------
     try:
         print("🤖 Creando nuevo assistant y vector para el guion...")
-        assistant_id, vector_id = crear_assistant()
+        assistant_id, vector_id = await crear_assistant()
         print(f"✅ Assistant creado: {assistant_id} | Vector creado: {vector_id}")
 
         await archivo.seek(0)
@@ -3324,7 +3006,7 @@ async def crear_guion(
 
     # -------------------- Guardar guion_clase --------------------
     try:
-        cursor.execute(
+        guion = await repositorio.uno(
             """
             INSERT INTO guion_clase (
                 titulo, ra, contenido, estilo, duracion, semana,
@@ -3339,40 +3021,42 @@ async def crear_guion(
             )
         )
 
-        guion_id = cursor.fetchone()["id"]
-        conn.commit()
+        guion_id = guion["id"]
         print(f"✅ Guion guardado con ID: {guion_id}")
 
     except Exception as e:
         print("❌ Error insertando guion_clase:", e)
         raise
 
-    # -------------------- Enviar datos a GPT --------------------
-    try:
-        print("🤖 Enviando datos a GPT (SIN HTTP interno)...")
-
-        data_response = await crear_guion_fn(
-            assistant_id=assistant_id,
-            titulo=titulo,
-            resultado_aprendizaje=ra,
-            contenido_tematico=contenido,
-            tipo_clase=estilo,
-            duracion=duracion_int,
-            semana=semana_int,
-            vector_id=vector_id,
-        )
-
-        print("✅ Llamada a GPT completada (sin HTTP)")
+    datos_guion = {
+        "assistant_id": assistant_id,
+        "vector_id": vector_id,
+        "titulo": titulo,
+        "ra": ra,
+        "contenido": contenido,
+        "estilo": estilo,
+        "duracion": duracion_int,
+        "semana": semana_int,
+        "nombre_unidad": nombre_unidad,
+        "nombre_curso": nombre_curso,
+        "nombre_profesor": nombre_profesor,
+    }
 
-    except Exception as e:
-        print("❌ Error llamando a GPT:", e)
-        raise HTTPException(status_code=500, detail=f"Error al comunicarse con GPT: {e}")
+    # -------------------- Modo asíncrono: la fase GPT corre en la cola de trabajos --------------------
+    if asincrono:
+        trabajo_id = await asyncio.to_thread(cola_trabajos.encolar, "crear_guion", {"guion_id": guion_id, **datos_guion})
+        return JSONResponse(status_code=202, content={
+            "message": "Guion creado, planificación en proceso",
+            "guion_id": guion_id,
+            "vector_id": vector_id,
+            "trabajo_id": trabajo_id,
+            "estado_url": f"/trabajos/{trabajo_id}"
+        })
 
-    thread_id = data_response.get("thread_id")
-    print(f"📦 thread_id recibido: {thread_id}")
+    return JSONResponse(status_code=201, content=await completar_guion(guion_id, datos_guion))
 
 
-    # -------------------- Guardar planificación (FORMATO DOCENTE) --------------------
+def _guardar_planificacion(cursor, guion_id, datos, data_response, thread_id):
     try:
         cursor.execute("""
             INSERT INTO planificacion (
@@ -3395,13 +3079,13 @@ async def crear_guion(
             ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
         """, (
             guion_id,
-            titulo,
-            ra,
-            contenido,
-            estilo,
-            duracion_int,
-            semana_int,
-            vector_id,
+            datos["titulo"],
+            datos["ra"],
+            datos["contenido"],
+            datos["estilo"],
+            datos["duracion"],
+            datos["semana"],
+            datos["vector_id"],
 
             json.dumps(data_response.get("identificacion_clase", {}), ensure_ascii=False),
             json.dumps(data_response.get("secuencia_actividades", {}), ensure_ascii=False),
@@ -3413,7 +3097,6 @@ async def crear_guion(
             json.dumps(data_response.get("metadata", {}), ensure_ascii=False),
             data_response.get("thread_id", thread_id)
         ))
-        conn.commit()
         print("✅ Planificación guardada en DB (formato docente)")
     except Exception as e:
         print("❌ Error insertando en planificacion:", e)
@@ -3422,29 +3105,73 @@ async def crear_guion(
     # -------------------- Actualizar thread --------------------
     try:
         cursor.execute("UPDATE guion_clase SET thread = %s WHERE id = %s", (thread_id, guion_id))
-        conn.commit()
-        cursor.close()
-        conn.close()
         print("✅ Thread actualizado en guion_clase")
         
     except Exception as e:
         print("❌ Error actualizando thread en guion_clase:", e)
         raise
 
-    # -------------------- Construir respuesta FINAL --------------------
-    respuesta_final = {
-    "identificacion_clase": parse_json_field(
-        data_response.get("identificacion_clase"), {}
-    ),
-
-    "resultado_aprendizaje": ra,
-    "contenido_tematico": contenido,
 
-    "analisis_ra": parse_json_field(
-        data_response.get("analisis_ra"), {}
-    ),
+async def completar_guion(guion_id: int, datos: dict) -> dict:
+    """
+    Fase GPT de crear guion: genera la planificación con el assistant del
+    guion, la guarda en BD y actualiza el thread. Se usa directo desde el
+    endpoint o desde la cola de trabajos (tipo "crear_guion").
+    """
+    assistant_id = datos["assistant_id"]
+    vector_id = datos["vector_id"]
+    titulo = datos["titulo"]
+    ra = datos["ra"]
+    contenido = datos["contenido"]
+    estilo = datos["estilo"]
+    duracion_int = datos["duracion"]
+    semana_int = datos["semana"]
+    nombre_unidad = datos["nombre_unidad"]
+    nombre_curso = datos["nombre_curso"]
+    nombre_profesor = datos["nombre_profesor"]
 
-    "secuencia_actividades": parse_json_field(
+    # -------------------- Enviar datos a GPT --------------------
+    try:
+        print("🤖 Enviando datos a GPT (SIN HTTP interno)...")
+
+        data_response = await crear_guion_fn(
+            assistant_id=assistant_id,
+            titulo=titulo,
+            resultado_aprendizaje=ra,
+            contenido_tematico=contenido,
+            tipo_clase=estilo,
+            duracion=duracion_int,
+            semana=semana_int,
+            vector_id=vector_id,
+        )
+
+        print("✅ Llamada a GPT completada (sin HTTP)")
+
+    except Exception as e:
+        print("❌ Error llamando a GPT:", e)
+        raise HTTPException(status_code=500, detail=f"Error al comunicarse con GPT: {e}")
+
+    thread_id = data_response.get("thread_id")
+    print(f"📦 thread_id recibido: {thread_id}")
+
+
+    # -------------------- Guardar planificación (FORMATO DOCENTE) y thread --------------------
+    await repositorio.transaccion(_guardar_planificacion, guion_id, datos, data_response, thread_id)
+
+    # -------------------- Construir respuesta FINAL --------------------
+    respuesta_final = {
+    "identificacion_clase": parse_json_field(
+        data_response.get("identificacion_clase"), {}
+    ),
+
+    "resultado_aprendizaje": ra,
+    "contenido_tematico": contenido,
+
+    "analisis_ra": parse_json_field(
+        data_response.get("analisis_ra"), {}
+    ),
+
+    "secuencia_actividades": parse_json_field(
         data_response.get("secuencia_actividades"), {}
     ),
 
@@ -3473,13 +3200,13 @@ async def crear_guion(
 
 
 
-    return JSONResponse(status_code=201, content={
+    return {
         "message": "Guion y planificación creados exitosamente",
         "guion_id": guion_id,
         "thread_id": thread_id,
         "vector_id": vector_id,
         "planificacion": respuesta_final
-    })
+    }
 
 ################## Funcion para obtener guión de clase en curso-profesor
 ##################
@@ -3487,69 +3214,21 @@ async def crear_guion(
 
 # En el endpoint que obtiene la planificación, agrega:
 @app.get("/guion/{guion_id}/planificacion")
-async def obtener_planificacion_guion(guion_id: int):
+async def obtener_planificacion_guion(
+    guion_id: int,
+    campos: Optional[str] = Query(None, description="Campos separados por comas (default: todos)"),
+):
+    """Planificación del guion armada por Postgres; con `campos` solo trae esos."""
+    seleccion = leer_campos(campos)
     try:
-        conn = connect_db()
-        cursor = conn.cursor()
-
-
-        cursor.execute("""
-            SELECT 
-                p.identificacion_clase,
-                p.resultado_aprendizaje,
-                p.contenido_tematico,
-                p.analisis_ra,
-                p.secuencia_actividades,
-                p.estrategias_didacticas,
-                p.evaluaciones_formativas,
-                p.bibliografia_material,
-                p.metadata,
-                p.thread_id,
-                u.nombre as nombre_unidad,
-                c.nombre as nombre_curso,
-                us.nombre as nombre_profesor
-            FROM planificacion p
-            JOIN guion_clase gc ON p.id_guion_clase = gc.id
-            JOIN unidad u ON gc.id_unidad = u.id
-            JOIN curso c ON u.id_curso = c.id
-            JOIN usuario_curso uc ON c.id = uc.id_curso
-            JOIN usuario us ON uc.id_usuario = us.id
-            WHERE p.id_guion_clase = %s
-            AND us.tipo = 2
-            LIMIT 1
-        """, (guion_id,))
-
-        planificacion = cursor.fetchone()
-        cursor.close()
-        conn.close()
-
-        if not planificacion:
-            return {"message": "No hay planificación para este guion"}
-
-        # Reconstruir estructura (igual a la respuesta nueva de tu /crear_guion)
-        result = {
-            "identificacion_clase": parse_json_field(planificacion.get("identificacion_clase"), {}),
-            "resultado_aprendizaje": planificacion.get("resultado_aprendizaje", ""),
-            "contenido_tematico": planificacion.get("contenido_tematico", ""),
-            "analisis_ra": parse_json_field(planificacion.get("analisis_ra"), {}),
-            "secuencia_actividades": parse_json_field(planificacion.get("secuencia_actividades"), {}),
-            "estrategias_didacticas": parse_json_field(planificacion.get("estrategias_didacticas"), []),
-            "evaluaciones_formativas": parse_json_field(planificacion.get("evaluaciones_formativas"), []),
-            "bibliografia_material": parse_json_field(planificacion.get("bibliografia_material"), []),
-            "metadata": parse_json_field(planificacion.get("metadata"), {}),
-            "thread_id": planificacion.get("thread_id", ""),
-
-            "nombre_unidad": planificacion.get("nombre_unidad", ""),
-            "nombre_curso": planificacion.get("nombre_curso", ""),
-            "nombre_profesor": planificacion.get("nombre_profesor", ""),
-        }
-
-
-        return result
-
+        fila = await repositorio.uno(sql_planificacion(seleccion), (guion_id,))
     except Exception as e:
         print(f"Error al obtener planificación: {e}")
         raise HTTPException(status_code=500, detail="Error interno del servidor")
+
+    if not fila:
+        return {"message": "No hay planificación para este guion"}
+    return respuesta_json(fila["json"])
 ##########################################################################
 ##################
 ################## Funcion para obtener informacion de la planificacion
@@ -3557,7 +3236,7 @@ async def obtener_planificacion_guion(guion_id: int):
 #########################################################################
 
 @app.get("/unidad/{unidad_id}/planificaciones")
-async def obtener_planificaciones_unidad(unidad_id: int):
+def obtener_planificaciones_unidad(unidad_id: int):
     try:
         conn = connect_db()
         cursor = conn.cursor()
@@ -3587,22 +3266,23 @@ async def obtener_planificaciones_unidad(unidad_id: int):
 
 def eliminar_guion(id_guion: int):
     """
-    Elimina un guión y todos sus recursos asociados en OpenAI
-    (assistant, vector store, file) y luego borra el registro en DB.
+    Elimina un guión, su planificación y sus materiales en una transacción.
+    Su assistant, vector store y file de OpenAI quedan encolados y se borran
+    en segundo plano (borrado_cascada).
     """
 
     conn = None
     cursor = None
 
     try:
-        # 1️⃣ Obtener IDs de recursos desde PostgreSQL
         conn = connect_db()
         cursor = conn.cursor()
 
         cursor.execute("""
-            SELECT assistant_id, vector_id, file_id
+            SELECT vector_id, file_id
             FROM guion_clase
             WHERE id = %s
+            FOR UPDATE
         """, (id_guion,))
 
         guion = cursor.fetchone()
@@ -3610,61 +3290,24 @@ def eliminar_guion(id_guion: int):
         if not guion:
             return {"error": "Guión no encontrado"}
 
-        assistant_id = guion.get("assistant_id")
-        vector_id = guion.get("vector_id")
-        file_id = guion.get("file_id")
-
-        cursor.close()
-        conn.close()
-        cursor = None
-        conn = None
-
-        recursos_eliminados = []
-
-        def _safe_id(x):
-            return isinstance(x, str) and x.strip()
-
-        # 2️⃣ Eliminar assistant
-        if _safe_id(assistant_id):
-            try:
-                client.beta.assistants.delete(assistant_id)
-                recursos_eliminados.append(f"assistant_{assistant_id}")
-            except Exception as e:
-                if "not found" not in str(e).lower():
-                    print(f"⚠️ Error eliminando assistant {assistant_id}: {e}")
-
-        # 3️⃣ Eliminar vector store
-        if _safe_id(vector_id):
-            try:
-                client.beta.vector_stores.delete(vector_id)
-                recursos_eliminados.append(f"vector_{vector_id}")
-            except Exception as e:
-                if "not found" not in str(e).lower():
-                    print(f"⚠️ Error eliminando vector {vector_id}: {e}")
-
-        # 4️⃣ Eliminar archivo
-        if _safe_id(file_id):
-            try:
-                client.files.delete(file_id)
-                recursos_eliminados.append(f"file_{file_id}")
-            except Exception as e:
-                if "not found" not in str(e).lower():
-                    print(f"⚠️ Error eliminando file {file_id}: {e}")
-
-        # 5️⃣ Eliminar guión de la BD
-        conn = connect_db()
-        cursor = conn.cursor()
-
-        cursor.execute("DELETE FROM guion_clase WHERE id = %s", (id_guion,))
+        borrado = borrar_en_cascada(cursor, "guion_clase", id_guion)
         conn.commit()
 
+        # Las generaciones cacheadas de su material ya no sirven
+        corpus_id = guion.get("file_id") or guion.get("vector_id")
+        if isinstance(corpus_id, str) and corpus_id.strip():
+            cache_generaciones.invalidar(corpus_id=corpus_id)
+
         return {
             "message": f"Guión {id_guion} eliminado correctamente",
-            "recursos_eliminados": recursos_eliminados,
-            "recursos_count": len(recursos_eliminados)
+            "filas_eliminadas": borrado["filas"],
+            "recursos_count": borrado["recursos"],
+            "trabajo_id": borrado["trabajo_id"],
         }
 
     except Exception as e:
+        if conn:
+            conn.rollback()
         print(f"❌ Error eliminando guión {id_guion}: {e}")
         return {"error": f"Error eliminando guión: {str(e)}"}
 
@@ -3682,8 +3325,7 @@ def eliminar_guion(id_guion: int):
 
 
 @app.delete("/guion/{id_guion}")
-async def eliminar_guion_endpoint(id_guion: int):
-    # Si quieres que no bloquee el event loop, luego lo pasamos a threadpool.
+def eliminar_guion_endpoint(id_guion: int):
     return eliminar_guion(id_guion)
 from fastapi.responses import StreamingResponse
 from reportlab.lib.pagesizes import letter
@@ -3700,7 +3342,6 @@ from reportlab.platypus import (
     SimpleDocTemplate, Paragraph, Spacer, ListFlowable, ListItem, Table, TableStyle
 )
 from datetime import datetime
-from threading import Lock
 
 
 ##########################################################################
@@ -3708,25 +3349,9 @@ from threading import Lock
 ################## Funciones auxialiares para buen funcionamiento 
 ##################
 #########################################################################
-# Estado global para throttling
-estado_global = {
-    'ultima_solicitud': 0,
-    'lock': Lock(),
-    'intervalo_minimo': 1.5  # 1.5 segundos entre solicitudes
-}
-
-async def throttling_global():
-    """Controla el ritmo de todas las solicitudes a la API"""
-    with estado_global['lock']:
-        tiempo_actual = time.time()
-        tiempo_desde_ultima = tiempo_actual - estado_global['ultima_solicitud']
-        
-        if tiempo_desde_ultima < estado_global['intervalo_minimo']:
-            espera = estado_global['intervalo_minimo'] - tiempo_desde_ultima
-            print(f"⏳ Throttling: esperando {espera:.1f}s")
-            await asyncio.sleep(espera)
-        
-        estado_global['ultima_solicitud'] = time.time()
+# El ritmo de llamadas a OpenAI lo controla el limitador compartido
+# (app/services/openai_limitador.py), enganchado al cliente `aclient`:
+# buckets de requests y tokens por modelo + headers x-ratelimit-*.
 
 def validar_contenido_segun_tipo(contenido_texto, tipo_contenido):
     """
@@ -3740,16 +3365,22 @@ def validar_contenido_segun_tipo(contenido_texto, tipo_contenido):
     print(f"🔍 CONTENIDO RECIBIDO ({tipo_contenido}): {contenido_texto[:500]}{'...' if len(contenido_texto) > 500 else ''}")
     
     try:
+        # Tipos con esquema Pydantic: si viene JSON, el esquema decide
+        if tipo_contenido in ESQUEMAS:
+            contenido_json = extraer_json(contenido_texto)
+            if contenido_json is not None:
+                es_valido, mensaje = validar_esquema(tipo_contenido, contenido_json)
+                if es_valido and tipo_contenido == "mapa_conceptual":
+                    return validar_grafo_mapa(contenido_json)
+                return es_valido, f"{tipo_contenido}: {mensaje}"
+
         if tipo_contenido in ["glosario", "flashcards", "evaluacion"]:
             # Para estos tipos, debe ser JSON válido y tener estructura esperada
             contenido_json = None
             
-            # 🔍 Usar TU método de extracción de JSON
-            match = re.search(r'```json([\s\S]*?)```', contenido_texto)
-            if match:
-                contenido_json = json.loads(match.group(1))
-            else:
-                contenido_json = json.loads(contenido_texto)
+            contenido_json = extraer_json(contenido_texto)
+            if contenido_json is None:
+                return False, f"No se encontró JSON válido en {tipo_contenido}"
             
             # Validar estructura específica según tipo
             if tipo_contenido == "glosario":
@@ -3821,64 +3452,54 @@ def validar_contenido_segun_tipo(contenido_texto, tipo_contenido):
         
         elif tipo_contenido == "mapa_conceptual":
             # Para mapa conceptual, usar TU validación completa
-            mapa_texto_limpio = contenido_texto.strip()
-            json_str = None
+            mapa_json = extraer_json(contenido_texto, aperturas="{")
 
-            # Usar TU lógica de extracción
-            if mapa_texto_limpio.startswith('{'):
-                json_str = mapa_texto_limpio
-            else:
-                match = re.search(r'```json\s*([\s\S]*?)\s*```', contenido_texto)
-                if match:
-                    json_str = match.group(1).strip()
-                else:
-                    match_json = re.search(r'\{[\s\S]*\}', mapa_texto_limpio)
-                    if match_json:
-                        json_str = match_json.group(0)
-            
-            if not json_str:
+            if mapa_json is None:
                 return False, "No se encontró JSON en mapa conceptual"
-            
-            # Intentar parsear con TU función de limpieza
-            try:
-                json_limpio = limpiar_json(json_str)
-                mapa_json = json.loads(json_limpio)
-                
-                # Validar estructura básica del mapa
-                if isinstance(mapa_json, dict) and mapa_json:
-                    # Puede tener la estructura antigua o nueva
-                    if "conceptos_principales" in mapa_json or "conceptos" in mapa_json:
-                        return True, "Mapa conceptual con estructura válida"
-                    else:
-                        return False, "Mapa conceptual sin estructura reconocida"
+
+            # Validar estructura básica del mapa
+            if isinstance(mapa_json, dict) and mapa_json:
+                # Puede tener la estructura antigua o nueva
+                if "conceptos" in mapa_json:
+                    return validar_grafo_mapa(mapa_json)
+                if "conceptos_principales" in mapa_json:
+                    return True, "Mapa conceptual con estructura válida"
                 else:
-                    return False, "Mapa conceptual JSON vacío"
-                
-            except (json.JSONDecodeError, Exception) as e:  # ✅ CORREGIDO: JSONDecodeError
-                return False, f"Error parseando mapa: {str(e)}"
+                    return False, "Mapa conceptual sin estructura reconocida"
+            else:
+                return False, "Mapa conceptual JSON vacío"
         
         return False, f"Tipo de contenido no soportado: {tipo_contenido}"
         
     except Exception as e:
         return False, f"Error en validación: {str(e)}"
 
+from contextvars import ContextVar
+
+# (vector_id, assistant_id) ya verificados en el pipeline de materiales: las tareas
+# que crea `generar_materiales` heredan este valor y no repiten la verificación
+recursos_verificados: ContextVar = ContextVar("recursos_verificados", default=None)
+
+
 async def verificar_recursos_antes_de_procesar(vector_id, assistant_id):
     """
     Verifica que los recursos estén disponibles
     """
+    if recursos_verificados.get() == (vector_id, assistant_id):
+        return True, "Recursos ya verificados en este pipeline"
     try:
         # Verificar vector store
-        vector_store = client.beta.vector_stores.retrieve(vector_id)
-        files = list(client.beta.vector_stores.files.list(
+        vector_store = await aclient.beta.vector_stores.retrieve(vector_id)
+        files = (await aclient.beta.vector_stores.files.list(
             vector_store_id=vector_id, 
             limit=5
-        ))
+        )).data
         
         if len(files) == 0:
             return False, "Vector store no tiene archivos"
             
         # Verificar assistant
-        assistant = client.beta.assistants.retrieve(assistant_id)
+        assistant = await aclient.beta.assistants.retrieve(assistant_id)
         
         return True, f"Recursos OK: {len(files)} archivos"
         
@@ -3891,11 +3512,11 @@ async def cancelar_runs_activos_si_reintento(thread_id, intento_actual, max_inte
     """
     if intento_actual > 0:  # Solo si es un reintento
         try:
-            active_runs = client.beta.threads.runs.list(thread_id=thread_id)
-            for run in active_runs:
+            active_runs = await aclient.beta.threads.runs.list(thread_id=thread_id)
+            for run in active_runs.data:
                 if run.status in ["queued", "in_progress"]:
                     print(f"🛑 Cancelando run huérfano {run.id} (reintento {intento_actual})")
-                    client.beta.threads.runs.cancel(
+                    await aclient.beta.threads.runs.cancel(
                         thread_id=thread_id, 
                         run_id=run.id
                     )
@@ -3934,6 +3555,9 @@ async def llamar_fn_con_reintentos_y_cancelacion(
 
             contenido_texto = obtener_contenido_por_tipo(data_response, tipo_contenido)
             es_valido, mensaje = validar_contenido_segun_tipo(contenido_texto, tipo_contenido)
+            metricas_rechazo.registrar(
+                tipo_contenido, es_valido, bool((data_response or {}).get("con_esquema")), mensaje
+            )
 
             if es_valido:
                 print(f"✅ {mensaje} (intento {intento + 1})")
@@ -3977,6 +3601,49 @@ def obtener_contenido_por_tipo(data_response, tipo_contenido):
 #########################################################################
 #########################################################################
 from app.services.openai_assistants import generar_resumen_fn
+from app.services.cache_generaciones import cache_generaciones, clave_generacion
+from app.services.vuelo_unico import una_sola_generacion, vuelo_unico
+from app.services.digest_corpus import digests_corpus
+from api import VERSIONES_PROMPT
+
+# El nivel Postgres del cache usa la misma conexión que el resto de la app
+cache_generaciones.configurar(connect_db)
+# El lock de vuelo único se mantiene toda la generación: conexión propia, fuera del pool
+vuelo_unico.configurar(pool_bd.conectar_directo)
+
+
+async def material_guardado(tipo, valores):
+    """Para vuelo único: si accion=obtener puede devolver el material sin generarlo."""
+    return await repositorio.transaccion(estado_material, valores["guion_id"], tipo) is not None
+
+
+@app.delete("/planificacion/{guion_id}/cache")
+def invalidar_cache_generaciones(guion_id: int, tipo: Optional[str] = None):
+    """
+    Borra las generaciones cacheadas del material de un guion
+    (todas, o solo un tipo: resumen, mapa_conceptual, flashcards, glosario,
+    digest_corpus).
+    """
+    conn = None
+    try:
+        conn = connect_db()
+        cursor = conn.cursor()
+        cursor.execute("SELECT vector_id, file_id FROM guion_clase WHERE id = %s", (guion_id,))
+        result = cursor.fetchone()
+        cursor.close()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al obtener guion: {str(e)}")
+    finally:
+        if conn:
+            conn.close()
+
+    if not result:
+        raise HTTPException(status_code=404, detail="Guion no encontrado")
+
+    corpus_id = result.get("file_id") or result["vector_id"]
+    borradas = cache_generaciones.invalidar(corpus_id=corpus_id, artefacto=tipo)
+    print(f"🧹 Cache de generaciones invalidado - Guión: {guion_id}, tipo: {tipo or 'todos'}, filas: {borradas}")
+    return {"guion_id": guion_id, "tipo": tipo, "entradas_borradas": borradas}
 
 
 #########################################################################
@@ -3985,11 +3652,10 @@ from app.services.openai_assistants import generar_resumen_fn
 ##################
 #########################################################################
 @app.get("/planificacion/{guion_id}/resumen")
-async def generar_resumen(guion_id: int, accion: str = Query("obtener")):
+@una_sola_generacion("resumen", existe=material_guardado)
+async def generar_resumen(guion_id: int, accion: str = Query("obtener"), sin_cache: bool = False):
     print(f"📥 Generando resumen - Acción: {accion}")
     thread_id = None
-    conn = None
-    cursor = None
 
     def parse_json_field(value, default):
         if value is None:
@@ -4003,64 +3669,35 @@ async def generar_resumen(guion_id: int, accion: str = Query("obtener")):
                 return default
         return default
 
-    try:
-        conn = connect_db()
-        cursor = conn.cursor()
+    if accion == "obtener":
+        resumen_existente = await repositorio.transaccion(obtener_material, guion_id, "resumen")
 
-        if accion == "obtener":
-            cursor.execute("""
-                SELECT tema_principal, ideas_principales, conceptos_clave, conclusion, metadata
-                FROM resumen
-                WHERE id_guion_clase = %s
-                ORDER BY version DESC
-                LIMIT 1
-            """, (guion_id,))
-            resumen_existente = cursor.fetchone()
-
-            if resumen_existente:
-                ideas_principales = parse_json_field(resumen_existente.get("ideas_principales"), [])
-                conceptos_clave = parse_json_field(resumen_existente.get("conceptos_clave"), [])
-                metadata = parse_json_field(resumen_existente.get("metadata"), {})
-
-                resumen_json = {
-                    "tema_principal": resumen_existente.get("tema_principal", ""),
-                    "ideas_principales": ideas_principales,
-                    "conceptos_clave": conceptos_clave,
-                    "conclusion": resumen_existente.get("conclusion", "")
-                }
+        if resumen_existente:
+            metadata = resumen_existente["metadata"]
 
-                return JSONResponse({
-                    "resumen": resumen_json,
-                    "unidad_nombre": metadata.get("unidad_nombre", "Sin nombre"),
-                    "profesor": metadata.get("profesor", "Docente no especificado"),
-                    "nombre_curso": metadata.get("nombre_curso", "Curso no especificado"),
-                    "nombre_asignatura": metadata.get("nombre_asignatura", "Asignatura no especificada"),
-                    "nombre_unidad": metadata.get("nombre_unidad", "Unidad no especificada")
-                })
+            return JSONResponse({
+                "resumen": resumen_existente["contenido"],
+                "unidad_nombre": metadata.get("unidad_nombre", "Sin nombre"),
+                "profesor": metadata.get("profesor", "Docente no especificado"),
+                "nombre_curso": metadata.get("nombre_curso", "Curso no especificado"),
+                "nombre_asignatura": metadata.get("nombre_asignatura", "Asignatura no especificada"),
+                "nombre_unidad": metadata.get("nombre_unidad", "Unidad no especificada")
+            })
 
-        print(f"🔍 Obteniendo información del guión {guion_id}")
-        cursor.execute("""
-            SELECT
-                g.vector_id,
-                g.assistant_id,
-                u.nombre AS unidad_nombre,
-                usr.nombre AS profesor,
-                c.nombre AS nombre_curso,
-                p.identificacion_clase
-            FROM guion_clase g
-            JOIN unidad u ON g.id_unidad = u.id
-            JOIN curso c ON u.id_curso = c.id
-            LEFT JOIN planificacion p ON p.id_guion_clase = g.id
-            LEFT JOIN usuario_curso uc ON uc.id_curso = c.id
-            LEFT JOIN usuario usr ON uc.id_usuario = usr.id
-            WHERE g.id = %s AND usr.tipo = 2
-            LIMIT 1
-        """, (guion_id,))
+    print(f"🔍 Obteniendo información del guión {guion_id}")
+    # Unidad, curso y profesor salen del cache de metadatos
+    result = await obtener_info_guion(guion_id)
+    if not result:
+        raise HTTPException(status_code=404, detail="Guion no encontrado")
 
-        result = cursor.fetchone()
-        if not result:
-            raise HTTPException(status_code=404, detail="Guion no encontrado")
+    # Cache content-addressed: mismo corpus + prompt + modelo + parámetros → misma salida
+    corpus_id = result.get("file_id") or result["vector_id"]
+    clave_cache = clave_generacion(
+        "resumen", corpus_id, MODELO_ASSISTANT, VERSIONES_PROMPT["resumen"], params={}
+    )
+    data_response = None if sin_cache else await asyncio.to_thread(cache_generaciones.obtener, clave_cache)
 
+    if data_response is None:
         recursos_ok, mensaje_recursos = await verificar_recursos_antes_de_procesar(
             result["vector_id"],
             result["assistant_id"]
@@ -4068,47 +3705,52 @@ async def generar_resumen(guion_id: int, accion: str = Query("obtener")):
         if not recursos_ok:
             raise HTTPException(status_code=400, detail=mensaje_recursos)
 
-        result_data = {
-            "vector_id": result["vector_id"],
-            "assistant_id": result["assistant_id"],
-            "unidad_nombre": result.get("unidad_nombre"),
-            "profesor": result.get("profesor"),
-            "nombre_curso": result.get("nombre_curso"),
-            "identificacion_clase": result.get("identificacion_clase"),
-        }
-
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
+    result_data = {
+        "vector_id": result["vector_id"],
+        "assistant_id": result["assistant_id"],
+        "unidad_nombre": result.get("unidad_nombre"),
+        "profesor": result.get("profesor"),
+        "nombre_curso": result.get("nombre_curso"),
+        "identificacion_clase": result.get("identificacion_clase"),
+    }
 
     try:
-        # ✅ Crear thread ANTES de reintentos
-        await throttling_global()
-        nuevo_thread = client.beta.threads.create()
-        thread_id = nuevo_thread.id
-        print(f"🆕 Nuevo thread creado: {thread_id}")
+        if data_response is None:
+            # ✅ Crear thread ANTES de reintentos
+            nuevo_thread = await aclient.beta.threads.create()
+            thread_id = nuevo_thread.id
+            print(f"🆕 Nuevo thread creado: {thread_id}")
+
+            # Digest compartido del corpus: el material se genera sobre él, sin file_search
+            digest = await digests_corpus.obtener_texto(
+                corpus_id, result_data["assistant_id"], result_data["vector_id"], regenerar=sin_cache
+            )
 
-        data = {
-            "thread_id": thread_id,
-            "vector_id": result_data["vector_id"],
-            "assistant_id": result_data["assistant_id"],
-        }
+            data = {
+                "thread_id": thread_id,
+                "vector_id": result_data["vector_id"],
+                "assistant_id": result_data["assistant_id"],
+                "digest": digest,
+            }
 
-        async def call_fn(payload):
-            return await generar_resumen_fn(
-                assistant_id=payload["assistant_id"],
-                thread_id=payload["thread_id"],
-                vector_id=payload["vector_id"],
+            async def call_fn(payload):
+                return await generar_resumen_fn(
+                    assistant_id=payload["assistant_id"],
+                    thread_id=payload["thread_id"],
+                    vector_id=payload["vector_id"],
+                    digest=payload["digest"],
+                )
+
+            data_response = await llamar_fn_con_reintentos_y_cancelacion(
+                call_fn,
+                data,
+                max_intentos=3,
+                tipo_contenido="resumen"
             )
-
-        data_response = await llamar_fn_con_reintentos_y_cancelacion(
-            call_fn,
-            data,
-            max_intentos=3,
-            tipo_contenido="resumen"
-        )
+            if data_response:
+                await asyncio.to_thread(cache_generaciones.guardar, clave_cache, "resumen", corpus_id, data_response)
+        else:
+            print("⚡ resumen servido desde cache de generaciones (sin llamadas a OpenAI)")
 
         if data_response:
             resumen_texto = data_response.get("resumen", "")
@@ -4120,17 +3762,9 @@ async def generar_resumen(guion_id: int, accion: str = Query("obtener")):
                 "conclusion": "Contenido generado automáticamente"
             })
 
-        match = re.search(r'```json([\s\S]*?)```', resumen_texto)
-        if match:
-            try:
-                resumen_json = json.loads(match.group(1))
-            except json.JSONDecodeError:
-                resumen_json = {"texto": resumen_texto}
-        else:
-            try:
-                resumen_json = json.loads(resumen_texto)
-            except json.JSONDecodeError:
-                resumen_json = {"texto": resumen_texto}
+        resumen_json = extraer_json(resumen_texto)
+        if resumen_json is None:
+            resumen_json = {"texto": resumen_texto}
 
         identificacion_data = parse_json_field(result_data.get("identificacion_clase"), {})
         nombre_asignatura = identificacion_data.get(
@@ -4138,17 +3772,6 @@ async def generar_resumen(guion_id: int, accion: str = Query("obtener")):
             result_data.get("nombre_curso", "Asignatura no especificada")
         )
 
-        conn = connect_db()
-        cursor = conn.cursor()
-
-        cursor.execute("""
-            SELECT COALESCE(MAX(version), 0) + 1 as nueva_version
-            FROM resumen
-            WHERE id_guion_clase = %s
-        """, (guion_id,))
-        version_result = cursor.fetchone()
-        nueva_version = version_result.get("nueva_version") if version_result else 1
-
         metadata = {
             "unidad_nombre": result_data.get("unidad_nombre", "Sin nombre"),
             "profesor": result_data.get("profesor", "Docente no especificado"),
@@ -4159,30 +3782,18 @@ async def generar_resumen(guion_id: int, accion: str = Query("obtener")):
             "assistant_id": result_data.get("assistant_id")
         }
 
-        cursor.execute("DELETE FROM resumen WHERE id_guion_clase = %s", (guion_id,))
-
-        cursor.execute("""
-            INSERT INTO resumen (
-                id_guion_clase,
-                tema_principal,
-                ideas_principales,
-                conceptos_clave,
-                conclusion,
-                metadata,
-                version
-            ) VALUES (%s, %s, %s, %s, %s, %s, 1)
-        """, (
-            guion_id,
-            resumen_json.get("tema_principal", ""),
-            json.dumps(resumen_json.get("ideas_principales", []), ensure_ascii=False),
-            json.dumps(resumen_json.get("conceptos_clave", []), ensure_ascii=False),
-            resumen_json.get("conclusion", ""),
-            json.dumps(metadata, ensure_ascii=False)
-        ))
-
-        conn.commit()
+        contenido = {
+            "tema_principal": resumen_json.get("tema_principal", ""),
+            "ideas_principales": resumen_json.get("ideas_principales", []),
+            "conceptos_clave": resumen_json.get("conceptos_clave", []),
+            "conclusion": resumen_json.get("conclusion", ""),
+        }
+        guardado = await repositorio.transaccion(guardar_material, guion_id, "resumen", contenido, metadata)
 
-        print(f"✅ Resumen guardado en BD (v{nueva_version})")
+        if guardado["cambio"]:
+            print(f"✅ Resumen guardado en BD (v{guardado['version']})")
+        else:
+            print(f"♻️ Resumen sin cambios (v{guardado['version']})")
 
         return JSONResponse({
             "resumen": resumen_json,
@@ -4194,20 +3805,9 @@ async def generar_resumen(guion_id: int, accion: str = Query("obtener")):
         })
 
     finally:
-        try:
-            if cursor:
-                cursor.close()
-        except:
-            pass
-        try:
-            if conn:
-                conn.close()
-        except:
-            pass
-
         if thread_id:
             try:
-                client.beta.threads.delete(thread_id)
+                await aclient.beta.threads.delete(thread_id)
                 print(f"🧹 Thread {thread_id} eliminado")
             except Exception as e:
                 print(f"⚠️ No se pudo eliminar thread: {e}")
@@ -4226,10 +3826,9 @@ import base64
 def limpiar_json(json_str):
     """
     Elimina comas sobrantes al final de objetos y arrays en JSON
+    (y normaliza comillas tipográficas / saltos de línea dentro de strings)
     """
-    json_limpio = re.sub(r',\s*([}\]])', r'\1', json_str)
-    print(f"🔧 Comas sobrantes eliminadas: {json_str.count(',') - json_limpio.count(',')}")
-    return json_limpio
+    return reparar_json(json_str)
 
 def escapar_caracteres_mermaid(texto):
     """
@@ -4340,35 +3939,14 @@ def procesar_mapa_conceptual_api(mapa_texto, solo_validar=False):
         if not mapa_texto_limpio:
             raise ValueError("Mapa conceptual vacío")
 
-        json_str = None
+        # Extraer JSON de la respuesta (una pasada, con reparación)
+        mapa_json = extraer_json(mapa_texto_limpio, aperturas="{")
 
-        # Extraer JSON de la respuesta
-        if mapa_texto_limpio.startswith('{'):
-            json_str = mapa_texto_limpio
-            if not solo_validar:
-                print("✅ JSON directo (sin marcas de código)")
-        else:
-            match = re.search(r'```json\s*([\s\S]*?)\s*```', mapa_texto)
-            if match:
-                json_str = match.group(1).strip()
-                if not solo_validar:
-                    print("✅ JSON encontrado en bloque ```json")
-            else:
-                match_json = re.search(r'\{[\s\S]*\}', mapa_texto_limpio)
-                if match_json:
-                    json_str = match_json.group(0)
-                    if not solo_validar:
-                        print("✅ JSON extraído del texto (patrón general)")
-
-        if not json_str:
+        if mapa_json is None:
             raise ValueError("No se encontró JSON válido en la respuesta")
 
-        # Limpiar y parsear JSON
-        json_limpio = limpiar_json(json_str)
-        mapa_json = json.loads(json_limpio)
-        
         if not solo_validar:
-            print("✅ JSON parseado correctamente después de limpiar")
+            print("✅ JSON parseado correctamente")
             # Normalizar y limpiar para Mermaid
             return limpiar_mapa_para_mermaid(mapa_json)
         else:
@@ -4382,130 +3960,55 @@ def procesar_mapa_conceptual_api(mapa_texto, solo_validar=False):
     
 
 
-def validar_estructura_arbol(conceptos, relaciones, ids_conceptos):
+def validar_grafo_mapa(mapa_json):
+    """
+    Valida el grafo del mapa (raíz única, ciclos, huérfanos y profundidad real)
+    en una sola pasada: ver app/services/grafo_mapa.py
+    """
+    reporte = analizar_mapa(mapa_json.get("conceptos"), mapa_json.get("relaciones"))
+    for advertencia in reporte.advertencias:
+        print(f"⚠️ Mapa conceptual: {advertencia}")
+
+    if not reporte.es_valido:
+        return False, "; ".join(reporte.errores)
+    if not reporte.profundidad_suficiente():
+        return False, f"Mapa conceptual sin profundidad suficiente ({reporte.total_conceptos} conceptos, {reporte.profundidad} niveles)"
+    return True, f"Mapa conceptual válido ({reporte.total_conceptos} conceptos, {reporte.profundidad} niveles)"
+
+
+def validar_estructura_arbol(conceptos, relaciones, ids_conceptos=None):
     """
     Valida que la estructura del árbol sea lógica:
     - No hay ciclos
     - No hay conceptos huérfanos (excepto el raíz)
     - La jerarquía es coherente
+    (los ids se indexan en analizar_mapa; `ids_conceptos` queda por compatibilidad)
     """
-    problemas = []
-    
-    # ✅ CONSTRUIR GRAFO SOLO CON RELACIONES VÁLIDAS
-    grafo = {id_concepto: [] for id_concepto in ids_conceptos}
-    relaciones_invalidas_en_arbol = []
-    
-    for relacion in relaciones:
-        origen = relacion.get("origen")
-        destino = relacion.get("destino")
-        
-        # ✅ VERIFICAR SI LA RELACIÓN ES VÁLIDA
-        if origen in ids_conceptos and destino in ids_conceptos:
-            grafo[origen].append(destino)
-        else:
-            # Registrar relación inválida para debug
-            if origen not in ids_conceptos:
-                relaciones_invalidas_en_arbol.append(f"Origen '{origen}' no existe")
-            if destino not in ids_conceptos:
-                relaciones_invalidas_en_arbol.append(f"Destino '{destino}' no existe")
-    
-    if relaciones_invalidas_en_arbol:
-        problemas.extend(relaciones_invalidas_en_arbol)
-    
-    # Encontrar concepto raíz
-    raiz = None
-    for concepto in conceptos:
-        if concepto.get("nivel") == "raiz" or concepto.get("id") == "cp_1":
-            raiz = concepto.get("id")
-            break
-    
-    if not raiz:
-        problemas.append("No se pudo identificar el concepto raíz")
-        return problemas
-    
-    # ✅ SOLO VERIFICAR CICLOS SI HAY RELACIONES VÁLIDAS
-    if any(grafo.values()):  # Solo si hay al menos una relación válida
-        if detectar_ciclos(grafo, raiz):
-            problemas.append("Se detectaron ciclos en la estructura del mapa")
-    
-    # ✅ VERIFICAR CONCEPTOS HUÉRFANOS (excluyendo el raíz)
-    if any(grafo.values()):  # Solo si hay relaciones
-        todos_destinos = set()
-        for destinos in grafo.values():
-            todos_destinos.update(destinos)
-        
-        conceptos_conectados = {raiz} | todos_destinos
-        conceptos_huérfanos = ids_conceptos - conceptos_conectados
-        
-        # ✅ EXCLUIR EL RAÍZ DE LOS HUÉRFANOS (es normal que no tenga padre)
-        if raiz in conceptos_huérfanos:
-            conceptos_huérfanos.remove(raiz)
-            
-        if conceptos_huérfanos:
-            problemas.append(f"Conceptos huérfanos (sin conexión al árbol): {', '.join(conceptos_huérfanos)}")
-    else:
-        # Si no hay relaciones válidas, todos los conceptos excepto el raíz están huérfanos
-        conceptos_huérfanos = ids_conceptos - {raiz}
-        if conceptos_huérfanos:
-            problemas.append(f"Sin relaciones válidas - conceptos desconectados: {', '.join(conceptos_huérfanos)}")
-    
-    return problemas
-                
+    return analizar_mapa(conceptos, relaciones).problemas
+
 
 def detectar_ciclos(grafo, inicio):
-    """Detecta ciclos en el grafo usando DFS"""
-    visitados = set()
-    en_camino = set()
-    
-    def dfs(nodo):
-        if nodo in en_camino:
-            return True
-        if nodo in visitados:
-            return False
-            
-        visitados.add(nodo)
-        en_camino.add(nodo)
-        
-        for vecino in grafo.get(nodo, []):
-            if dfs(vecino):
-                return True
-                
-        en_camino.remove(nodo)
-        return False
-    
-    return dfs(inicio)
+    """Detecta ciclos en el grafo usando DFS (iterativo: sin límite de recursión)"""
+    return tiene_ciclo(grafo, inicio)
 
 
 def validar_profundidad_mapa(conceptos, relaciones):
     """
     Valida que el mapa tenga suficiente profundidad conceptual
-    Versión MEJORADA - más flexible
+    (profundidad real del grafo, no estimada por la forma de los IDs)
     """
-    if len(conceptos) < 3:
-        return False  # Mínimo raíz + 2 conceptos
-    
-    # Contar niveles de profundidad por estructura de IDs
-    niveles = set()
-    for concepto in conceptos:
-        id_concepto = concepto.get("id", "")
-        # Estimar nivel por el ID (cp_1, cp_1_1, cp_1_1_1, etc.)
-        nivel = id_concepto.count("_")
-        niveles.add(nivel)
-    
-    # Debe tener al menos 2 niveles de profundidad (raíz + secundarios)
-    # O si tiene muchos conceptos, puede ser más plano pero informativo
-    return len(niveles) >= 2 or len(conceptos) >= 5
+    return analizar_mapa(conceptos, relaciones).profundidad_suficiente()
 
 from app.services.openai_assistants import generar_mapa_conceptual_fn
 @app.get("/planificacion/{guion_id}/mapa-conceptual")
+@una_sola_generacion("mapa_conceptual", existe=material_guardado)
 async def generar_mapa_conceptual(
     guion_id: int,
-    accion: str = Query("obtener", description="Acción: 'obtener' (default), 'regenerar'")
+    accion: str = Query("obtener", description="Acción: 'obtener' (default), 'regenerar'"),
+    sin_cache: bool = False
 ):
     print(f"🗺️ Mapa conceptual - Guión: {guion_id}, Acción: {accion}")
     thread_id = None
-    conn = None
-    cursor = None
 
     def parse_json_field(value, default):
         """
@@ -4525,35 +4028,15 @@ async def generar_mapa_conceptual(
 
     # -------------------- 1) BD: obtener existente o cargar datos base --------------------
     try:
-        conn = connect_db()
-        cursor = conn.cursor()
-
         # 1.1) Si ya existe y no se quiere regenerar
         if accion == "obtener":
-            cursor.execute("""
-                SELECT titulo, conceptos, relaciones, metadata
-                FROM mapa_conceptual
-                WHERE id_guion_clase = %s
-                ORDER BY version DESC
-                LIMIT 1
-            """, (guion_id,))
-
-            mapa_existente = cursor.fetchone()
+            mapa_existente = await repositorio.transaccion(obtener_material, guion_id, "mapa_conceptual")
             if mapa_existente:
                 print("✅ Mapa conceptual encontrado en BD, devolviendo...")
-
-                conceptos = parse_json_field(mapa_existente.get("conceptos"), [])
-                relaciones = parse_json_field(mapa_existente.get("relaciones"), [])
-                metadata = parse_json_field(mapa_existente.get("metadata"), {})
-
-                mapa_procesado = {
-                    "titulo": mapa_existente.get("titulo", "") or "",
-                    "conceptos": conceptos,
-                    "relaciones": relaciones
-                }
+                metadata = mapa_existente["metadata"]
 
                 return {
-                    "mapa_conceptual": mapa_procesado,
+                    "mapa_conceptual": mapa_existente["contenido"],
                     "unidad_nombre": metadata.get("unidad_nombre"),
                     "profesor": metadata.get("profesor"),
                     "titulo_guion": metadata.get("titulo_guion", ""),
@@ -4563,36 +4046,25 @@ async def generar_mapa_conceptual(
 
         # 1.2) Si no existe o se quiere regenerar: cargar info del guion
         print(f"🔍 Obteniendo información del guión {guion_id}")
-        cursor.execute("""
-            SELECT
-                g.vector_id,
-                g.assistant_id,
-                g.titulo,
-                u.nombre AS unidad_nombre,
-                usr.nombre AS profesor,
-                c.nombre AS nombre_curso,
-                p.identificacion_clase
-            FROM guion_clase g
-            JOIN unidad u ON g.id_unidad = u.id
-            JOIN curso c ON u.id_curso = c.id
-            LEFT JOIN planificacion p ON p.id_guion_clase = g.id
-            LEFT JOIN usuario_curso uc ON uc.id_curso = c.id
-            LEFT JOIN usuario usr ON uc.id_usuario = usr.id
-            WHERE g.id = %s AND usr.tipo = 2
-            LIMIT 1
-        """, (guion_id,))
-
-        result = cursor.fetchone()
+        # Unidad, curso y profesor salen del cache de metadatos
+        result = await obtener_info_guion(guion_id)
         if not result:
             raise HTTPException(status_code=404, detail=f"Guion {guion_id} no encontrado")
 
-        # Verificar recursos ANTES
-        recursos_ok, mensaje_recursos = await verificar_recursos_antes_de_procesar(
-            result["vector_id"],
-            result["assistant_id"]
+        # Cache content-addressed: mismo corpus + prompt + modelo + parámetros → misma salida
+        corpus_id = result.get("file_id") or result["vector_id"]
+        clave_cache = clave_generacion(
+            "mapa_conceptual", corpus_id, MODELO_ASSISTANT, VERSIONES_PROMPT["mapa_conceptual"], params={"titulo_guion": result.get("titulo") or ""}
         )
-        if not recursos_ok:
-            raise HTTPException(status_code=400, detail=mensaje_recursos)
+        data_response = None if sin_cache else await asyncio.to_thread(cache_generaciones.obtener, clave_cache)
+
+        if data_response is None:
+            recursos_ok, mensaje_recursos = await verificar_recursos_antes_de_procesar(
+                result["vector_id"],
+                result["assistant_id"]
+            )
+            if not recursos_ok:
+                raise HTTPException(status_code=400, detail=mensaje_recursos)
 
         # Guardar result para usarlo después
         result_data = {
@@ -4610,42 +4082,48 @@ async def generar_mapa_conceptual(
     except Exception as db_error:
         print(f"❌ Error en base de datos: {db_error}")
         raise HTTPException(status_code=500, detail=f"Error accediendo a datos: {str(db_error)}")
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
 
     # -------------------- 2) Generación con reintentos (con thread válido) --------------------
     try:
-        await throttling_global()
 
-        # ✅ Crear thread ANTES de reintentos
-        nuevo_thread = client.beta.threads.create()
-        thread_id = nuevo_thread.id
-        print(f"🆕 Nuevo thread creado para mapa: {thread_id}")
-
-        data = {
-            "thread_id": thread_id,
-            "vector_id": result_data["vector_id"],
-            "assistant_id": result_data["assistant_id"],
-            "titulo_guion": result_data["titulo"],
-        }
+        if data_response is None:
+            # ✅ Crear thread ANTES de reintentos
+            nuevo_thread = await aclient.beta.threads.create()
+            thread_id = nuevo_thread.id
+            print(f"🆕 Nuevo thread creado para mapa: {thread_id}")
 
-        async def call_fn(payload):
-            return await generar_mapa_conceptual_fn(
-                assistant_id=payload["assistant_id"],
-                thread_id=payload["thread_id"],
-                vector_id=payload["vector_id"],
-                titulo_guion=payload["titulo_guion"],
+            # Digest compartido del corpus: el material se genera sobre él, sin file_search
+            digest = await digests_corpus.obtener_texto(
+                corpus_id, result_data["assistant_id"], result_data["vector_id"], regenerar=sin_cache
             )
 
-        data_response = await llamar_fn_con_reintentos_y_cancelacion(
-            call_fn,
-            data,
-            max_intentos=3,
-            tipo_contenido="mapa_conceptual"
-        )
+            data = {
+                "thread_id": thread_id,
+                "vector_id": result_data["vector_id"],
+                "assistant_id": result_data["assistant_id"],
+                "digest": digest,
+                "titulo_guion": result_data["titulo"],
+            }
+
+            async def call_fn(payload):
+                return await generar_mapa_conceptual_fn(
+                    assistant_id=payload["assistant_id"],
+                    thread_id=payload["thread_id"],
+                    vector_id=payload["vector_id"],
+                    titulo_guion=payload["titulo_guion"],
+                    digest=payload["digest"],
+                )
+
+            data_response = await llamar_fn_con_reintentos_y_cancelacion(
+                call_fn,
+                data,
+                max_intentos=3,
+                tipo_contenido="mapa_conceptual"
+            )
+            if data_response:
+                await asyncio.to_thread(cache_generaciones.guardar, clave_cache, "mapa_conceptual", corpus_id, data_response)
+        else:
+            print("⚡ mapa_conceptual servido desde cache de generaciones (sin llamadas a OpenAI)")
 
         if not data_response:
             raise HTTPException(
@@ -4664,19 +4142,6 @@ async def generar_mapa_conceptual(
         )
 
         # -------------------- 3) Guardar en BD --------------------
-        conn = connect_db()
-        cursor = conn.cursor()
-
-        cursor.execute("""
-            SELECT COALESCE(MAX(version), 0) + 1 as nueva_version
-            FROM mapa_conceptual
-            WHERE id_guion_clase = %s
-        """, (guion_id,))
-
-        version_result = cursor.fetchone()
-        # ✅ FIX KeyError:0
-        nueva_version = version_result.get("nueva_version") if version_result else 1
-
         metadata = {
             "unidad_nombre": result_data.get("unidad_nombre"),
             "profesor": result_data.get("profesor"),
@@ -4687,32 +4152,17 @@ async def generar_mapa_conceptual(
             "assistant_id": result_data.get("assistant_id")
         }
 
-        # Borrar anteriores del mismo guion
-        cursor.execute("""
-            DELETE FROM mapa_conceptual
-            WHERE id_guion_clase = %s
-        """, (guion_id,))
+        contenido = {
+            "titulo": mapa_procesado.get("titulo", "") or "",
+            "conceptos": mapa_procesado.get("conceptos", []),
+            "relaciones": mapa_procesado.get("relaciones", []),
+        } if isinstance(mapa_procesado, dict) else {"titulo": "", "conceptos": [], "relaciones": []}
 
-        # Insertar nuevo (version siempre 1 según tu decisión)
-        cursor.execute("""
-            INSERT INTO mapa_conceptual (
-                id_guion_clase,
-                titulo,
-                conceptos,
-                relaciones,
-                metadata,
-                version
-            ) VALUES (%s, %s, %s, %s, %s, 1)
-        """, (
-            guion_id,
-            mapa_procesado.get("titulo", "") if isinstance(mapa_procesado, dict) else "",
-            json.dumps(mapa_procesado.get("conceptos", []), ensure_ascii=False) if isinstance(mapa_procesado, dict) else "[]",
-            json.dumps(mapa_procesado.get("relaciones", []), ensure_ascii=False) if isinstance(mapa_procesado, dict) else "[]",
-            json.dumps(metadata, ensure_ascii=False)
-        ))
-
-        conn.commit()
-        print(f"✅ Mapa conceptual guardado en BD (v{nueva_version})")
+        guardado = await repositorio.transaccion(guardar_material, guion_id, "mapa_conceptual", contenido, metadata)
+        if guardado["cambio"]:
+            print(f"✅ Mapa conceptual guardado en BD (v{guardado['version']})")
+        else:
+            print(f"♻️ Mapa conceptual sin cambios (v{guardado['version']})")
 
         return {
             "mapa_conceptual": mapa_procesado,
@@ -4730,22 +4180,9 @@ async def generar_mapa_conceptual(
         raise HTTPException(status_code=500, detail=f"Error generando mapa conceptual: {str(api_error)}")
 
     finally:
-        # cerrar DB si quedó abierta
-        try:
-            if cursor:
-                cursor.close()
-        except:
-            pass
-        try:
-            if conn:
-                conn.close()
-        except:
-            pass
-
-        # limpiar thread
         if thread_id:
             try:
-                client.beta.threads.delete(thread_id)
+                await aclient.beta.threads.delete(thread_id)
                 print(f"🧹 Thread {thread_id} eliminado")
             except Exception as e:
                 print(f"⚠️ No se pudo eliminar thread: {e}")
@@ -4759,28 +4196,19 @@ async def regenerar_mapa_conceptual(guion_id: int):
 
 
 @app.get("/planificacion/{guion_id}/mapa-conceptual/existe")
-async def verificar_mapa_conceptual_existe(guion_id: int):
+def verificar_mapa_conceptual_existe(guion_id: int):
     """Verifica si ya existe un mapa conceptual para este guión"""
     try:
         conn = connect_db()
         cursor = conn.cursor()
 
-        
-        cursor.execute("""
-            SELECT id, version, creado_en, titulo 
-            FROM mapa_conceptual 
-            WHERE id_guion_clase = %s 
-            ORDER BY version DESC 
-            LIMIT 1
-        """, (guion_id,))
-        
-        mapa = cursor.fetchone()
-        
+        mapa = estado_material(cursor, guion_id, "mapa_conceptual")
+
         return {
             "existe": mapa is not None,
             "version": mapa['version'] if mapa else 0,
             "titulo": mapa['titulo'] if mapa else "",
-            "creado_en": mapa['creado_en'].isoformat() if mapa and mapa['creado_en'] else None
+            "creado_en": mapa['actualizado_en'].isoformat() if mapa else None
         }
         
     except Exception as e:
@@ -4801,14 +4229,14 @@ from app.services.openai_assistants import generar_flashcards_fn
 ##################
 #########################################################################
 @app.get("/planificacion/{guion_id}/flashcards")
+@una_sola_generacion("flashcards", existe=material_guardado)
 async def generar_flashcards(
     guion_id: int,
-    accion: str = Query("obtener", description="Acción: 'obtener' (default), 'regenerar'")
+    accion: str = Query("obtener", description="Acción: 'obtener' (default), 'regenerar'"),
+    sin_cache: bool = False
 ):
     print(f"📚 Flashcards - Guión: {guion_id}, Acción: {accion}")
     thread_id = None
-    conn = None
-    cursor = None
 
     def parse_json_field(value, default):
         if value is None:
@@ -4823,72 +4251,51 @@ async def generar_flashcards(
         return default
 
     # -------------------- 1) BD: devolver existentes o cargar datos base --------------------
-    try:
-        conn = connect_db()
-        cursor = conn.cursor()
-
-        if accion == "obtener":
-            cursor.execute("""
-                SELECT cards, metadata
-                FROM flashcard
-                WHERE id_guion_clase = %s
-                ORDER BY version DESC
-                LIMIT 1
-            """, (guion_id,))
-
-            flashcards_existentes = cursor.fetchone()
-            if flashcards_existentes:
-                print("✅ Flashcards encontradas en BD, devolviendo...")
-
-                cards = parse_json_field(flashcards_existentes.get("cards"), [])
-                metadata = parse_json_field(flashcards_existentes.get("metadata"), {})
-                total_cards = len(cards) if isinstance(cards, list) else 0
-
-                flashcards_formateadas = []
-                if isinstance(cards, list):
-                    for i, card in enumerate(cards):
-                        if isinstance(card, dict):
-                            flashcards_formateadas.append({
-                                "id": i + 1,
-                                "pregunta": card.get("pregunta", f"Pregunta {i+1}"),
-                                "respuesta": card.get("respuesta", f"Respuesta {i+1}"),
-                                "categoria": card.get("categoria", "concepto")
-                            })
-
-                return JSONResponse({
-                    "flashcards": flashcards_formateadas,
-                    "unidad_nombre": metadata.get("unidad_nombre", "Sin nombre"),
-                    "profesor": metadata.get("profesor", "Docente no especificado"),
-                    "nombre_curso": metadata.get("nombre_curso", "Curso no especificado"),
-                    "nombre_asignatura": metadata.get("nombre_asignatura", "Asignatura no especificada"),
-                    "nombre_unidad": metadata.get("nombre_unidad", "Unidad no especificada"),
-                    "total_cards": total_cards
-                })
-
-        # Si no existen o se quiere regenerar
-        print(f"🔍 Obteniendo información del guión {guion_id}")
-        cursor.execute("""
-            SELECT
-                g.vector_id,
-                g.assistant_id,
-                u.nombre AS unidad_nombre,
-                usr.nombre AS profesor,
-                c.nombre AS nombre_curso,
-                p.identificacion_clase
-            FROM guion_clase g
-            JOIN unidad u ON g.id_unidad = u.id
-            JOIN curso c ON u.id_curso = c.id
-            LEFT JOIN planificacion p ON p.id_guion_clase = g.id
-            LEFT JOIN usuario_curso uc ON uc.id_curso = c.id
-            LEFT JOIN usuario usr ON uc.id_usuario = usr.id
-            WHERE g.id = %s AND usr.tipo = 2
-            LIMIT 1
-        """, (guion_id,))
+    if accion == "obtener":
+        flashcards_existentes = await repositorio.transaccion(obtener_material, guion_id, "flashcards")
+        if flashcards_existentes:
+            print("✅ Flashcards encontradas en BD, devolviendo...")
+
+            cards = flashcards_existentes["contenido"].get("cards", [])
+            metadata = flashcards_existentes["metadata"]
+            total_cards = len(cards) if isinstance(cards, list) else 0
+
+            flashcards_formateadas = []
+            if isinstance(cards, list):
+                for i, card in enumerate(cards):
+                    if isinstance(card, dict):
+                        flashcards_formateadas.append({
+                            "id": i + 1,
+                            "pregunta": card.get("pregunta", f"Pregunta {i+1}"),
+                            "respuesta": card.get("respuesta", f"Respuesta {i+1}"),
+                            "categoria": card.get("categoria", "concepto")
+                        })
+
+            return JSONResponse({
+                "flashcards": flashcards_formateadas,
+                "unidad_nombre": metadata.get("unidad_nombre", "Sin nombre"),
+                "profesor": metadata.get("profesor", "Docente no especificado"),
+                "nombre_curso": metadata.get("nombre_curso", "Curso no especificado"),
+                "nombre_asignatura": metadata.get("nombre_asignatura", "Asignatura no especificada"),
+                "nombre_unidad": metadata.get("nombre_unidad", "Unidad no especificada"),
+                "total_cards": total_cards
+            })
 
-        result = cursor.fetchone()
-        if not result:
-            raise HTTPException(status_code=404, detail="Guion no encontrado")
+    # Si no existen o se quiere regenerar
+    print(f"🔍 Obteniendo información del guión {guion_id}")
+    # Unidad, curso y profesor salen del cache de metadatos
+    result = await obtener_info_guion(guion_id)
+    if not result:
+        raise HTTPException(status_code=404, detail="Guion no encontrado")
+
+    # Cache content-addressed: mismo corpus + prompt + modelo + parámetros → misma salida
+    corpus_id = result.get("file_id") or result["vector_id"]
+    clave_cache = clave_generacion(
+        "flashcards", corpus_id, MODELO_ASSISTANT, VERSIONES_PROMPT["flashcards"], params={}
+    )
+    data_response = None if sin_cache else await asyncio.to_thread(cache_generaciones.obtener, clave_cache)
 
+    if data_response is None:
         recursos_ok, mensaje_recursos = await verificar_recursos_antes_de_procesar(
             result["vector_id"],
             result["assistant_id"]
@@ -4896,63 +4303,60 @@ async def generar_flashcards(
         if not recursos_ok:
             raise HTTPException(status_code=400, detail=mensaje_recursos)
 
-        result_data = {
-            "vector_id": result["vector_id"],
-            "assistant_id": result["assistant_id"],
-            "unidad_nombre": result.get("unidad_nombre"),
-            "profesor": result.get("profesor"),
-            "nombre_curso": result.get("nombre_curso"),
-            "identificacion_clase": result.get("identificacion_clase")
-        }
-
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
+    result_data = {
+        "vector_id": result["vector_id"],
+        "assistant_id": result["assistant_id"],
+        "unidad_nombre": result.get("unidad_nombre"),
+        "profesor": result.get("profesor"),
+        "nombre_curso": result.get("nombre_curso"),
+        "identificacion_clase": result.get("identificacion_clase")
+    }
 
     # -------------------- 2) Generación con reintentos --------------------
     try:
-        await throttling_global()
 
-        nuevo_thread = client.beta.threads.create()
-        thread_id = nuevo_thread.id
-        print(f"🆕 Nuevo thread creado para flashcards: {thread_id}")
+        if data_response is None:
+            nuevo_thread = await aclient.beta.threads.create()
+            thread_id = nuevo_thread.id
+            print(f"🆕 Nuevo thread creado para flashcards: {thread_id}")
 
-        data = {
-            "thread_id": thread_id,
-            "vector_id": result_data["vector_id"],
-            "assistant_id": result_data["assistant_id"],
-        }
-
-        async def call_fn(payload):
-            return await generar_flashcards_fn(
-                assistant_id=payload["assistant_id"],
-                thread_id=payload["thread_id"],
-                vector_id=payload["vector_id"],
+            # Digest compartido del corpus: el material se genera sobre él, sin file_search
+            digest = await digests_corpus.obtener_texto(
+                corpus_id, result_data["assistant_id"], result_data["vector_id"], regenerar=sin_cache
             )
 
-        data_response = await llamar_fn_con_reintentos_y_cancelacion(
-            call_fn,
-            data,
-            max_intentos=3,
-            tipo_contenido="flashcards"
-        )
+            data = {
+                "thread_id": thread_id,
+                "vector_id": result_data["vector_id"],
+                "assistant_id": result_data["assistant_id"],
+                "digest": digest,
+            }
+
+            async def call_fn(payload):
+                return await generar_flashcards_fn(
+                    assistant_id=payload["assistant_id"],
+                    thread_id=payload["thread_id"],
+                    vector_id=payload["vector_id"],
+                    digest=payload["digest"],
+                )
+
+            data_response = await llamar_fn_con_reintentos_y_cancelacion(
+                call_fn,
+                data,
+                max_intentos=3,
+                tipo_contenido="flashcards"
+            )
+            if data_response:
+                await asyncio.to_thread(cache_generaciones.guardar, clave_cache, "flashcards", corpus_id, data_response)
+        else:
+            print("⚡ flashcards servido desde cache de generaciones (sin llamadas a OpenAI)")
 
         flashcards_texto = data_response.get("flashcards", "") if data_response else ""
 
         # -------------------- 2.1) Tu parsing actual --------------------
-        match = re.search(r'```json([\s\S]*?)```', flashcards_texto)
-        if match:
-            try:
-                flashcards_json = json.loads(match.group(1))
-            except json.JSONDecodeError:
-                flashcards_json = {"error": "No se pudieron generar las flashcards"}
-        else:
-            try:
-                flashcards_json = json.loads(flashcards_texto)
-            except json.JSONDecodeError:
-                flashcards_json = {"error": "No se pudieron generar las flashcards"}
+        flashcards_json = extraer_json(flashcards_texto)
+        if flashcards_json is None:
+            flashcards_json = {"error": "No se pudieron generar las flashcards"}
 
         if isinstance(flashcards_json, dict) and "flashcards" in flashcards_json:
             flashcards_array = flashcards_json["flashcards"]
@@ -4988,19 +4392,6 @@ async def generar_flashcards(
         )
 
         # -------------------- 3) Guardar en BD --------------------
-        conn = connect_db()
-        cursor = conn.cursor()
-
-        cursor.execute("""
-            SELECT COALESCE(MAX(version), 0) + 1 as nueva_version
-            FROM flashcard
-            WHERE id_guion_clase = %s
-        """, (guion_id,))
-
-        version_result = cursor.fetchone()
-        # ✅ FIX KeyError:0
-        nueva_version = version_result.get("nueva_version") if version_result else 1
-
         metadata = {
             "unidad_nombre": result_data.get("unidad_nombre", "Sin nombre"),
             "profesor": result_data.get("profesor", "Docente no especificado"),
@@ -5013,23 +4404,11 @@ async def generar_flashcards(
 
         total_cards = len(flashcards_formateadas)
 
-        cursor.execute("DELETE FROM flashcard WHERE id_guion_clase = %s", (guion_id,))
-
-        cursor.execute("""
-            INSERT INTO flashcard (
-                id_guion_clase,
-                cards,
-                metadata,
-                version
-            ) VALUES (%s, %s, %s, 1)
-        """, (
-            guion_id,
-            json.dumps(flashcards_formateadas, ensure_ascii=False),
-            json.dumps(metadata, ensure_ascii=False)
-        ))
-
-        conn.commit()
-        print(f"✅ Flashcards guardadas en BD (v{nueva_version}) - {total_cards} cards")
+        guardado = await repositorio.transaccion(guardar_material, guion_id, "flashcards", {"cards": flashcards_formateadas}, metadata)
+        if guardado["cambio"]:
+            print(f"✅ Flashcards guardadas en BD (v{guardado['version']}) - {total_cards} cards")
+        else:
+            print(f"♻️ Flashcards sin cambios (v{guardado['version']})")
 
         return JSONResponse({
             "flashcards": flashcards_formateadas,
@@ -5048,20 +4427,9 @@ async def generar_flashcards(
         raise HTTPException(status_code=500, detail="Error generando flashcards")
 
     finally:
-        try:
-            if cursor:
-                cursor.close()
-        except:
-            pass
-        try:
-            if conn:
-                conn.close()
-        except:
-            pass
-
         if thread_id:
             try:
-                client.beta.threads.delete(thread_id)
+                await aclient.beta.threads.delete(thread_id)
                 print(f"🧹 Thread {thread_id} eliminado (flashcards)")
             except Exception as e:
                 print(f"⚠️ No se pudo eliminar thread: {e}")
@@ -5074,27 +4442,18 @@ async def regenerar_flashcards(guion_id: int):
 
 
 @app.get("/planificacion/{guion_id}/flashcards/existe")
-async def verificar_flashcards_existe(guion_id: int):
+def verificar_flashcards_existe(guion_id: int):
     """Verifica si ya existen flashcards para este guión"""
     try:
         conn = connect_db()
         cursor = conn.cursor()
 
-        
-        cursor.execute("""
-            SELECT id, version, creado_en, 
-            FROM flashcard 
-            WHERE id_guion_clase = %s 
-            ORDER BY version DESC 
-            LIMIT 1
-        """, (guion_id,))
-        
-        flashcards = cursor.fetchone()
-        
+        flashcards = estado_material(cursor, guion_id, "flashcards")
+
         return {
             "existe": flashcards is not None,
             "version": flashcards['version'] if flashcards else 0,
-            "creado_en": flashcards['creado_en'].isoformat() if flashcards and flashcards['creado_en'] else None
+            "creado_en": flashcards['actualizado_en'].isoformat() if flashcards else None
         }
         
     except Exception as e:
@@ -5115,14 +4474,14 @@ from app.services.openai_assistants import generar_glosario_fn
 ##################
 #########################################################################
 @app.get("/planificacion/{guion_id}/glosario")
+@una_sola_generacion("glosario", existe=material_guardado)
 async def generar_glosario(
     guion_id: int,
-    accion: str = Query("obtener", description="Acción: 'obtener' (default), 'regenerar'")
+    accion: str = Query("obtener", description="Acción: 'obtener' (default), 'regenerar'"),
+    sin_cache: bool = False
 ):
     print(f"📖 Glosario - Guión: {guion_id}, Acción: {accion}")
     thread_id = None
-    conn = None
-    cursor = None
 
     def parse_json_field(value, default):
         if value is None:
@@ -5137,72 +4496,51 @@ async def generar_glosario(
         return default
 
     # -------------------- 1) BD: devolver existentes o cargar datos base --------------------
-    try:
-        conn = connect_db()
-        cursor = conn.cursor()
-
-        if accion == "obtener":
-            cursor.execute("""
-                SELECT terminos, metadata
-                FROM glosario
-                WHERE id_guion_clase = %s
-                ORDER BY version DESC
-                LIMIT 1
-            """, (guion_id,))
-
-            glosario_existente = cursor.fetchone()
-            if glosario_existente:
-                print("✅ Glosario encontrado en BD, devolviendo...")
-
-                terminos = parse_json_field(glosario_existente.get("terminos"), [])
-                metadata = parse_json_field(glosario_existente.get("metadata"), {})
-                total_terminos = len(terminos) if isinstance(terminos, list) else 0
-
-                glosario_formateado = []
-                if isinstance(terminos, list):
-                    for i, termino in enumerate(terminos):
-                        if isinstance(termino, dict):
-                            glosario_formateado.append({
-                                "id": i + 1,
-                                "termino": termino.get("termino", f"Término {i+1}"),
-                                "definicion": termino.get("definicion", f"Definición del término {i+1}"),
-                                "categoria": termino.get("categoria", "general"),
-                                "ejemplo": termino.get("ejemplo", "")
-                            })
-
-                return JSONResponse({
-                    "glosario": glosario_formateado,
-                    "unidad_nombre": metadata.get("unidad_nombre", "Sin nombre"),
-                    "profesor": metadata.get("profesor", "Docente no especificado"),
-                    "nombre_curso": metadata.get("nombre_curso", "Curso no especificado"),
-                    "nombre_asignatura": metadata.get("nombre_asignatura", "Asignatura no especificada"),
-                    "total_terminos": total_terminos
-                })
-
-        # Si no existe o se quiere regenerar
-        print(f"🔍 Obteniendo información del guión {guion_id}")
-        cursor.execute("""
-            SELECT
-                g.vector_id,
-                g.assistant_id,
-                u.nombre AS unidad_nombre,
-                usr.nombre AS profesor,
-                c.nombre AS nombre_curso,
-                p.identificacion_clase
-            FROM guion_clase g
-            JOIN unidad u ON g.id_unidad = u.id
-            JOIN curso c ON u.id_curso = c.id
-            LEFT JOIN planificacion p ON p.id_guion_clase = g.id
-            LEFT JOIN usuario_curso uc ON uc.id_curso = c.id
-            LEFT JOIN usuario usr ON uc.id_usuario = usr.id
-            WHERE g.id = %s AND usr.tipo = 2
-            LIMIT 1
-        """, (guion_id,))
+    if accion == "obtener":
+        glosario_existente = await repositorio.transaccion(obtener_material, guion_id, "glosario")
+        if glosario_existente:
+            print("✅ Glosario encontrado en BD, devolviendo...")
+
+            terminos = glosario_existente["contenido"].get("terminos", [])
+            metadata = glosario_existente["metadata"]
+            total_terminos = len(terminos) if isinstance(terminos, list) else 0
+
+            glosario_formateado = []
+            if isinstance(terminos, list):
+                for i, termino in enumerate(terminos):
+                    if isinstance(termino, dict):
+                        glosario_formateado.append({
+                            "id": i + 1,
+                            "termino": termino.get("termino", f"Término {i+1}"),
+                            "definicion": termino.get("definicion", f"Definición del término {i+1}"),
+                            "categoria": termino.get("categoria", "general"),
+                            "ejemplo": termino.get("ejemplo", "")
+                        })
+
+            return JSONResponse({
+                "glosario": glosario_formateado,
+                "unidad_nombre": metadata.get("unidad_nombre", "Sin nombre"),
+                "profesor": metadata.get("profesor", "Docente no especificado"),
+                "nombre_curso": metadata.get("nombre_curso", "Curso no especificado"),
+                "nombre_asignatura": metadata.get("nombre_asignatura", "Asignatura no especificada"),
+                "total_terminos": total_terminos
+            })
 
-        result = cursor.fetchone()
-        if not result:
-            raise HTTPException(status_code=404, detail="Guion no encontrado")
+    # Si no existe o se quiere regenerar
+    print(f"🔍 Obteniendo información del guión {guion_id}")
+    # Unidad, curso y profesor salen del cache de metadatos
+    result = await obtener_info_guion(guion_id)
+    if not result:
+        raise HTTPException(status_code=404, detail="Guion no encontrado")
+
+    # Cache content-addressed: mismo corpus + prompt + modelo + parámetros → misma salida
+    corpus_id = result.get("file_id") or result["vector_id"]
+    clave_cache = clave_generacion(
+        "glosario", corpus_id, MODELO_ASSISTANT, VERSIONES_PROMPT["glosario"], params={}
+    )
+    data_response = None if sin_cache else await asyncio.to_thread(cache_generaciones.obtener, clave_cache)
 
+    if data_response is None:
         recursos_ok, mensaje_recursos = await verificar_recursos_antes_de_procesar(
             result["vector_id"],
             result["assistant_id"]
@@ -5210,63 +4548,60 @@ async def generar_glosario(
         if not recursos_ok:
             raise HTTPException(status_code=400, detail=mensaje_recursos)
 
-        result_data = {
-            "vector_id": result["vector_id"],
-            "assistant_id": result["assistant_id"],
-            "unidad_nombre": result.get("unidad_nombre"),
-            "profesor": result.get("profesor"),
-            "nombre_curso": result.get("nombre_curso"),
-            "identificacion_clase": result.get("identificacion_clase")
-        }
-
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
+    result_data = {
+        "vector_id": result["vector_id"],
+        "assistant_id": result["assistant_id"],
+        "unidad_nombre": result.get("unidad_nombre"),
+        "profesor": result.get("profesor"),
+        "nombre_curso": result.get("nombre_curso"),
+        "identificacion_clase": result.get("identificacion_clase")
+    }
 
     # -------------------- 2) Generación con reintentos --------------------
     try:
-        await throttling_global()
-
-        nuevo_thread = client.beta.threads.create()
-        thread_id = nuevo_thread.id
-        print(f"🆕 Nuevo thread creado para glosario: {thread_id}")
 
-        data = {
-            "thread_id": thread_id,
-            "vector_id": result_data["vector_id"],
-            "assistant_id": result_data["assistant_id"],
-        }
+        if data_response is None:
+            nuevo_thread = await aclient.beta.threads.create()
+            thread_id = nuevo_thread.id
+            print(f"🆕 Nuevo thread creado para glosario: {thread_id}")
 
-        async def call_fn(payload):
-            return await generar_glosario_fn(
-                assistant_id=payload["assistant_id"],
-                thread_id=payload["thread_id"],
-                vector_id=payload["vector_id"],
+            # Digest compartido del corpus: el material se genera sobre él, sin file_search
+            digest = await digests_corpus.obtener_texto(
+                corpus_id, result_data["assistant_id"], result_data["vector_id"], regenerar=sin_cache
             )
 
-        data_response = await llamar_fn_con_reintentos_y_cancelacion(
-            call_fn,
-            data,
-            max_intentos=3,
-            tipo_contenido="glosario"
-        )
+            data = {
+                "thread_id": thread_id,
+                "vector_id": result_data["vector_id"],
+                "assistant_id": result_data["assistant_id"],
+                "digest": digest,
+            }
+
+            async def call_fn(payload):
+                return await generar_glosario_fn(
+                    assistant_id=payload["assistant_id"],
+                    thread_id=payload["thread_id"],
+                    vector_id=payload["vector_id"],
+                    digest=payload["digest"],
+                )
+
+            data_response = await llamar_fn_con_reintentos_y_cancelacion(
+                call_fn,
+                data,
+                max_intentos=3,
+                tipo_contenido="glosario"
+            )
+            if data_response:
+                await asyncio.to_thread(cache_generaciones.guardar, clave_cache, "glosario", corpus_id, data_response)
+        else:
+            print("⚡ glosario servido desde cache de generaciones (sin llamadas a OpenAI)")
 
         glosario_texto = data_response.get("glosario", "") if data_response else ""
 
         # -------------------- 2.1) Tu parsing actual --------------------
-        match = re.search(r'```json([\s\S]*?)```', glosario_texto)
-        if match:
-            try:
-                glosario_json = json.loads(match.group(1))
-            except json.JSONDecodeError:
-                glosario_json = {"error": "No se pudo generar el glosario"}
-        else:
-            try:
-                glosario_json = json.loads(glosario_texto)
-            except json.JSONDecodeError:
-                glosario_json = {"error": "No se pudo generar el glosario"}
+        glosario_json = extraer_json(glosario_texto)
+        if glosario_json is None:
+            glosario_json = {"error": "No se pudo generar el glosario"}
 
         if isinstance(glosario_json, dict) and "glosario" in glosario_json:
             glosario_array = glosario_json["glosario"]
@@ -5304,19 +4639,6 @@ async def generar_glosario(
         )
 
         # -------------------- 3) Guardar en BD --------------------
-        conn = connect_db()
-        cursor = conn.cursor()
-
-        cursor.execute("""
-            SELECT COALESCE(MAX(version), 0) + 1 as nueva_version
-            FROM glosario
-            WHERE id_guion_clase = %s
-        """, (guion_id,))
-
-        version_result = cursor.fetchone()
-        # ✅ FIX KeyError:0
-        nueva_version = version_result.get("nueva_version") if version_result else 1
-
         metadata = {
             "unidad_nombre": result_data.get("unidad_nombre", "Sin nombre"),
             "profesor": result_data.get("profesor", "Docente no especificado"),
@@ -5324,28 +4646,16 @@ async def generar_glosario(
             "nombre_asignatura": nombre_asignatura,
             "nombre_unidad": result_data.get("unidad_nombre", "Unidad no especificada"),
             "vector_id": result_data.get("vector_id"),
-            "assistant_id": result_data.get("assistant_id")
-        }
-
-        total_terminos = len(glosario_formateado)
-
-        cursor.execute("DELETE FROM glosario WHERE id_guion_clase = %s", (guion_id,))
-
-        cursor.execute("""
-            INSERT INTO glosario (
-                id_guion_clase,
-                terminos,
-                metadata,
-                version
-            ) VALUES (%s, %s, %s, 1)
-        """, (
-            guion_id,
-            json.dumps(glosario_formateado, ensure_ascii=False),
-            json.dumps(metadata, ensure_ascii=False)
-        ))
+            "assistant_id": result_data.get("assistant_id")
+        }
 
-        conn.commit()
-        print(f"✅ Glosario guardado en BD (v{nueva_version}) - {total_terminos} términos")
+        total_terminos = len(glosario_formateado)
+
+        guardado = await repositorio.transaccion(guardar_material, guion_id, "glosario", {"terminos": glosario_formateado}, metadata)
+        if guardado["cambio"]:
+            print(f"✅ Glosario guardado en BD (v{guardado['version']}) - {total_terminos} términos")
+        else:
+            print(f"♻️ Glosario sin cambios (v{guardado['version']})")
 
         return JSONResponse({
             "glosario": glosario_formateado,
@@ -5363,20 +4673,9 @@ async def generar_glosario(
         raise HTTPException(status_code=500, detail="Error generando glosario")
 
     finally:
-        try:
-            if cursor:
-                cursor.close()
-        except:
-            pass
-        try:
-            if conn:
-                conn.close()
-        except:
-            pass
-
         if thread_id:
             try:
-                client.beta.threads.delete(thread_id)
+                await aclient.beta.threads.delete(thread_id)
                 print(f"🧹 Thread {thread_id} eliminado (glosario)")
             except Exception as e:
                 print(f"⚠️ No se pudo eliminar thread: {e}")
@@ -5389,27 +4688,18 @@ async def regenerar_glosario(guion_id: int):
 
 
 @app.get("/planificacion/{guion_id}/glosario/existe")
-async def verificar_glosario_existe(guion_id: int):
+def verificar_glosario_existe(guion_id: int):
     """Verifica si ya existe un glosario para este guión"""
     try:
         conn = connect_db()
         cursor = conn.cursor()
 
-        
-        cursor.execute("""
-            SELECT id, version, creado_en,
-            FROM glosario 
-            WHERE id_guion_clase = %s 
-            ORDER BY version DESC 
-            LIMIT 1
-        """, (guion_id,))
-        
-        glosario = cursor.fetchone()
-        
+        glosario = estado_material(cursor, guion_id, "glosario")
+
         return {
             "existe": glosario is not None,
             "version": glosario['version'] if glosario else 0,
-            "creado_en": glosario['creado_en'].isoformat() if glosario and glosario['creado_en'] else None
+            "creado_en": glosario['actualizado_en'].isoformat() if glosario else None
         }
         
     except Exception as e:
@@ -5432,6 +4722,7 @@ from app.services.openai_assistants import generar_infografia_fn
 ##################
 #########################################################################
 @app.get("/planificacion/{guion_id}/infografia")
+@una_sola_generacion("infografia", existe=material_guardado)
 async def generar_infografia(
     guion_id: int,
     accion: str = Query("obtener", description="Acción: 'obtener' (default), 'regenerar'")
@@ -5439,8 +4730,6 @@ async def generar_infografia(
     print(f"🎨 Infografía - Guión: {guion_id}, Acción: {accion}")
 
     thread_id = None
-    conn = None
-    cursor = None
 
     def parse_json_field(value, default):
         if value is None:
@@ -5456,23 +4745,13 @@ async def generar_infografia(
 
     # -------------------- 1) BD: devolver existentes o cargar datos base --------------------
     try:
-        conn = connect_db()
-        cursor = conn.cursor()
-
         if accion == "obtener":
-            cursor.execute("""
-                SELECT imagen_url, imagen_base64, metadata, titulo
-                FROM infografia
-                WHERE id_guion_clase = %s
-                ORDER BY version DESC
-                LIMIT 1
-            """, (guion_id,))
-
-            infografia_existente = cursor.fetchone()
-            if infografia_existente:
+            material = await repositorio.transaccion(obtener_material, guion_id, "infografia")
+            if material:
                 print("✅ Infografía encontrada en BD, verificando...")
 
-                metadata = parse_json_field(infografia_existente.get("metadata"), {})
+                infografia_existente = material["contenido"]
+                metadata = material["metadata"]
 
                 imagen_base64 = None
                 imagen_base64_db = infografia_existente.get("imagen_base64") or ""
@@ -5510,7 +4789,7 @@ async def generar_infografia(
 
         # Si no existe o se quiere regenerar
         print(f"🔍 Obteniendo información del guión {guion_id}")
-        cursor.execute("""
+        result = await repositorio.uno(f"""
             SELECT
                 g.titulo,
                 g.ra AS recursos_aprendizaje,
@@ -5520,7 +4799,7 @@ async def generar_infografia(
                 u.nombre AS unidad_nombre,
                 usr.nombre AS profesor,
                 c.nombre AS nombre_curso,
-                p.identificacion_clase
+                {IDENTIFICACION_CLASE}
             FROM guion_clase g
             JOIN unidad u ON g.id_unidad = u.id
             JOIN curso c ON u.id_curso = c.id
@@ -5531,8 +4810,6 @@ async def generar_infografia(
             AND usr.tipo = 2
             LIMIT 1
         """, (guion_id,))
-
-        result = cursor.fetchone()
         if not result:
             raise HTTPException(status_code=404, detail="Guion no encontrado")
 
@@ -5551,17 +4828,6 @@ async def generar_infografia(
     except Exception as db_error:
         print(f"❌ Error en base de datos: {db_error}")
         raise HTTPException(status_code=500, detail=f"Error accediendo a datos: {str(db_error)}")
-    finally:
-        try:
-            if cursor:
-                cursor.close()
-        except:
-            pass
-        try:
-            if conn:
-                conn.close()
-        except:
-            pass
 
     # -------------------- 2) Generación con reintentos internos --------------------
     try:
@@ -5572,9 +4838,8 @@ async def generar_infografia(
         if not recursos_ok:
             raise HTTPException(status_code=400, detail=mensaje_recursos)
 
-        await throttling_global()
 
-        nuevo_thread = client.beta.threads.create()
+        nuevo_thread = await aclient.beta.threads.create()
         thread_id = nuevo_thread.id
         print(f"🆕 Thread creado: {thread_id}")
 
@@ -5624,18 +4889,6 @@ async def generar_infografia(
         )
 
         # -------------------- 3) Guardar en BD --------------------
-        conn = connect_db()
-        cursor = conn.cursor()
-
-        cursor.execute("""
-            SELECT COALESCE(MAX(version), 0) + 1 as nueva_version
-            FROM infografia
-            WHERE id_guion_clase = %s
-        """, (guion_id,))
-
-        version_result = cursor.fetchone()
-        nueva_version = version_result.get("nueva_version") if version_result else 1
-
         metadata = {
             "unidad_nombre": result_data.get("unidad_nombre", "Sin nombre"),
             "profesor": result_data.get("profesor", "Docente no especificado"),
@@ -5656,29 +4909,15 @@ async def generar_infografia(
         else:
             base64_a_guardar = f"[Imagen base64 truncada - tamaño original: {len(imagen_base64)} chars]"
 
-        cursor.execute("DELETE FROM infografia WHERE id_guion_clase = %s", (guion_id,))
-
-        cursor.execute("""
-            INSERT INTO infografia (
-                id_guion_clase,
-                titulo,
-                imagen_url,
-                imagen_base64,
-                prompt_utilizado,
-                metadata,
-                version
-            ) VALUES (%s, %s, %s, %s, %s, %s, 1)
-        """, (
-            guion_id,
-            result_data.get("titulo", ""),
-            imagen_url,
-            base64_a_guardar,
-            "Prompt generado automáticamente",
-            json.dumps(metadata, ensure_ascii=False)
-        ))
-
-        conn.commit()
-        print(f"✅ Infografía guardada en BD (v{nueva_version})")
+        guardado = await repositorio.transaccion(guardar_material, guion_id, "infografia", {
+            "titulo": result_data.get("titulo", "") or "",
+            "imagen_url": imagen_url,
+            "imagen_base64": base64_a_guardar,
+        }, metadata)
+        if guardado["cambio"]:
+            print(f"✅ Infografía guardada en BD (v{guardado['version']})")
+        else:
+            print(f"♻️ Infografía sin cambios (v{guardado['version']})")
 
         return JSONResponse({
             "infografia": imagen_base64,
@@ -5701,20 +4940,9 @@ async def generar_infografia(
         raise HTTPException(status_code=500, detail=f"Error generando infografía: {str(e)}")
 
     finally:
-        try:
-            if cursor:
-                cursor.close()
-        except:
-            pass
-        try:
-            if conn:
-                conn.close()
-        except:
-            pass
-
         if thread_id:
             try:
-                client.beta.threads.delete(thread_id)
+                await aclient.beta.threads.delete(thread_id)
                 print(f"🧹 Thread {thread_id} eliminado")
             except Exception as e:
                 print(f"⚠️ No se pudo eliminar thread: {e}")
@@ -5726,29 +4954,20 @@ async def regenerar_infografia(guion_id: int):
 
 
 @app.get("/planificacion/{guion_id}/infografia/existe")
-async def verificar_infografia_existe(guion_id: int):
+def verificar_infografia_existe(guion_id: int):
     """Verifica si ya existe una infografía para este guión"""
     try:
         conn = connect_db()
         cursor = conn.cursor()
 
-        
-        cursor.execute("""
-            SELECT id, version, creado_en, titulo, imagen_url 
-            FROM infografia 
-            WHERE id_guion_clase = %s 
-            ORDER BY version DESC 
-            LIMIT 1
-        """, (guion_id,))
-        
-        infografia = cursor.fetchone()
-        
+        infografia = estado_material(cursor, guion_id, "infografia")
+
         return {
             "existe": infografia is not None,
             "version": infografia['version'] if infografia else 0,
             "titulo": infografia['titulo'] if infografia else "",
             "tiene_url": bool(infografia['imagen_url']) if infografia else False,
-            "creado_en": infografia['creado_en'].isoformat() if infografia and infografia['creado_en'] else None
+            "creado_en": infografia['actualizado_en'].isoformat() if infografia else None
         }
         
     except Exception as e:
@@ -5866,6 +5085,185 @@ async def llamar_fn_con_reintentos_infografia(
 #################################################################
 
 
+#########################################################################
+##################
+################## Pipeline: todos los materiales de un guion en paralelo
+##################
+#########################################################################
+MATERIALES_CONCURRENCIA = int(os.getenv("MATERIALES_CONCURRENCIA", "5"))
+
+GENERADORES_MATERIALES = {
+    "resumen": generar_resumen,
+    "mapa_conceptual": generar_mapa_conceptual,
+    "flashcards": generar_flashcards,
+    "glosario": generar_glosario,
+    "infografia": generar_infografia,
+}
+
+
+@app.get("/planificacion/{guion_id}/materiales")
+async def generar_materiales(
+    guion_id: int,
+    accion: str = Query("obtener", description="Acción: 'obtener' (default), 'regenerar'"),
+    tipos: Optional[str] = Query(None, description="Lista separada por comas (default: todos)"),
+):
+    """
+    Genera resumen, mapa conceptual, flashcards, glosario e infografía de un
+    guion en paralelo (máximo MATERIALES_CONCURRENCIA a la vez).
+
+    Los recursos de OpenAI se verifican una sola vez para todo el pipeline.
+    Cada generador guarda su resultado en BD apenas termina, así que un error
+    en uno no afecta a los demás; la respuesta trae el estado de cada material.
+    """
+    seleccion = [t.strip() for t in tipos.split(",") if t.strip()] if tipos else list(GENERADORES_MATERIALES)
+    desconocidos = [t for t in seleccion if t not in GENERADORES_MATERIALES]
+    if desconocidos:
+        raise HTTPException(status_code=400, detail=f"Tipos no soportados: {', '.join(desconocidos)}")
+
+    print(f"🏭 Materiales - Guión: {guion_id}, Acción: {accion}, Tipos: {seleccion}")
+
+    # -------------------- 1) Recursos del guion (una sola vez) --------------------
+    try:
+        guion = await repositorio.uno("SELECT vector_id, assistant_id FROM guion_clase WHERE id = %s", (guion_id,))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error accediendo a datos: {str(e)}")
+
+    if not guion:
+        raise HTTPException(status_code=404, detail="Guion no encontrado")
+
+    recursos = (guion["vector_id"], guion["assistant_id"])
+    recursos_ok, mensaje_recursos = await verificar_recursos_antes_de_procesar(*recursos)
+    if not recursos_ok:
+        raise HTTPException(status_code=400, detail=mensaje_recursos)
+
+    # -------------------- 2) Fan-out con concurrencia acotada --------------------
+    semaforo = asyncio.Semaphore(max(1, MATERIALES_CONCURRENCIA))
+    inicio = time.monotonic()
+
+    async def _generar(tipo):
+        async with semaforo:
+            t0 = time.monotonic()
+            try:
+                respuesta = await GENERADORES_MATERIALES[tipo](guion_id, accion)
+                if isinstance(respuesta, JSONResponse):
+                    respuesta = json.loads(respuesta.body)
+                estado = {"estado": "ok", "contenido": respuesta}
+            except HTTPException as e:
+                estado = {"estado": "error", "status_code": e.status_code, "detalle": e.detail}
+            except Exception as e:
+                estado = {"estado": "error", "status_code": 500, "detalle": str(e)}
+            estado["segundos"] = round(time.monotonic() - t0, 2)
+            return tipo, estado
+
+    token = recursos_verificados.set(recursos)
+    try:
+        tareas = [asyncio.create_task(_generar(tipo)) for tipo in seleccion]
+    finally:
+        recursos_verificados.reset(token)
+
+    materiales = {}
+    for terminada in asyncio.as_completed(tareas):
+        tipo, estado = await terminada
+        materiales[tipo] = estado
+        icono = "✅" if estado["estado"] == "ok" else "❌"
+        print(f"{icono} Materiales - {tipo}: {estado['estado']} en {estado['segundos']}s")
+
+    total = round(time.monotonic() - inicio, 2)
+    errores = [t for t, e in materiales.items() if e["estado"] != "ok"]
+    print(f"🏁 Materiales - Guión: {guion_id} listo en {total}s ({len(errores)} con error)")
+
+    return {
+        "guion_id": guion_id,
+        "accion": accion,
+        "segundos_total": total,
+        "completados": len(materiales) - len(errores),
+        "errores": errores,
+        "materiales": {tipo: materiales[tipo] for tipo in seleccion},
+    }
+
+
+#########################################################################
+##################
+################## Cola de trabajos: generaciones largas en segundo plano
+##################
+#########################################################################
+async def _trabajo_crear_guion(payload):
+    return await completar_guion(payload["guion_id"], payload)
+
+
+async def _trabajo_material(payload):
+    respuesta = await GENERADORES_MATERIALES[payload["tipo"]](payload["guion_id"], payload.get("accion", "obtener"))
+    if isinstance(respuesta, JSONResponse):
+        respuesta = json.loads(respuesta.body)
+    return respuesta
+
+
+async def _trabajo_materiales(payload):
+    return await generar_materiales(payload["guion_id"], payload.get("accion", "obtener"), payload.get("tipos"))
+
+
+cola_trabajos.configurar(connect_db)
+cola_trabajos.registrar("crear_guion", _trabajo_crear_guion)
+cola_trabajos.registrar("material", _trabajo_material)
+cola_trabajos.registrar("materiales", _trabajo_materiales)
+cola_trabajos.registrar("borrar_recursos", borrar_recursos)
+cola_trabajos.registrar("reconciliar_recursos", reconciliar_recursos)
+
+
+@app.post("/planificacion/{guion_id}/trabajos")
+def encolar_material(
+    guion_id: int,
+    tipo: str = Query(..., description="resumen, mapa_conceptual, flashcards, glosario, infografia o materiales"),
+    accion: str = Query("obtener", description="Acción: 'obtener' (default), 'regenerar'"),
+    tipos: Optional[str] = Query(None, description="Solo para tipo=materiales: lista separada por comas"),
+):
+    """Encola la generación y responde de inmediato con el id del trabajo."""
+    if tipo == "materiales":
+        trabajo_id = cola_trabajos.encolar("materiales", {"guion_id": guion_id, "accion": accion, "tipos": tipos})
+    elif tipo in GENERADORES_MATERIALES:
+        trabajo_id = cola_trabajos.encolar("material", {"guion_id": guion_id, "tipo": tipo, "accion": accion})
+    else:
+        raise HTTPException(status_code=400, detail=f"Tipo no soportado: {tipo}")
+
+    return JSONResponse(status_code=202, content={
+        "trabajo_id": trabajo_id,
+        "estado": "pendiente",
+        "estado_url": f"/trabajos/{trabajo_id}",
+        "resultado_url": f"/trabajos/{trabajo_id}/resultado",
+    })
+
+
+@app.get("/trabajos/{trabajo_id}")
+def estado_trabajo(trabajo_id: int):
+    try:
+        trabajo = cola_trabajos.obtener(trabajo_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error consultando trabajo: {str(e)}")
+    if not trabajo:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    return trabajo
+
+
+@app.get("/trabajos/{trabajo_id}/resultado")
+def resultado_trabajo(trabajo_id: int):
+    try:
+        trabajo = cola_trabajos.obtener(trabajo_id, con_resultado=True)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error consultando trabajo: {str(e)}")
+    if not trabajo:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+
+    if trabajo["estado"] == "completado":
+        return trabajo["resultado"]
+    if trabajo["estado"] == "error":
+        raise HTTPException(status_code=500, detail=f"El trabajo falló: {trabajo['error']}")
+    return JSONResponse(status_code=202, content={
+        "trabajo_id": trabajo_id,
+        "estado": trabajo["estado"],
+        "intentos": trabajo["intentos"],
+    })
+
+
 
 
 ##########################################################################
@@ -5968,205 +5366,27 @@ async def enviar_correo_con_archivos(
 ################## Funcion para limpiar gpt
 ##################
 #########################################################################
-def get_preserved_assistant_ids():
-    """Obtiene todos los assistant_ids que deben preservarse de la base de datos"""
-    preserved_ids = set()
-    
-    try:
-        conn = mysql.connector.connect(**db_config)
-        cursor = conn.cursor()
-        
-        # Obtener assistant_ids de la tabla guion_clase
-        cursor.execute("SELECT assistant_id FROM guion_clase WHERE assistant_id IS NOT NULL AND assistant_id != ''")
-        for row in cursor.fetchall():
-            preserved_ids.add(row[0])
-        
-        # Obtener assistant_ids de la tabla unidad
-        cursor.execute("SELECT assistant_id FROM unidad WHERE assistant_id IS NOT NULL AND assistant_id != ''")
-        for row in cursor.fetchall():
-            preserved_ids.add(row[0])
-        
-        cursor.close()
-        conn.close()
-        
-    except Exception as e:
-        print(f"Error al obtener assistant_ids de la BD: {e}")
-    
-    return preserved_ids
-
-def get_preserved_vector_store_ids():
-    """Obtiene todos los vector_ids que deben preservarse de la base de datos"""
-    preserved_ids = set()
-    
-    try:
-        conn = mysql.connector.connect(**db_config)
-        cursor = conn.cursor()
-        
-        # Obtener vector_ids de la tabla guion_clase
-        cursor.execute("SELECT vector_id FROM guion_clase WHERE vector_id IS NOT NULL AND vector_id != ''")
-        for row in cursor.fetchall():
-            preserved_ids.add(row[0])
-        
-        # Obtener vector_ids de la tabla unidad
-        cursor.execute("SELECT vector_id FROM unidad WHERE vector_id IS NOT NULL AND vector_id != ''")
-        for row in cursor.fetchall():
-            preserved_ids.add(row[0])
-        
-        cursor.close()
-        conn.close()
-        
-    except Exception as e:
-        print(f"Error al obtener vector_ids de la BD: {e}")
-    
-    return preserved_ids
-
-def get_preserved_file_ids():
-    """Obtiene todos los file_ids que deben preservarse de la base de datos"""
-    preserved_ids = set()
-    
-    try:
-        conn = mysql.connector.connect(**db_config)
-        cursor = conn.cursor()
-        
-        # Obtener file_ids de la tabla guion_clase
-        cursor.execute("SELECT file_id FROM guion_clase WHERE file_id IS NOT NULL AND file_id != ''")
-        for row in cursor.fetchall():
-            preserved_ids.add(row[0])
-        
-        cursor.close()
-        conn.close()
-        
-    except Exception as e:
-        print(f"Error al obtener file_ids de la BD: {e}")
-    
-    return preserved_ids
-
-def delete_all_assistants():
-    """Elimina solo los asistentes que NO están en la base de datos"""
-    preserved_assistant_ids = get_preserved_assistant_ids()
-    
-    print(f"Preservando {len(preserved_assistant_ids)} asistentes de la BD")
-    
-    try:
-        assistants = client.beta.assistants.list()
-        # Convertir a lista para evitar problemas de paginación durante la eliminación
-        assistants_list = list(assistants)
-        
-        for assistant in assistants_list:
-            if assistant.id in preserved_assistant_ids:
-                print(f"✅ Preservando assistant {assistant.id} (está en BD)")
-                continue
-            
-            try:
-                client.beta.assistants.delete(assistant.id)
-                print(f"🗑️ Assistant {assistant.id} eliminado exitosamente.")
-            except Exception as e:
-                print(f"❌ Error eliminando assistant {assistant.id}: {e}")
-    except Exception as e:
-        print(f"❌ Error obteniendo lista de asistentes: {e}")
-
-def delete_all_vector_stores():
-    """Elimina solo los vector stores que NO están en la base de datos"""
-    preserved_vector_ids = get_preserved_vector_store_ids()
-    
-    print(f"Preservando {len(preserved_vector_ids)} vector stores de la BD")
-    
-    try:
-        vector_stores = client.beta.vector_stores.list()
-        # Convertir a lista para evitar problemas de paginación durante la eliminación
-        vector_stores_list = list(vector_stores)
-        
-        for vector_store in vector_stores_list:
-            if vector_store.id in preserved_vector_ids:
-                print(f"✅ Preservando vector store {vector_store.id} (está en BD)")
-                continue
-            
-            try:
-                client.beta.vector_stores.delete(vector_store.id)
-                print(f"🗑️ Vector store {vector_store.id} eliminado exitosamente.")
-            except Exception as e:
-                # Si el vector store ya no existe, solo lo registramos y continuamos
-                if "not found" in str(e).lower():
-                    print(f"⚠️ Vector store {vector_store.id} ya fue eliminado")
-                else:
-                    print(f"❌ Error eliminando vector store {vector_store.id}: {e}")
-    except Exception as e:
-        print(f"❌ Error obteniendo lista de vector stores: {e}")
-
-def delete_all_files():
-    """Elimina solo los archivos que NO están en la base de datos"""
-    preserved_file_ids = get_preserved_file_ids()
-    
-    print(f"Preservando {len(preserved_file_ids)} archivos de la BD")
-    
-    try:
-        files = client.files.list()
-        # Convertir a lista para evitar problemas de paginación durante la eliminación
-        files_list = list(files)
-        
-        for file in files_list:
-            if file.id in preserved_file_ids:
-                print(f"✅ Preservando file {file.id} (está en BD)")
-                continue
-            
-            try:
-                client.files.delete(file.id)
-                print(f"🗑️ File {file.id} eliminado exitosamente.")
-            except Exception as e:
-                # Si el archivo ya no existe, solo lo registramos y continuamos
-                if "not found" in str(e).lower():
-                    print(f"⚠️ File {file.id} ya fue eliminado")
-                else:
-                    print(f"❌ Error eliminando file {file.id}: {e}")
-    except Exception as e:
-        print(f"❌ Error obteniendo lista de archivos: {e}")
-
-# Versión alternativa más robusta con manejo de errores mejorado
-def delete_all_vector_stores_safe():
-    """Versión más segura para eliminar vector stores"""
-    preserved_vector_ids = get_preserved_vector_store_ids()
-    
-    print(f"Preservando {len(preserved_vector_ids)} vector stores de la BD")
-    
-    try:
-        # Obtener todos los vector stores de forma segura
-        vector_stores = list(client.beta.vector_stores.list())
-        print(f"Encontrados {len(vector_stores)} vector stores en total")
-        
-        deleted_count = 0
-        error_count = 0
-        
-        for vector_store in vector_stores:
-            if vector_store.id in preserved_vector_ids:
-                print(f"✅ Preservando vector store {vector_store.id} (está en BD)")
-                continue
-            
-            try:
-                # Verificar si existe antes de intentar eliminar
-                client.beta.vector_stores.retrieve(vector_store.id)
-                # Si llegamos aquí, existe - procedemos a eliminar
-                client.beta.vector_stores.delete(vector_store.id)
-                print(f"🗑️ Vector store {vector_store.id} eliminado exitosamente.")
-                deleted_count += 1
-            except Exception as e:
-                if "not found" in str(e).lower():
-                    print(f"⚠️ Vector store {vector_store.id} ya fue eliminado")
-                else:
-                    print(f"❌ Error eliminando vector store {vector_store.id}: {e}")
-                    error_count += 1
-        
-        print(f"Resumen: {deleted_count} eliminados, {error_count} errores")
-        
-    except Exception as e:
-        print(f"❌ Error crítico en delete_all_vector_stores_safe: {e}")
-
-
-def NUKE():
-    delete_all_assistants()
-    delete_all_vector_stores()
-    delete_all_files()
-
-#NUKE()
+@app.post("/admin/recursos-openai/reconciliar")
+def encolar_reconciliacion(
+    aplicar: bool = Query(False, description="false (default) solo simula; true borra los huérfanos"),
+    incluir_ajenos: bool = Query(False, description="Borrar también objetos que esta app no registró"),
+    tipos: Optional[str] = Query(None, description="assistant, vector_store, file, thread (separados por comas)"),
+):
+    """Encola la reconciliación de objetos huérfanos en OpenAI (ver reconciliar_recursos.py)."""
+    lista_tipos = [t.strip() for t in tipos.split(",") if t.strip()] if tipos else None
+    desconocidos = [t for t in lista_tipos or [] if t not in REFERENCIAS]
+    if desconocidos:
+        raise HTTPException(status_code=400, detail=f"Tipos no soportados: {', '.join(desconocidos)}")
+
+    trabajo_id = cola_trabajos.encolar("reconciliar_recursos", {
+        "aplicar": aplicar, "incluir_ajenos": incluir_ajenos, "tipos": lista_tipos,
+    })
+    return JSONResponse(status_code=202, content={
+        "trabajo_id": trabajo_id,
+        "aplicar": aplicar,
+        "estado_url": f"/trabajos/{trabajo_id}",
+        "resultado_url": f"/trabajos/{trabajo_id}/resultado",
+    })
 
 #################################################################
 #################################################################
@@ -6279,6 +5499,12 @@ async def send_email(destinatarios, msg):
 
 
 
+def _leer_evaluacion_formativa(cursor, parametros):
+    # Parámetros con nombre: va por cursor.execute, no por una sentencia preparada
+    cursor.execute(SQL_EVALUACION_FORMATIVA, parametros)
+    return cursor.fetchone()
+
+
 @app.get("/planificacion/{guion_id}/evaluacion_formativa")
 async def generar_evaluacion_formativa(
     guion_id: int,
@@ -6287,52 +5513,22 @@ async def generar_evaluacion_formativa(
 ):
     print("📥 Generando evaluación formativa", guion_id, momento, tipo)
 
-    conn = connect_db()
-    cursor = conn.cursor()
-
-
-    try:
-        # 1️⃣ Obtener datos del guion + planificacion
-        cursor.execute("""
-            SELECT 
-                g.vector_id,
-                g.assistant_id,
-                p.evaluaciones_formativas,
-                p.estrategias_didacticas
-            FROM guion_clase g
-            JOIN planificacion p ON p.id_guion_clase = g.id
-            WHERE g.id = %s
-            LIMIT 1
-        """, (guion_id,))
-
-        data = cursor.fetchone()
-        if not data:
-            raise HTTPException(status_code=404, detail="Guion no encontrado")
-
-        evaluaciones = json.loads(data["evaluaciones_formativas"] or "[]")
-        estrategias = json.loads(data["estrategias_didacticas"] or "[]")
-
-        # 2️⃣ Filtrar evaluación por momento + tipo
-        evaluacion = next(
-            (e for e in evaluaciones if e["momento"] == momento and e["tipo"] == tipo),
-            None
-        )
-
-        if not evaluacion:
-            raise HTTPException(status_code=404, detail="Evaluación no encontrada")
+    # 1️⃣ Datos del guion + evaluación (momento + tipo) y estrategia del momento
+    data = await repositorio.transaccion(
+        _leer_evaluacion_formativa, {"guion_id": guion_id, "momento": momento, "tipo": tipo}
+    )
+    if not data:
+        raise HTTPException(status_code=404, detail="Guion no encontrado")
 
-        estrategia = next(
-            (e for e in estrategias if e["momento"] == momento),
-            None
-        )
+    evaluacion = data["evaluacion"]
+    if not evaluacion:
+        raise HTTPException(status_code=404, detail="Evaluación no encontrada")
 
-        # 3️⃣ Crear thread
-        nuevo_thread = client.beta.threads.create()
-        thread_id = nuevo_thread.id
+    estrategia = data["estrategia"]
 
-    finally:
-        cursor.close()
-        conn.close()
+    # 3️⃣ Crear thread
+    nuevo_thread = await aclient.beta.threads.create()
+    thread_id = nuevo_thread.id
 
     # 4️⃣ Llamar a la API IA
     url = f"{url_api}/generar_evaluacion_formativa/{data['assistant_id']}"
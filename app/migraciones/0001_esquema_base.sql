@@ -0,0 +1,236 @@
+-- 0001: esquema base
+-- Tablas tal como las usa app/main.py. En una BD existente no cambia nada
+-- (IF NOT EXISTS); en una BD nueva deja el esquema listo para arrancar.
+-- Las columnas JSON se guardan como TEXT porque el código escribe json.dumps(...).
+
+CREATE TABLE IF NOT EXISTS usuario (
+    id          SERIAL PRIMARY KEY,
+    nombre      TEXT NOT NULL,
+    tipo        INT NOT NULL,             -- 1 = alumno, 2 = profesor
+    clave       TEXT NOT NULL,
+    correo      TEXT NOT NULL,
+    direccion   TEXT,
+    numero_cel  TEXT
+);
+
+CREATE TABLE IF NOT EXISTS curso (
+    id      SERIAL PRIMARY KEY,
+    nombre  TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS usuario_curso (
+    id          SERIAL PRIMARY KEY,
+    id_usuario  INT NOT NULL,
+    id_curso    INT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS unidad (
+    id            SERIAL PRIMARY KEY,
+    nombre        TEXT NOT NULL,
+    id_curso      INT NOT NULL,
+    assistant_id  TEXT,
+    vector_id     TEXT,
+    batch_id      TEXT
+);
+
+CREATE TABLE IF NOT EXISTS actividad (
+    id              SERIAL PRIMARY KEY,
+    titulo          TEXT NOT NULL,
+    descripcion     TEXT,
+    id_unidad       INT NOT NULL,
+    estado          INT,                      -- 1 activa, 2 pendiente, 3 cerrada (0004 convierte las BD con TEXT)
+    fecha_inicio    DATE,
+    fecha_cierre    DATE,
+    hora_inicio     TIME,
+    hora_cierre     TIME,
+    requerimientos  TEXT
+);
+
+CREATE TABLE IF NOT EXISTS respuesta (
+    id            SERIAL PRIMARY KEY,
+    archivo       TEXT,
+    feedback      TEXT,
+    id_usuario    INT NOT NULL,
+    id_actividad  INT NOT NULL,
+    fecha         TIMESTAMP NOT NULL DEFAULT now()
+);
+
+CREATE TABLE IF NOT EXISTS notificacion (
+    id            SERIAL PRIMARY KEY,
+    titulo        TEXT NOT NULL,
+    comentario    TEXT,
+    fecha         DATE NOT NULL,
+    hora          TIME NOT NULL,
+    leido         SMALLINT NOT NULL DEFAULT 0,
+    id_usuario    INT NOT NULL,
+    id_curso      INT,
+    id_actividad  INT,
+    id_respuesta  INT
+);
+
+CREATE TABLE IF NOT EXISTS corpus (
+    id         SERIAL PRIMARY KEY,
+    titulo     TEXT,
+    material   TEXT,
+    id_unidad  INT NOT NULL
+);
+
+-- ----------------------------------------------------------------------
+-- Evaluaciones
+-- ----------------------------------------------------------------------
+CREATE TABLE IF NOT EXISTS evaluacion (
+    id                      SERIAL PRIMARY KEY,
+    titulo                  TEXT NOT NULL,
+    descripcion             TEXT,
+    id_unidad               INT NOT NULL,
+    preguntas_desarrollo    INT,
+    preguntas_alternativas  INT,
+    preguntas_vf            INT,
+    puntaje_total           INT,
+    versiones               INT,
+    dificultad              TEXT,
+    thread                  TEXT
+);
+
+CREATE TABLE IF NOT EXISTS alternativas (
+    id             SERIAL PRIMARY KEY,
+    id_evaluacion  INT NOT NULL,
+    enunciado      TEXT NOT NULL,
+    respuesta_a    TEXT,
+    respuesta_b    TEXT,
+    respuesta_c    TEXT,
+    respuesta_d    TEXT,
+    respuesta_e    TEXT,
+    correcta       TEXT,
+    puntaje        INT
+);
+
+CREATE TABLE IF NOT EXISTS vf (
+    id             SERIAL PRIMARY KEY,
+    id_evaluacion  INT NOT NULL,
+    enunciado      TEXT NOT NULL,
+    correcta       TEXT,
+    puntaje        INT
+);
+
+CREATE TABLE IF NOT EXISTS desarrollo (
+    id             SERIAL PRIMARY KEY,
+    id_evaluacion  INT NOT NULL,
+    enunciado      TEXT NOT NULL,
+    respuesta      TEXT,
+    puntaje        INT
+);
+
+-- ----------------------------------------------------------------------
+-- Foros
+-- ----------------------------------------------------------------------
+CREATE TABLE IF NOT EXISTS foro (
+    id           SERIAL PRIMARY KEY,
+    titulo       TEXT NOT NULL,
+    descripcion  TEXT,
+    fecha        DATE NOT NULL,
+    hora         TIME NOT NULL,
+    id_usuario   INT NOT NULL,
+    id_unidad    INT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS respuesta_foro (
+    id          SERIAL PRIMARY KEY,
+    comentario  TEXT NOT NULL,
+    fecha       DATE NOT NULL,
+    hora        TIME NOT NULL,
+    id_usuario  INT NOT NULL,
+    id_foro     INT NOT NULL
+);
+
+-- ----------------------------------------------------------------------
+-- Guiones de clase, planificación y materiales de estudio
+-- ----------------------------------------------------------------------
+CREATE TABLE IF NOT EXISTS guion_clase (
+    id            SERIAL PRIMARY KEY,
+    titulo        TEXT NOT NULL,
+    ra            TEXT,
+    contenido     TEXT,
+    estilo        TEXT,
+    duracion      TEXT,
+    semana        TEXT,
+    id_unidad     INT NOT NULL,
+    thread        TEXT,
+    assistant_id  TEXT,
+    vector_id     TEXT,
+    file_id       TEXT,
+    file_name     TEXT
+);
+
+CREATE TABLE IF NOT EXISTS planificacion (
+    id                       SERIAL PRIMARY KEY,
+    id_guion_clase           INT NOT NULL,
+    titulo                   TEXT,
+    resultado_aprendizaje    TEXT,
+    contenido_tematico       TEXT,
+    tipo_clase               TEXT,
+    duracion                 INT,
+    semana                   INT,
+    vector_id                TEXT,
+    identificacion_clase     TEXT,
+    secuencia_actividades    TEXT,
+    evaluaciones_formativas  TEXT,
+    estrategias_didacticas   TEXT,
+    bibliografia_material    TEXT,
+    analisis_ra              TEXT,
+    metadata                 TEXT,
+    thread_id                TEXT
+);
+
+CREATE TABLE IF NOT EXISTS resumen (
+    id                 SERIAL PRIMARY KEY,
+    id_guion_clase     INT NOT NULL,
+    tema_principal     TEXT,
+    ideas_principales  TEXT,
+    conceptos_clave    TEXT,
+    conclusion         TEXT,
+    metadata           TEXT,
+    version            INT NOT NULL DEFAULT 1,
+    creado_en          TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE TABLE IF NOT EXISTS mapa_conceptual (
+    id              SERIAL PRIMARY KEY,
+    id_guion_clase  INT NOT NULL,
+    titulo          TEXT,
+    conceptos       TEXT,
+    relaciones      TEXT,
+    metadata        TEXT,
+    version         INT NOT NULL DEFAULT 1,
+    creado_en       TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE TABLE IF NOT EXISTS flashcard (
+    id              SERIAL PRIMARY KEY,
+    id_guion_clase  INT NOT NULL,
+    cards           TEXT,
+    metadata        TEXT,
+    version         INT NOT NULL DEFAULT 1,
+    creado_en       TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE TABLE IF NOT EXISTS glosario (
+    id              SERIAL PRIMARY KEY,
+    id_guion_clase  INT NOT NULL,
+    terminos        TEXT,
+    metadata        TEXT,
+    version         INT NOT NULL DEFAULT 1,
+    creado_en       TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE TABLE IF NOT EXISTS infografia (
+    id                SERIAL PRIMARY KEY,
+    id_guion_clase    INT NOT NULL,
+    titulo            TEXT,
+    imagen_url        TEXT,
+    imagen_base64     TEXT,
+    prompt_utilizado  TEXT,
+    metadata          TEXT,
+    version           INT NOT NULL DEFAULT 1,
+    creado_en         TIMESTAMPTZ NOT NULL DEFAULT now()
+);
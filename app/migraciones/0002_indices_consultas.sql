@@ -0,0 +1,41 @@
+-- sin_transaccion
+-- 0002: índices de las consultas frecuentes
+-- CONCURRENTLY para no bloquear escrituras en una BD con datos; por eso esta
+-- migración corre fuera de una transacción, sentencia por sentencia.
+-- Se comprueban con: python -m app.services.verificar_indices
+
+-- Inscripciones: cursos de un usuario / usuarios de un curso (index-only scan en ambos sentidos)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_usuario_curso_usuario ON usuario_curso (id_usuario, id_curso);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_usuario_curso_curso ON usuario_curso (id_curso, id_usuario);
+
+-- Jerarquía curso → unidad → actividad / corpus / foro / evaluación / guion
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_unidad_curso ON unidad (id_curso);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_actividad_unidad ON actividad (id_unidad);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_corpus_unidad ON corpus (id_unidad);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_foro_unidad_fecha ON foro (id_unidad, fecha DESC, hora DESC);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_respuesta_foro_foro_fecha ON respuesta_foro (id_foro, fecha DESC, hora DESC);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_evaluacion_unidad ON evaluacion (id_unidad);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_alternativas_evaluacion ON alternativas (id_evaluacion);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_vf_evaluacion ON vf (id_evaluacion);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_desarrollo_evaluacion ON desarrollo (id_evaluacion);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_guion_clase_unidad ON guion_clase (id_unidad, id DESC);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_planificacion_guion ON planificacion (id_guion_clase);
+
+-- Entregas: por actividad y por (usuario, actividad) ordenadas por fecha
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_respuesta_actividad ON respuesta (id_actividad, fecha DESC);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_respuesta_usuario_actividad ON respuesta (id_usuario, id_actividad, fecha DESC);
+
+-- Notificaciones: listado ordenado del usuario y el chequeo de no leídas (índice parcial)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_notificacion_usuario_fecha ON notificacion (id_usuario, fecha DESC, hora DESC);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_notificacion_no_leidas ON notificacion (id_usuario) WHERE leido = 0;
+
+-- Materiales: última versión por guion (WHERE id_guion_clase = ? ORDER BY version DESC LIMIT 1).
+-- INCLUDE (id, creado_en) deja los endpoints /existe en index-only scan.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_resumen_guion_version ON resumen (id_guion_clase, version DESC) INCLUDE (id, creado_en);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_mapa_conceptual_guion_version ON mapa_conceptual (id_guion_clase, version DESC) INCLUDE (id, creado_en);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_flashcard_guion_version ON flashcard (id_guion_clase, version DESC) INCLUDE (id, creado_en);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_glosario_guion_version ON glosario (id_guion_clase, version DESC) INCLUDE (id, creado_en);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_infografia_guion_version ON infografia (id_guion_clase, version DESC) INCLUDE (id, creado_en);
+
+-- Login
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_usuario_correo ON usuario (correo);
@@ -0,0 +1,14 @@
+-- sin_transaccion
+-- 0003: índices para la paginación keyset
+-- Los listados paginados ordenan por (fecha DESC, hora DESC, id DESC): con el
+-- id al final del índice, cada página es un solo recorrido del índice desde
+-- el cursor, sin ordenar en memoria. Reemplazan a los de 0002.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_notificacion_usuario_orden ON notificacion (id_usuario, fecha DESC, hora DESC, id DESC);
+DROP INDEX CONCURRENTLY IF EXISTS idx_notificacion_usuario_fecha;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_foro_unidad_orden ON foro (id_unidad, fecha DESC, hora DESC, id DESC);
+DROP INDEX CONCURRENTLY IF EXISTS idx_foro_unidad_fecha;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_respuesta_foro_foro_orden ON respuesta_foro (id_foro, fecha DESC, hora DESC, id DESC);
+DROP INDEX CONCURRENTLY IF EXISTS idx_respuesta_foro_foro_fecha;
@@ -0,0 +1,23 @@
+-- 0004: instantes de apertura y cierre de las actividades
+-- El planificador (app/services/planificador_actividades.py) necesita fecha y
+-- hora combinadas: comparar fecha_* y hora_* por separado no es exacto y no
+-- usa índices. Columnas generadas para que los endpoints sigan escribiendo
+-- fecha y hora como siempre.
+
+-- estado se compara con enteros (1 activa, 2 pendiente, 3 cerrada); las BD
+-- creadas con la primera versión de 0001 lo tienen como TEXT
+DO $$
+BEGIN
+    IF (SELECT data_type FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = 'actividad' AND column_name = 'estado') <> 'integer' THEN
+        ALTER TABLE actividad ALTER COLUMN estado TYPE INT USING NULLIF(trim(estado::text), '')::int;
+    END IF;
+END $$;
+
+ALTER TABLE actividad
+    ADD COLUMN IF NOT EXISTS inicio_en TIMESTAMP GENERATED ALWAYS AS (fecha_inicio + hora_inicio) STORED,
+    ADD COLUMN IF NOT EXISTS cierre_en TIMESTAMP GENERATED ALWAYS AS (fecha_cierre + hora_cierre) STORED;
+
+-- El ALTER reescribe la tabla de todos modos: los índices se crean en la misma transacción
+CREATE INDEX IF NOT EXISTS idx_actividad_inicio_pendiente ON actividad (inicio_en) WHERE estado = 2;
+CREATE INDEX IF NOT EXISTS idx_actividad_cierre_abierta ON actividad (cierre_en) WHERE estado IN (1, 2);
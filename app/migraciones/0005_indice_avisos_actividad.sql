@@ -0,0 +1,6 @@
+-- sin_transaccion
+-- 0005: avisos de cierre ya enviados
+-- El planificador comprueba por actividad y usuario si el aviso ya existe
+-- antes de insertarlo (NOT EXISTS); sin índice sería un recorrido de notificacion.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_notificacion_actividad_usuario ON notificacion (id_actividad, id_usuario) WHERE id_actividad IS NOT NULL;
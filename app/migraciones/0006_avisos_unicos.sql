@@ -0,0 +1,27 @@
+-- sin_transaccion
+-- 0006: un aviso de cierre por usuario, actividad y tipo
+-- El planificador inserta los avisos con ON CONFLICT DO NOTHING sobre este
+-- índice único en vez de comprobar con NOT EXISTS bajo un advisory lock.
+
+ALTER TABLE notificacion ADD COLUMN IF NOT EXISTS tipo_aviso TEXT;
+
+-- Avisos enviados antes de existir la columna (uno por usuario y actividad, el primero)
+UPDATE notificacion n
+SET tipo_aviso = CASE n.titulo WHEN '24 horas para cierre de actividad' THEN 'aviso_24h' ELSE 'aviso_1h' END
+FROM (
+    SELECT min(id) AS id
+    FROM notificacion
+    WHERE tipo_aviso IS NULL
+      AND id_actividad IS NOT NULL
+      AND titulo IN ('24 horas para cierre de actividad', '1 hora para cierre de actividad')
+    GROUP BY id_usuario, id_actividad, titulo
+) primeros
+WHERE n.id = primeros.id
+  AND NOT EXISTS (
+      SELECT 1 FROM notificacion ya
+      WHERE ya.id_usuario = n.id_usuario AND ya.id_actividad = n.id_actividad
+        AND ya.tipo_aviso = CASE n.titulo WHEN '24 horas para cierre de actividad' THEN 'aviso_24h' ELSE 'aviso_1h' END
+  );
+
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS uq_notificacion_aviso ON notificacion (id_usuario, id_actividad, tipo_aviso) WHERE tipo_aviso IS NOT NULL;
+DROP INDEX CONCURRENTLY IF EXISTS idx_notificacion_actividad_usuario;
@@ -0,0 +1,62 @@
+-- 0007: NOTIFY por cada cambio en notificacion
+-- Un aviso por usuario afectado y por sentencia (transition tables), así el
+-- fan-out del planificador a un curso entero no manda un aviso por fila.
+-- Lo reparte app/services/notificaciones_push.py por SSE.
+
+CREATE OR REPLACE FUNCTION notificacion_avisar_insercion() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    PERFORM pg_notify('notificaciones', json_build_object(
+        'usuario', id_usuario,
+        'ids', json_agg(id ORDER BY id),
+        'delta_no_leidas', count(*) FILTER (WHERE leido = 0)
+    )::text)
+    FROM nuevas
+    GROUP BY id_usuario;
+    RETURN NULL;
+END $$;
+
+CREATE OR REPLACE FUNCTION notificacion_avisar_actualizacion() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    PERFORM pg_notify('notificaciones', json_build_object(
+        'usuario', n.id_usuario,
+        'delta_no_leidas', sum((n.leido = 0)::int - (v.leido = 0)::int)
+    )::text)
+    FROM nuevas n
+    JOIN viejas v ON v.id = n.id
+    GROUP BY n.id_usuario
+    HAVING sum((n.leido = 0)::int - (v.leido = 0)::int) <> 0;
+    RETURN NULL;
+END $$;
+
+CREATE OR REPLACE FUNCTION notificacion_avisar_borrado() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    PERFORM pg_notify('notificaciones', json_build_object(
+        'usuario', id_usuario,
+        'delta_no_leidas', -count(*)
+    )::text)
+    FROM viejas
+    WHERE leido = 0
+    GROUP BY id_usuario;
+    RETURN NULL;
+END $$;
+
+DROP TRIGGER IF EXISTS notificacion_insertada ON notificacion;
+CREATE TRIGGER notificacion_insertada
+    AFTER INSERT ON notificacion
+    REFERENCING NEW TABLE AS nuevas
+    FOR EACH STATEMENT EXECUTE FUNCTION notificacion_avisar_insercion();
+
+DROP TRIGGER IF EXISTS notificacion_actualizada ON notificacion;
+CREATE TRIGGER notificacion_actualizada
+    AFTER UPDATE ON notificacion
+    REFERENCING OLD TABLE AS viejas NEW TABLE AS nuevas
+    FOR EACH STATEMENT EXECUTE FUNCTION notificacion_avisar_actualizacion();
+
+DROP TRIGGER IF EXISTS notificacion_borrada ON notificacion;
+CREATE TRIGGER notificacion_borrada
+    AFTER DELETE ON notificacion
+    REFERENCING OLD TABLE AS viejas
+    FOR EACH STATEMENT EXECUTE FUNCTION notificacion_avisar_borrado();
@@ -0,0 +1,15 @@
+-- 0008: registro de los objetos que la app crea en OpenAI
+-- Lo llena el hook de respuestas del cliente compartido (recursos_openai.py)
+-- y lo usa la reconciliación de huérfanos (reconciliar_recursos.py) para
+-- borrar solo lo que esta app creó.
+
+CREATE TABLE IF NOT EXISTS recurso_openai (
+    tipo          TEXT NOT NULL,                  -- assistant | vector_store | file | thread
+    recurso_id    TEXT NOT NULL,
+    creado_en     TIMESTAMPTZ NOT NULL DEFAULT now(),
+    eliminado_en  TIMESTAMPTZ,
+    PRIMARY KEY (tipo, recurso_id)
+);
+
+-- Los que siguen vivos, por antigüedad (candidatos de la reconciliación)
+CREATE INDEX IF NOT EXISTS idx_recurso_openai_vivos ON recurso_openai (tipo, creado_en) WHERE eliminado_en IS NULL;
@@ -0,0 +1,99 @@
+-- 0009: materiales de estudio en una sola tabla versionada
+-- Cada regeneración de resumen, mapa conceptual, flashcards, glosario e
+-- infografía hacía MAX(version)+1, DELETE de todo e INSERT de la versión 1
+-- en su propia tabla. Ahora hay una fila por (guion, tipo) con el contenido
+-- en JSONB y un upsert (app/services/materiales_estudio.py) que solo sube la
+-- versión si cambió el hash del contenido. Las versiones anteriores quedan en
+-- material_estudio_version.
+
+CREATE TABLE IF NOT EXISTS material_estudio (
+    guion_id        INT NOT NULL,
+    tipo            TEXT NOT NULL,          -- resumen | mapa_conceptual | flashcards | glosario | infografia
+    version         INT NOT NULL DEFAULT 1,
+    contenido       JSONB NOT NULL,
+    metadata        JSONB NOT NULL DEFAULT '{}',
+    -- jsonb::text es canónico (claves ordenadas, sin espacios de más): mismo contenido, mismo hash
+    hash            TEXT GENERATED ALWAYS AS (md5(contenido::text)) STORED,
+    actualizado_en  TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (guion_id, tipo)
+);
+
+CREATE TABLE IF NOT EXISTS material_estudio_version (
+    guion_id   INT NOT NULL,
+    tipo       TEXT NOT NULL,
+    version    INT NOT NULL,
+    hash       TEXT NOT NULL,
+    contenido  JSONB NOT NULL,
+    metadata   JSONB NOT NULL,
+    creado_en  TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (guion_id, tipo, version)
+);
+
+-- Las columnas viejas son TEXT con JSON; lo que no parsea queda con el default
+-- (igual que parse_json_field en los endpoints)
+CREATE FUNCTION pg_temp.a_jsonb(valor TEXT, defecto JSONB) RETURNS JSONB
+LANGUAGE plpgsql AS $$
+BEGIN
+    RETURN COALESCE(NULLIF(trim(valor), '')::jsonb, defecto);
+EXCEPTION WHEN others THEN
+    RETURN defecto;
+END $$;
+
+-- Última versión de cada guion en las tablas anteriores
+INSERT INTO material_estudio (guion_id, tipo, version, contenido, metadata, actualizado_en)
+SELECT DISTINCT ON (id_guion_clase) id_guion_clase, 'resumen', version,
+       jsonb_build_object(
+           'tema_principal', COALESCE(tema_principal, ''),
+           'ideas_principales', pg_temp.a_jsonb(ideas_principales, '[]'),
+           'conceptos_clave', pg_temp.a_jsonb(conceptos_clave, '[]'),
+           'conclusion', COALESCE(conclusion, '')),
+       pg_temp.a_jsonb(metadata, '{}'), creado_en
+FROM resumen
+ORDER BY id_guion_clase, version DESC
+ON CONFLICT (guion_id, tipo) DO NOTHING;
+
+INSERT INTO material_estudio (guion_id, tipo, version, contenido, metadata, actualizado_en)
+SELECT DISTINCT ON (id_guion_clase) id_guion_clase, 'mapa_conceptual', version,
+       jsonb_build_object(
+           'titulo', COALESCE(titulo, ''),
+           'conceptos', pg_temp.a_jsonb(conceptos, '[]'),
+           'relaciones', pg_temp.a_jsonb(relaciones, '[]')),
+       pg_temp.a_jsonb(metadata, '{}'), creado_en
+FROM mapa_conceptual
+ORDER BY id_guion_clase, version DESC
+ON CONFLICT (guion_id, tipo) DO NOTHING;
+
+INSERT INTO material_estudio (guion_id, tipo, version, contenido, metadata, actualizado_en)
+SELECT DISTINCT ON (id_guion_clase) id_guion_clase, 'flashcards', version,
+       jsonb_build_object('cards', pg_temp.a_jsonb(cards, '[]')),
+       pg_temp.a_jsonb(metadata, '{}'), creado_en
+FROM flashcard
+ORDER BY id_guion_clase, version DESC
+ON CONFLICT (guion_id, tipo) DO NOTHING;
+
+INSERT INTO material_estudio (guion_id, tipo, version, contenido, metadata, actualizado_en)
+SELECT DISTINCT ON (id_guion_clase) id_guion_clase, 'glosario', version,
+       jsonb_build_object('terminos', pg_temp.a_jsonb(terminos, '[]')),
+       pg_temp.a_jsonb(metadata, '{}'), creado_en
+FROM glosario
+ORDER BY id_guion_clase, version DESC
+ON CONFLICT (guion_id, tipo) DO NOTHING;
+
+INSERT INTO material_estudio (guion_id, tipo, version, contenido, metadata, actualizado_en)
+SELECT DISTINCT ON (id_guion_clase) id_guion_clase, 'infografia', version,
+       jsonb_build_object(
+           'titulo', COALESCE(titulo, ''),
+           'imagen_url', COALESCE(imagen_url, ''),
+           'imagen_base64', COALESCE(imagen_base64, '')),
+       pg_temp.a_jsonb(metadata, '{}'), creado_en
+FROM infografia
+ORDER BY id_guion_clase, version DESC
+ON CONFLICT (guion_id, tipo) DO NOTHING;
+
+INSERT INTO material_estudio_version (guion_id, tipo, version, hash, contenido, metadata, creado_en)
+SELECT guion_id, tipo, version, hash, contenido, metadata, actualizado_en
+FROM material_estudio
+ON CONFLICT DO NOTHING;
+
+-- Nadie más las lee ni las escribe (sus índices de 0002 se van con ellas)
+DROP TABLE IF EXISTS resumen, mapa_conceptual, flashcard, glosario, infografia;
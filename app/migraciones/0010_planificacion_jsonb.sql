@@ -0,0 +1,30 @@
+-- 0010: campos JSON de planificacion como JSONB
+-- Se guardaban como texto de json.dumps y cada lectura bajaba y parseaba el
+-- documento completo para usar una parte (p. ej. una evaluación formativa por
+-- momento y tipo). Con JSONB la extracción se hace en Postgres
+-- (app/services/planificacion_json.py) y viaja solo lo pedido.
+
+-- Lo que no parsea queda con el default, igual que parse_json_field (OR REPLACE:
+-- 0009 ya la crea si las dos corren en la misma conexión)
+CREATE OR REPLACE FUNCTION pg_temp.a_jsonb(valor TEXT, defecto JSONB) RETURNS JSONB
+LANGUAGE plpgsql AS $$
+BEGIN
+    RETURN COALESCE(NULLIF(trim(valor), '')::jsonb, defecto);
+EXCEPTION WHEN others THEN
+    RETURN defecto;
+END $$;
+
+ALTER TABLE planificacion
+    ALTER COLUMN identificacion_clase    TYPE JSONB USING pg_temp.a_jsonb(identificacion_clase::text, '{}'),
+    ALTER COLUMN analisis_ra             TYPE JSONB USING pg_temp.a_jsonb(analisis_ra::text, '{}'),
+    ALTER COLUMN secuencia_actividades   TYPE JSONB USING pg_temp.a_jsonb(secuencia_actividades::text, '{}'),
+    ALTER COLUMN estrategias_didacticas  TYPE JSONB USING pg_temp.a_jsonb(estrategias_didacticas::text, '[]'),
+    ALTER COLUMN evaluaciones_formativas TYPE JSONB USING pg_temp.a_jsonb(evaluaciones_formativas::text, '[]'),
+    ALTER COLUMN bibliografia_material   TYPE JSONB USING pg_temp.a_jsonb(bibliografia_material::text, '[]'),
+    ALTER COLUMN metadata                TYPE JSONB USING pg_temp.a_jsonb(metadata::text, '{}');
+
+-- Búsquedas por contenido entre planificaciones (@>, @? con jsonpath), p. ej.
+-- qué guiones tienen una evaluación de cierre de tipo "rúbrica".
+-- El ALTER reescribe la tabla de todos modos: se crean en la misma transacción
+CREATE INDEX IF NOT EXISTS idx_planificacion_evaluaciones ON planificacion USING GIN (evaluaciones_formativas jsonb_path_ops);
+CREATE INDEX IF NOT EXISTS idx_planificacion_estrategias ON planificacion USING GIN (estrategias_didacticas jsonb_path_ops);
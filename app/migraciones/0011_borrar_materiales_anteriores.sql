@@ -0,0 +1,44 @@
+-- 0011: borrar las tablas de materiales anteriores a material_estudio
+-- 0009 copia la última versión de cada guion y borra las tablas viejas en
+-- la misma transacción. Si alguna sigue existiendo (creada de nuevo por
+-- código anterior, o restaurada de un respaldo), aquí se comprueba que
+-- ningún guion vivo quedó sin su fila en material_estudio y recién entonces
+-- se borra; si falta alguno la migración falla (y con ella el arranque) sin
+-- tocar nada. Donde 0009 ya las borró, no hay nada que verificar.
+
+DO $$
+DECLARE
+    tabla_anterior TEXT;
+    tipo_material TEXT;
+    faltantes BIGINT;
+BEGIN
+    FOR tabla_anterior, tipo_material IN
+        SELECT * FROM (VALUES
+            ('resumen', 'resumen'),
+            ('mapa_conceptual', 'mapa_conceptual'),
+            ('flashcard', 'flashcards'),
+            ('glosario', 'glosario'),
+            ('infografia', 'infografia')
+        ) AS t (tabla, tipo)
+    LOOP
+        CONTINUE WHEN to_regclass(tabla_anterior) IS NULL;
+        -- Los guiones ya borrados no cuentan (borrado_cascada no limpia estas tablas)
+        EXECUTE format($sql$
+            SELECT count(DISTINCT v.id_guion_clase)
+            FROM %I v
+            JOIN guion_clase g ON g.id = v.id_guion_clase
+            WHERE NOT EXISTS (
+                SELECT 1 FROM material_estudio m
+                WHERE m.guion_id = v.id_guion_clase AND m.tipo = %L
+            )
+        $sql$, tabla_anterior, tipo_material) INTO faltantes;
+
+        IF faltantes > 0 THEN
+            RAISE EXCEPTION '0011: % guiones de "%" sin copia en material_estudio; no se borra ninguna tabla',
+                faltantes, tabla_anterior;
+        END IF;
+    END LOOP;
+END $$;
+
+-- Nadie más las lee ni las escribe (sus índices de 0002 se van con ellas)
+DROP TABLE IF EXISTS resumen, mapa_conceptual, flashcard, glosario, infografia;
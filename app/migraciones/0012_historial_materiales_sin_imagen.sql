@@ -0,0 +1,8 @@
+-- 0012: el historial de materiales no guarda la imagen de la infografía
+-- materiales_estudio.py ya no copia `imagen_base64` a material_estudio_version
+-- (la imagen solo vive en la fila vigente); aquí se quita de lo ya guardado.
+-- El tope de versiones por (guion, tipo) se aplica en el próximo guardado.
+
+UPDATE material_estudio_version
+SET contenido = contenido - 'imagen_base64'
+WHERE tipo = 'infografia' AND contenido ? 'imagen_base64';
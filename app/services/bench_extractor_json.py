@@ -0,0 +1,132 @@
+# app/services/bench_extractor_json.py
+"""
+Microbenchmark: extractor de una pasada vs la cascada de regex anterior.
+
+    python -m app.services.bench_extractor_json
+
+La cascada se reproduce tal como estaba en api.py / main.py
+(extraer_json_del_texto → extraer_json_robusto → buscar_json_especifico →
+limpiar_json), sin los prints, sobre respuestas de ~20 y ~50 KB con texto
+alrededor, bloque ```json``` y una coma sobrante (el caso que obligaba a
+recorrer toda la cascada).
+"""
+import json
+import re
+import time
+
+from app.services.extractor_json import extraer_json
+
+
+# ----------------------------------------------------------------------
+# Cascada anterior
+# ----------------------------------------------------------------------
+def _extraer_json_del_texto(texto):
+    texto = texto.strip()
+    try:
+        return json.loads(texto)
+    except json.JSONDecodeError:
+        pass
+    inicio = texto.find("{")
+    fin = texto.rfind("}")
+    if inicio == -1 or fin == -1 or fin <= inicio:
+        return None
+    try:
+        return json.loads(texto[inicio:fin + 1])
+    except json.JSONDecodeError:
+        return None
+
+
+def _buscar_json_especifico(texto):
+    patrones = [
+        r'\{[^{}]*"evaluaciones_formativas"[^{}]*"frameworks"[^{}]*"materiales_apoyo"[^{}]*\}',
+        r'\{.*"frameworks".*\}',
+        r'\{.*"evaluaciones_formativas".*\}',
+    ]
+    for patron in patrones:
+        match = re.search(patron, texto, re.DOTALL)
+        if match:
+            try:
+                return json.loads(match.group(0))
+            except Exception:
+                continue
+    return None
+
+
+def _limpiar_json(json_str):
+    return re.sub(r',\s*([}\]])', r'\1', json_str)
+
+
+def cascada_anterior(texto):
+    json_obj = _extraer_json_del_texto(texto)
+    if json_obj:
+        return json_obj
+
+    for pattern in (
+        r'```json\s*(\{.*?\})\s*```',
+        r'```\s*(\{.*?\})\s*```',
+        r'```(\{.*?\})```',
+        r'(\{.*\})',
+    ):
+        match = re.search(pattern, texto, re.DOTALL)
+        if match:
+            try:
+                return json.loads(match.group(1).strip().replace("\n", " ").replace("\t", " "))
+            except json.JSONDecodeError:
+                continue
+
+    json_obj = _buscar_json_especifico(texto)
+    if json_obj:
+        return json_obj
+
+    # Último recurso del mapa conceptual: bloque ```json``` + limpiar_json
+    match = re.search(r'```json\s*([\s\S]*?)\s*```', texto)
+    json_str = match.group(1).strip() if match else None
+    if not json_str:
+        match_json = re.search(r'\{[\s\S]*\}', texto)
+        json_str = match_json.group(0) if match_json else None
+    if json_str:
+        try:
+            return json.loads(_limpiar_json(json_str))
+        except json.JSONDecodeError:
+            return None
+    return None
+
+
+# ----------------------------------------------------------------------
+def _respuesta_de_prueba(kb):
+    conceptos = []
+    i = 0
+    while len(json.dumps(conceptos, ensure_ascii=False)) < kb * 1024:
+        conceptos.append({
+            "id": f"cp_1_{i}",
+            "nombre": f"Concepto {i} {{con llaves}} y “comillas”",
+            "descripcion": "Descripción del concepto, con comas, [corchetes] y texto " * 2,
+            "nivel": "secundario",
+        })
+        i += 1
+    cuerpo = json.dumps({"titulo": "Mapa", "conceptos": conceptos, "frameworks": []}, ensure_ascii=False, indent=2)
+    cuerpo = cuerpo[:-1].rstrip() + ",\n}"      # coma sobrante antes del cierre
+    return f"Claro, aquí está el mapa conceptual:\n\n```json\n{cuerpo}\n```\n\nEspero que te sirva {{:}}."
+
+
+def _medir(fn, texto, repeticiones):
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        resultado = fn(texto)
+    return (time.perf_counter() - inicio) / repeticiones * 1000, resultado
+
+
+def main(repeticiones=50):
+    for kb in (20, 50):
+        texto = _respuesta_de_prueba(kb)
+        ms_anterior, r_anterior = _medir(cascada_anterior, texto, repeticiones)
+        ms_nuevo, r_nuevo = _medir(extraer_json, texto, repeticiones)
+        assert r_nuevo is not None and r_nuevo == r_anterior, "los resultados no coinciden"
+        print(
+            f"{len(texto) / 1024:5.1f} KB | cascada anterior {ms_anterior:8.3f} ms"
+            f" | extractor {ms_nuevo:8.3f} ms | x{ms_anterior / ms_nuevo:.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+# app/services/bench_grafo_mapa.py
+"""
+Microbenchmark: validación del grafo del mapa conceptual en una pasada vs las
+funciones anteriores de app/main.py.
+
+    python -m app.services.bench_grafo_mapa
+
+Las funciones anteriores se reproducen tal como estaban
+(validar_estructura_arbol + detectar_ciclos recursivo +
+validar_profundidad_mapa), sin los comentarios, sobre mapas sintéticos:
+    - árbol balanceado (5 hijos por nodo) de 1.000, 5.000 y 20.000 conceptos
+    - cadena de 5.000 conceptos (un mapa "profundo")
+"""
+import sys
+import time
+
+from app.services.grafo_mapa import analizar_mapa
+
+
+# ----------------------------------------------------------------------
+# Funciones anteriores
+# ----------------------------------------------------------------------
+def _detectar_ciclos(grafo, inicio):
+    visitados = set()
+    en_camino = set()
+
+    def dfs(nodo):
+        if nodo in en_camino:
+            return True
+        if nodo in visitados:
+            return False
+        visitados.add(nodo)
+        en_camino.add(nodo)
+        for vecino in grafo.get(nodo, []):
+            if dfs(vecino):
+                return True
+        en_camino.remove(nodo)
+        return False
+
+    return dfs(inicio)
+
+
+def _validar_estructura_arbol(conceptos, relaciones, ids_conceptos):
+    problemas = []
+    grafo = {id_concepto: [] for id_concepto in ids_conceptos}
+    for relacion in relaciones:
+        origen = relacion.get("origen")
+        destino = relacion.get("destino")
+        if origen in ids_conceptos and destino in ids_conceptos:
+            grafo[origen].append(destino)
+        else:
+            if origen not in ids_conceptos:
+                problemas.append(f"Origen '{origen}' no existe")
+            if destino not in ids_conceptos:
+                problemas.append(f"Destino '{destino}' no existe")
+
+    raiz = None
+    for concepto in conceptos:
+        if concepto.get("nivel") == "raiz" or concepto.get("id") == "cp_1":
+            raiz = concepto.get("id")
+            break
+    if not raiz:
+        problemas.append("No se pudo identificar el concepto raíz")
+        return problemas
+
+    if any(grafo.values()):
+        if _detectar_ciclos(grafo, raiz):
+            problemas.append("Se detectaron ciclos en la estructura del mapa")
+        todos_destinos = set()
+        for destinos in grafo.values():
+            todos_destinos.update(destinos)
+        huerfanos = ids_conceptos - ({raiz} | todos_destinos)
+        if huerfanos:
+            problemas.append(f"Conceptos huérfanos (sin conexión al árbol): {', '.join(huerfanos)}")
+    return problemas
+
+
+def _validar_profundidad_mapa(conceptos, relaciones):
+    if len(conceptos) < 3:
+        return False
+    niveles = set()
+    for concepto in conceptos:
+        niveles.add(concepto.get("id", "").count("_"))
+    return len(niveles) >= 2 or len(conceptos) >= 5
+
+
+def validacion_anterior(conceptos, relaciones):
+    ids = {c.get("id") for c in conceptos}
+    return _validar_estructura_arbol(conceptos, relaciones, ids), _validar_profundidad_mapa(conceptos, relaciones)
+
+
+def validacion_nueva(conceptos, relaciones):
+    reporte = analizar_mapa(conceptos, relaciones)
+    return reporte.problemas, reporte.profundidad_suficiente()
+
+
+# ----------------------------------------------------------------------
+def _arbol(n, ramas=5):
+    conceptos = [{"id": "cp_1", "nombre": "Raíz", "nivel": "raiz"}]
+    relaciones = []
+    for i in range(1, n):
+        padre = conceptos[(i - 1) // ramas]["id"]
+        id_concepto = f"{padre}_{i}"
+        conceptos.append({"id": id_concepto, "nombre": f"Concepto {i}", "nivel": "secundario", "padre": padre})
+        relaciones.append({"origen": padre, "destino": id_concepto})
+    return conceptos, relaciones
+
+
+def _cadena(n):
+    conceptos = [{"id": "cp_1", "nombre": "Raíz", "nivel": "raiz"}]
+    relaciones = []
+    for i in range(1, n):
+        conceptos.append({"id": f"c_{i}", "nombre": f"Concepto {i}", "nivel": "secundario", "padre": conceptos[-1]["id"]})
+        relaciones.append({"origen": conceptos[-2]["id"], "destino": f"c_{i}"})
+    return conceptos, relaciones
+
+
+def _medir(fn, conceptos, relaciones, repeticiones):
+    inicio = time.perf_counter()
+    try:
+        for _ in range(repeticiones):
+            fn(conceptos, relaciones)
+    except RecursionError:
+        return None
+    return (time.perf_counter() - inicio) / repeticiones * 1000
+
+
+def main(repeticiones=20):
+    casos = [(f"árbol {n}", *_arbol(n)) for n in (1000, 5000, 20000)]
+    casos.append(("cadena 5000", *_cadena(5000)))
+
+    print(f"(límite de recursión de Python: {sys.getrecursionlimit()})")
+    for nombre, conceptos, relaciones in casos:
+        ms_anterior = _medir(validacion_anterior, conceptos, relaciones, repeticiones)
+        ms_nuevo = _medir(validacion_nueva, conceptos, relaciones, repeticiones)
+        reporte = analizar_mapa(conceptos, relaciones)
+        assert reporte.es_valido and not reporte.huerfanos, reporte.problemas
+        anterior = "RecursionError" if ms_anterior is None else f"{ms_anterior:8.3f} ms"
+        comparacion = "" if ms_anterior is None else f" | x{ms_anterior / ms_nuevo:.1f}"
+        print(
+            f"{nombre:>12} | anterior {anterior:>14} | una pasada {ms_nuevo:8.3f} ms"
+            f" | profundidad real {reporte.profundidad}{comparacion}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+# app/services/borrado_cascada.py
+"""
+Borrado en cascada de cursos, unidades y guiones.
+
+Antes cada endpoint borraba en OpenAI (assistants, vector stores, archivos)
+uno por uno y con la transacción abierta: un curso con 20 unidades tenía las
+filas bloqueadas durante todas esas llamadas remotas. Ahora:
+
+1. En una sola transacción se borra la fila y todo lo que cuelga de ella
+   (JERARQUIA) y se anotan los recursos remotos de las filas borradas.
+2. Esos recursos se encolan como un trabajo "borrar_recursos" en la tabla
+   `trabajo` con el mismo cursor (outbox): si la transacción hace rollback
+   no queda nada encolado, y si hace commit el borrado remoto queda
+   garantizado aunque el proceso se caiga.
+3. El endpoint hace commit y responde. La cola de trabajos (trabajos.py)
+   ejecuta `borrar_recursos` en segundo plano: borra en paralelo, con a lo
+   sumo BORRADO_CONCURRENCIA llamadas a la vez, y si algo falla el trabajo se
+   reintenta con backoff. Lo que ya no existe en OpenAI cuenta como borrado,
+   así que reintentar es seguro.
+
+    resumen = borrar_en_cascada(cursor, "curso", curso_id)     # antes del commit
+"""
+import asyncio
+import os
+
+from openai import NotFoundError
+
+from app.services.openai_cliente import aclient
+from app.services.trabajos import cola_trabajos
+
+BORRADO_CONCURRENCIA = int(os.getenv("BORRADO_CONCURRENCIA", "4"))
+
+# tabla -> [(tabla hija, columna que apunta al padre)]
+JERARQUIA = {
+    "curso": [("usuario_curso", "id_curso"), ("unidad", "id_curso")],
+    "unidad": [
+        ("actividad", "id_unidad"), ("corpus", "id_unidad"), ("evaluacion", "id_unidad"),
+        ("foro", "id_unidad"), ("guion_clase", "id_unidad"),
+    ],
+    "actividad": [("respuesta", "id_actividad")],
+    "evaluacion": [("alternativas", "id_evaluacion"), ("vf", "id_evaluacion"), ("desarrollo", "id_evaluacion")],
+    "foro": [("respuesta_foro", "id_foro")],
+    "guion_clase": [
+        ("planificacion", "id_guion_clase"),
+        ("material_estudio", "guion_id"), ("material_estudio_version", "guion_id"),
+    ],
+}
+
+# tabla -> {columna: tipo de recurso remoto}
+RECURSOS = {
+    "unidad": {"assistant_id": "assistant", "vector_id": "vector_store"},
+    "guion_clase": {"assistant_id": "assistant", "vector_id": "vector_store", "file_id": "file"},
+    "corpus": {"material": "file"},       # material guarda el file_id
+}
+
+
+# ======================================================================
+# Base de datos (dentro de la transacción del endpoint)
+# ======================================================================
+def _borrar(cursor, tabla, columna, valores, recursos, conteo):
+    """Borra las filas de `tabla` con `columna` en `valores` y todo lo que cuelga de ellas."""
+    # Primero los hijos: funciona igual con o sin FOREIGN KEY en la BD
+    if tabla in JERARQUIA:
+        cursor.execute(f"SELECT id FROM {tabla} WHERE {columna} = ANY(%s) FOR UPDATE", (valores,))
+        ids = [fila["id"] for fila in cursor.fetchall()]
+        if ids:
+            for hija, columna_hija in JERARQUIA[tabla]:
+                _borrar(cursor, hija, columna_hija, ids, recursos, conteo)
+
+    columnas = RECURSOS.get(tabla)
+    if not columnas:
+        # Sin recursos remotos (y quizás sin columna id, p. ej. material_estudio)
+        cursor.execute(f"DELETE FROM {tabla} WHERE {columna} = ANY(%s)", (valores,))
+        if cursor.rowcount:
+            conteo[tabla] = conteo.get(tabla, 0) + cursor.rowcount
+        return
+
+    cursor.execute(
+        f"DELETE FROM {tabla} WHERE {columna} = ANY(%s) RETURNING {', '.join(['id', *columnas])}",
+        (valores,),
+    )
+    filas = cursor.fetchall()
+    for fila in filas:
+        for columna_recurso, tipo in columnas.items():
+            recurso_id = fila[columna_recurso]
+            if isinstance(recurso_id, str) and recurso_id.strip():
+                recursos.setdefault((tipo, recurso_id.strip()), f"{tabla}:{fila['id']}")
+    if filas:
+        conteo[tabla] = conteo.get(tabla, 0) + len(filas)
+
+
+def borrar_en_cascada(cursor, tabla, id_):
+    """
+    Borra `tabla`.id = id_ con sus dependientes y encola el borrado de sus
+    recursos remotos, todo con el cursor del llamador (que hace el commit).
+    Retorna {"filas": {tabla: n}, "recursos": n, "trabajo_id": id | None};
+    filas vacío si la fila no existía.
+    """
+    recursos = {}
+    conteo = {}
+    _borrar(cursor, tabla, "id", [id_], recursos, conteo)
+
+    trabajo_id = None
+    if recursos:
+        trabajo_id = cola_trabajos.encolar_en(cursor, "borrar_recursos", {
+            "origen": f"{tabla}:{id_}",
+            "recursos": [
+                {"tipo": tipo, "id": recurso_id, "fila": fila}
+                for (tipo, recurso_id), fila in recursos.items()
+            ],
+        })
+    return {"filas": conteo, "recursos": len(recursos), "trabajo_id": trabajo_id}
+
+
+# ======================================================================
+# Borrado remoto (trabajo en segundo plano)
+# ======================================================================
+_BORRADORES = {
+    "assistant": lambda recurso_id: aclient.beta.assistants.delete(recurso_id),
+    "vector_store": lambda recurso_id: aclient.beta.vector_stores.delete(recurso_id),
+    "file": lambda recurso_id: aclient.files.delete(recurso_id),
+    "thread": lambda recurso_id: aclient.beta.threads.delete(recurso_id),
+}
+
+_semaforo = None
+
+
+async def borrar_recurso(recurso):
+    """
+    Borra {"tipo", "id"} en OpenAI. Retorna "eliminado", "no_encontrado" o
+    "error: ...". Comparte el semáforo con la reconciliación de huérfanos.
+    """
+    global _semaforo
+    if _semaforo is None:
+        _semaforo = asyncio.Semaphore(BORRADO_CONCURRENCIA)
+    async with _semaforo:
+        try:
+            await _BORRADORES[recurso["tipo"]](recurso["id"])
+            return "eliminado"
+        except NotFoundError:
+            # Ya no existe (borrado antes o en un intento anterior)
+            return "no_encontrado"
+        except Exception as e:
+            return f"error: {e}"
+
+
+async def borrar_recursos(payload):
+    """Handler de cola_trabajos para "borrar_recursos"."""
+    recursos = payload["recursos"]
+    resultados = await asyncio.gather(*(borrar_recurso(r) for r in recursos))
+
+    errores = [f"{r['tipo']} {r['id']}: {res}" for r, res in zip(recursos, resultados) if res.startswith("error")]
+    eliminados = sum(1 for res in resultados if res == "eliminado")
+    print(f"🗑️ Recursos de {payload.get('origen')}: {eliminados} eliminados, "
+          f"{len(resultados) - eliminados - len(errores)} ya no existían, {len(errores)} con error")
+    if errores:
+        # El trabajo se reintenta entero: lo ya borrado vuelve como no_encontrado
+        raise Exception("; ".join(errores))
+    return {"origen": payload.get("origen"), "eliminados": eliminados, "total": len(recursos)}
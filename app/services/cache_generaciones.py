@@ -0,0 +1,186 @@
+# app/services/cache_generaciones.py
+"""
+Cache de generaciones (resumen, mapa conceptual, flashcards, glosario y el
+digest del corpus que los cuatro comparten).
+
+La clave es content-addressed: sha256 de
+    artefacto + corpus + versión del prompt + modelo + parámetros
+Si ninguno de esos insumos cambió, regenerar devuelve la misma salida que ya
+se pagó, sin crear thread ni llamar a la API.
+
+El "corpus" es el file_id de OpenAI del material del guion: un file_id apunta
+siempre al mismo contenido (los archivos subidos son inmutables), así que
+cambia si y solo si el docente sube otro material.
+
+Dos niveles:
+    1) memoria: TTLCache (LRU con expiración) por proceso
+    2) Postgres: tabla cache_generacion, compartida entre workers y reinicios
+
+Los métodos hacen I/O de BD síncrona: desde código async se llaman con
+asyncio.to_thread. Si el pool está agotado se propaga PoolError.
+"""
+import hashlib
+import json
+import os
+
+from cachetools import TTLCache
+from psycopg2.pool import PoolError
+
+CACHE_GENERACION_TTL = int(os.getenv("CACHE_GENERACION_TTL", str(7 * 24 * 3600)))   # 7 días
+CACHE_GENERACION_MAX = int(os.getenv("CACHE_GENERACION_MAX", "256"))
+
+
+def clave_generacion(artefacto, corpus_id, modelo, version_prompt, params=None):
+    """Hash estable de todos los insumos que determinan una generación."""
+    insumos = {
+        "artefacto": artefacto,
+        "corpus": corpus_id,
+        "modelo": modelo,
+        "version_prompt": version_prompt,
+        "params": params or {},
+    }
+    serializado = json.dumps(insumos, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(serializado.encode("utf-8")).hexdigest()
+
+
+class CacheGeneraciones:
+    def __init__(self, conectar=None, maxsize=CACHE_GENERACION_MAX, ttl=CACHE_GENERACION_TTL):
+        self.conectar = conectar
+        self.ttl = ttl
+        self._memoria = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._tabla_lista = False
+        self.hits_memoria = 0
+        self.hits_bd = 0
+        self.misses = 0
+
+    def configurar(self, conectar):
+        """Registra la función que abre conexiones a Postgres (connect_db)."""
+        self.conectar = conectar
+
+    # ------------------------------------------------------------------
+    def _asegurar_tabla(self, cursor):
+        if self._tabla_lista:
+            return
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS cache_generacion (
+                clave       TEXT PRIMARY KEY,
+                artefacto   TEXT NOT NULL,
+                corpus_id   TEXT,
+                contenido   JSONB NOT NULL,
+                creado_en   TIMESTAMPTZ NOT NULL DEFAULT now(),
+                expira_en   TIMESTAMPTZ NOT NULL
+            )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_cache_generacion_corpus ON cache_generacion (corpus_id)")
+        self._tabla_lista = True
+
+    def _ejecutar(self, fn):
+        if self.conectar is None:
+            return None
+        conn = None
+        try:
+            conn = self.conectar()
+            cursor = conn.cursor()
+            self._asegurar_tabla(cursor)
+            resultado = fn(cursor)
+            conn.commit()
+            cursor.close()
+            return resultado
+        except PoolError:
+            # Pool agotado no es un miss: tratarlo así dispararía N regeneraciones
+            raise
+        except Exception as e:
+            print(f"⚠️ Cache de generaciones (BD) no disponible: {e}")
+            if conn:
+                conn.rollback()
+            return None
+        finally:
+            if conn:
+                conn.close()
+
+    # ------------------------------------------------------------------
+    def obtener(self, clave):
+        """Devuelve el contenido cacheado (dict) o None."""
+        contenido = self._memoria.get(clave)
+        if contenido is not None:
+            self.hits_memoria += 1
+            print(f"⚡ Cache hit (memoria) {clave[:12]}")
+            return contenido
+
+        def _leer(cursor):
+            cursor.execute("""
+                SELECT contenido
+                FROM cache_generacion
+                WHERE clave = %s AND expira_en > now()
+            """, (clave,))
+            return cursor.fetchone()
+
+        fila = self._ejecutar(_leer)
+        if fila:
+            contenido = fila["contenido"]
+            if isinstance(contenido, str):
+                contenido = json.loads(contenido)
+            self._memoria[clave] = contenido
+            self.hits_bd += 1
+            print(f"⚡ Cache hit (BD) {clave[:12]}")
+            return contenido
+
+        self.misses += 1
+        return None
+
+    def guardar(self, clave, artefacto, corpus_id, contenido):
+        self._memoria[clave] = contenido
+
+        def _escribir(cursor):
+            cursor.execute("""
+                INSERT INTO cache_generacion (clave, artefacto, corpus_id, contenido, expira_en)
+                VALUES (%s, %s, %s, %s, now() + make_interval(secs => %s))
+                ON CONFLICT (clave) DO UPDATE
+                SET contenido = EXCLUDED.contenido,
+                    creado_en = now(),
+                    expira_en = EXCLUDED.expira_en
+            """, (clave, artefacto, corpus_id, json.dumps(contenido, ensure_ascii=False), self.ttl))
+
+        self._ejecutar(_escribir)
+
+    def invalidar(self, clave=None, corpus_id=None, artefacto=None):
+        """
+        Invalida por clave exacta, o por corpus (y opcionalmente artefacto).
+        Retorna cuántas filas se borraron en BD.
+        """
+        if clave is None and corpus_id is None:
+            return 0
+
+        # En memoria no se guarda el corpus por clave: se limpia todo el nivel
+        # cuando se invalida por corpus (es barato y se vuelve a llenar desde BD)
+        if clave is not None:
+            self._memoria.pop(clave, None)
+        else:
+            self._memoria.clear()
+
+        def _borrar(cursor):
+            if clave is not None:
+                cursor.execute("DELETE FROM cache_generacion WHERE clave = %s", (clave,))
+            elif artefacto is not None:
+                cursor.execute(
+                    "DELETE FROM cache_generacion WHERE corpus_id = %s AND artefacto = %s",
+                    (corpus_id, artefacto)
+                )
+            else:
+                cursor.execute("DELETE FROM cache_generacion WHERE corpus_id = %s", (corpus_id,))
+            return cursor.rowcount
+
+        return self._ejecutar(_borrar) or 0
+
+    def estadisticas(self):
+        return {
+            "entradas_memoria": len(self._memoria),
+            "hits_memoria": self.hits_memoria,
+            "hits_bd": self.hits_bd,
+            "misses": self.misses,
+            "ttl_segundos": self.ttl,
+        }
+
+
+# Instancia única por proceso (main.py le pasa connect_db al arrancar)
+cache_generaciones = CacheGeneraciones()
@@ -0,0 +1,150 @@
+# app/services/cache_metadatos.py
+"""
+Cache read-through de metadatos chicos que casi nunca cambian: nombre de un
+curso, unidades de un curso, y unidad + curso + profesor de una unidad (los
+JOIN de crear_guion y generar_resumen).
+
+    curso = await cache_metadatos.obtener("curso", curso_id, cargar)
+
+`cargar` es una corrutina sin argumentos que lee de la BD (repositorio); solo
+se llama si la clave no está o expiró. Cada tipo tiene su TTL. Los valores
+se comparten entre peticiones: no se modifican.
+
+Invalidación: los endpoints que cambian cursos o unidades llaman a
+`publicar(evento, cursor)` antes de su commit. El evento se aplica en el
+proceso al instante y viaja a los demás workers por NOTIFY (escucha_bd), que
+Postgres entrega solo si la transacción hace commit. El TTL acota lo que
+quede desactualizado si un aviso se pierde; si la escucha se reconecta, el
+cache se vacía entero.
+
+Eventos (dict serializado en JSON):
+    {"tipo": "curso", "id": curso_id}                  nombre, unidades, o el curso se borró
+    {"tipo": "unidad", "id": unidad_id, "curso": id}   unidad creada, renombrada o borrada
+    {"tipo": "usuarios"}                               inscripciones o nombres de profesores
+"""
+import json
+import os
+import threading
+
+from cachetools import TLRUCache
+
+from app.services.escucha_bd import escucha_bd, notificar
+
+CANAL = "cache_metadatos"
+CACHE_METADATOS_MAX = int(os.getenv("CACHE_METADATOS_MAX", "4096"))
+TTLS = {
+    "curso": int(os.getenv("CACHE_METADATOS_TTL_CURSO", "900")),                 # segundos
+    "unidades_curso": int(os.getenv("CACHE_METADATOS_TTL_UNIDADES", "600")),
+    "info_unidad": int(os.getenv("CACHE_METADATOS_TTL_INFO_UNIDAD", "600")),
+}
+TTL_POR_DEFECTO = 300
+
+_FALTA = object()
+
+
+def _ttu(clave, valor, ahora):
+    return ahora + TTLS.get(clave[0], TTL_POR_DEFECTO)
+
+
+class CacheMetadatos:
+    def __init__(self, maxsize=CACHE_METADATOS_MAX):
+        self._cache = TLRUCache(maxsize=maxsize, ttu=_ttu)
+        self._lock = threading.Lock()
+        # Sube con cada invalidación: una carga que empezó antes no guarda su valor
+        self._generacion = 0
+        self._origen = f"{os.getpid()}-{id(self)}"
+        self.hits = 0
+        self.misses = 0
+        self.invalidaciones = 0
+        self.invalidaciones_remotas = 0
+
+    # ------------------------------------------------------------------
+    async def obtener(self, tipo, id_, cargar):
+        clave = (tipo, id_)
+        with self._lock:
+            valor = self._cache.get(clave, _FALTA)
+            generacion = self._generacion
+        if valor is not _FALTA:
+            self.hits += 1
+            return valor
+
+        self.misses += 1
+        valor = await cargar()
+        if valor is not None:
+            with self._lock:
+                if generacion == self._generacion:
+                    self._cache[clave] = valor
+        return valor
+
+    # ------------------------------------------------------------------
+    def _quitar(self, tipo, id_=None, filtro=None):
+        for clave in list(self._cache.keys()):
+            if clave[0] != tipo:
+                continue
+            if id_ is not None and clave[1] != id_:
+                continue
+            if filtro is not None and not filtro(self._cache.get(clave)):
+                continue
+            self._cache.pop(clave, None)
+
+    def aplicar(self, evento):
+        """Invalida en este proceso lo que afecta el evento."""
+        tipo = evento.get("tipo")
+        with self._lock:
+            self._generacion += 1
+            if tipo == "curso":
+                curso_id = evento.get("id")
+                self._quitar("curso", curso_id)
+                self._quitar("unidades_curso", curso_id)
+                self._quitar("info_unidad", filtro=lambda info: info and info.get("id_curso") == curso_id)
+            elif tipo == "unidad":
+                self._quitar("info_unidad", evento.get("id"))
+                # Sin curso conocido se vacían todas las listas de unidades
+                self._quitar("unidades_curso", evento.get("curso"))
+            elif tipo == "usuarios":
+                self._quitar("info_unidad")
+            else:
+                self._cache.clear()
+        self.invalidaciones += 1
+
+    def publicar(self, evento, cursor):
+        """
+        Invalida aquí y avisa a los demás workers. `cursor` es el de la
+        transacción que hace el cambio: el aviso sale con su commit.
+        """
+        self.aplicar(evento)
+        notificar(cursor, CANAL, json.dumps({**evento, "origen": self._origen}))
+
+    def vaciar(self):
+        with self._lock:
+            self._generacion += 1
+            self._cache.clear()
+
+    def _al_recibir(self, payload):
+        try:
+            evento = json.loads(payload)
+        except ValueError:
+            evento = {}
+        if evento.get("origen") != self._origen:
+            self.invalidaciones_remotas += 1
+        # También el propio: vuelve a invalidar ya con el commit hecho, por si
+        # otra petición recargó el valor viejo entre publicar() y el commit
+        self.aplicar(evento)
+
+    def estadisticas(self):
+        total = self.hits + self.misses
+        return {
+            "entradas": len(self._cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "tasa_hit": round(self.hits / total, 3) if total else None,
+            "invalidaciones": self.invalidaciones,
+            "invalidaciones_remotas": self.invalidaciones_remotas,
+            "ttls": TTLS,
+        }
+
+
+# Instancia única por proceso
+cache_metadatos = CacheMetadatos()
+escucha_bd.suscribir(CANAL, cache_metadatos._al_recibir)
+escucha_bd.al_reconectar(cache_metadatos.vaciar)
@@ -0,0 +1,132 @@
+# app/services/digest_corpus.py
+"""
+Digest por corpus: UNA extracción del vector_store (conceptos, definiciones,
+estructura, relaciones) reutilizada por resumen, glosario, flashcards y las
+fases 1 / 1.5 / 2 del mapa conceptual.
+
+Antes cada material lanzaba su propio run con file_search sobre el corpus
+completo. Ahora:
+    1) el primer material que lo necesita genera el digest (un run con
+       file_search, JSON validado contra `DigestCorpus` de esquemas.py);
+    2) se guarda en el cache de generaciones como artefacto "digest_corpus",
+       con la misma clave content-addressed (file_id + versión del prompt +
+       modelo): cambia si y solo si cambia el material del guion;
+    3) los materiales reciben el digest como texto compacto en el prompt y
+       corren sin file_search (menos tokens de entrada y menos latencia).
+
+Si varios materiales lo piden a la vez (fan-out de /materiales) el digest se
+genera una sola vez: `vuelo_unico` comparte la generación en curso.
+
+Si el digest no se puede generar, los materiales siguen por el camino
+anterior (file_search directo).
+"""
+import asyncio
+
+from psycopg2.pool import PoolError
+
+from app.gpt_api import MODELO_ASSISTANT
+from app.services.cache_generaciones import cache_generaciones, clave_generacion
+from app.services.openai_assistants import generar_digest_fn
+from app.services.vuelo_unico import vuelo_unico
+from api import VERSIONES_PROMPT
+
+ARTEFACTO = "digest_corpus"
+
+
+def digest_a_texto(digest):
+    """Serializa el digest como esquema de texto (más corto que el JSON indentado)."""
+    lineas = [f"TEMA CENTRAL: {digest['tema_central']}", "", "ESTRUCTURA:"]
+    for i, seccion in enumerate(digest.get("estructura") or [], 1):
+        lineas.append(f"{i}. {seccion['titulo']}")
+        lineas.extend(f"   - {idea}" for idea in seccion.get("ideas") or [])
+
+    lineas += ["", "CONCEPTOS (nivel ← padre | categoría):"]
+    for c in digest.get("conceptos") or []:
+        ubicacion = c.get("nivel") or "concepto"
+        if c.get("padre"):
+            ubicacion += f" ← {c['padre']}"
+        if c.get("categoria"):
+            ubicacion += f" | {c['categoria']}"
+        linea = f"- {c['nombre']} [{ubicacion}]: {c['definicion']}"
+        if c.get("ejemplo"):
+            linea += f" Ej.: {c['ejemplo']}"
+        lineas.append(linea)
+
+    if digest.get("relaciones"):
+        lineas += ["", "RELACIONES:"]
+        for rel in digest["relaciones"]:
+            tipo = f" —{rel['tipo']}→ " if rel.get("tipo") else " → "
+            lineas.append(f"- {rel['origen']}{tipo}{rel['destino']}")
+
+    if digest.get("conclusiones"):
+        lineas += ["", "CONCLUSIONES:"]
+        lineas.extend(f"- {c}" for c in digest["conclusiones"])
+
+    return "\n".join(lineas)
+
+
+class DigestsCorpus:
+    def __init__(self):
+        self.generados = 0
+        self.reutilizados = 0
+        self.fallidos = 0
+        self.tokens_entrada_digest = 0
+
+    def clave(self, corpus_id):
+        return clave_generacion(ARTEFACTO, corpus_id, MODELO_ASSISTANT, VERSIONES_PROMPT[ARTEFACTO])
+
+    async def obtener(self, corpus_id, assistant_id, vector_id, regenerar=False):
+        """
+        Digest (dict) del corpus, generándolo solo si no existe.
+        Retorna None si no se pudo generar; PoolError se propaga.
+        """
+        clave = self.clave(corpus_id)
+
+        if not regenerar:
+            digest = await asyncio.to_thread(cache_generaciones.obtener, clave)
+            if digest is not None:
+                self.reutilizados += 1
+                return digest
+
+        async def generar():
+            respuesta = await generar_digest_fn(assistant_id=assistant_id, vector_id=vector_id)
+            if not respuesta or "error" in respuesta:
+                self.fallidos += 1
+                print(f"⚠️ Digest del corpus no disponible: {(respuesta or {}).get('error')}")
+                return None
+            self.generados += 1
+            if respuesta.get("uso"):
+                self.tokens_entrada_digest += respuesta["uso"]["entrada"]
+            await asyncio.to_thread(cache_generaciones.guardar, clave, ARTEFACTO, corpus_id, respuesta["digest"])
+            return respuesta["digest"]
+
+        async def leer_existente():
+            return await asyncio.to_thread(cache_generaciones.obtener, clave)
+
+        return await vuelo_unico.ejecutar(f"{ARTEFACTO}:{clave}", generar, leer_existente)
+
+    async def obtener_texto(self, corpus_id, assistant_id, vector_id, regenerar=False):
+        """Digest listo para anteponer al prompt de un material, o None."""
+        try:
+            digest = await self.obtener(corpus_id, assistant_id, vector_id, regenerar=regenerar)
+        except PoolError:
+            # Sin BD no se sabe si el digest existe: seguir sin él haría que cada
+            # material regenerara desde el corpus completo
+            raise
+        except Exception as e:
+            self.fallidos += 1
+            print(f"⚠️ Error obteniendo digest del corpus {corpus_id}: {e}")
+            return None
+        return digest_a_texto(digest) if digest else None
+
+    def estadisticas(self):
+        return {
+            "generados": self.generados,
+            "reutilizados": self.reutilizados,
+            "fallidos": self.fallidos,
+            "tokens_entrada_digest": self.tokens_entrada_digest,
+        }
+
+
+# Instancia única por proceso
+digests_corpus = DigestsCorpus()
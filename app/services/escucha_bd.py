@@ -0,0 +1,126 @@
+# app/services/escucha_bd.py
+"""
+LISTEN de Postgres en un hilo propio, compartido por todo el proceso.
+
+Los servicios se suscriben a un canal antes de `iniciar()` (startup de
+main.py) y reciben cada NOTIFY en el hilo de escucha:
+
+    escucha_bd.suscribir("cache_metadatos", al_recibir)    # al_recibir(payload: str)
+    escucha_bd.al_reconectar(vaciar_cache)                 # se pudieron perder avisos
+
+El otro lado es un `SELECT pg_notify(canal, payload)` dentro de la misma
+transacción que hizo el cambio (`notificar(cursor, ...)`): Postgres entrega el
+aviso al hacer commit, a todos los workers, y no lo entrega si hay rollback.
+
+La conexión de escucha queda abierta todo el tiempo, así que es directa
+(pool_bd.conectar_directo) y no ocupa un cupo del pool. Si se cae, se
+reconecta y avisa con `al_reconectar` para que nadie confíe en un estado que
+pudo perderse mientras no había escucha.
+"""
+import os
+import select
+import threading
+
+ESCUCHA_BD_ESPERA = float(os.getenv("ESCUCHA_BD_ESPERA", "5"))          # segundos por vuelta del select
+ESCUCHA_BD_REINTENTO = float(os.getenv("ESCUCHA_BD_REINTENTO", "3"))    # segundos antes de reconectar
+
+
+def notificar(cursor, canal, payload):
+    """NOTIFY dentro de la transacción del cursor (se entrega al hacer commit)."""
+    cursor.execute("SELECT pg_notify(%s, %s)", (canal, payload))
+
+
+class EscuchaBD:
+    def __init__(self, conectar=None):
+        self.conectar = conectar
+        self._suscripciones = {}     # canal -> [fn(payload)]
+        self._reconexion = []        # [fn()]
+        self._hilo = None
+        self._detener = threading.Event()
+        self.conectada = False
+        self.recibidas = 0
+        self.reconexiones = 0
+        self.errores_callback = 0
+
+    def configurar(self, conectar):
+        """Función que abre una conexión propia (fuera del pool): pool_bd.conectar_directo."""
+        self.conectar = conectar
+
+    def suscribir(self, canal, fn):
+        """Registra fn(payload) para un canal. Debe llamarse antes de iniciar()."""
+        self._suscripciones.setdefault(canal, []).append(fn)
+
+    def al_reconectar(self, fn):
+        """fn() se llama cada vez que la escucha (re)conecta."""
+        self._reconexion.append(fn)
+
+    # ------------------------------------------------------------------
+    def iniciar(self):
+        if self._hilo is not None or not self._suscripciones or self.conectar is None:
+            return
+        self._detener.clear()
+        self._hilo = threading.Thread(target=self._bucle, name="escucha_bd", daemon=True)
+        self._hilo.start()
+        print(f"👂 Escuchando NOTIFY en: {', '.join(self._suscripciones)}")
+
+    def detener(self):
+        if self._hilo is None:
+            return
+        self._detener.set()
+        self._hilo.join(timeout=ESCUCHA_BD_ESPERA + 1)
+        self._hilo = None
+
+    def _llamar(self, fn, *args):
+        try:
+            fn(*args)
+        except Exception as e:
+            self.errores_callback += 1
+            print(f"⚠️ Error en callback de escucha_bd: {e}")
+
+    def _bucle(self):
+        while not self._detener.is_set():
+            conn = None
+            try:
+                conn = self.conectar()
+                conn.autocommit = True
+                cursor = conn.cursor()
+                for canal in self._suscripciones:
+                    cursor.execute(f'LISTEN "{canal}"')
+                self.conectada = True
+                for fn in self._reconexion:
+                    self._llamar(fn)
+
+                while not self._detener.is_set():
+                    if select.select([conn], [], [], ESCUCHA_BD_ESPERA) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        aviso = conn.notifies.pop(0)
+                        self.recibidas += 1
+                        for fn in self._suscripciones.get(aviso.channel, ()):
+                            self._llamar(fn, aviso.payload)
+            except Exception as e:
+                if not self._detener.is_set():
+                    self.reconexiones += 1
+                    print(f"⚠️ Escucha de NOTIFY caída, reintentando en {ESCUCHA_BD_REINTENTO:.0f}s: {e}")
+                    self._detener.wait(ESCUCHA_BD_REINTENTO)
+            finally:
+                self.conectada = False
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+
+    def estadisticas(self):
+        return {
+            "conectada": self.conectada,
+            "canales": list(self._suscripciones),
+            "recibidas": self.recibidas,
+            "reconexiones": self.reconexiones,
+            "errores_callback": self.errores_callback,
+        }
+
+
+# Instancia única por proceso (main.py le pasa pool_bd.conectar_directo)
+escucha_bd = EscuchaBD()
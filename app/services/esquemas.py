@@ -0,0 +1,345 @@
+# app/services/esquemas.py
+"""
+Esquemas Pydantic de cada material generado por los assistants.
+
+Se usan de dos formas:
+    1) `response_format_de(tipo)` → JSON schema estricto para el run
+       (Structured Outputs): el modelo queda obligado a devolver un objeto
+       que cumple el esquema, así que el loop de validar-y-reintentar pasa a
+       ser la excepción.
+    2) `validar_esquema(tipo, datos)` → validación del lado nuestro (por si
+       el modelo o la API no soportan el esquema y se generó en texto libre).
+
+`metricas_rechazo` cuenta por tipo cuántas respuestas se aceptaron y cuántas
+se rechazaron (y si el run iba con esquema), para ver la ganancia en
+/api/openai/estado.
+"""
+import copy
+import os
+import time
+from typing import List, Literal, Optional
+
+from pydantic import BaseModel, Field, ValidationError
+
+
+# Los defaults solo relajan la validación local de respuestas en texto libre;
+# en el JSON schema del response_format todos los campos son obligatorios.
+
+# ======================================================================
+# Crear guion: análisis del RA
+# ======================================================================
+class AnalisisRA(BaseModel):
+    verbos_clave: List[str]
+    que_debe_lograr_el_estudiante: str
+    evidencias_esperadas: List[str]
+    enfoque_en_una_sesion: str
+
+
+class RespuestaAnalisisRA(BaseModel):
+    analisis_ra: AnalisisRA
+
+
+# ======================================================================
+# Crear guion: guion de clase
+# ======================================================================
+class IdentificacionClase(BaseModel):
+    nombre_asignatura: str
+    unidad_semana_clase: str
+    duracion_sesion: str
+    resultado_aprendizaje: str
+    contenidos_clase: str
+
+
+class MomentoInicio(BaseModel):
+    proposito_pedagogico: str
+    pregunta_gatillante: str
+    actividad_principal: str
+    tiempo_estimado: str
+    pasos_docente: List[str]
+    pasos_estudiantes: List[str]
+
+
+class MomentoDesarrollo(BaseModel):
+    proposito_pedagogico: str
+    exposicion_guiada: str
+    actividades_principales: List[str]
+    discusiones_debates: str
+    recursos_desarrollo: List[str]
+    tiempo_estimado: str
+    pasos_docente: List[str]
+    pasos_estudiantes: List[str]
+
+
+class MomentoCierre(BaseModel):
+    proposito_pedagogico: str
+    sintesis_clase: str
+    actividad_integradora: str
+    tarea_siguiente_clase: str
+    tiempo_estimado: str
+    pasos_docente: List[str]
+    pasos_estudiantes: List[str]
+
+
+class SecuenciaActividades(BaseModel):
+    inicio: MomentoInicio
+    desarrollo: MomentoDesarrollo
+    cierre: MomentoCierre
+
+
+class EvaluacionFormativa(BaseModel):
+    momento: Literal["inicio", "desarrollo", "cierre"]
+    proposito: str
+    tipo: str
+    actividad: str
+    duracion_estimada: str
+    criterio_observacion: str
+    retroalimentacion_sugerida: str
+
+
+class EstrategiaDidactica(BaseModel):
+    tipo: str
+    nombre: str = Field(description='Comienza con "INICIO –", "DESARROLLO –" o "CIERRE –"')
+    descripcion: str
+    alineacion_ra: str
+
+
+class ReferenciaBibliografica(BaseModel):
+    tipo: Literal["BIBLIOGRAFIA", "MATERIAL_COMPLEMENTARIO"]
+    referencia: str
+    uso_recomendado: str
+
+
+class GuionClase(BaseModel):
+    identificacion_clase: IdentificacionClase
+    secuencia_actividades: SecuenciaActividades
+    evaluaciones_formativas: List[EvaluacionFormativa]
+    estrategias_didacticas: List[EstrategiaDidactica]
+    bibliografia_material: List[ReferenciaBibliografica]
+
+
+# ======================================================================
+# Materiales de estudio
+# ======================================================================
+class Resumen(BaseModel):
+    tema_principal: str
+    ideas_principales: List[str]
+    conceptos_clave: List[str] = Field(description='Formato "Concepto: descripción"')
+    conclusion: str
+
+
+class Flashcard(BaseModel):
+    pregunta: str
+    respuesta: str
+    categoria: str = Field(default="", description="concepto | definicion | aplicacion")
+
+
+class Flashcards(BaseModel):
+    flashcards: List[Flashcard]
+
+
+class TerminoGlosario(BaseModel):
+    termino: str
+    definicion: str
+    categoria: str = Field(default="", description="concepto | tecnico | proceso | principio | marco_teorico | herramienta")
+    ejemplo: Optional[str] = None
+
+
+class Glosario(BaseModel):
+    glosario: List[TerminoGlosario]
+
+
+class ConceptoMapa(BaseModel):
+    id: str
+    nombre: str
+    nivel: str = Field(default="", description="raiz | principal | secundario | terciario")
+    padre: Optional[str] = None
+
+
+class RelacionMapa(BaseModel):
+    origen: str
+    destino: str
+
+
+class MapaConceptual(BaseModel):
+    titulo: str = ""
+    conceptos: List[ConceptoMapa]
+    relaciones: List[RelacionMapa] = Field(default_factory=list)
+
+
+# ======================================================================
+# Digest del corpus (insumo común de los materiales de estudio)
+# ======================================================================
+class SeccionDigest(BaseModel):
+    titulo: str
+    ideas: List[str]
+
+
+class ConceptoDigest(BaseModel):
+    nombre: str
+    definicion: str
+    nivel: str = Field(default="", description="raiz | principal | secundario | terciario")
+    padre: Optional[str] = Field(default=None, description="Nombre literal del concepto padre")
+    categoria: str = Field(default="", description="concepto | tecnico | proceso | principio | marco_teorico | herramienta")
+    ejemplo: Optional[str] = None
+
+
+class RelacionDigest(BaseModel):
+    origen: str
+    destino: str
+    tipo: str = Field(default="", description="Verbo o frase que une ambos conceptos")
+
+
+class DigestCorpus(BaseModel):
+    tema_central: str
+    estructura: List[SeccionDigest]
+    conceptos: List[ConceptoDigest]
+    relaciones: List[RelacionDigest] = Field(default_factory=list)
+    conclusiones: List[str] = Field(default_factory=list)
+
+
+ESQUEMAS = {
+    "analisis_ra": RespuestaAnalisisRA,
+    "guion_clase": GuionClase,
+    "resumen": Resumen,
+    "flashcards": Flashcards,
+    "glosario": Glosario,
+    "mapa_conceptual": MapaConceptual,
+    "evaluacion_formativa": EvaluacionFormativa,
+    "digest_corpus": DigestCorpus,
+}
+
+# Si la API rechaza response_format (modelo o herramienta sin soporte) se
+# desactiva solo para esa configuración de run (modelo + herramientas) y por
+# ESQUEMAS_REINTENTO segundos; mientras tanto se sigue con la validación local.
+# Un rechazo de un run con file_search no apaga los runs con tools=[].
+ESQUEMAS_REINTENTO = float(os.getenv("ESQUEMAS_REINTENTO", "3600"))     # segundos
+_desactivados = {}           # configuración -> time.monotonic() hasta el que sigue apagado
+
+
+def configuracion_run(run_kwargs):
+    """Clave de la configuración de un run: modelo y herramientas (las del assistant si no se pasan)."""
+    modelo = run_kwargs.get("model") or "assistant"
+    tools = run_kwargs.get("tools")
+    if tools is None:
+        return f"{modelo}|tools=assistant"
+    tipos = sorted(t.get("type", "") if isinstance(t, dict) else str(getattr(t, "type", t)) for t in tools)
+    return f"{modelo}|tools={','.join(tipos)}"
+
+
+# ======================================================================
+# JSON schema estricto para response_format
+# ======================================================================
+def _estricto(nodo):
+    """Structured Outputs exige additionalProperties=false y todas las propiedades en required."""
+    if isinstance(nodo, dict):
+        nodo.pop("title", None)
+        nodo.pop("default", None)
+        if nodo.get("type") == "object" and "properties" in nodo:
+            nodo["additionalProperties"] = False
+            nodo["required"] = list(nodo["properties"])
+        for valor in nodo.values():
+            _estricto(valor)
+    elif isinstance(nodo, list):
+        for valor in nodo:
+            _estricto(valor)
+    return nodo
+
+
+_cache_response_format = {}
+
+
+def response_format_de(tipo, configuracion=None):
+    """response_format para runs.create / runs.stream, o None si no hay esquema."""
+    modelo = ESQUEMAS.get(tipo)
+    if modelo is None or not esquemas_activos(configuracion):
+        return None
+    if tipo not in _cache_response_format:
+        _cache_response_format[tipo] = {
+            "type": "json_schema",
+            "json_schema": {
+                "name": tipo,
+                "schema": _estricto(copy.deepcopy(modelo.model_json_schema())),
+                "strict": True,
+            },
+        }
+    return _cache_response_format[tipo]
+
+
+def desactivar_esquemas(motivo, configuracion=None):
+    if esquemas_activos(configuracion):
+        print(f"⚠️ response_format con JSON schema no soportado ({configuracion}), "
+              f"se desactiva por {ESQUEMAS_REINTENTO:.0f}s: {motivo}")
+    _desactivados[configuracion] = time.monotonic() + ESQUEMAS_REINTENTO
+
+
+def esquemas_activos(configuracion=None):
+    hasta = _desactivados.get(configuracion)
+    if hasta is None:
+        return True
+    if time.monotonic() >= hasta:
+        _desactivados.pop(configuracion, None)
+        return True
+    return False
+
+
+def validar_esquema(tipo, datos):
+    """
+    Valida `datos` (ya parseado) contra el esquema del tipo.
+    Retorna (ok, mensaje). Tipos sin esquema se aceptan.
+    """
+    modelo = ESQUEMAS.get(tipo)
+    if modelo is None:
+        return True, "sin esquema"
+
+    # Formato antiguo: glosario / flashcards como array suelto
+    if isinstance(datos, list) and tipo in ("glosario", "flashcards"):
+        datos = {tipo: datos}
+
+    try:
+        modelo.model_validate(datos)
+        return True, "cumple el esquema"
+    except ValidationError as e:
+        primer_error = e.errors()[0]
+        campo = ".".join(str(p) for p in primer_error["loc"])
+        return False, f"{e.error_count()} errores de esquema (ej: {campo}: {primer_error['msg']})"
+
+
+# ======================================================================
+# Métricas de rechazo
+# ======================================================================
+class MetricasRechazo:
+    def __init__(self):
+        self._por_tipo = {}
+
+    def registrar(self, tipo, aceptado, con_esquema, motivo=None):
+        stats = self._por_tipo.setdefault(tipo, {
+            "con_esquema": {"aceptadas": 0, "rechazadas": 0},
+            "sin_esquema": {"aceptadas": 0, "rechazadas": 0},
+            "ultimo_motivo": None,
+        })
+        grupo = stats["con_esquema" if con_esquema else "sin_esquema"]
+        if aceptado:
+            grupo["aceptadas"] += 1
+        else:
+            grupo["rechazadas"] += 1
+            stats["ultimo_motivo"] = motivo
+
+    def estadisticas(self):
+        ahora = time.monotonic()
+        resultado = {"esquemas_desactivados": {
+            configuracion: round(hasta - ahora) for configuracion, hasta in list(_desactivados.items()) if hasta > ahora
+        }}
+        for tipo, stats in self._por_tipo.items():
+            resumen = {"ultimo_motivo": stats["ultimo_motivo"]}
+            for grupo in ("con_esquema", "sin_esquema"):
+                total = stats[grupo]["aceptadas"] + stats[grupo]["rechazadas"]
+                resumen[grupo] = {
+                    **stats[grupo],
+                    "tasa_rechazo": round(stats[grupo]["rechazadas"] / total, 3) if total else None,
+                }
+            resultado[tipo] = resumen
+        return resultado
+
+
+# Instancia única por proceso
+metricas_rechazo = MetricasRechazo()
@@ -0,0 +1,220 @@
+# app/services/extractor_json.py
+"""
+Extracción de JSON desde respuestas del modelo, en una sola pasada.
+
+Reemplaza la cascada de regex + json.loads (```json```, `(\\{.*\\})`, primer
+`{` hasta último `}`, etc.): un escáner que conoce strings y escapes recorre
+el texto una vez, delimita el primer objeto/array balanceado y lo parsea.
+Los saltos entre caracteres relevantes se hacen con `re.search` desde la
+posición actual, así que el costo es lineal en el largo del texto.
+
+Si el candidato no es JSON válido se intenta reparar (también en una pasada):
+    - comas sobrantes antes de } o ]
+    - comillas tipográficas “ ” usadas como delimitadores de string
+    - saltos de línea / tabs crudos dentro de strings
+    - (al final de un stream cortado) strings y llaves sin cerrar
+
+`ExtractorJSONIncremental` hace lo mismo a medida que llegan los deltas del
+stream de un run: cuando se cierra la llave de nivel superior el JSON ya está
+parseado, sin esperar al mensaje completo.
+
+Benchmark contra la cascada anterior: python -m app.services.bench_extractor_json
+"""
+import json
+import re
+
+_CIERRE = {"{": "}", "[": "]"}
+
+# Caracteres que cambian el estado del escáner. Fuera de un string, un string
+# completo se consume de una vez; si está cortado (fin del fragmento) se entra
+# al estado "dentro de string" con la comilla suelta.
+_FUERA_DE_STRING = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"|“[^”\\]*(?:\\.[^”\\]*)*”|[{}\[\]"“”]', re.DOTALL)
+_DENTRO_STRING = re.compile(r'["\\]')
+_DENTRO_STRING_TIPOGRAFICO = re.compile(r'[”\\]')
+
+# Tokens que la reparación reescribe; todo lo demás se copia tal cual
+_TOKENS_REPARACION = re.compile(
+    r'"[^"\\]*(?:\\.[^"\\]*)*"'           # string normal
+    r'|[“”][^”\\]*(?:\\.[^”\\]*)*”'       # string con comillas tipográficas
+    r'|,(?=\s*[}\]])',                     # coma sobrante
+    re.DOTALL,
+)
+_CONTROL = re.compile(r'[\x00-\x1f]')
+_ESCAPES_CONTROL = {"\n": "\\n", "\r": "\\r", "\t": "\\t"}
+
+
+def _escapar_control(contenido):
+    return _CONTROL.sub(lambda m: _ESCAPES_CONTROL.get(m.group(), ""), contenido)
+
+
+def _reparar_token(m):
+    token = m.group()
+    if token == ",":
+        return ""
+    if token[0] == '"':
+        return _escapar_control(token) if _CONTROL.search(token) else token
+    # “texto” → "texto" (las comillas rectas de adentro se escapan)
+    interior = token[1:-1].replace('\\"', '"').replace('"', '\\"')
+    return '"' + _escapar_control(interior) + '"'
+
+
+def reparar_json(texto, cierres=""):
+    """
+    Repara errores típicos del modelo en una sola pasada (ver docstring del
+    módulo). `cierres` se agrega al final para completar un JSON truncado
+    (ej. '"]}' si quedaron abiertos un string, un array y un objeto).
+    """
+    if cierres.startswith('"'):
+        texto, cierres = texto + '"', cierres[1:]
+    reparado = _TOKENS_REPARACION.sub(_reparar_token, texto)
+    if cierres:
+        reparado = reparado.rstrip(" \t\r\n,") + cierres
+    return reparado
+
+
+def _parsear(candidato, cierres=""):
+    try:
+        return json.loads(candidato + cierres)
+    except ValueError:
+        pass
+    try:
+        return json.loads(reparar_json(candidato, cierres))
+    except ValueError:
+        return None
+
+
+class ExtractorJSONIncremental:
+    """
+    Escáner de JSON alimentado por fragmentos:
+
+        extractor = ExtractorJSONIncremental()
+        for delta in stream:
+            extractor.alimentar(delta)
+        datos = extractor.finalizar()
+
+    `aperturas` define con qué puede empezar el JSON buscado ("{[" por
+    defecto; "{" si solo sirve un objeto).
+    """
+
+    def __init__(self, aperturas="{["):
+        self._re_apertura = re.compile("[" + re.escape(aperturas) + "]")
+        self.resultado = None
+        self.completo = False
+        self._partes = []
+        self._pila = []
+        self._cierre_string = None
+        self._escape = False
+
+    def alimentar(self, fragmento):
+        """Procesa un fragmento. Retorna el JSON apenas se completa (o None)."""
+        if self.completo or not fragmento:
+            return self.resultado
+
+        i = 0
+        n = len(fragmento)
+        inicio = 0 if self._pila else None
+
+        while i < n:
+            if not self._pila:
+                m = self._re_apertura.search(fragmento, i)
+                if not m:
+                    break
+                i = m.start()
+                inicio = i
+                self._partes = []
+                self._pila.append(_CIERRE[fragmento[i]])
+                i += 1
+                continue
+
+            if self._escape:
+                self._escape = False
+                i += 1
+                continue
+
+            if self._cierre_string is not None:
+                patron = _DENTRO_STRING if self._cierre_string == '"' else _DENTRO_STRING_TIPOGRAFICO
+                m = patron.search(fragmento, i)
+                if not m:
+                    i = n
+                    break
+                c = m.group()
+                i = m.end()
+                if c == "\\":
+                    self._escape = True
+                elif c == self._cierre_string:
+                    self._cierre_string = None
+                continue
+
+            m = _FUERA_DE_STRING.search(fragmento, i)
+            if not m:
+                i = n
+                break
+            c = m.group()
+            i = m.end()
+
+            if len(c) > 1:
+                pass                                # string completo
+            elif c == '"':
+                self._cierre_string = '"'
+            elif c in "“”":
+                self._cierre_string = "”"
+            elif c in "{[":
+                self._pila.append(_CIERRE[c])
+            elif c != self._pila[-1]:
+                # Cierre que no corresponde: este candidato no es JSON, buscar el siguiente
+                self._pila = []
+                self._partes = []
+                inicio = None
+            else:
+                self._pila.pop()
+                if not self._pila:
+                    self._partes.append(fragmento[inicio:i])
+                    candidato = "".join(self._partes)
+                    self._partes = []
+                    inicio = None
+                    datos = _parsear(candidato)
+                    if datos is not None:
+                        self.resultado = datos
+                        self.completo = True
+                        return datos
+
+        if self._pila and inicio is not None:
+            self._partes.append(fragmento[inicio:])
+        return self.resultado
+
+    def finalizar(self):
+        """
+        Cierra el stream. Si el JSON quedó truncado intenta repararlo cerrando
+        strings y llaves abiertas.
+        """
+        if self.completo or not self._pila:
+            return self.resultado
+
+        candidato = "".join(self._partes)
+        cierres = ('"' if self._cierre_string else "") + "".join(reversed(self._pila))
+        datos = _parsear(candidato, cierres)
+        if datos is not None:
+            print(f"🔧 JSON truncado reparado ({len(candidato)} chars)")
+            self.resultado = datos
+            self.completo = True
+        return self.resultado
+
+
+def extraer_json(texto, aperturas="{["):
+    """
+    Extrae el primer objeto/array JSON válido de `texto` (con o sin bloque
+    ```json```, con texto antes o después). Retorna dict/list o None.
+    """
+    if not texto:
+        return None
+
+    texto = texto.strip()
+    if texto and texto[0] in aperturas:
+        try:
+            return json.loads(texto)
+        except ValueError:
+            pass
+
+    extractor = ExtractorJSONIncremental(aperturas)
+    extractor.alimentar(texto)
+    return extractor.finalizar()
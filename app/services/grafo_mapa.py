@@ -0,0 +1,238 @@
+# app/services/grafo_mapa.py
+"""
+Validación del grafo de un mapa conceptual en una sola pasada O(V+E).
+
+Antes, `validar_estructura_arbol`, `detectar_ciclos` y
+`validar_profundidad_mapa` (app/main.py) armaban la adyacencia por separado,
+el DFS era recursivo (RecursionError en mapas profundos) y la "profundidad" se
+estimaba contando "_" en los ids. Aquí:
+
+    1) se indexan conceptos y aristas UNA vez (relaciones + campo `padre`);
+    2) un DFS iterativo con colores desde la raíz detecta ciclos (aristas de
+       retroceso) y calcula la profundidad real (camino más largo raíz → hoja);
+    3) los nodos que quedan sin visitar son los huérfanos; se recorren
+       también para detectar ciclos fuera del árbol.
+
+`analizar_mapa(conceptos, relaciones)` retorna un `ReporteMapa`.
+
+Benchmark contra las funciones anteriores: python -m app.services.bench_grafo_mapa
+"""
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+NIVEL_RAIZ = "raiz"
+ID_RAIZ = "cp_1"
+
+# Colores del DFS
+_BLANCO, _GRIS, _NEGRO = 0, 1, 2
+
+
+@dataclass
+class ReporteMapa:
+    total_conceptos: int = 0
+    total_relaciones: int = 0
+    raiz: Optional[str] = None
+    raices: List[str] = field(default_factory=list)
+    huerfanos: List[str] = field(default_factory=list)
+    ciclos: List[Tuple[str, str]] = field(default_factory=list)              # aristas de retroceso
+    relaciones_invalidas: List[Tuple[str, str]] = field(default_factory=list)
+    extremos_inexistentes: List[str] = field(default_factory=list)
+    ids_duplicados: List[str] = field(default_factory=list)
+    multiples_padres: List[str] = field(default_factory=list)
+    profundidad: int = 0                                                     # niveles del camino más largo
+
+    @property
+    def errores(self) -> List[str]:
+        """Problemas que hacen inservible el mapa (se rechaza y se reintenta)."""
+        errores = []
+        if not self.raices:
+            errores.append("No se pudo identificar el concepto raíz")
+        elif len(self.raices) > 1:
+            errores.append(f"Más de un concepto raíz: {', '.join(self.raices)}")
+        if self.ciclos:
+            ejemplo = " → ".join(self.ciclos[0])
+            errores.append(f"Se detectaron ciclos en la estructura del mapa ({len(self.ciclos)}, ej: {ejemplo})")
+        if self.ids_duplicados:
+            errores.append(f"IDs de concepto repetidos: {', '.join(self.ids_duplicados)}")
+        return errores
+
+    @property
+    def advertencias(self) -> List[str]:
+        """Problemas que el mapa tolera (se informan pero no se rechaza)."""
+        advertencias = list(self.extremos_inexistentes)
+        if self.huerfanos:
+            advertencias.append(f"Conceptos huérfanos (sin conexión al árbol): {', '.join(self.huerfanos)}")
+        return advertencias
+
+    @property
+    def problemas(self) -> List[str]:
+        return self.errores + self.advertencias
+
+    @property
+    def es_valido(self) -> bool:
+        return not self.errores
+
+    def profundidad_suficiente(self, minimo_conceptos=3, minimo_niveles=2, conceptos_planos=5) -> bool:
+        """Raíz + al menos un nivel, o un mapa plano pero con suficientes conceptos."""
+        if self.total_conceptos < minimo_conceptos:
+            return False
+        return self.profundidad >= minimo_niveles or self.total_conceptos >= conceptos_planos
+
+    def como_dict(self) -> Dict:
+        return {
+            "total_conceptos": self.total_conceptos,
+            "total_relaciones": self.total_relaciones,
+            "raiz": self.raiz,
+            "profundidad": self.profundidad,
+            "huerfanos": self.huerfanos,
+            "ciclos": [list(c) for c in self.ciclos],
+            "multiples_padres": self.multiples_padres,
+            "errores": self.errores,
+            "advertencias": self.advertencias,
+        }
+
+
+def analizar_mapa(conceptos, relaciones) -> ReporteMapa:
+    """
+    Analiza el grafo (conceptos + relaciones) en O(V+E), sin recursión.
+    Las aristas salen de `relaciones` (origen → destino) y del campo `padre`
+    de cada concepto; las repetidas se cuentan una vez.
+    """
+    conceptos = conceptos or []
+    relaciones = relaciones or []
+    reporte = ReporteMapa(total_conceptos=len(conceptos), total_relaciones=len(relaciones))
+
+    # 1) Índice de nodos: id → posición (y las aristas del campo `padre`)
+    indice = {}
+    ids = []
+    aristas_padre = []
+    for concepto in conceptos:
+        id_concepto = concepto.get("id")
+        if id_concepto in indice:
+            reporte.ids_duplicados.append(id_concepto)
+            continue
+        indice[id_concepto] = len(ids)
+        if concepto.get("nivel") == NIVEL_RAIZ or id_concepto == ID_RAIZ:
+            reporte.raices.append(id_concepto)
+        padre = concepto.get("padre")
+        if padre:
+            aristas_padre.append((padre, len(ids)))
+        ids.append(id_concepto)
+
+    # 2) Lista de adyacencia (una sola vez). `padre_de` guarda el primer
+    #    padre de cada nodo: descarta la arista padre→hijo repetida entre
+    #    `relaciones` y `padre` sin un set de pares.
+    n = len(ids)
+    hijos = [[] for _ in range(n)]
+    padre_de = [-1] * n
+    multiples = [False] * n
+    posicion = indice.get
+
+    def _invalida(origen, destino, i, j):
+        reporte.relaciones_invalidas.append((origen, destino))
+        if i is None:
+            reporte.extremos_inexistentes.append(f"Origen '{origen}' no existe")
+        if j is None:
+            reporte.extremos_inexistentes.append(f"Destino '{destino}' no existe")
+
+    def _agregar(i, j):
+        padre = padre_de[j]
+        if padre == i:
+            return
+        if padre == -1:
+            padre_de[j] = i
+        else:
+            multiples[j] = True
+        hijos[i].append(j)
+
+    for relacion in relaciones:
+        origen = relacion.get("origen")
+        destino = relacion.get("destino")
+        i = posicion(origen)
+        j = posicion(destino)
+        if i is None or j is None:
+            _invalida(origen, destino, i, j)
+        elif padre_de[j] == -1:
+            padre_de[j] = i
+            hijos[i].append(j)
+        else:
+            _agregar(i, j)
+
+    for padre, j in aristas_padre:
+        i = posicion(padre)
+        if i is None:
+            _invalida(padre, ids[j], i, j)
+        elif padre_de[j] != i:
+            _agregar(i, j)
+
+    reporte.multiples_padres = [ids[j] for j in range(n) if multiples[j]]
+
+    if reporte.raices:
+        reporte.raiz = reporte.raices[0]
+
+    # 3) DFS iterativo con colores: una arista a un nodo GRIS es un ciclo. La
+    #    altura (niveles hasta la hoja más lejana) se propaga al padre al
+    #    cerrar cada nodo, y al cruzar una arista hacia un nodo ya cerrado.
+    #    Primero desde la raíz; después, los no alcanzados (huérfanos).
+    color = [_BLANCO] * n
+    altura = [1] * n
+    siguiente = [0] * n
+
+    def _dfs(inicio):
+        color[inicio] = _GRIS
+        pila = [inicio]
+        while pila:
+            nodo = pila[-1]
+            vecinos = hijos[nodo]
+            k = siguiente[nodo]
+            if k < len(vecinos):
+                siguiente[nodo] = k + 1
+                vecino = vecinos[k]
+                estado = color[vecino]
+                if estado == _BLANCO:
+                    color[vecino] = _GRIS
+                    pila.append(vecino)
+                elif estado == _GRIS:
+                    reporte.ciclos.append((ids[nodo], ids[vecino]))
+                elif altura[vecino] >= altura[nodo]:
+                    altura[nodo] = altura[vecino] + 1
+                continue
+            pila.pop()
+            color[nodo] = _NEGRO
+            if pila and altura[nodo] >= altura[pila[-1]]:
+                altura[pila[-1]] = altura[nodo] + 1
+
+    if reporte.raiz is not None:
+        i_raiz = indice[reporte.raiz]
+        _dfs(i_raiz)
+        reporte.profundidad = altura[i_raiz]
+        reporte.huerfanos = [ids[i] for i in range(n) if color[i] == _BLANCO]
+
+    for i in range(n):
+        if color[i] == _BLANCO:
+            _dfs(i)
+
+    return reporte
+
+
+def tiene_ciclo(grafo, inicio):
+    """
+    Ciclo alcanzable desde `inicio` en un grafo {nodo: [vecinos]} (DFS
+    iterativo; reemplaza al DFS recursivo de detectar_ciclos).
+    """
+    color = {inicio: _GRIS}
+    pila = [(inicio, iter(grafo.get(inicio, ())))]
+    while pila:
+        nodo, vecinos = pila[-1]
+        for vecino in vecinos:
+            estado = color.get(vecino, _BLANCO)
+            if estado == _GRIS:
+                return True
+            if estado == _BLANCO:
+                color[vecino] = _GRIS
+                pila.append((vecino, iter(grafo.get(vecino, ()))))
+                break
+        else:
+            pila.pop()
+            color[nodo] = _NEGRO
+    return False
@@ -0,0 +1,122 @@
+# app/services/lecturas_json.py
+"""
+Modelos de lectura armados por Postgres (json_agg / json_build_object).
+
+Para los listados anidados (usuario → cursos, evaluación → preguntas) la BD
+devuelve el documento completo como texto JSON en una sola fila; el endpoint
+lo responde tal cual con `respuesta_json(...)`, sin armar dicts fila por fila
+en Python ni volver a serializar.
+
+Las consultas terminan en `::text` a propósito: si la columna sale como json,
+psycopg2 la parsea a objetos Python y se pierde lo que se quiere ahorrar.
+"""
+import json
+
+from fastapi.responses import Response
+
+# ======================================================================
+# Usuarios con sus cursos
+# ======================================================================
+# Un objeto por usuario: id, nombre, tipo, correo, direccion, numero_cel, cursos[]
+_USUARIO_CON_CURSOS = """
+    SELECT u.id, u.nombre, u.tipo, u.correo, u.direccion, u.numero_cel,
+           COALESCE(
+               (SELECT json_agg(json_build_object('curso_id', c.id, 'curso_nombre', c.nombre) ORDER BY c.id)
+                FROM usuario_curso uc
+                JOIN curso c ON c.id = uc.id_curso
+                WHERE uc.id_usuario = u.id),
+               '[]'::json
+           ) AS cursos
+    FROM usuario u
+"""
+
+# Todos los usuarios (respuesta sin paginar de /usuarios-cursos)
+SQL_USUARIOS_CON_CURSOS = f"""
+    SELECT COALESCE(json_agg(fila ORDER BY fila.id), '[]'::json)::text AS json
+    FROM ({_USUARIO_CON_CURSOS}) fila
+"""
+
+# Solo los usuarios de una página (ids ya resueltos por el keyset)
+SQL_USUARIOS_CON_CURSOS_IDS = f"""
+    SELECT COALESCE(json_agg(fila ORDER BY fila.id), '[]'::json)::text AS json
+    FROM ({_USUARIO_CON_CURSOS} WHERE u.id = ANY(%s)) fila
+"""
+
+# Exportación NDJSON: una fila (dict) por usuario, en orden de id
+SQL_EXPORTAR_USUARIOS_CON_CURSOS = _USUARIO_CON_CURSOS + " ORDER BY u.id"
+
+# ======================================================================
+# Evaluaciones
+# ======================================================================
+def _lista(select):
+    """json_agg de un SELECT, '[]' si no hay filas."""
+    return f"COALESCE((SELECT json_agg(p ORDER BY p.id) FROM ({select}) p), '[]'::json)"
+
+
+# /evaluacion/{id}/preguntas: datos de la evaluación + preguntas completas (vista del profesor)
+SQL_EVALUACION_PREGUNTAS = f"""
+    SELECT json_build_object(
+        'evaluacion', json_build_object(
+            'titulo', e.titulo,
+            'descripcion', e.descripcion,
+            'versiones', COALESCE(NULLIF(e.versiones, 0)::text, ''),
+            'thread', e.thread
+        ),
+        'preguntas', json_build_object(
+            'alternativas', {_lista('''
+                SELECT 'alternativa' AS tipo, id, enunciado, respuesta_a, respuesta_b, respuesta_c,
+                       respuesta_d, respuesta_e, correcta, puntaje
+                FROM alternativas WHERE id_evaluacion = e.id''')},
+            'vf', {_lista('''
+                SELECT 'vf' AS tipo, id, enunciado, correcta, puntaje
+                FROM vf WHERE id_evaluacion = e.id''')},
+            'desarrollo', {_lista('''
+                SELECT 'desarrollo' AS tipo, id, enunciado, respuesta, puntaje
+                FROM desarrollo WHERE id_evaluacion = e.id''')}
+        )
+    )::text AS json
+    FROM evaluacion e
+    WHERE e.id = %s
+"""
+
+# /evaluaciones/{id}/preguntas: enunciados sin las correctas (vista del alumno)
+SQL_PREGUNTAS_ALUMNO = f"""
+    SELECT
+        (EXISTS (SELECT 1 FROM desarrollo WHERE id_evaluacion = e.id)
+         OR EXISTS (SELECT 1 FROM vf WHERE id_evaluacion = e.id)
+         OR EXISTS (SELECT 1 FROM alternativas WHERE id_evaluacion = e.id)) AS hay_preguntas,
+        json_build_object(
+            'nivel', e.dificultad,
+            'desarrollo', {_lista('SELECT id, enunciado FROM desarrollo WHERE id_evaluacion = e.id')},
+            'vf', {_lista('SELECT id, enunciado FROM vf WHERE id_evaluacion = e.id')},
+            'alternativas', {_lista('''
+                SELECT id, enunciado, respuesta_a, respuesta_b, respuesta_c, respuesta_d, respuesta_e
+                FROM alternativas WHERE id_evaluacion = e.id''')}
+        )::text AS json
+    FROM evaluacion e
+    WHERE e.id = %s
+"""
+
+
+# ======================================================================
+# Respuesta HTTP
+# ======================================================================
+def respuesta_json(cuerpo, status_code=200):
+    """Response con JSON ya serializado (str o bytes), sin pasar por jsonable_encoder."""
+    if isinstance(cuerpo, str):
+        cuerpo = cuerpo.encode("utf-8")
+    return Response(content=cuerpo, status_code=status_code, media_type="application/json")
+
+
+def envolver_json(campos):
+    """
+    Arma un objeto JSON a partir de fragmentos: los valores `bytes` se
+    insertan tal cual (JSON ya serializado por la BD) y el resto pasa por
+    json.dumps. Para agregar p. ej. siguiente_cursor a una lista de Postgres.
+    """
+    partes = []
+    for clave, valor in campos.items():
+        if not isinstance(valor, (bytes, bytearray)):
+            valor = json.dumps(valor, ensure_ascii=False).encode("utf-8")
+        partes.append(json.dumps(clave).encode("utf-8") + b":" + valor)
+    return b"{" + b",".join(partes) + b"}"
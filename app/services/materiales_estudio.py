@@ -0,0 +1,111 @@
+# app/services/materiales_estudio.py
+"""
+Almacén versionado de los materiales de estudio de un guion (resumen, mapa
+conceptual, flashcards, glosario, infografía). Tabla `material_estudio`,
+migración 0009.
+
+Una fila por (guion_id, tipo) con el contenido en JSONB:
+
+- `obtener_material` es una lectura por clave primaria.
+- `guardar_material` es un solo INSERT ... ON CONFLICT: si el hash del
+  contenido no cambió no escribe nada (regenerar y obtener lo mismo no sube
+  la versión); si cambió, la versión sube en la misma sentencia (sin
+  MAX(version)+1 aparte, así dos regeneraciones simultáneas no chocan) y el
+  contenido nuevo queda también en `material_estudio_version`.
+
+El historial se acota en la misma sentencia: sin `imagen_base64` (la imagen
+de la infografía solo vive en la fila vigente) y con a lo sumo
+MATERIALES_HISTORIAL versiones por (guion, tipo); 0 = sin límite.
+
+Reciben un cursor; los generadores las corren con repositorio.transaccion
+(en un hilo, commit al terminar) para no retener una conexión del pool
+mientras esperan a OpenAI.
+
+    guardado = await repositorio.transaccion(guardar_material, guion_id, "glosario", {"terminos": [...]}, metadata)
+    guardado  # {"version": 3, "cambio": True}
+"""
+import json
+import os
+
+MATERIALES_HISTORIAL = int(os.getenv("MATERIALES_HISTORIAL", "10"))    # versiones guardadas por (guion, tipo)
+
+TIPOS = ("resumen", "mapa_conceptual", "flashcards", "glosario", "infografia")
+
+SQL_OBTENER = """
+    SELECT contenido, metadata, version, actualizado_en
+    FROM material_estudio
+    WHERE guion_id = %s AND tipo = %s
+"""
+
+# Lo justo para los endpoints /existe (sin traer el contenido completo)
+SQL_ESTADO = """
+    SELECT version, actualizado_en, contenido->>'titulo' AS titulo, contenido->>'imagen_url' AS imagen_url
+    FROM material_estudio
+    WHERE guion_id = %s AND tipo = %s
+"""
+
+# El último SELECT ve la tabla como estaba antes de la sentencia: si el upsert
+# no escribió (mismo hash), de ahí sale la versión vigente; si la fila la
+# insertó una transacción concurrente no sale nada (ver guardar_material).
+# `recorte` corre aunque nadie lo lea (los CTE que modifican siempre se ejecutan)
+SQL_GUARDAR = """
+    WITH nuevo AS (
+        INSERT INTO material_estudio AS m (guion_id, tipo, contenido, metadata)
+        VALUES (%(guion_id)s, %(tipo)s, %(contenido)s::jsonb, %(metadata)s::jsonb)
+        ON CONFLICT (guion_id, tipo) DO UPDATE
+            SET contenido = EXCLUDED.contenido,
+                metadata = EXCLUDED.metadata,
+                version = m.version + 1,
+                actualizado_en = now()
+            WHERE m.hash <> md5(EXCLUDED.contenido::text)
+        RETURNING guion_id, tipo, version, hash, contenido, metadata, actualizado_en
+    ), historial AS (
+        INSERT INTO material_estudio_version (guion_id, tipo, version, hash, contenido, metadata, creado_en)
+        SELECT guion_id, tipo, version, hash, contenido - 'imagen_base64', metadata, actualizado_en FROM nuevo
+        RETURNING version
+    ), recorte AS (
+        DELETE FROM material_estudio_version v
+        USING nuevo n
+        WHERE %(historial)s > 0
+          AND v.guion_id = n.guion_id AND v.tipo = n.tipo
+          AND v.version <= n.version - %(historial)s
+    )
+    SELECT version, true AS cambio FROM historial
+    UNION ALL
+    SELECT version, false AS cambio
+    FROM material_estudio
+    WHERE guion_id = %(guion_id)s AND tipo = %(tipo)s
+      AND NOT EXISTS (SELECT 1 FROM nuevo)
+"""
+
+
+def obtener_material(cursor, guion_id, tipo):
+    """{"contenido", "metadata", "version", "actualizado_en"} o None."""
+    cursor.execute(SQL_OBTENER, (guion_id, tipo))
+    return cursor.fetchone()
+
+
+def estado_material(cursor, guion_id, tipo):
+    """{"version", "actualizado_en", "titulo", "imagen_url"} o None."""
+    cursor.execute(SQL_ESTADO, (guion_id, tipo))
+    return cursor.fetchone()
+
+
+def guardar_material(cursor, guion_id, tipo, contenido, metadata):
+    """Upsert del material. Retorna {"version": n, "cambio": bool}."""
+    cursor.execute(SQL_GUARDAR, {
+        "guion_id": guion_id,
+        "tipo": tipo,
+        "contenido": json.dumps(contenido, ensure_ascii=False),
+        "metadata": json.dumps(metadata, ensure_ascii=False),
+        "historial": MATERIALES_HISTORIAL,
+    })
+    fila = cursor.fetchone()
+    if fila is None:
+        # Dos primeros guardados simultáneos con el mismo contenido: el ON CONFLICT
+        # esperó al otro y no escribió, y su fila no está en la foto de la
+        # sentencia. Una sentencia nueva ya la ve.
+        cursor.execute("SELECT version FROM material_estudio WHERE guion_id = %s AND tipo = %s", (guion_id, tipo))
+        fila = cursor.fetchone()
+        return {"version": fila["version"], "cambio": False}
+    return {"version": fila["version"], "cambio": fila["cambio"]}
@@ -0,0 +1,213 @@
+# app/services/migraciones.py
+"""
+Migraciones versionadas del esquema de Postgres.
+
+Los archivos viven en app/migraciones/NNNN_nombre.sql y se aplican en orden
+una sola vez; cada una queda registrada en `schema_migracion` con su checksum.
+
+    python -m app.services.migraciones            # aplica las pendientes
+    python -m app.services.migraciones --estado   # lista aplicadas / pendientes
+
+main.py las aplica al arrancar (MIGRAR_AL_INICIAR=0 para no hacerlo).
+
+    - Cada migración corre en su propia transacción. Si la primera línea es
+      `-- sin_transaccion` (p. ej. CREATE INDEX CONCURRENTLY) se ejecuta
+      sentencia por sentencia en autocommit; antes se borran los índices
+      INVALID que haya dejado un intento anterior interrumpido, porque
+      IF NOT EXISTS no los reconstruye.
+    - Un advisory lock evita que dos workers de uvicorn migren a la vez.
+    - Si el archivo de una migración ya aplicada cambió (checksum distinto)
+      se avisa, pero no se vuelve a aplicar: los cambios van en una nueva.
+"""
+import hashlib
+import os
+import re
+import sys
+import time
+from pathlib import Path
+
+from app.services.pool_bd import pool_bd
+
+DIRECTORIO_MIGRACIONES = Path(__file__).resolve().parent.parent / "migraciones"
+MIGRAR_AL_INICIAR = os.getenv("MIGRAR_AL_INICIAR", "1") == "1"
+
+_LOCK_MIGRACIONES = 0x6D696772          # "migr"
+_ARCHIVO = re.compile(r"^(\d{4})_([a-z0-9_]+)\.sql$")
+_INDICE = re.compile(r"CREATE\s+(?:UNIQUE\s+)?INDEX\s+CONCURRENTLY\s+IF\s+NOT\s+EXISTS\s+(\w+)", re.IGNORECASE)
+
+
+class Migracion:
+    def __init__(self, ruta):
+        coincidencia = _ARCHIVO.match(ruta.name)
+        self.version = coincidencia.group(1)
+        self.nombre = coincidencia.group(2)
+        self.sql = ruta.read_text(encoding="utf-8")
+        self.checksum = hashlib.sha256(self.sql.encode("utf-8")).hexdigest()
+        self.sin_transaccion = self.sql.lstrip().startswith("-- sin_transaccion")
+
+    def sentencias(self):
+        """Sentencias del archivo (una por `;` al final de línea), sin comentarios."""
+        sentencias = []
+        actual = []
+        for linea in self.sql.splitlines():
+            if linea.strip().startswith("--"):
+                continue
+            actual.append(linea)
+            if linea.rstrip().endswith(";"):
+                sentencia = "\n".join(actual).strip()
+                if sentencia.rstrip(";").strip():
+                    sentencias.append(sentencia)
+                actual = []
+        if "\n".join(actual).strip():
+            sentencias.append("\n".join(actual).strip())
+        return sentencias
+
+
+def cargar_migraciones(directorio=DIRECTORIO_MIGRACIONES):
+    return [Migracion(ruta) for ruta in sorted(directorio.glob("*.sql")) if _ARCHIVO.match(ruta.name)]
+
+
+class Migraciones:
+    def __init__(self, conectar=None, directorio=DIRECTORIO_MIGRACIONES):
+        self.conectar = conectar
+        self.directorio = directorio
+
+    def configurar(self, conectar):
+        """Función que abre una conexión propia (fuera del pool): pool_bd.conectar_directo."""
+        self.conectar = conectar
+
+    # ------------------------------------------------------------------
+    def _asegurar_tabla(self, cursor):
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migracion (
+                version     TEXT PRIMARY KEY,
+                nombre      TEXT NOT NULL,
+                checksum    TEXT NOT NULL,
+                segundos    DOUBLE PRECISION,
+                aplicada_en TIMESTAMPTZ NOT NULL DEFAULT now()
+            )
+        """)
+
+    def _aplicadas(self, cursor):
+        cursor.execute("SELECT version, checksum FROM schema_migracion")
+        return {fila["version"]: fila["checksum"] for fila in cursor.fetchall()}
+
+    def _borrar_indices_invalidos(self, cursor, migracion):
+        nombres = _INDICE.findall(migracion.sql)
+        if not nombres:
+            return
+        cursor.execute("""
+            SELECT c.relname AS nombre
+            FROM pg_index i
+            JOIN pg_class c ON c.oid = i.indexrelid
+            WHERE NOT i.indisvalid
+              AND c.relname = ANY(%s)
+              AND pg_catalog.pg_table_is_visible(c.oid)
+        """, (nombres,))
+        for fila in cursor.fetchall():
+            print(f"🧹 Índice inválido {fila['nombre']} (build interrumpido), se reconstruye")
+            cursor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS "{fila["nombre"]}"')
+
+    def _aplicar_una(self, conn, migracion):
+        inicio = time.monotonic()
+        cursor = conn.cursor()
+        try:
+            if migracion.sin_transaccion:
+                conn.autocommit = True
+                self._borrar_indices_invalidos(cursor, migracion)
+                for sentencia in migracion.sentencias():
+                    cursor.execute(sentencia)
+                conn.autocommit = False
+            else:
+                cursor.execute(migracion.sql)
+
+            cursor.execute("""
+                INSERT INTO schema_migracion (version, nombre, checksum, segundos)
+                VALUES (%s, %s, %s, %s)
+            """, (migracion.version, migracion.nombre, migracion.checksum, time.monotonic() - inicio))
+            conn.commit()
+        except Exception:
+            if conn.autocommit:
+                conn.autocommit = False
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+        print(f"🗄️ Migración {migracion.version}_{migracion.nombre} aplicada ({time.monotonic() - inicio:.2f}s)")
+
+    def aplicar(self, conn=None, hasta=None):
+        """
+        Aplica las migraciones pendientes (hasta la versión `hasta`, inclusive,
+        si se indica). Retorna las versiones aplicadas.
+        Con `conn` usa esa conexión (y su search_path) en vez de abrir una.
+        """
+        propia = conn is None
+        if propia:
+            conn = self.conectar()
+        aplicadas_ahora = []
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT pg_advisory_lock(%s)", (_LOCK_MIGRACIONES,))
+            try:
+                self._asegurar_tabla(cursor)
+                conn.commit()
+                aplicadas = self._aplicadas(cursor)
+                conn.commit()
+                for migracion in cargar_migraciones(self.directorio):
+                    if hasta is not None and migracion.version > hasta:
+                        break
+                    checksum = aplicadas.get(migracion.version)
+                    if checksum is None:
+                        self._aplicar_una(conn, migracion)
+                        aplicadas_ahora.append(migracion.version)
+                    elif checksum != migracion.checksum:
+                        print(f"⚠️ La migración {migracion.version}_{migracion.nombre} cambió después de aplicarse (no se reaplica)")
+            finally:
+                conn.rollback()
+                cursor.execute("SELECT pg_advisory_unlock(%s)", (_LOCK_MIGRACIONES,))
+                conn.commit()
+                cursor.close()
+        finally:
+            if propia:
+                conn.close()
+        if not aplicadas_ahora:
+            print("🗄️ Esquema al día, sin migraciones pendientes")
+        return aplicadas_ahora
+
+    def estado(self):
+        conn = self.conectar()
+        try:
+            cursor = conn.cursor()
+            self._asegurar_tabla(cursor)
+            conn.commit()
+            aplicadas = self._aplicadas(cursor)
+            cursor.close()
+        finally:
+            conn.close()
+        return [
+            {
+                "version": m.version,
+                "nombre": m.nombre,
+                "aplicada": m.version in aplicadas,
+                "modificada": m.version in aplicadas and aplicadas[m.version] != m.checksum,
+            }
+            for m in cargar_migraciones(self.directorio)
+        ]
+
+
+# Instancia única por proceso (main.py le pasa pool_bd.conectar_directo)
+migraciones = Migraciones(conectar=pool_bd.conectar_directo)
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    pool_bd.configurar(os.getenv("DATABASE_URL"))
+    if "--estado" in sys.argv:
+        for m in migraciones.estado():
+            marca = "✅" if m["aplicada"] else "⏳"
+            aviso = " (modificada)" if m["modificada"] else ""
+            print(f"{marca} {m['version']}_{m['nombre']}{aviso}")
+    else:
+        migraciones.aplicar()
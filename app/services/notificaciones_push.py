@@ -0,0 +1,178 @@
+# app/services/notificaciones_push.py
+"""
+Notificaciones en tiempo real: Postgres avisa, cada worker reparte por SSE.
+
+Los triggers de la migración 0007 hacen `pg_notify('notificaciones', ...)`
+por cada sentencia que inserta, marca como leída o borra notificaciones, con
+un aviso por usuario afectado:
+
+    {"usuario": 7, "ids": [101, 102], "delta_no_leidas": 2}     INSERT
+    {"usuario": 7, "delta_no_leidas": -1}                         UPDATE / DELETE
+
+Así cubre todos los que escriben en `notificacion` (endpoints de feedback y
+foros, fan-out del planificador) sin tocarlos. La escucha es la de escucha_bd
+(una conexión por worker).
+
+- Contador de no leídas en memoria por usuario: se carga de la BD la primera
+  vez que se pide y después se mueve con los deltas. Expira a los
+  NOTIFICACIONES_CONTADOR_TTL segundos para acotar cualquier desfase (p. ej.
+  un aviso que llega justo después de la carga que ya lo contaba).
+- `eventos(usuario_id, cargar)` es el generador SSE de
+  /notificaciones/{user_id}/stream: manda el contador al conectar y luego
+  cada notificación nueva (`cargar(ids)` trae las filas) y cada cambio del
+  contador. Un comentario de latido mantiene viva la conexión.
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+
+from cachetools import TLRUCache
+
+from app.services.escucha_bd import escucha_bd
+from app.services.repositorio import repositorio
+
+CANAL = "notificaciones"
+NOTIFICACIONES_CONTADOR_TTL = int(os.getenv("NOTIFICACIONES_CONTADOR_TTL", "300"))   # segundos
+NOTIFICACIONES_CONTADORES_MAX = int(os.getenv("NOTIFICACIONES_CONTADORES_MAX", "20000"))
+NOTIFICACIONES_SSE_LATIDO = float(os.getenv("NOTIFICACIONES_SSE_LATIDO", "25"))      # segundos
+NOTIFICACIONES_SSE_COLA = int(os.getenv("NOTIFICACIONES_SSE_COLA", "100"))          # eventos pendientes por conexión
+
+
+def _sse(evento, datos):
+    return f"event: {evento}\ndata: {json.dumps(datos, ensure_ascii=False, default=str)}\n\n"
+
+
+class NotificacionesPush:
+    def __init__(self):
+        # usuario -> [no_leidas] (lista para sumar deltas sin renovar el TTL)
+        self._contadores = TLRUCache(
+            maxsize=NOTIFICACIONES_CONTADORES_MAX,
+            ttu=lambda clave, valor, ahora: ahora + NOTIFICACIONES_CONTADOR_TTL,
+            timer=time.monotonic,
+        )
+        self._cargando = {}          # usuario -> True si llegó un aviso durante la carga
+        self._suscriptores = {}      # usuario -> {(loop, asyncio.Queue)}
+        self._lock = threading.Lock()
+        self.avisos = 0
+        self.hits = 0
+        self.misses = 0
+        self.descartados = 0
+
+    # ------------------------------------------------------------------
+    # Contador de no leídas
+    # ------------------------------------------------------------------
+    async def no_leidas(self, usuario_id):
+        with self._lock:
+            contador = self._contadores.get(usuario_id)
+            if contador is not None:
+                self.hits += 1
+                return contador[0]
+            self._cargando[usuario_id] = False
+
+        self.misses += 1
+        try:
+            fila = await repositorio.uno("""
+                SELECT count(*) AS no_leidas
+                FROM notificacion
+                WHERE id_usuario = %s AND leido = 0
+            """, (usuario_id,))
+        except Exception:
+            with self._lock:
+                self._cargando.pop(usuario_id, None)
+            raise
+        no_leidas = fila["no_leidas"]
+        with self._lock:
+            # Si llegó un aviso mientras se contaba no se sabe si quedó incluido: no se guarda
+            if not self._cargando.pop(usuario_id, True):
+                self._contadores[usuario_id] = [no_leidas]
+        return no_leidas
+
+    # ------------------------------------------------------------------
+    # Avisos de Postgres (hilo de escucha_bd)
+    # ------------------------------------------------------------------
+    def _al_recibir(self, payload):
+        evento = json.loads(payload)
+        usuario_id = evento["usuario"]
+        self.avisos += 1
+        with self._lock:
+            contador = self._contadores.get(usuario_id)
+            if contador is not None:
+                contador[0] = max(0, contador[0] + evento.get("delta_no_leidas", 0))
+            if usuario_id in self._cargando:
+                self._cargando[usuario_id] = True
+            evento["no_leidas"] = contador[0] if contador is not None else None
+            suscriptores = list(self._suscriptores.get(usuario_id, ()))
+        for loop, cola in suscriptores:
+            loop.call_soon_threadsafe(self._entregar, cola, evento)
+
+    def _al_reconectar(self):
+        # Mientras no hubo escucha se pudieron perder avisos: todo se vuelve a leer
+        with self._lock:
+            self._contadores.clear()
+            for usuario_id in self._cargando:
+                self._cargando[usuario_id] = True
+            suscriptores = [s for conjunto in self._suscriptores.values() for s in conjunto]
+        for loop, cola in suscriptores:
+            loop.call_soon_threadsafe(self._entregar, cola, {"no_leidas": None})
+
+    def _entregar(self, cola, evento):
+        if cola.full():
+            # Cliente lento: se pierde el evento más viejo, el contador igual se reenvía
+            cola.get_nowait()
+            self.descartados += 1
+        cola.put_nowait(evento)
+
+    # ------------------------------------------------------------------
+    # SSE
+    # ------------------------------------------------------------------
+    async def eventos(self, usuario_id, cargar):
+        """
+        Generador de texto SSE para un usuario. `cargar(ids)` es una corrutina
+        que retorna las filas de esas notificaciones.
+        """
+        suscripcion = (asyncio.get_running_loop(), asyncio.Queue(maxsize=NOTIFICACIONES_SSE_COLA))
+        with self._lock:
+            self._suscriptores.setdefault(usuario_id, set()).add(suscripcion)
+        cola = suscripcion[1]
+        try:
+            yield _sse("no_leidas", {"no_leidas": await self.no_leidas(usuario_id)})
+            while True:
+                try:
+                    evento = await asyncio.wait_for(cola.get(), timeout=NOTIFICACIONES_SSE_LATIDO)
+                except asyncio.TimeoutError:
+                    yield ": latido\n\n"
+                    continue
+
+                if evento.get("ids"):
+                    for fila in await cargar(evento["ids"]):
+                        yield _sse("notificacion", fila)
+                no_leidas = evento.get("no_leidas")
+                if no_leidas is None:
+                    no_leidas = await self.no_leidas(usuario_id)
+                yield _sse("no_leidas", {"no_leidas": no_leidas})
+        finally:
+            with self._lock:
+                conjunto = self._suscriptores.get(usuario_id)
+                if conjunto is not None:
+                    conjunto.discard(suscripcion)
+                    if not conjunto:
+                        del self._suscriptores[usuario_id]
+
+    def estadisticas(self):
+        total = self.hits + self.misses
+        return {
+            "conexiones": sum(len(s) for s in self._suscriptores.values()),
+            "usuarios_conectados": len(self._suscriptores),
+            "contadores": len(self._contadores),
+            "tasa_hit": round(self.hits / total, 3) if total else None,
+            "avisos": self.avisos,
+            "eventos_descartados": self.descartados,
+        }
+
+
+# Instancia única por proceso
+notificaciones_push = NotificacionesPush()
+escucha_bd.suscribir(CANAL, notificaciones_push._al_recibir)
+escucha_bd.al_reconectar(notificaciones_push._al_reconectar)
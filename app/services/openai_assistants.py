@@ -1,10 +1,11 @@
 # services/openai_assistants.py
 from typing import Optional
 from fastapi import HTTPException
-from api import client, instrucciones, modelo
+from api import instrucciones, modelo
+from app.services.openai_cliente import aclient
 
 async def create_assistant_fn(name: str) -> str:
-    assistant = client.beta.assistants.create(
+    assistant = await aclient.beta.assistants.create(
         name=name,
         instructions=instrucciones,
         model=modelo,
@@ -14,7 +15,7 @@ async def create_assistant_fn(name: str) -> str:
 
 
 async def create_assistant_fn(name: str) -> str:
-    assistant = client.beta.assistants.create(
+    assistant = await aclient.beta.assistants.create(
         name=name,
         instructions=instrucciones,
         model=modelo,
@@ -24,14 +25,14 @@ async def create_assistant_fn(name: str) -> str:
 
 async def create_vector_fn(assistant_id: str) -> str:
     # si tu endpoint create-vector recibe assistant_id, aquí lo igualas
-    vector_store = client.beta.vector_stores.create(name=f"vs_{assistant_id}")
+    vector_store = await aclient.beta.vector_stores.create(name=f"vs_{assistant_id}")
     return vector_store.id
 
 async def delete_assistant_fn(assistant_id: str) -> None:
-    client.beta.assistants.delete(assistant_id)
+    await aclient.beta.assistants.delete(assistant_id)
 
 async def delete_vector_fn(vector_id: str) -> None:
-    client.beta.vector_stores.delete(vector_id)
+    await aclient.beta.vector_stores.delete(vector_id)
 
 
 # app/services/openai_assistants.py
@@ -68,7 +69,7 @@ async def crear_guion_fn(
 import asyncio
 from api import generar_resumen_api  # endpoint interno
 
-async def generar_resumen_fn(assistant_id: str, thread_id: str, vector_id: str) -> dict:
+async def generar_resumen_fn(assistant_id: str, thread_id: str, vector_id: str, digest: Optional[str] = None) -> dict:
     """
     Reemplazo interno de POST /generar_resumen/{assistant_id}
     Retorna el dict: {"resumen": ..., "thread": ...} o {"error": ...}
@@ -80,6 +81,7 @@ async def generar_resumen_fn(assistant_id: str, thread_id: str, vector_id: str)
                 assistant_id=assistant_id,
                 thread_id=thread_id,
                 vector_id=vector_id,
+                digest=digest,
             )
         except Exception as e:
             last_err = e
@@ -88,7 +90,7 @@ async def generar_resumen_fn(assistant_id: str, thread_id: str, vector_id: str)
 import asyncio
 from api import generar_mapa_conceptual_api  # el endpoint interno :contentReference[oaicite:2]{index=2}
 
-async def generar_mapa_conceptual_fn(assistant_id: str, thread_id: str, vector_id: str, titulo_guion: str) -> dict:
+async def generar_mapa_conceptual_fn(assistant_id: str, thread_id: str, vector_id: str, titulo_guion: str, digest: Optional[str] = None) -> dict:
     """
     Reemplazo interno de POST /generar_mapa_conceptual/{assistant_id}
     Retorna dict: {"mapa_conceptual": "...json...", "thread": thread_id} :contentReference[oaicite:3]{index=3}
@@ -101,6 +103,7 @@ async def generar_mapa_conceptual_fn(assistant_id: str, thread_id: str, vector_i
                 thread_id=thread_id,
                 vector_id=vector_id,
                 titulo_guion=titulo_guion,
+                digest=digest,
             )
         except Exception as e:
             last_err = e
@@ -112,7 +115,7 @@ async def generar_mapa_conceptual_fn(assistant_id: str, thread_id: str, vector_i
 import asyncio
 from api import generar_flashcards_api
 
-async def generar_flashcards_fn(assistant_id: str, thread_id: str, vector_id: str) -> dict:
+async def generar_flashcards_fn(assistant_id: str, thread_id: str, vector_id: str, digest: Optional[str] = None) -> dict:
     """
     Reemplazo interno de POST /generar_flashcards/{assistant_id}
     Retorna dict con key "flashcards".
@@ -121,11 +124,12 @@ async def generar_flashcards_fn(assistant_id: str, thread_id: str, vector_id: st
         assistant_id=assistant_id,
         thread_id=thread_id,
         vector_id=vector_id,
+        digest=digest,
     )
 # app/services/openai_assistants.py
 from api import generar_glosario_api
 
-async def generar_glosario_fn(assistant_id: str, thread_id: str, vector_id: str) -> dict:
+async def generar_glosario_fn(assistant_id: str, thread_id: str, vector_id: str, digest: Optional[str] = None) -> dict:
     """
     Reemplazo interno de POST /generar_glosario/{assistant_id}
     """
@@ -133,6 +137,19 @@ async def generar_glosario_fn(assistant_id: str, thread_id: str, vector_id: str)
         assistant_id=assistant_id,
         thread_id=thread_id,
         vector_id=vector_id,
+        digest=digest,
+    )
+# app/services/openai_assistants.py
+from api import generar_digest_corpus_api
+
+async def generar_digest_fn(assistant_id: str, vector_id: str) -> dict:
+    """
+    Reemplazo interno de POST /generar_digest/{assistant_id}
+    Retorna dict con key "digest" (ya parseado) o {"error": ...}
+    """
+    return await generar_digest_corpus_api(
+        assistant_id=assistant_id,
+        vector_id=vector_id,
     )
 # app/services/openai_assistants.py
 from api import generar_infografia_api
@@ -0,0 +1,66 @@
+# app/services/openai_cliente.py
+"""
+Cliente AsyncOpenAI compartido por todo el proceso.
+
+Todas las llamadas a la API de Assistants (threads, runs, messages, files,
+vector stores) que se hacen desde rutas `async def` deben pasar por `aclient`,
+así no bloquean el event loop de uvicorn mientras esperan la respuesta HTTP.
+
+Hay UN solo cliente (y un solo pool de conexiones httpx) por proceso: cada
+worker de uvicorn importa este módulo una vez y reutiliza las conexiones
+keep-alive para todas las generaciones en curso.
+
+El pool lleva enganchado el limitador de uso (openai_limitador.py), así que
+cada request queda sujeta a los buckets de requests/tokens del modelo, y el
+registro de recursos (recursos_openai.py), que anota cada assistant, vector
+store, file y thread que se crea o se borra.
+"""
+import os
+from pathlib import Path
+
+import httpx
+from dotenv import load_dotenv
+from openai import AsyncOpenAI
+
+ENV_PATH = Path(__file__).resolve().parents[2] / ".env"   # -> backend/.env
+load_dotenv(ENV_PATH)
+
+from app.services.openai_limitador import hook_request_limitador, hook_response_limitador
+from app.services.recursos_openai import hook_response_recursos
+
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+if not OPENAI_API_KEY:
+    raise RuntimeError("❌ OPENAI_API_KEY no está definida en backend/.env")
+
+# Límites del pool (configurables por entorno)
+OPENAI_MAX_CONEXIONES = int(os.getenv("OPENAI_MAX_CONEXIONES", "100"))
+OPENAI_MAX_KEEPALIVE = int(os.getenv("OPENAI_MAX_KEEPALIVE", "20"))
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "60"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "2"))
+
+_http_client = httpx.AsyncClient(
+    limits=httpx.Limits(
+        max_connections=OPENAI_MAX_CONEXIONES,
+        max_keepalive_connections=OPENAI_MAX_KEEPALIVE,
+    ),
+    timeout=httpx.Timeout(OPENAI_TIMEOUT, connect=10.0),
+    event_hooks={
+        "request": [hook_request_limitador],
+        "response": [hook_response_limitador, hook_response_recursos],
+    },
+)
+
+aclient = AsyncOpenAI(
+    api_key=OPENAI_API_KEY,
+    http_client=_http_client,
+    max_retries=OPENAI_MAX_RETRIES,
+)
+
+
+async def cerrar_aclient():
+    """Cierra el pool de conexiones (llamar en el shutdown de la app)."""
+    try:
+        await aclient.close()
+        print("🔌 Cliente AsyncOpenAI cerrado")
+    except Exception as e:
+        print(f"⚠️ Error cerrando cliente AsyncOpenAI: {e}")
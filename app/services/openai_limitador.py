@@ -0,0 +1,242 @@
+# app/services/openai_limitador.py
+"""
+Limitador de uso de OpenAI (asyncio, sin locks de threading).
+
+Por cada modelo hay dos token buckets:
+    - requests: capacidad = RPM, recarga RPM/60 por segundo
+    - tokens:   capacidad = TPM, recarga TPM/60 por segundo
+
+Se engancha al httpx.AsyncClient del cliente compartido (ver openai_cliente.py):
+    - hook de request  → `adquirir(...)` antes de enviar cada llamada
+    - hook de response → ajusta los buckets con los headers x-ratelimit-* y,
+                         si llega un 429, bloquea el modelo hasta el reset
+
+Así TODAS las llamadas de api.py, gpt_api.py y main.py quedan limitadas sin
+tener que acordarse de llamar a nada antes.
+
+Los límites se configuran con OPENAI_LIMITES (JSON), ej:
+    {"gpt-4o": {"rpm": 500, "tpm": 30000}, "gpt-4o-mini": {"rpm": 500, "tpm": 200000}}
+"""
+import asyncio
+import json
+import os
+import re
+import time
+
+OPENAI_MODELO_DEFECTO = os.getenv("MODELO", "gpt-4o")
+
+# Estimación de tokens que consume un run de Assistants (file_search + respuesta).
+# Se corrige con el uso real cuando el run termina (ver `registrar_uso`).
+OPENAI_TOKENS_POR_RUN = int(os.getenv("OPENAI_TOKENS_POR_RUN", "4000"))
+
+LIMITES_DEFECTO = {
+    "gpt-4o": {"rpm": 500, "tpm": 30000},
+    "gpt-4o-mini": {"rpm": 500, "tpm": 200000},
+    "default": {"rpm": 500, "tpm": 30000},
+}
+
+
+def _cargar_limites():
+    limites = dict(LIMITES_DEFECTO)
+    try:
+        limites.update(json.loads(os.getenv("OPENAI_LIMITES", "{}")))
+    except Exception as e:
+        print(f"⚠️ OPENAI_LIMITES inválido, usando límites por defecto: {e}")
+    return limites
+
+
+def _parsear_duracion(valor):
+    """Convierte '6m0s', '1.5s', '20ms' (formato de OpenAI) a segundos."""
+    if not valor:
+        return None
+    try:
+        return float(valor)
+    except ValueError:
+        pass
+    total = 0.0
+    for numero, unidad in re.findall(r"([\d.]+)(ms|h|m|s)", valor):
+        numero = float(numero)
+        total += {"ms": numero / 1000, "s": numero, "m": numero * 60, "h": numero * 3600}[unidad]
+    return total
+
+
+class BucketTokens:
+    def __init__(self, capacidad, por_segundo):
+        self.capacidad = float(capacidad)
+        self.por_segundo = float(por_segundo)
+        self.nivel = float(capacidad)
+        self.bloqueado_hasta = 0.0
+        self._ultima_recarga = time.monotonic()
+
+    def _recargar(self):
+        ahora = time.monotonic()
+        self.nivel = min(self.capacidad, self.nivel + (ahora - self._ultima_recarga) * self.por_segundo)
+        self._ultima_recarga = ahora
+
+    def espera_para(self, cantidad):
+        """Segundos que faltan para poder consumir `cantidad` (0 si ya se puede)."""
+        self._recargar()
+        ahora = time.monotonic()
+        if ahora < self.bloqueado_hasta:
+            return self.bloqueado_hasta - ahora
+        cantidad = min(cantidad, self.capacidad)
+        if self.nivel >= cantidad:
+            return 0.0
+        return (cantidad - self.nivel) / self.por_segundo
+
+    def consumir(self, cantidad):
+        self.nivel -= min(cantidad, self.capacidad)
+
+    def devolver(self, cantidad):
+        self.nivel = min(self.capacidad, self.nivel + cantidad)
+
+
+class LimitadorOpenAI:
+    def __init__(self, limites=None):
+        self.limites = limites or _cargar_limites()
+        self._buckets = {}     # modelo -> {"requests": BucketTokens, "tokens": BucketTokens}
+        self._stats = {}       # modelo -> contadores
+
+    # ------------------------------------------------------------------
+    def _buckets_de(self, modelo):
+        modelo = modelo or OPENAI_MODELO_DEFECTO
+        if modelo not in self._buckets:
+            limite = self.limites.get(modelo, self.limites["default"])
+            self._buckets[modelo] = {
+                "requests": BucketTokens(limite["rpm"], limite["rpm"] / 60),
+                "tokens": BucketTokens(limite["tpm"], limite["tpm"] / 60),
+            }
+            self._stats[modelo] = {
+                "requests": 0,
+                "tokens_estimados": 0,
+                "tokens_reales": 0,
+                "esperas": 0,
+                "segundos_esperados": 0.0,
+                "respuestas_429": 0,
+            }
+        return self._buckets[modelo], self._stats[modelo]
+
+    async def adquirir(self, modelo=None, tokens=0):
+        """Espera (sin bloquear el loop) hasta tener cupo de 1 request + `tokens`."""
+        buckets, stats = self._buckets_de(modelo)
+        esperado = 0.0
+
+        while True:
+            espera = max(
+                buckets["requests"].espera_para(1),
+                buckets["tokens"].espera_para(tokens),
+            )
+            if espera <= 0:
+                buckets["requests"].consumir(1)
+                buckets["tokens"].consumir(tokens)
+                break
+            esperado += espera
+            await asyncio.sleep(espera)
+
+        stats["requests"] += 1
+        stats["tokens_estimados"] += tokens
+        if esperado > 0:
+            stats["esperas"] += 1
+            stats["segundos_esperados"] += esperado
+            print(f"⏳ Limitador OpenAI ({modelo or OPENAI_MODELO_DEFECTO}): esperó {esperado:.2f}s")
+
+    def registrar_uso(self, modelo, tokens_reales, tokens_estimados=OPENAI_TOKENS_POR_RUN):
+        """
+        Corrige el bucket de tokens con el uso real de un run ya terminado.
+        `modelo` es el bucket al que el hook de request cobró la estimación
+        (el `model` del body del run, o MODELO si no lo trae).
+        """
+        buckets, stats = self._buckets_de(modelo)
+        diferencia = tokens_reales - tokens_estimados
+        if diferencia > 0:
+            buckets["tokens"].consumir(diferencia)
+        elif diferencia < 0:
+            buckets["tokens"].devolver(-diferencia)
+        stats["tokens_reales"] += tokens_reales
+
+    def actualizar_desde_headers(self, modelo, headers, status_code=200):
+        """Sincroniza los buckets con x-ratelimit-* (y Retry-After si hubo 429)."""
+        buckets, stats = self._buckets_de(modelo)
+
+        for tipo in ("requests", "tokens"):
+            bucket = buckets[tipo]
+            limite = headers.get(f"x-ratelimit-limit-{tipo}")
+            restante = headers.get(f"x-ratelimit-remaining-{tipo}")
+            try:
+                if limite:
+                    bucket.capacidad = float(limite)
+                    bucket.por_segundo = float(limite) / 60
+                if restante is not None:
+                    bucket._recargar()
+                    bucket.nivel = min(bucket.nivel, float(restante))
+            except ValueError:
+                pass
+
+        if status_code == 429:
+            stats["respuestas_429"] += 1
+            espera = _parsear_duracion(headers.get("retry-after")) or max(
+                _parsear_duracion(headers.get("x-ratelimit-reset-requests")) or 0,
+                _parsear_duracion(headers.get("x-ratelimit-reset-tokens")) or 0,
+                1.0,
+            )
+            hasta = time.monotonic() + espera
+            for bucket in buckets.values():
+                bucket.bloqueado_hasta = max(bucket.bloqueado_hasta, hasta)
+            print(f"🚦 429 de OpenAI ({modelo or OPENAI_MODELO_DEFECTO}): pausa de {espera:.1f}s")
+
+    def estadisticas(self):
+        resultado = {}
+        for modelo, buckets in self._buckets.items():
+            resultado[modelo] = {
+                **self._stats[modelo],
+                "segundos_esperados": round(self._stats[modelo]["segundos_esperados"], 3),
+                "requests_disponibles": round(buckets["requests"].nivel, 1),
+                "requests_capacidad": buckets["requests"].capacidad,
+                "tokens_disponibles": round(buckets["tokens"].nivel, 1),
+                "tokens_capacidad": buckets["tokens"].capacidad,
+            }
+        return resultado
+
+
+# Instancia única por proceso
+limitador_openai = LimitadorOpenAI()
+
+
+# ----------------------------------------------------------------------
+# Hooks para httpx.AsyncClient
+# ----------------------------------------------------------------------
+def _modelo_y_tokens(request):
+    """Estima modelo y tokens de una request a la API de OpenAI."""
+    modelo = OPENAI_MODELO_DEFECTO
+    tokens = 0
+    try:
+        cuerpo = request.content
+    except Exception:
+        # Subidas multipart en streaming: no consumen tokens del modelo
+        return modelo, 0
+
+    if cuerpo and request.headers.get("content-type", "").startswith("application/json"):
+        try:
+            datos = json.loads(cuerpo)
+            modelo = datos.get("model") or modelo
+        except Exception:
+            pass
+
+    ruta = request.url.path
+    if request.method == "POST" and ruta.endswith("/runs"):
+        tokens = OPENAI_TOKENS_POR_RUN
+    elif request.method == "POST" and (ruta.endswith("/messages") or ruta.endswith("/chat/completions")):
+        tokens = len(cuerpo or b"") // 4
+
+    request.extensions["limitador_modelo"] = modelo
+    return modelo, tokens
+
+
+async def hook_request_limitador(request):
+    modelo, tokens = _modelo_y_tokens(request)
+    await limitador_openai.adquirir(modelo, tokens)
+
+
+async def hook_response_limitador(response):
+    modelo = response.request.extensions.get("limitador_modelo", OPENAI_MODELO_DEFECTO)
+    limitador_openai.actualizar_desde_headers(modelo, response.headers, response.status_code)
@@ -0,0 +1,173 @@
+# app/services/openai_multiplexor.py
+"""
+Multiplexor de runs: UN solo bucle por proceso que consulta el estado de todos
+los runs pendientes (thread_id, run_id).
+
+En vez de que cada request tenga su propio `while True: runs.retrieve(...)`,
+los llamadores registran el run y esperan un future:
+
+    run = await multiplexor_runs.esperar(thread_id, run_id, timeout=120)
+
+- Backoff adaptativo por run: el primer chequeo es rápido y el intervalo crece
+  (x1.5) hasta `intervalo_max` mientras el run siga en cola / en progreso.
+- Presupuesto global: como máximo `presupuesto_rps` consultas por segundo para
+  todo el proceso, sin importar cuántos runs haya en vuelo.
+- Si dos llamadores esperan el mismo run, comparten la misma consulta.
+"""
+import asyncio
+import heapq
+import itertools
+import os
+import time
+
+from app.services.openai_cliente import aclient
+
+ESTADOS_TERMINALES = {"completed", "failed", "cancelled", "expired", "incomplete", "requires_action"}
+
+MULTIPLEXOR_RPS = float(os.getenv("MULTIPLEXOR_RPS", "5"))
+MULTIPLEXOR_INTERVALO_MIN = float(os.getenv("MULTIPLEXOR_INTERVALO_MIN", "0.5"))
+MULTIPLEXOR_INTERVALO_MAX = float(os.getenv("MULTIPLEXOR_INTERVALO_MAX", "8"))
+
+
+class _RunPendiente:
+    __slots__ = ("thread_id", "run_id", "futuro", "intervalo", "deadline", "consultando")
+
+    def __init__(self, thread_id, run_id, futuro, intervalo, deadline):
+        self.thread_id = thread_id
+        self.run_id = run_id
+        self.futuro = futuro
+        self.intervalo = intervalo
+        self.deadline = deadline
+        self.consultando = False
+
+
+class MultiplexorRuns:
+    def __init__(self, presupuesto_rps=MULTIPLEXOR_RPS,
+                 intervalo_min=MULTIPLEXOR_INTERVALO_MIN,
+                 intervalo_max=MULTIPLEXOR_INTERVALO_MAX):
+        self.presupuesto_rps = presupuesto_rps
+        self.intervalo_min = intervalo_min
+        self.intervalo_max = intervalo_max
+
+        self._pendientes = {}          # (thread_id, run_id) -> _RunPendiente
+        self._agenda = []              # heap de (proximo_chequeo, seq, clave)
+        self._seq = itertools.count()
+        self._despertar = None
+        self._tarea = None
+        self._ultimo_envio = 0.0
+
+        self.consultas_realizadas = 0
+        self.runs_resueltos = 0
+
+    # ------------------------------------------------------------------
+    # API pública
+    # ------------------------------------------------------------------
+    async def esperar(self, thread_id, run_id, timeout=120):
+        """Espera el estado terminal del run. Retorna el run o None si hay timeout."""
+        self._asegurar_bucle()
+        clave = (thread_id, run_id)
+        ahora = time.monotonic()
+
+        pendiente = self._pendientes.get(clave)
+        if pendiente is None:
+            futuro = asyncio.get_running_loop().create_future()
+            pendiente = _RunPendiente(thread_id, run_id, futuro, self.intervalo_min, ahora + timeout)
+            self._pendientes[clave] = pendiente
+            self._agendar(clave, ahora + self.intervalo_min)
+        else:
+            # Otro llamador ya espera este run: se extiende el deadline si hace falta
+            pendiente.deadline = max(pendiente.deadline, ahora + timeout)
+
+        try:
+            return await asyncio.wait_for(asyncio.shield(pendiente.futuro), timeout=timeout)
+        except asyncio.TimeoutError:
+            print(f"❌ Timeout después de {timeout} segundos esperando run {run_id}")
+            return None
+
+    def estadisticas(self):
+        return {
+            "runs_pendientes": len(self._pendientes),
+            "consultas_realizadas": self.consultas_realizadas,
+            "runs_resueltos": self.runs_resueltos,
+            "presupuesto_rps": self.presupuesto_rps,
+        }
+
+    # ------------------------------------------------------------------
+    # Bucle interno
+    # ------------------------------------------------------------------
+    def _asegurar_bucle(self):
+        if self._tarea is None or self._tarea.done():
+            self._despertar = asyncio.Event()
+            self._tarea = asyncio.get_running_loop().create_task(self._bucle())
+
+    def _agendar(self, clave, cuando):
+        heapq.heappush(self._agenda, (cuando, next(self._seq), clave))
+        if self._despertar is not None:
+            self._despertar.set()
+
+    async def _bucle(self):
+        while True:
+            if not self._agenda:
+                self._despertar.clear()
+                await self._despertar.wait()
+                continue
+
+            cuando, _, clave = self._agenda[0]
+            espera = cuando - time.monotonic()
+            if espera > 0:
+                self._despertar.clear()
+                try:
+                    await asyncio.wait_for(self._despertar.wait(), timeout=espera)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            heapq.heappop(self._agenda)
+            pendiente = self._pendientes.get(clave)
+            if pendiente is None or pendiente.consultando:
+                continue
+
+            if pendiente.futuro.done() or time.monotonic() > pendiente.deadline:
+                self._pendientes.pop(clave, None)
+                if not pendiente.futuro.done():
+                    pendiente.futuro.set_result(None)
+                continue
+
+            # Presupuesto global de consultas por segundo
+            separacion = 1.0 / self.presupuesto_rps
+            hueco = self._ultimo_envio + separacion - time.monotonic()
+            if hueco > 0:
+                await asyncio.sleep(hueco)
+            self._ultimo_envio = time.monotonic()
+
+            pendiente.consultando = True
+            asyncio.get_running_loop().create_task(self._consultar(clave, pendiente))
+
+    async def _consultar(self, clave, pendiente):
+        try:
+            run = await aclient.beta.threads.runs.retrieve(
+                thread_id=pendiente.thread_id,
+                run_id=pendiente.run_id
+            )
+            self.consultas_realizadas += 1
+
+            if run.status in ESTADOS_TERMINALES:
+                self._pendientes.pop(clave, None)
+                self.runs_resueltos += 1
+                if not pendiente.futuro.done():
+                    pendiente.futuro.set_result(run)
+                return
+
+        except Exception as e:
+            print(f"❌ Error consultando run {pendiente.run_id}: {e}")
+
+        finally:
+            pendiente.consultando = False
+
+        # Sigue en curso: backoff adaptativo
+        pendiente.intervalo = min(pendiente.intervalo * 1.5, self.intervalo_max)
+        self._agendar(clave, time.monotonic() + pendiente.intervalo)
+
+
+# Instancia única por proceso
+multiplexor_runs = MultiplexorRuns()
@@ -0,0 +1,206 @@
+# app/services/openai_runs.py
+"""
+Ejecución de runs de Assistants con streaming de eventos.
+
+`ejecutar_run` crea el run con `runs.stream(...)` y consume los eventos SSE:
+retorna apenas llega el evento terminal del run (sin esperar al siguiente
+tick de un polling) y ya trae el texto del mensaje generado, así que no hace
+falta un `messages.list` adicional.
+
+Si el stream no se puede abrir o se corta a mitad de camino, cae a polling
+sobre el mismo run (`esperar_run_completado`), que delega en el multiplexor
+de runs del proceso (app/services/openai_multiplexor.py).
+
+Con OPENAI_MODO_RUNS=polling se omite el streaming y todos los runs se
+esperan a través del multiplexor (una sola conexión de consulta por proceso
+en vez de un stream abierto por run).
+
+Si se pasa `extractor_json` (ExtractorJSONIncremental), cada delta de texto
+del stream se le va entregando y el JSON ya parseado queda en
+`resultado["json"]`.
+
+`resultado["uso"]` trae los tokens de entrada/salida que reportó el run
+(None si el run no terminó o la API no los informó).
+
+Cada ejecución deja sus tiempos por fase en `resultado["tiempos"]`:
+    creado        → segundos hasta que el run existe en OpenAI
+    en_progreso   → segundos hasta que el run pasa a in_progress
+    primer_token  → segundos hasta el primer delta de texto
+    total         → segundos hasta el estado terminal
+"""
+import asyncio
+import os
+import time
+from typing import Optional
+
+from app.services.openai_cliente import aclient
+from app.services.openai_limitador import limitador_openai
+from app.services.openai_multiplexor import ESTADOS_TERMINALES, multiplexor_runs
+
+OPENAI_MODO_RUNS = os.getenv("OPENAI_MODO_RUNS", "stream")
+
+# Eventos terminales del run. Con prefijo no sirve: thread.run.step.completed
+# (p. ej. el paso de file_search) trae un RunStep con status "completed"
+EVENTOS_TERMINALES = {f"thread.run.{status}" for status in ESTADOS_TERMINALES}
+
+
+def texto_de_mensaje(msg) -> Optional[str]:
+    """Devuelve el primer bloque de texto de un mensaje del assistant."""
+    for c in getattr(msg, "content", None) or []:
+        if hasattr(c, "text") and c.text:
+            return c.text.value.strip()
+    return None
+
+
+async def esperar_run_completado(thread_id, run_id, timeout=120):
+    """
+    Espera a que un run termine (sin streaming). La consulta de estado la hace
+    el multiplexor compartido, con backoff por run y presupuesto global.
+    Retorna el run, o None si se alcanza el timeout.
+    """
+    return await multiplexor_runs.esperar(thread_id, run_id, timeout=timeout)
+
+
+async def _cancelar_run(thread_id, run_id):
+    try:
+        await aclient.beta.threads.runs.cancel(thread_id=thread_id, run_id=run_id)
+        print(f"🛑 Run {run_id} cancelado por timeout")
+    except Exception as e:
+        print(f"⚠️ No se pudo cancelar run {run_id}: {e}")
+
+
+async def ejecutar_run(thread_id, assistant_id, timeout=120, nombre_fase="run", extractor_json=None, **run_kwargs):
+    """
+    Crea un run en `thread_id` y espera su estado terminal vía streaming.
+
+    Retorna un dict:
+        {
+          "run": <Run> | None,
+          "status": "completed" | "failed" | ... | "timeout" | "error",
+          "texto": str | None,      # texto del mensaje generado por el run
+          "json": dict | list | None,   # solo con extractor_json y en modo stream
+          "modo": "stream" | "polling",
+          "uso": {"entrada": int, "salida": int} | None,
+          "tiempos": {"creado": s, "en_progreso": s, "primer_token": s, "total": s}
+        }
+    """
+    inicio = time.monotonic()
+    tiempos = {}
+    estado = {"run": None, "texto": None}
+
+    def _marcar(fase):
+        if fase not in tiempos:
+            tiempos[fase] = round(time.monotonic() - inicio, 3)
+
+    async def _consumir_stream():
+        async with aclient.beta.threads.runs.stream(
+            thread_id=thread_id,
+            assistant_id=assistant_id,
+            **run_kwargs,
+        ) as stream:
+            async for event in stream:
+                tipo = event.event
+
+                if tipo == "thread.run.created":
+                    estado["run"] = event.data
+                    _marcar("creado")
+                elif tipo == "thread.run.in_progress":
+                    estado["run"] = event.data
+                    _marcar("en_progreso")
+                elif tipo == "thread.message.delta":
+                    _marcar("primer_token")
+                    if extractor_json is not None:
+                        for bloque in event.data.delta.content or []:
+                            if getattr(bloque, "type", None) == "text" and bloque.text and bloque.text.value:
+                                extractor_json.alimentar(bloque.text.value)
+                elif tipo == "thread.message.completed":
+                    if estado["texto"] is None and event.data.role == "assistant":
+                        estado["texto"] = texto_de_mensaje(event.data)
+                elif tipo in EVENTOS_TERMINALES:
+                    estado["run"] = event.data
+                    return
+                elif tipo == "error":
+                    raise Exception(f"Error en stream: {event.data}")
+
+        # El stream terminó sin evento terminal → se confirma por polling
+        raise Exception("stream cerrado sin estado terminal")
+
+    modo = "stream"
+    try:
+        if OPENAI_MODO_RUNS == "polling":
+            raise Exception("streaming deshabilitado (OPENAI_MODO_RUNS=polling)")
+        await asyncio.wait_for(_consumir_stream(), timeout=timeout)
+
+    except asyncio.TimeoutError:
+        run = estado["run"]
+        if run is not None:
+            await _cancelar_run(thread_id, run.id)
+        tiempos["total"] = round(time.monotonic() - inicio, 3)
+        print(f"❌ {nombre_fase}: timeout después de {timeout} segundos")
+        return {"run": run, "status": "timeout", "texto": None, "json": None, "modo": modo, "uso": None, "tiempos": tiempos}
+
+    except Exception as e:
+        # Fallback: polling sobre el run ya creado, o crear uno nuevo si el stream ni siquiera partió
+        modo = "polling"
+        print(f"⚠️ {nombre_fase}: stream no disponible ({e}), usando polling")
+        try:
+            if estado["run"] is None:
+                estado["run"] = await aclient.beta.threads.runs.create(
+                    thread_id=thread_id,
+                    assistant_id=assistant_id,
+                    **run_kwargs,
+                )
+                _marcar("creado")
+
+            restante = max(timeout - (time.monotonic() - inicio), 1)
+            run = await esperar_run_completado(thread_id, estado["run"].id, timeout=restante)
+            if run is None:
+                await _cancelar_run(thread_id, estado["run"].id)
+                tiempos["total"] = round(time.monotonic() - inicio, 3)
+                return {
+                    "run": estado["run"], "status": "timeout", "texto": None, "json": None,
+                    "modo": modo, "uso": None, "tiempos": tiempos,
+                }
+            estado["run"] = run
+        except Exception as e2:
+            tiempos["total"] = round(time.monotonic() - inicio, 3)
+            print(f"❌ {nombre_fase}: error ejecutando run: {e2}")
+            return {
+                "run": estado["run"], "status": "error", "texto": None, "json": None,
+                "modo": modo, "uso": None, "tiempos": tiempos, "error": str(e2),
+            }
+
+    run = estado["run"]
+    texto = estado["texto"]
+
+    # En polling (o si el stream no trajo el mensaje) se lee el mensaje del run
+    if run is not None and run.status == "completed" and not texto:
+        try:
+            messages = await aclient.beta.threads.messages.list(thread_id=thread_id, run_id=run.id)
+            for msg in messages.data:
+                if msg.role == "assistant":
+                    texto = texto_de_mensaje(msg)
+                    if texto:
+                        break
+        except Exception as e:
+            print(f"⚠️ {nombre_fase}: no se pudo leer el mensaje del run: {e}")
+
+    # Corrige con lo que realmente consumió el run el mismo bucket que cobró la
+    # estimación: el hook solo ve el `model` del body (None → MODELO), no
+    # run.model, que es el del assistant
+    uso = getattr(run, "usage", None) if run is not None else None
+    tokens = None
+    if uso is not None and getattr(uso, "total_tokens", None):
+        limitador_openai.registrar_uso(run_kwargs.get("model"), uso.total_tokens)
+        tokens = {"entrada": uso.prompt_tokens, "salida": uso.completion_tokens}
+
+    # El JSON incremental solo vale si el texto completo llegó por el stream
+    datos_json = None
+    if extractor_json is not None and modo == "stream" and run is not None and run.status == "completed":
+        datos_json = extractor_json.finalizar()
+
+    tiempos["total"] = round(time.monotonic() - inicio, 3)
+    status = run.status if run is not None else "error"
+    print(f"⏱️ {nombre_fase}: {status} ({modo}) {tiempos}")
+
+    return {"run": run, "status": status, "texto": texto, "json": datos_json, "modo": modo, "uso": tokens, "tiempos": tiempos}
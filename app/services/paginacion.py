@@ -0,0 +1,187 @@
+# app/services/paginacion.py
+"""
+Paginación keyset y exportación NDJSON para los listados que crecen sin
+límite (usuarios, notificaciones, foros, respuestas, evaluaciones).
+
+Keyset en vez de OFFSET: cada página sigue desde los valores de orden de la
+última fila de la anterior (WHERE (orden) < (último) ... LIMIT n), y las
+filas que se insertan mientras se pagina no corren ni repiten resultados. El
+orden siempre termina en una columna única (id) para que sea estable.
+
+Si todas las columnas van en la misma dirección (notificaciones, foros,
+respuestas de foro, usuarios, evaluaciones) la condición es una comparación
+de filas, que Postgres usa como límite del recorrido del índice
+idx_*_orden (0003): la página 1.000 cuesta lo mismo que la 1. Con
+direcciones mixtas (ORDEN_RESPUESTAS_ACTIVIDAD) se expande en ORs, que solo
+se pueden filtrar: cada página recorre las filas anteriores.
+
+    ORDEN = (Columna("foro.fecha", "fecha", True, "date"),
+             Columna("foro.hora", "hora", True, "time"),
+             Columna("foro.id", "id", True))
+    despues = leer_cursor(cursor_texto, ORDEN)          # HTTPException 400 si es inválido
+    filas, siguiente = paginar(cursor_bd, SELECT, "foro.id_unidad = %s", (unidad_id,), ORDEN, limite, despues)
+
+El cursor que ve el cliente es opaco (base64 de los valores de orden).
+
+`exportar_ndjson(...)` responde el listado completo como NDJSON (una fila
+JSON por línea) leyendo con un cursor de servidor de Postgres: la memoria no
+crece con el tamaño del resultado. La conexión la toma y la devuelve el
+propio generador (en su finally), no depende de ningún middleware.
+"""
+import base64
+import json
+import os
+import uuid
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from typing import NamedTuple
+
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+
+from app.services.pool_bd import pool_bd
+
+PAGINA_POR_DEFECTO = int(os.getenv("PAGINA_POR_DEFECTO", "50"))
+PAGINA_MAXIMA = int(os.getenv("PAGINA_MAXIMA", "500"))
+EXPORTACION_LOTE = int(os.getenv("EXPORTACION_LOTE", "1000"))      # filas por viaje del cursor de servidor
+
+
+class Columna(NamedTuple):
+    expresion: str            # SQL (p. ej. "foro.fecha")
+    campo: str                # nombre de la columna en la fila resultante
+    descendente: bool = False
+    tipo: str = "int"         # cast del valor del cursor: int | text | date | time | timestamp
+
+
+def _a_json(valor):
+    if isinstance(valor, (datetime, date, time)):
+        return valor.isoformat()
+    if isinstance(valor, timedelta):
+        return valor.total_seconds()
+    if isinstance(valor, Decimal):
+        return float(valor)
+    if isinstance(valor, (bytes, bytearray, memoryview)):
+        return base64.b64encode(bytes(valor)).decode("ascii")
+    raise TypeError(f"{type(valor).__name__} no es serializable")
+
+
+# ======================================================================
+# Cursor opaco
+# ======================================================================
+def crear_cursor(fila, orden):
+    valores = [fila[c.campo] for c in orden]
+    crudo = json.dumps(valores, default=_a_json, separators=(",", ":"))
+    return base64.urlsafe_b64encode(crudo.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def leer_cursor(texto, orden):
+    """Valores de orden del cursor, o None si no hay. HTTPException 400 si es inválido."""
+    if not texto:
+        return None
+    try:
+        relleno = "=" * (-len(texto) % 4)
+        valores = json.loads(base64.urlsafe_b64decode(texto + relleno))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Cursor de paginación inválido")
+    if not isinstance(valores, list) or len(valores) != len(orden):
+        raise HTTPException(status_code=400, detail="Cursor de paginación inválido")
+    return valores
+
+
+# ======================================================================
+# SQL
+# ======================================================================
+def orden_sql(orden):
+    return ", ".join(f"{c.expresion} {'DESC' if c.descendente else 'ASC'}" for c in orden)
+
+
+def condicion_keyset(orden, valores):
+    """
+    Filas estrictamente después de `valores` en el orden dado.
+    Misma dirección en todas las columnas: (a, b, c) < (x, y, z).
+    Direcciones mixtas: (a > x) OR (a = x AND b < y) OR ...
+    """
+    if len({c.descendente for c in orden}) == 1:
+        operador = "<" if orden[0].descendente else ">"
+        columnas = ", ".join(c.expresion for c in orden)
+        marcadores = ", ".join(f"%s::{c.tipo}" for c in orden)
+        return f"(({columnas}) {operador} ({marcadores}))", list(valores)
+
+    ramas = []
+    parametros = []
+    for i, columna in enumerate(orden):
+        partes = []
+        for previa, valor in zip(orden[:i], valores[:i]):
+            partes.append(f"{previa.expresion} = %s::{previa.tipo}")
+            parametros.append(valor)
+        operador = "<" if columna.descendente else ">"
+        partes.append(f"{columna.expresion} {operador} %s::{columna.tipo}")
+        parametros.append(valores[i])
+        ramas.append("(" + " AND ".join(partes) + ")")
+    return "(" + " OR ".join(ramas) + ")", parametros
+
+
+def paginar(cursor, consulta, where, parametros, orden, limite=None, despues=None):
+    """
+    Ejecuta `consulta` (SELECT ... FROM ... JOIN ..., sin WHERE ni ORDER BY)
+    con `where` + keyset. Retorna (filas, siguiente_cursor | None).
+
+    Sin `limite` ni `despues` retorna todo (respuesta anterior de los
+    endpoints, para los clientes que todavía no paginan).
+    """
+    paginado = limite is not None or despues is not None
+    condiciones = [where] if where else []
+    parametros = list(parametros)
+    if despues is not None:
+        condicion, extra = condicion_keyset(orden, despues)
+        condiciones.append(condicion)
+        parametros.extend(extra)
+
+    sql = consulta
+    if condiciones:
+        sql += " WHERE " + " AND ".join(condiciones)
+    sql += f" ORDER BY {orden_sql(orden)}"
+    if paginado:
+        limite = max(1, min(limite or PAGINA_POR_DEFECTO, PAGINA_MAXIMA))
+        sql += " LIMIT %s"
+        parametros.append(limite + 1)
+
+    cursor.execute(sql, parametros)
+    filas = cursor.fetchall()
+    if paginado and len(filas) > limite:
+        filas = filas[:limite]
+        return filas, crear_cursor(filas[-1], orden)
+    return filas, None
+
+
+# ======================================================================
+# Exportación NDJSON con cursor de servidor
+# ======================================================================
+def exportar_ndjson(consulta, parametros=(), transformar=None, nombre="exportacion"):
+    """
+    StreamingResponse NDJSON del resultado completo de `consulta` (con su ORDER BY).
+    `transformar(fila) -> dict` se aplica a cada fila antes de serializar.
+    """
+    def filas():
+        conn = pool_bd.conectar()
+        cursor = conn.cursor(name=f"exportacion_{uuid.uuid4().hex[:12]}")
+        cursor.itersize = EXPORTACION_LOTE
+        try:
+            cursor.execute(consulta, parametros)
+            for fila in cursor:
+                if transformar is not None:
+                    fila = transformar(fila)
+                yield json.dumps(fila, default=_a_json, ensure_ascii=False) + "\n"
+        finally:
+            try:
+                cursor.close()
+            except Exception:
+                pass
+            # close() devuelve la conexión al pool (con rollback de la transacción del cursor)
+            conn.close()
+
+    return StreamingResponse(
+        filas(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{nombre}.ndjson"'},
+    )
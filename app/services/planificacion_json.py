@@ -0,0 +1,90 @@
+# app/services/planificacion_json.py
+"""
+Lecturas parciales de `planificacion` (campos JSONB desde la migración 0010).
+
+En vez de traer los documentos completos y hacer json.loads en Python, la
+BD extrae lo que cada endpoint usa:
+
+- `sql_planificacion(campos)`: la planificación de un guion como texto JSON
+  listo para responder (mismo criterio que lecturas_json.py), solo con los
+  campos pedidos.
+- SQL_EVALUACION_FORMATIVA: la evaluación formativa de un momento y tipo y
+  la estrategia del mismo momento, con jsonb_path_query_first; viajan esos
+  dos objetos y no los arreglos completos.
+"""
+from fastapi import HTTPException
+
+# campo -> expresión (los JSONB con el mismo default que usaba parse_json_field)
+CAMPOS = {
+    "identificacion_clase": "COALESCE(p.identificacion_clase, '{}'::jsonb)",
+    "resultado_aprendizaje": "p.resultado_aprendizaje",
+    "contenido_tematico": "p.contenido_tematico",
+    "analisis_ra": "COALESCE(p.analisis_ra, '{}'::jsonb)",
+    "secuencia_actividades": "COALESCE(p.secuencia_actividades, '{}'::jsonb)",
+    "estrategias_didacticas": "COALESCE(p.estrategias_didacticas, '[]'::jsonb)",
+    "evaluaciones_formativas": "COALESCE(p.evaluaciones_formativas, '[]'::jsonb)",
+    "bibliografia_material": "COALESCE(p.bibliografia_material, '[]'::jsonb)",
+    "metadata": "COALESCE(p.metadata, '{}'::jsonb)",
+    "thread_id": "p.thread_id",
+    "nombre_unidad": "u.nombre",
+    "nombre_curso": "c.nombre",
+    "nombre_profesor": "us.nombre",
+}
+
+
+def leer_campos(campos):
+    """Lista de campos a partir de "a,b,c" (None = todos). 400 si alguno no existe."""
+    if not campos:
+        return list(CAMPOS)
+    seleccion = [c.strip() for c in campos.split(",") if c.strip()]
+    desconocidos = [c for c in seleccion if c not in CAMPOS]
+    if desconocidos:
+        raise HTTPException(status_code=400, detail=f"Campos no soportados: {', '.join(desconocidos)}")
+    # En el orden de CAMPOS: cada combinación es una sola sentencia preparada
+    return [c for c in CAMPOS if c in seleccion]
+
+
+def sql_planificacion(campos):
+    """SELECT de una columna `json` (texto) con `campos` de la planificación del guion %s."""
+    objeto = ", ".join(f"'{campo}', {CAMPOS[campo]}" for campo in campos)
+    return f"""
+        SELECT json_build_object({objeto})::text AS json
+        FROM planificacion p
+        JOIN guion_clase gc ON p.id_guion_clase = gc.id
+        JOIN unidad u ON gc.id_unidad = u.id
+        JOIN curso c ON u.id_curso = c.id
+        JOIN usuario_curso uc ON c.id = uc.id_curso
+        JOIN usuario us ON uc.id_usuario = us.id
+        WHERE p.id_guion_clase = %s
+          AND us.tipo = 2
+        LIMIT 1
+    """
+
+
+# Parámetros: {"guion_id", "momento", "tipo"}. evaluacion/estrategia son NULL si no hay
+SQL_EVALUACION_FORMATIVA = """
+    SELECT
+        g.vector_id,
+        g.assistant_id,
+        jsonb_path_query_first(
+            p.evaluaciones_formativas,
+            '$[*] ? (@.momento == $momento && @.tipo == $tipo)',
+            jsonb_build_object('momento', %(momento)s::text, 'tipo', %(tipo)s::text)
+        ) AS evaluacion,
+        jsonb_path_query_first(
+            p.estrategias_didacticas,
+            '$[*] ? (@.momento == $momento)',
+            jsonb_build_object('momento', %(momento)s::text)
+        ) AS estrategia
+    FROM guion_clase g
+    JOIN planificacion p ON p.id_guion_clase = g.id
+    WHERE g.id = %(guion_id)s
+    LIMIT 1
+"""
+
+# Para los materiales solo se usa identificacion_clase.nombre_asignatura
+# (sin la clave si falta, para que .get(..., default) siga funcionando)
+IDENTIFICACION_CLASE = (
+    "jsonb_strip_nulls(jsonb_build_object('nombre_asignatura', p.identificacion_clase->'nombre_asignatura'))"
+    " AS identificacion_clase"
+)
@@ -0,0 +1,325 @@
+# app/services/planificador_actividades.py
+"""
+Planificador de los cambios de estado de las actividades por fecha y hora.
+
+Reemplaza el barrido cada 60 s de toda la tabla `actividad` (abrir las
+pendientes, cerrar las activas) y el hilo que buscaba cada minuto las que
+cierran en 1 y 24 horas para avisar a los alumnos.
+
+Las transiciones se ordenan en un min-heap en memoria por instante:
+
+    abrir       inicio_en              estado 2 (pendiente) → 1 (activa)
+    aviso_24h   cierre_en - 24 h       notificación a los inscritos del curso
+    aviso_1h    cierre_en - 1 h        notificación a los inscritos del curso
+    cerrar      cierre_en              estado 1 (activa) → 3 (cerrada)
+
+El bucle duerme hasta la próxima transición y solo toca las filas que
+vencen. `inicio_en` y `cierre_en` son columnas generadas (fecha + hora,
+migración 0004) con índices parciales, así que la carga del heap es un
+rango de índice y no compara fecha y hora por separado.
+
+Solo se cargan las transiciones de las próximas PLANIFICADOR_HORIZONTE
+horas; al llegar al final del horizonte se vuelve a cargar. Los endpoints
+de actividades llaman a `publicar(actividad_id, cursor)` antes de su commit:
+se refresca esa actividad en este proceso y, por NOTIFY (escucha_bd), en los
+demás workers.
+
+Con varios workers cada uno tiene su heap: los UPDATE llevan la condición de
+estado (solo uno cambia la fila) y los avisos llevan `tipo_aviso` con un
+índice único (usuario, actividad, tipo), así que no se duplican.
+
+Apagado por defecto (PLANIFICADOR_ACTIVIDADES=1 lo activa): el barrido y el
+hilo de avisos anteriores estaban comentados, así que al activarlo la primera
+carga cierra todas las actividades ya vencidas y empieza a notificar a los
+alumnos inscritos.
+"""
+import asyncio
+import heapq
+import itertools
+import os
+from datetime import datetime, timedelta
+
+from app.services.escucha_bd import escucha_bd, notificar
+from app.services.repositorio import repositorio
+
+CANAL = "actividades"
+PLANIFICADOR_ACTIVIDADES = os.getenv("PLANIFICADOR_ACTIVIDADES", "0") == "1"
+PLANIFICADOR_HORIZONTE = float(os.getenv("PLANIFICADOR_HORIZONTE", "6"))       # horas
+PLANIFICADOR_REINTENTO = float(os.getenv("PLANIFICADOR_REINTENTO", "30"))      # segundos tras un error de BD
+
+# Un aviso cuyo instante ya pasó (actividad creada a menos de 24 h del cierre,
+# o servidor detenido) solo se envía si está dentro de este margen
+GRACIA_AVISOS = timedelta(minutes=int(os.getenv("PLANIFICADOR_GRACIA_AVISOS", "10")))
+
+# tipo -> (desplazamiento desde cierre_en, título, comentario)
+AVISOS = {
+    "aviso_24h": (timedelta(hours=24), "24 horas para cierre de actividad",
+                  "Quedan 24 horas para el cierre de la actividad {titulo}."),
+    "aviso_1h": (timedelta(hours=1), "1 hora para cierre de actividad",
+                 "Queda 1 hora para el cierre de la actividad {titulo}."),
+}
+
+
+# ======================================================================
+# SQL
+# ======================================================================
+def _cargar_sql(cursor, hasta, ids=None):
+    """Actividades con alguna transición antes de `hasta` (o las de `ids`)."""
+    columnas = "SELECT id, titulo, estado, inicio_en, cierre_en FROM actividad"
+    if ids is not None:
+        cursor.execute(columnas + " WHERE id = ANY(%s)", (list(ids),))
+    else:
+        # Cada rama usa su índice parcial (idx_actividad_inicio_pendiente / idx_actividad_cierre_abierta)
+        cursor.execute(columnas + """
+            WHERE (estado = 2 AND inicio_en <= %s)
+               OR (estado IN (1, 2) AND cierre_en <= %s)
+        """, (hasta, hasta + AVISOS["aviso_24h"][0]))
+    return cursor.fetchall()
+
+
+def _abrir_sql(cursor, ids, ahora):
+    cursor.execute("""
+        UPDATE actividad
+        SET estado = 1,
+            fecha_inicio = NULL,
+            hora_inicio = NULL
+        WHERE id = ANY(%s) AND estado = 2 AND inicio_en <= %s
+        RETURNING id
+    """, (list(ids), ahora))
+    return [fila["id"] for fila in cursor.fetchall()]
+
+
+def _cerrar_sql(cursor, ids, ahora):
+    cursor.execute("""
+        UPDATE actividad
+        SET estado = 3,
+            fecha_cierre = NULL,
+            hora_cierre = NULL
+        WHERE id = ANY(%s) AND estado = 1 AND cierre_en <= %s
+        RETURNING id
+    """, (list(ids), ahora))
+    return [fila["id"] for fila in cursor.fetchall()]
+
+
+def _avisar_sql(cursor, ids, tipo, ahora):
+    """
+    Fan-out de un aviso: una notificación por inscrito del curso de cada
+    actividad, en un solo INSERT ... SELECT. Las que ya existen (mismo
+    usuario, actividad y tipo) se saltan por el índice único.
+    """
+    _, titulo, comentario = AVISOS[tipo]
+    cursor.execute("""
+        INSERT INTO notificacion (titulo, comentario, fecha, hora, leido, id_usuario, id_curso, id_actividad, id_respuesta, tipo_aviso)
+        SELECT %s, replace(%s, '{titulo}', a.titulo), %s, %s, 0, uc.id_usuario, u.id_curso, a.id, NULL, %s
+        FROM actividad a
+        JOIN unidad u ON a.id_unidad = u.id
+        JOIN usuario_curso uc ON uc.id_curso = u.id_curso
+        WHERE a.id = ANY(%s)
+          AND a.estado IN (1, 2)
+          AND a.cierre_en > %s
+        ON CONFLICT (id_usuario, id_actividad, tipo_aviso) WHERE tipo_aviso IS NOT NULL DO NOTHING
+    """, (titulo, comentario, ahora.date(), ahora.time(), tipo, list(ids), ahora))
+    return cursor.rowcount
+
+
+# ======================================================================
+# Planificador
+# ======================================================================
+class PlanificadorActividades:
+    def __init__(self):
+        self._heap = []                  # (instante, secuencia, actividad_id, tipo, version)
+        self._secuencia = itertools.count()
+        self._versiones = {}             # actividad_id -> versión vigente de sus entradas
+        self._hasta = None               # fin del horizonte cargado
+        self._por_refrescar = set()
+        self._recargar = True
+        self._despertar = None           # asyncio.Event (se crea al iniciar, dentro del loop)
+        self._loop = None
+        self._tarea = None
+        self.aperturas = 0
+        self.cierres = 0
+        self.avisos = 0
+        self.recargas = 0
+
+    # ------------------------------------------------------------------
+    # Heap
+    # ------------------------------------------------------------------
+    def _programar(self, fila, ahora):
+        """Reemplaza las transiciones de una actividad por las de su fila actual."""
+        actividad_id = fila["id"]
+        version = self._versiones.get(actividad_id, 0) + 1
+        self._versiones[actividad_id] = version
+
+        eventos = []
+        if fila["estado"] == 2 and fila["inicio_en"] is not None:
+            eventos.append((fila["inicio_en"], "abrir"))
+        if fila["estado"] in (1, 2) and fila["cierre_en"] is not None:
+            for tipo, (antes, _, _) in AVISOS.items():
+                if fila["cierre_en"] - antes >= ahora - GRACIA_AVISOS:
+                    eventos.append((fila["cierre_en"] - antes, tipo))
+            eventos.append((fila["cierre_en"], "cerrar"))
+
+        for instante, tipo in eventos:
+            if instante <= self._hasta:
+                heapq.heappush(self._heap, (instante, next(self._secuencia), actividad_id, tipo, version))
+
+    def _olvidar(self, actividad_id):
+        # Las entradas viejas quedan en el heap y se descartan al salir (versión vencida)
+        self._versiones[actividad_id] = self._versiones.get(actividad_id, 0) + 1
+
+    def _vencidos(self, ahora):
+        vencidos = {}
+        while self._heap and self._heap[0][0] <= ahora:
+            _, _, actividad_id, tipo, version = heapq.heappop(self._heap)
+            if self._versiones.get(actividad_id) == version:
+                vencidos.setdefault(tipo, []).append(actividad_id)
+        return vencidos
+
+    # ------------------------------------------------------------------
+    # Carga
+    # ------------------------------------------------------------------
+    async def _cargar_todo(self):
+        ahora = datetime.now()
+        hasta = ahora + timedelta(hours=PLANIFICADOR_HORIZONTE)
+        filas = await repositorio.transaccion(_cargar_sql, hasta)
+        self._heap = []
+        self._versiones = {}
+        self._hasta = hasta
+        for fila in filas:
+            self._programar(fila, ahora)
+        self._recargar = False
+        self.recargas += 1
+        print(f"🗓️ Planificador de actividades: {len(self._heap)} transiciones hasta {hasta:%Y-%m-%d %H:%M}")
+
+    async def _refrescar_pendientes(self):
+        ids = self._por_refrescar
+        self._por_refrescar = set()
+        filas = await repositorio.transaccion(_cargar_sql, None, ids)
+        for actividad_id in ids:
+            self._olvidar(actividad_id)
+        ahora = datetime.now()
+        for fila in filas:
+            self._programar(fila, ahora)
+
+    # ------------------------------------------------------------------
+    # Transiciones
+    # ------------------------------------------------------------------
+    async def _ejecutar(self, vencidos, ahora):
+        # Avisos antes que el cierre: si ambos vencieron juntos (p. ej. tras
+        # estar detenido), el aviso se descarta solo por `cierre_en > ahora`
+        if "abrir" in vencidos:
+            abiertas = await repositorio.transaccion(_abrir_sql, vencidos["abrir"], ahora)
+            self.aperturas += len(abiertas)
+            if abiertas:
+                print(f"🟢 Actividades abiertas: {abiertas}")
+        for tipo in AVISOS:
+            if tipo not in vencidos:
+                continue
+            enviadas = await repositorio.transaccion(_avisar_sql, vencidos[tipo], tipo, ahora)
+            self.avisos += enviadas
+            if enviadas:
+                print(f"🔔 {enviadas} notificaciones ({tipo}) de las actividades {vencidos[tipo]}")
+        if "cerrar" in vencidos:
+            cerradas = await repositorio.transaccion(_cerrar_sql, vencidos["cerrar"], ahora)
+            self.cierres += len(cerradas)
+            if cerradas:
+                print(f"🔴 Actividades cerradas: {cerradas}")
+
+    async def _bucle(self):
+        while True:
+            try:
+                if self._recargar or datetime.now() >= self._hasta:
+                    await self._cargar_todo()
+                if self._por_refrescar:
+                    await self._refrescar_pendientes()
+
+                ahora = datetime.now()
+                vencidos = self._vencidos(ahora)
+                if vencidos:
+                    await self._ejecutar(vencidos, ahora)
+                    continue
+
+                proximo = self._heap[0][0] if self._heap else self._hasta
+                espera = max(0.0, (min(proximo, self._hasta) - ahora).total_seconds())
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Sin BD no se sabe qué cambió: se recarga todo al reintentar
+                print(f"⚠️ Planificador de actividades: {e}")
+                self._recargar = True
+                espera = PLANIFICADOR_REINTENTO
+
+            self._despertar.clear()
+            try:
+                await asyncio.wait_for(self._despertar.wait(), timeout=espera)
+            except asyncio.TimeoutError:
+                pass
+
+    # ------------------------------------------------------------------
+    # API
+    # ------------------------------------------------------------------
+    def iniciar(self):
+        if not PLANIFICADOR_ACTIVIDADES or self._tarea is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._despertar = asyncio.Event()
+        self._recargar = True
+        self._tarea = asyncio.create_task(self._bucle())
+
+    async def detener(self):
+        if self._tarea is None:
+            return
+        self._tarea.cancel()
+        await asyncio.gather(self._tarea, return_exceptions=True)
+        self._tarea = None
+
+    def _pedir(self, actividad_id=None):
+        # Siempre dentro del loop (call_soon_threadsafe)
+        if actividad_id is None:
+            self._recargar = True
+        else:
+            self._por_refrescar.add(actividad_id)
+        self._despertar.set()
+
+    def refrescar(self, actividad_id=None):
+        """
+        Vuelve a leer una actividad (o todas, sin id) y reprograma sus
+        transiciones. Se puede llamar desde cualquier hilo.
+        """
+        if self._loop is None or self._tarea is None:
+            return
+        self._loop.call_soon_threadsafe(self._pedir, actividad_id)
+
+    def publicar(self, actividad_id, cursor):
+        """
+        Refresca aquí y avisa a los demás workers. `cursor` es el de la
+        transacción que crea, cambia o borra la actividad.
+        """
+        self.refrescar(actividad_id)
+        notificar(cursor, CANAL, str(actividad_id))
+
+    def _al_recibir(self, payload):
+        # También el propio aviso: llega ya con el commit hecho y vuelve a
+        # leer la fila por si el refresco de publicar() vio la versión anterior
+        try:
+            self.refrescar(int(payload))
+        except ValueError:
+            self.refrescar()
+
+    def estadisticas(self):
+        return {
+            "activo": self._tarea is not None,
+            "transiciones_en_heap": len(self._heap),
+            "proxima": self._heap[0][0].isoformat() if self._heap else None,
+            "horizonte_hasta": self._hasta.isoformat() if self._hasta else None,
+            "aperturas": self.aperturas,
+            "cierres": self.cierres,
+            "avisos": self.avisos,
+            "recargas": self.recargas,
+        }
+
+
+# Instancia única por proceso (main.py la inicia al arrancar)
+planificador_actividades = PlanificadorActividades()
+escucha_bd.suscribir(CANAL, planificador_actividades._al_recibir)
+escucha_bd.al_reconectar(planificador_actividades.refrescar)
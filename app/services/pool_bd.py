@@ -0,0 +1,288 @@
+# app/services/pool_bd.py
+"""
+Pool de conexiones a Postgres compartido por todo el proceso.
+
+`connect_db()` (app/main.py) y `login` (app/autenticacion.py) abrían una
+conexión nueva (TCP + TLS + auth) en cada llamada. Ahora piden una conexión
+al pool y `conn.close()` la DEVUELVE en vez de cerrarla, así que todo el
+código existente (conn = connect_db() ... conn.close()) queda usando el pool
+sin cambios.
+
+Para código nuevo, acquire/release con context manager:
+
+    with pool_bd.conexion() as conn:
+        cursor = conn.cursor()
+        ...
+    # commit si el bloque terminó bien, rollback si lanzó, y siempre se devuelve
+
+Garantías:
+    - Al devolverse, una conexión con transacción abierta o fallida se hace
+      rollback y vuelve a autocommit=False: la siguiente petición la recibe limpia.
+    - La conexión se devuelve con `with` o con conn.close() en un `finally`:
+      el pool no rescata las que quedan sin devolver.
+    - Health check: una conexión inactiva más de DB_POOL_HEALTHCHECK segundos
+      se prueba con SELECT 1 antes de entregarla; las rotas se descartan.
+    - Reciclaje: las conexiones con más de DB_POOL_MAX_VIDA segundos se cierran.
+    - Si no hay conexión libre en DB_POOL_TIMEOUT segundos se lanza PoolError.
+    - La espera por un cupo bloquea el hilo: desde código async se pide con
+      `await pool_bd.conectar_async()` (espera en un hilo aparte) o se usa
+      repositorio.py. Si conectar() se llama en el hilo del event loop con el
+      pool agotado, lanza PoolError en vez de congelar el loop.
+    - No se retiene una conexión mientras se espera a la red (OpenAI, etc.):
+      se lee, se devuelve, se hace la llamada y se pide otra para guardar.
+
+Las sesiones largas (advisory locks, LISTEN) usan `conectar_directo()`, fuera
+del pool, para no ocupar un cupo durante minutos.
+"""
+import asyncio
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import extensions
+from psycopg2.extras import RealDictCursor
+from psycopg2.pool import PoolError, ThreadedConnectionPool
+
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))             # segundos esperando una conexión libre
+DB_POOL_HEALTHCHECK = float(os.getenv("DB_POOL_HEALTHCHECK", "30"))     # segundos de inactividad antes de un SELECT 1
+DB_POOL_MAX_VIDA = float(os.getenv("DB_POOL_MAX_VIDA", "1800"))         # segundos antes de reciclar una conexión
+
+
+def _en_event_loop():
+    try:
+        asyncio.get_running_loop()
+        return True
+    except RuntimeError:
+        return False
+
+
+class ConexionPostgres(extensions.connection):
+    """Conexión de psycopg2 con estado propio de la sesión: las sentencias ya preparadas."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.sentencias_preparadas = set()
+
+
+class ConexionPool:
+    """
+    Conexión prestada por el pool. Se comporta como la conexión de psycopg2
+    (cursor, commit, rollback, autocommit...) salvo que close() la devuelve.
+    """
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+        self._devuelta = False
+
+    def __getattr__(self, nombre):
+        if nombre.startswith("_"):
+            raise AttributeError(nombre)
+        return getattr(self._conn, nombre)
+
+    @property
+    def autocommit(self):
+        return self._conn.autocommit
+
+    @autocommit.setter
+    def autocommit(self, valor):
+        self._conn.autocommit = valor
+
+    @property
+    def closed(self):
+        return self._devuelta or self._conn.closed
+
+    def close(self):
+        self._pool.devolver(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, tipo_error, error, traza):
+        try:
+            if not self._devuelta and not self._conn.closed:
+                if tipo_error is None:
+                    self._conn.commit()
+                else:
+                    self._conn.rollback()
+        finally:
+            self.close()
+        return False
+
+
+class PoolBD:
+    def __init__(self, dsn=None, minimo=DB_POOL_MIN, maximo=DB_POOL_MAX, timeout=DB_POOL_TIMEOUT):
+        self.dsn = dsn
+        self.minimo = minimo
+        self.maximo = maximo
+        self.timeout = timeout
+        self._pool = None
+        self._lock = threading.Lock()
+        self._cupos = threading.BoundedSemaphore(maximo)
+        self._uso = {}               # id(conn) -> [creada_en, usada_en]
+        self.en_uso = 0
+        self.prestamos = 0
+        self.esperas = 0
+        self.segundos_espera = 0.0
+        self.descartadas = 0
+        self.recicladas = 0
+
+    def configurar(self, dsn, minimo=None, maximo=None, timeout=None):
+        """Registra el DSN (DATABASE_URL). El pool se abre en el primer préstamo."""
+        self.dsn = dsn
+        if minimo is not None:
+            self.minimo = minimo
+        if timeout is not None:
+            self.timeout = timeout
+        if maximo is not None and maximo != self.maximo:
+            self.maximo = maximo
+            self._cupos = threading.BoundedSemaphore(maximo)
+
+    # ------------------------------------------------------------------
+    def _abrir(self):
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    if not self.dsn:
+                        raise RuntimeError("DATABASE_URL no configurada")
+                    self._pool = ThreadedConnectionPool(
+                        self.minimo, self.maximo, self.dsn,
+                        connection_factory=ConexionPostgres, cursor_factory=RealDictCursor,
+                    )
+                    print(f"🏊 Pool de Postgres abierto (min {self.minimo}, max {self.maximo})")
+        return self._pool
+
+    def _descartar(self, conn):
+        self._uso.pop(id(conn), None)
+        try:
+            self._pool.putconn(conn, close=True)
+        except Exception:
+            pass
+
+    def _guardar(self, conn):
+        """Deja la conexión limpia y la devuelve al pool (libera su cupo)."""
+        try:
+            if self._pool is None:
+                conn.close()
+                return
+            if conn.closed:
+                self.descartadas += 1
+                self._descartar(conn)
+                return
+            if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+            if conn.autocommit:
+                conn.autocommit = False
+            uso = self._uso.get(id(conn))
+            if uso is not None:
+                uso[1] = time.monotonic()
+            self._pool.putconn(conn)
+        except Exception as e:
+            print(f"⚠️ Conexión de BD descartada al devolverla: {e}")
+            self.descartadas += 1
+            self._descartar(conn)
+        finally:
+            self.en_uso -= 1
+            self._cupos.release()
+
+    def _sana(self, conn):
+        if conn.closed:
+            return False
+        ahora = time.monotonic()
+        uso = self._uso.setdefault(id(conn), [ahora, ahora])
+        if ahora - uso[0] > DB_POOL_MAX_VIDA:
+            self.recicladas += 1
+            return False
+        if ahora - uso[1] > DB_POOL_HEALTHCHECK:
+            try:
+                cursor = conn.cursor()
+                cursor.execute("SELECT 1")
+                cursor.close()
+                conn.rollback()
+            except Exception as e:
+                print(f"⚠️ Conexión de BD inactiva descartada (health check): {e}")
+                return False
+        return True
+
+    # ------------------------------------------------------------------
+    def conectar(self):
+        """Presta una conexión del pool. `conn.close()` la devuelve."""
+        pool = self._abrir()
+
+        if not self._cupos.acquire(blocking=False):
+            if _en_event_loop():
+                # Esperar aquí congelaría el loop, y con él a quien tiene que devolver
+                raise PoolError(f"Pool de conexiones agotado ({self.maximo} en uso); "
+                                "desde código async usar conectar_async() o repositorio")
+            inicio = time.monotonic()
+            self.esperas += 1
+            obtenido = self._cupos.acquire(timeout=self.timeout)
+            self.segundos_espera += time.monotonic() - inicio
+            if not obtenido:
+                raise PoolError(f"Pool de conexiones agotado ({self.maximo} en uso por más de {self.timeout:.0f}s)")
+
+        try:
+            for _ in range(self.maximo + 1):
+                conn = pool.getconn()
+                if self._sana(conn):
+                    break
+                self.descartadas += 1
+                self._descartar(conn)
+            else:
+                raise PoolError("No se pudo obtener una conexión sana del pool")
+        except Exception:
+            self._cupos.release()
+            raise
+
+        self.en_uso += 1
+        self.prestamos += 1
+        return ConexionPool(self, conn)
+
+    async def conectar_async(self):
+        """conectar() para código async: la espera por un cupo no bloquea el event loop."""
+        return await asyncio.to_thread(self.conectar)
+
+    def devolver(self, conexion):
+        if conexion._devuelta:
+            return
+        conexion._devuelta = True
+        self._guardar(conexion._conn)
+
+    @contextmanager
+    def conexion(self):
+        """with pool_bd.conexion() as conn: commit al salir bien, rollback si lanza, siempre devuelve."""
+        conn = self.conectar()
+        with conn:
+            yield conn
+
+    def conectar_directo(self):
+        """Conexión propia fuera del pool, para sesiones largas (advisory locks, LISTEN)."""
+        if not self.dsn:
+            raise RuntimeError("DATABASE_URL no configurada")
+        return psycopg2.connect(self.dsn, cursor_factory=RealDictCursor)
+
+    def cerrar(self):
+        if self._pool is not None:
+            self._pool.closeall()
+            self._pool = None
+            self._uso.clear()
+            print("🏊 Pool de Postgres cerrado")
+
+    def estadisticas(self):
+        return {
+            "maximo": self.maximo,
+            "en_uso": self.en_uso,
+            "prestamos": self.prestamos,
+            "esperas": self.esperas,
+            "segundos_espera": round(self.segundos_espera, 3),
+            "descartadas": self.descartadas,
+            "recicladas": self.recicladas,
+        }
+
+
+# Instancia única por proceso (main.py le pasa DATABASE_URL al arrancar)
+pool_bd = PoolBD()
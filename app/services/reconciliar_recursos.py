@@ -0,0 +1,249 @@
+# app/services/reconciliar_recursos.py
+"""
+Reconciliación de objetos huérfanos en OpenAI.
+
+Reemplaza a NUKE() de main.py, que bajaba todas las listas a memoria, borraba
+de a uno y se llevaba por delante cualquier objeto de la cuenta que no
+estuviera en la BD (aunque no lo hubiera creado esta app).
+
+Por cada tipo:
+
+1. Se leen los ids referenciados por filas vivas (REFERENCIAS) y los que
+   siguen vivos en el registro `recurso_openai` (recursos_openai.py). Un
+   file también está en uso si está adjunto a un vector store referenciado
+   (p. ej. los que sube /upload-file de api.py, que no quedan en ninguna
+   fila): se listan los files de esos vector stores, a lo sumo
+   RECONCILIAR_CONCURRENCIA a la vez.
+2. Se recorre la lista de OpenAI página por página (`async for`, 100 por
+   página); de cada objeto solo se guarda el id. Es huérfano si nadie lo
+   referencia, es más viejo que RECONCILIAR_ANTIGUEDAD horas (lo recién
+   creado puede no estar guardado todavía en su fila) y está en el registro,
+   salvo con incluir_ajenos=True.
+3. Con aplicar=True los huérfanos se borran en paralelo con borrar_recurso
+   de borrado_cascada (a lo sumo BORRADO_CONCURRENCIA a la vez, y cada
+   llamada pasa por el limitador del cliente compartido). Se borra recién
+   al terminar de listar: borrar mientras se pagina corre el cursor `after`.
+   Lo que estaba en el registro y ya no aparece en la lista se marca
+   como eliminado.
+
+Los threads no se pueden listar en la API: salen solo del registro, con una
+antigüedad mínima de RECONCILIAR_ANTIGUEDAD_THREADS días.
+
+Por defecto es simulación (dry-run): imprime y retorna lo que borraría.
+
+    python -m app.services.reconciliar_recursos               # simulación
+    python -m app.services.reconciliar_recursos --aplicar
+    POST /admin/recursos-openai/reconciliar?aplicar=true       # como trabajo
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from openai import NotFoundError
+
+from app.services.borrado_cascada import borrar_recurso
+from app.services.openai_cliente import aclient
+from app.services.pool_bd import pool_bd
+from app.services.recursos_openai import recursos_openai
+from app.services.repositorio import repositorio
+
+RECONCILIAR_ANTIGUEDAD = float(os.getenv("RECONCILIAR_ANTIGUEDAD", "24"))                    # horas
+RECONCILIAR_ANTIGUEDAD_THREADS = float(os.getenv("RECONCILIAR_ANTIGUEDAD_THREADS", "7"))     # días
+RECONCILIAR_MUESTRA = int(os.getenv("RECONCILIAR_MUESTRA", "200"))      # ids por tipo en el resumen
+RECONCILIAR_CONCURRENCIA = int(os.getenv("RECONCILIAR_CONCURRENCIA", "5"))   # vector stores listados a la vez
+
+# tipo -> [(tabla, columna)] que lo mantienen vivo
+REFERENCIAS = {
+    "assistant": [("unidad", "assistant_id"), ("guion_clase", "assistant_id")],
+    "vector_store": [("unidad", "vector_id"), ("guion_clase", "vector_id"), ("planificacion", "vector_id")],
+    "file": [("guion_clase", "file_id"), ("corpus", "material")],
+    "thread": [("guion_clase", "thread"), ("evaluacion", "thread"), ("planificacion", "thread_id")],
+}
+
+# tipo -> listado paginado de OpenAI (los threads no tienen)
+_LISTADOS = {
+    "assistant": lambda: aclient.beta.assistants.list(limit=100),
+    "vector_store": lambda: aclient.beta.vector_stores.list(limit=100),
+    "file": lambda: aclient.files.list(),
+}
+
+
+# ======================================================================
+# Base de datos
+# ======================================================================
+async def _referenciados(tipo):
+    consulta = " UNION ".join(
+        f"SELECT btrim({columna}) AS id FROM {tabla} WHERE btrim({columna}) <> ''"
+        for tabla, columna in REFERENCIAS[tipo]
+    )
+    return {fila["id"] for fila in await repositorio.todos(consulta)}
+
+
+async def _registrados(tipo, antiguedad=None):
+    """Ids vivos del registro; con `antiguedad` (segundos), solo los más viejos que eso."""
+    if antiguedad is None:
+        filas = await repositorio.todos("""
+            SELECT recurso_id FROM recurso_openai
+            WHERE tipo = %s AND eliminado_en IS NULL
+        """, (tipo,))
+    else:
+        filas = await repositorio.todos("""
+            SELECT recurso_id FROM recurso_openai
+            WHERE tipo = %s AND eliminado_en IS NULL
+              AND creado_en < now() - make_interval(secs => %s)
+        """, (tipo, antiguedad))
+    return {fila["recurso_id"] for fila in filas}
+
+
+async def _marcar_eliminados(tipo, ids):
+    if ids:
+        await repositorio.ejecutar("""
+            UPDATE recurso_openai SET eliminado_en = now()
+            WHERE tipo = %s AND recurso_id = ANY(%s) AND eliminado_en IS NULL
+        """, (tipo, list(ids)))
+
+
+# ======================================================================
+# OpenAI
+# ======================================================================
+async def _archivos_de_vector_stores(vector_stores):
+    """Ids de los files adjuntos a `vector_stores`. Si un listado falla, lanza (mejor no borrar)."""
+    semaforo = asyncio.Semaphore(max(1, RECONCILIAR_CONCURRENCIA))
+
+    async def listar(vector_store_id):
+        async with semaforo:
+            try:
+                return [f.id async for f in aclient.beta.vector_stores.files.list(
+                    vector_store_id=vector_store_id, limit=100
+                )]
+            except NotFoundError:
+                return []           # referenciado en la BD pero ya no existe en OpenAI
+
+    listas = await asyncio.gather(*(listar(v) for v in vector_stores))
+    return {file_id for lista in listas for file_id in lista}
+
+
+# ======================================================================
+# Reconciliación
+# ======================================================================
+async def _huerfanos_listados(tipo, referenciados, registrados, incluir_ajenos, resumen):
+    """Recorre el listado de OpenAI y retorna (huérfanos, ids vistos)."""
+    limite = time.time() - RECONCILIAR_ANTIGUEDAD * 3600
+    huerfanos = []
+    vistos = set()
+    async for objeto in _LISTADOS[tipo]():
+        vistos.add(objeto.id)
+        if objeto.id in referenciados:
+            resumen["referenciados"] += 1
+        elif objeto.created_at > limite:
+            resumen["recientes"] += 1
+        elif objeto.id not in registrados and not incluir_ajenos:
+            resumen["ajenos"] += 1
+        else:
+            huerfanos.append(objeto.id)
+    resumen["listados"] = len(vistos)
+    return huerfanos, vistos
+
+
+async def _reconciliar_tipo(tipo, aplicar, incluir_ajenos):
+    resumen = {"listados": 0, "referenciados": 0, "recientes": 0, "ajenos": 0,
+               "huerfanos": 0, "eliminados": 0, "no_encontrados": 0, "errores": [],
+               "fuera_de_openai": 0, "ids": []}
+    referenciados = await _referenciados(tipo)
+    if tipo == "file":
+        referenciados |= await _archivos_de_vector_stores(await _referenciados("vector_store"))
+
+    if tipo in _LISTADOS:
+        registrados = await _registrados(tipo)
+        huerfanos, vistos = await _huerfanos_listados(tipo, referenciados, registrados, incluir_ajenos, resumen)
+        # Del registro pero ya no existe en OpenAI (borrado por fuera de la app)
+        fuera = registrados - vistos
+    else:
+        registrados = await _registrados(tipo, RECONCILIAR_ANTIGUEDAD_THREADS * 86400)
+        resumen["listados"] = len(registrados)
+        resumen["referenciados"] = len(registrados & referenciados)
+        huerfanos = sorted(registrados - referenciados)
+        fuera = set()
+
+    resumen["huerfanos"] = len(huerfanos)
+    resumen["fuera_de_openai"] = len(fuera)
+    resumen["ids"] = huerfanos[:RECONCILIAR_MUESTRA]
+
+    if not aplicar:
+        for recurso_id in huerfanos:
+            print(f"🧪 [simulación] se borraría {tipo} {recurso_id}")
+        return resumen
+
+    resultados = await asyncio.gather(*(borrar_recurso({"tipo": tipo, "id": r}) for r in huerfanos))
+    no_encontrados = set()
+    for recurso_id, resultado in zip(huerfanos, resultados):
+        if resultado == "eliminado":
+            resumen["eliminados"] += 1          # el hook del cliente lo anota en el registro
+        elif resultado == "no_encontrado":
+            no_encontrados.add(recurso_id)
+        else:
+            resumen["errores"].append(f"{tipo} {recurso_id}: {resultado}")
+    resumen["no_encontrados"] = len(no_encontrados)
+    await _marcar_eliminados(tipo, fuera | no_encontrados)
+    return resumen
+
+
+async def reconciliar(aplicar=False, incluir_ajenos=False, tipos=None):
+    """
+    Reconciliación completa. Retorna {"aplicar", "tipos": {tipo: resumen}}. Lanza si algún tipo
+    falló (listado o borrado), para que el trabajo se reintente: volver a
+    correrla es seguro.
+    """
+    # Lo que este proceso tiene anotado sin escribir todavía
+    await recursos_openai.guardar()
+
+    resultado = {}
+    fallas = []
+    for tipo in tipos or list(REFERENCIAS):
+        try:
+            resumen = await _reconciliar_tipo(tipo, aplicar, incluir_ajenos)
+        except Exception as e:
+            fallas.append(f"{tipo}: {e}")
+            print(f"❌ Error reconciliando {tipo}: {e}")
+            continue
+        resultado[tipo] = resumen
+        fallas.extend(resumen["errores"])
+        accion = "eliminados" if aplicar else "por borrar"
+        print(f"🧹 {tipo}: {resumen['listados']} revisados, {resumen['referenciados']} en uso, "
+              f"{resumen['recientes']} recientes, {resumen['ajenos']} ajenos, "
+              f"{resumen['eliminados'] if aplicar else resumen['huerfanos']} {accion}, "
+              f"{len(resumen['errores'])} con error")
+
+    # Los borrados que anotó el hook (en la CLI no corre el task de escritura)
+    await recursos_openai.guardar()
+    if fallas:
+        raise Exception("; ".join(fallas[:20]))
+    return {"aplicar": aplicar, "tipos": resultado}
+
+
+async def reconciliar_recursos(payload):
+    """Handler de cola_trabajos para "reconciliar_recursos"."""
+    return await reconciliar(
+        aplicar=payload.get("aplicar", False),
+        incluir_ajenos=payload.get("incluir_ajenos", False),
+        tipos=payload.get("tipos"),
+    )
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--aplicar", action="store_true", help="borrar de verdad (por defecto solo simula)")
+    parser.add_argument("--incluir-ajenos", action="store_true", help="borrar también lo que no está en el registro")
+    parser.add_argument("--tipos", help="lista separada por comas (assistant,vector_store,file,thread)")
+    argumentos = parser.parse_args()
+
+    load_dotenv()
+    pool_bd.configurar(os.getenv("DATABASE_URL"))
+    asyncio.run(reconciliar(
+        aplicar=argumentos.aplicar,
+        incluir_ajenos=argumentos.incluir_ajenos,
+        tipos=argumentos.tipos.split(",") if argumentos.tipos else None,
+    ))
@@ -0,0 +1,132 @@
+# app/services/recursos_openai.py
+"""
+Registro (tabla `recurso_openai`) de los assistants, vector stores, files y
+threads que crea la app.
+
+No hay que acordarse de registrar nada: el hook de respuestas del cliente
+compartido (openai_cliente.py) ve cada POST de creación y cada DELETE que
+responde 200 y los anota. Las anotaciones se acumulan en memoria y un task
+las escribe por lotes cada RECURSOS_FLUSH segundos (un INSERT ... ON CONFLICT
+por lote), así el hook no hace I/O de BD en medio de la llamada a OpenAI.
+
+Lo usa reconciliar_recursos.py para saber qué objetos de la cuenta son de
+esta app y cuáles de ellos ya no referencia ninguna fila.
+"""
+import asyncio
+import os
+import re
+import threading
+
+from app.services.repositorio import repositorio
+
+RECURSOS_FLUSH = float(os.getenv("RECURSOS_FLUSH", "5"))        # segundos entre escrituras
+
+# segmento de la ruta de la API -> tipo
+TIPOS = {"assistants": "assistant", "vector_stores": "vector_store", "files": "file", "threads": "thread"}
+_CREACION = re.compile(r"/v1/(assistants|vector_stores|files|threads)$")
+_BORRADO = re.compile(r"/v1/(assistants|vector_stores|files|threads)/([^/]+)$")
+
+
+def _guardar_sql(cursor, creados, borrados):
+    if creados:
+        cursor.execute("""
+            INSERT INTO recurso_openai (tipo, recurso_id)
+            SELECT * FROM unnest(%s::text[], %s::text[])
+            ON CONFLICT (tipo, recurso_id) DO NOTHING
+        """, ([t for t, _ in creados], [r for _, r in creados]))
+    if borrados:
+        # Borrados de objetos anteriores al registro también quedan anotados
+        cursor.execute("""
+            INSERT INTO recurso_openai (tipo, recurso_id, eliminado_en)
+            SELECT tipo, recurso_id, now() FROM unnest(%s::text[], %s::text[]) AS b(tipo, recurso_id)
+            ON CONFLICT (tipo, recurso_id) DO UPDATE SET eliminado_en = EXCLUDED.eliminado_en
+        """, ([t for t, _ in borrados], [r for _, r in borrados]))
+
+
+class RecursosOpenAI:
+    def __init__(self):
+        self._creados = []           # [(tipo, recurso_id)]
+        self._borrados = []
+        self._lock = threading.Lock()
+        self._tarea = None
+        self.registrados = 0
+        self.eliminados = 0
+        self.errores = 0
+
+    def registrar_creacion(self, tipo, recurso_id):
+        with self._lock:
+            self._creados.append((tipo, recurso_id))
+
+    def registrar_borrado(self, tipo, recurso_id):
+        with self._lock:
+            self._borrados.append((tipo, recurso_id))
+
+    async def guardar(self):
+        """Escribe lo acumulado. Si falla, se reintenta en la siguiente vuelta."""
+        with self._lock:
+            creados, self._creados = self._creados, []
+            borrados, self._borrados = self._borrados, []
+        if not creados and not borrados:
+            return
+        try:
+            await repositorio.transaccion(_guardar_sql, creados, borrados)
+            self.registrados += len(creados)
+            self.eliminados += len(borrados)
+        except Exception as e:
+            self.errores += 1
+            print(f"⚠️ No se pudo guardar el registro de recursos de OpenAI: {e}")
+            with self._lock:
+                self._creados[:0] = creados
+                self._borrados[:0] = borrados
+
+    async def _bucle(self):
+        while True:
+            await asyncio.sleep(RECURSOS_FLUSH)
+            await self.guardar()
+
+    def iniciar(self):
+        if self._tarea is None:
+            self._tarea = asyncio.create_task(self._bucle())
+
+    async def detener(self):
+        if self._tarea is not None:
+            self._tarea.cancel()
+            await asyncio.gather(self._tarea, return_exceptions=True)
+            self._tarea = None
+        await self.guardar()
+
+    def estadisticas(self):
+        return {
+            "pendientes": len(self._creados) + len(self._borrados),
+            "registrados": self.registrados,
+            "eliminados": self.eliminados,
+            "errores": self.errores,
+        }
+
+
+# Instancia única por proceso (main.py inicia el task de escritura)
+recursos_openai = RecursosOpenAI()
+
+
+async def hook_response_recursos(response):
+    """Hook de httpx: anota creaciones y borrados exitosos de objetos de OpenAI."""
+    if response.status_code != 200:
+        return
+    metodo = response.request.method
+    ruta = response.request.url.path
+    if metodo == "POST":
+        coincidencia = _CREACION.search(ruta)
+        if coincidencia is None:
+            return
+        # Respuesta JSON chica (el objeto creado); queda leída para el SDK
+        await response.aread()
+        try:
+            recurso_id = response.json().get("id")
+        except ValueError:
+            return
+        if recurso_id:
+            recursos_openai.registrar_creacion(TIPOS[coincidencia.group(1)], recurso_id)
+    elif metodo == "DELETE":
+        coincidencia = _BORRADO.search(ruta)
+        if coincidencia is not None:
+            recursos_openai.registrar_borrado(TIPOS[coincidencia.group(1)], coincidencia.group(2))
@@ -0,0 +1,141 @@
+# app/services/repositorio.py
+"""
+Acceso a Postgres para los endpoints async sin bloquear el event loop.
+
+Los endpoints CRUD de app/main.py son `async def` pero llamaban a psycopg2
+directamente: mientras una consulta lenta (p. ej. /usuarios-cursos) esperaba
+a la BD, el worker no atendía ninguna otra petición. Aquí cada consulta corre
+en un hilo (asyncio.to_thread) con una conexión del pool (pool_bd), así que
+las esperas de BD de varias peticiones se solapan:
+
+    usuario = await repositorio.uno("SELECT ... WHERE id = %s", (user_id,))
+    cursos = await repositorio.todos("SELECT ...")
+    filas = await repositorio.ejecutar("UPDATE ...", (...))          # commit
+    resultado = await repositorio.transaccion(fn, ...)               # fn(cursor, ...) en una transacción
+
+Las filas siguen siendo dicts (RealDictCursor), igual que con connect_db().
+
+Sentencias preparadas: las consultas con parámetros se preparan una vez por
+conexión (PREPARE q_<hash> ... / EXECUTE q_<hash>(...)), así Postgres no
+vuelve a parsear y planificar las consultas repetidas. Se desactivan con
+DB_SENTENCIAS_PREPARADAS=0 (p. ej. detrás de un pgbouncer en modo transacción).
+
+No se usa asyncpg/psycopg3: no están en requirements.txt y el resto del
+código (autenticación, cola de trabajos, vuelo_unico) comparte el pool de
+psycopg2.
+"""
+import asyncio
+import hashlib
+import os
+import re
+
+from app.services.pool_bd import pool_bd
+
+DB_SENTENCIAS_PREPARADAS = os.getenv("DB_SENTENCIAS_PREPARADAS", "1") == "1"
+
+_MARCADOR = re.compile(r"%(s|%)")
+
+
+def _a_posicionales(consulta):
+    """`%s` → `$1, $2...` (y `%%` → `%`) para el cuerpo de un PREPARE."""
+    contador = [0]
+
+    def reemplazar(coincidencia):
+        if coincidencia.group(1) == "%":
+            return "%"
+        contador[0] += 1
+        return f"${contador[0]}"
+
+    return _MARCADOR.sub(reemplazar, consulta), contador[0]
+
+
+class RepositorioBD:
+    def __init__(self, pool=pool_bd, preparadas=DB_SENTENCIAS_PREPARADAS):
+        self.pool = pool
+        self.preparadas = preparadas
+        self._sentencias = {}        # consulta -> (nombre, PREPARE, cantidad de parámetros)
+        self.consultas = 0
+        self.preparaciones = 0
+
+    # ------------------------------------------------------------------
+    def _sentencia(self, consulta):
+        sentencia = self._sentencias.get(consulta)
+        if sentencia is None:
+            cuerpo, cantidad = _a_posicionales(consulta)
+            nombre = "q_" + hashlib.sha1(consulta.encode("utf-8")).hexdigest()[:16]
+            sentencia = (nombre, f"PREPARE {nombre} AS {cuerpo}", cantidad)
+            self._sentencias[consulta] = sentencia
+        return sentencia
+
+    def _ejecutar_preparada(self, conn, cursor, consulta, parametros):
+        nombre, prepare, cantidad = self._sentencia(consulta)
+        marcadores = ", ".join(["%s"] * cantidad)
+        execute = f"EXECUTE {nombre}({marcadores})" if cantidad else f"EXECUTE {nombre}"
+
+        # `conn` es el proxy del pool; el conjunto vive en la conexión real
+        # (ConexionPostgres) y se va con ella cuando el pool la descarta
+        preparadas = conn._conn.sentencias_preparadas
+        if nombre not in preparadas:
+            cursor.execute(prepare)
+            self.preparaciones += 1
+            preparadas.add(nombre)
+
+        cursor.execute(execute, parametros)
+
+    def _correr(self, consulta, parametros, resultado):
+        with self.pool.conexion() as conn:
+            cursor = conn.cursor()
+            try:
+                if self.preparadas and parametros:
+                    self._ejecutar_preparada(conn, cursor, consulta, parametros)
+                else:
+                    cursor.execute(consulta, parametros)
+                self.consultas += 1
+                if resultado == "uno":
+                    return cursor.fetchone()
+                if resultado == "todos":
+                    return cursor.fetchall()
+                return cursor.rowcount
+            finally:
+                cursor.close()
+
+    def _transaccion(self, fn, args):
+        with self.pool.conexion() as conn:
+            cursor = conn.cursor()
+            try:
+                self.consultas += 1
+                return fn(cursor, *args)
+            finally:
+                cursor.close()
+
+    # ------------------------------------------------------------------
+    async def uno(self, consulta, parametros=None):
+        """Primera fila (dict) o None."""
+        return await asyncio.to_thread(self._correr, consulta, parametros, "uno")
+
+    async def todos(self, consulta, parametros=None):
+        """Lista de filas (dicts)."""
+        return await asyncio.to_thread(self._correr, consulta, parametros, "todos")
+
+    async def ejecutar(self, consulta, parametros=None):
+        """INSERT/UPDATE/DELETE con commit. Retorna las filas afectadas."""
+        return await asyncio.to_thread(self._correr, consulta, parametros, "filas")
+
+    async def transaccion(self, fn, *args):
+        """
+        Corre fn(cursor, *args) en un hilo dentro de una transacción:
+        commit si termina bien, rollback si lanza. Retorna lo que retorne fn.
+        """
+        return await asyncio.to_thread(self._transaccion, fn, args)
+
+    def estadisticas(self):
+        return {
+            "sentencias_preparadas": self.preparadas,
+            "consultas": self.consultas,
+            "preparaciones": self.preparaciones,
+            "sentencias_distintas": len(self._sentencias),
+        }
+
+
+# Instancia única por proceso (usa el pool ya configurado por main.py)
+repositorio = RepositorioBD()
@@ -0,0 +1,120 @@
+# app/services/test_extractor_json.py
+"""
+Casos del extractor de JSON de una pasada.
+
+    python -m pytest app/services/test_extractor_json.py
+"""
+from app.services import bench_extractor_json
+from app.services.extractor_json import ExtractorJSONIncremental, extraer_json, reparar_json
+
+
+def test_json_puro():
+    assert extraer_json('{"a": 1, "b": [1, 2]}') == {"a": 1, "b": [1, 2]}
+
+
+def test_bloque_markdown_con_texto_alrededor():
+    texto = 'Aquí está el resultado:\n```json\n{"tema": "Sistemas"}\n```\nEspero que sirva.'
+    assert extraer_json(texto) == {"tema": "Sistemas"}
+
+
+def test_vacio_o_sin_json():
+    assert extraer_json("") is None
+    assert extraer_json(None) is None
+    assert extraer_json("sin llaves en todo el texto") is None
+
+
+def test_comas_sobrantes():
+    texto = 'Resultado: {"ideas": ["a", "b",], "conclusion": "c",}'
+    assert extraer_json(texto) == {"ideas": ["a", "b"], "conclusion": "c"}
+
+
+def test_coma_dentro_de_string_no_se_toca():
+    assert extraer_json('{"texto": "uno, }", "x": 1,}') == {"texto": "uno, }", "x": 1}
+
+
+def test_comillas_tipograficas():
+    texto = '{“titulo”: “Mapa”, “ideas”: [“una”, “dos”]}'
+    assert extraer_json(texto) == {"titulo": "Mapa", "ideas": ["una", "dos"]}
+
+
+def test_comillas_rectas_dentro_de_string_tipografico():
+    assert extraer_json('{“cita”: “dijo "hola"”}') == {"cita": 'dijo "hola"'}
+
+
+def test_saltos_de_linea_crudos_en_strings():
+    texto = '{"resumen": "primera línea\nsegunda\tcon tab"}'
+    assert extraer_json(texto) == {"resumen": "primera línea\nsegunda\tcon tab"}
+
+
+def test_llaves_dentro_de_strings():
+    texto = 'x {"codigo": "if (a) { b(); }", "lista": "[1, 2"} y'
+    assert extraer_json(texto) == {"codigo": "if (a) { b(); }", "lista": "[1, 2"}
+
+
+def test_comillas_escapadas_dentro_de_strings():
+    assert extraer_json(r'{"a": "dice \"}\" aquí"}') == {"a": 'dice "}" aquí'}
+
+
+def test_candidato_previo_invalido():
+    # "{no es json}" se balancea pero no parsea; "[1}" cierra mal: se sigue buscando
+    texto = 'Ejemplo {no es json} y [1} antes del bueno: {"ok": true}'
+    assert extraer_json(texto) == {"ok": True}
+
+
+def test_aperturas_solo_objeto():
+    texto = 'Lista [1, 2] y objeto {"a": 1}'
+    assert extraer_json(texto) == [1, 2]
+    assert extraer_json(texto, aperturas="{") == {"a": 1}
+
+
+def test_json_truncado_se_cierra():
+    assert extraer_json('{"ideas": ["una", "do') == {"ideas": ["una", "do"]}
+    assert extraer_json('{"a": 1, "b": [1, 2,') == {"a": 1, "b": [1, 2]}
+
+
+def test_reparar_json_con_cierres():
+    assert reparar_json('{"a": ["x', '"]}') == '{"a": ["x"]}'
+    assert reparar_json('{"a": [1,\n', "]}") == '{"a": [1]}'
+
+
+def test_incremental_por_fragmentos():
+    texto = 'Texto previo {"conceptos": [{"id": "cp_1", "nombre": "Raíz {x}"}], "n": 1} después'
+    extractor = ExtractorJSONIncremental()
+    resultados = [extractor.alimentar(texto[i:i + 3]) for i in range(0, len(texto), 3)]
+    esperado = {"conceptos": [{"id": "cp_1", "nombre": "Raíz {x}"}], "n": 1}
+    assert extractor.completo
+    assert resultados[-1] == esperado
+    assert extractor.finalizar() == esperado
+
+
+def test_incremental_escape_partido_entre_fragmentos():
+    extractor = ExtractorJSONIncremental()
+    for fragmento in ['{"a": "x\\', '"y"}']:
+        extractor.alimentar(fragmento)
+    assert extractor.resultado == {"a": 'x"y'}
+
+
+def test_incremental_string_tipografico_partido():
+    extractor = ExtractorJSONIncremental()
+    for fragmento in ['{“a”: “uno } ', 'dos”}']:
+        extractor.alimentar(fragmento)
+    assert extractor.resultado == {"a": "uno } dos"}
+
+
+def test_incremental_stream_cortado():
+    extractor = ExtractorJSONIncremental()
+    extractor.alimentar('{"terminos": [{"termino": "Sist')
+    extractor.alimentar('ema", "definicion": "conjunto')
+    assert not extractor.completo
+    assert extractor.finalizar() == {"terminos": [{"termino": "Sistema", "definicion": "conjunto"}]}
+
+
+def test_incremental_ignora_lo_que_sigue_al_json():
+    extractor = ExtractorJSONIncremental()
+    extractor.alimentar('{"a": 1}')
+    extractor.alimentar(' {"b": 2}')
+    assert extractor.finalizar() == {"a": 1}
+
+
+def test_benchmark_corre():
+    bench_extractor_json.main(repeticiones=1)
@@ -0,0 +1,152 @@
+# app/services/test_grafo_mapa.py
+"""
+Casos de la validación del grafo del mapa conceptual.
+
+    python -m pytest app/services/test_grafo_mapa.py
+"""
+from app.services import bench_grafo_mapa
+from app.services.grafo_mapa import analizar_mapa, tiene_ciclo
+
+
+def _concepto(id_concepto, nivel="secundario", padre=None):
+    concepto = {"id": id_concepto, "nombre": id_concepto, "nivel": nivel}
+    if padre:
+        concepto["padre"] = padre
+    return concepto
+
+
+def _rel(origen, destino):
+    return {"origen": origen, "destino": destino}
+
+
+def test_arbol_valido():
+    conceptos = [_concepto("cp_1", "raiz"), _concepto("cp_2"), _concepto("cs_2_1"), _concepto("cp_3")]
+    relaciones = [_rel("cp_1", "cp_2"), _rel("cp_2", "cs_2_1"), _rel("cp_1", "cp_3")]
+    reporte = analizar_mapa(conceptos, relaciones)
+    assert reporte.es_valido
+    assert reporte.raiz == "cp_1"
+    assert reporte.profundidad == 3
+    assert reporte.huerfanos == []
+    assert reporte.problemas == []
+
+
+def test_mapa_vacio():
+    reporte = analizar_mapa(None, None)
+    assert not reporte.es_valido
+    assert reporte.errores == ["No se pudo identificar el concepto raíz"]
+
+
+def test_ciclo_desde_la_raiz():
+    conceptos = [_concepto("cp_1", "raiz"), _concepto("a"), _concepto("b")]
+    relaciones = [_rel("cp_1", "a"), _rel("a", "b"), _rel("b", "a")]
+    reporte = analizar_mapa(conceptos, relaciones)
+    assert not reporte.es_valido
+    assert reporte.ciclos == [("b", "a")]
+    assert "ciclos" in reporte.errores[0]
+
+
+def test_ciclo_fuera_del_arbol():
+    conceptos = [_concepto("cp_1", "raiz"), _concepto("x"), _concepto("y")]
+    relaciones = [_rel("x", "y"), _rel("y", "x")]
+    reporte = analizar_mapa(conceptos, relaciones)
+    assert reporte.ciclos
+    assert set(reporte.huerfanos) == {"x", "y"}
+    assert not reporte.es_valido
+
+
+def test_varias_raices():
+    conceptos = [_concepto("cp_1", "raiz"), _concepto("otra", "raiz")]
+    reporte = analizar_mapa(conceptos, [_rel("cp_1", "otra")])
+    assert reporte.raices == ["cp_1", "otra"]
+    assert reporte.raiz == "cp_1"
+    assert any("Más de un concepto raíz" in e for e in reporte.errores)
+
+
+def test_huerfanos_son_advertencia():
+    conceptos = [_concepto("cp_1", "raiz"), _concepto("a"), _concepto("suelto")]
+    reporte = analizar_mapa(conceptos, [_rel("cp_1", "a")])
+    assert reporte.es_valido
+    assert reporte.huerfanos == ["suelto"]
+    assert any("suelto" in a for a in reporte.advertencias)
+
+
+def test_aristas_del_campo_padre():
+    conceptos = [_concepto("cp_1", "raiz"), _concepto("a", padre="cp_1"), _concepto("b", padre="a")]
+    reporte = analizar_mapa(conceptos, [])
+    assert reporte.es_valido
+    assert reporte.huerfanos == []
+    assert reporte.profundidad == 3
+
+
+def test_padre_y_relacion_repetidos_cuentan_una_vez():
+    conceptos = [_concepto("cp_1", "raiz"), _concepto("a", padre="cp_1")]
+    reporte = analizar_mapa(conceptos, [_rel("cp_1", "a")])
+    assert reporte.multiples_padres == []
+    assert reporte.es_valido
+
+
+def test_multiples_padres():
+    conceptos = [_concepto("cp_1", "raiz"), _concepto("a"), _concepto("b"), _concepto("c", padre="b")]
+    relaciones = [_rel("cp_1", "a"), _rel("cp_1", "b"), _rel("a", "c")]
+    reporte = analizar_mapa(conceptos, relaciones)
+    assert reporte.multiples_padres == ["c"]
+    assert reporte.es_valido
+
+
+def test_extremos_inexistentes_y_padre_inexistente():
+    conceptos = [_concepto("cp_1", "raiz"), _concepto("a", padre="fantasma")]
+    reporte = analizar_mapa(conceptos, [_rel("cp_1", "no_existe")])
+    assert ("cp_1", "no_existe") in reporte.relaciones_invalidas
+    assert ("fantasma", "a") in reporte.relaciones_invalidas
+    assert "Destino 'no_existe' no existe" in reporte.advertencias
+    assert "Origen 'fantasma' no existe" in reporte.advertencias
+    assert reporte.huerfanos == ["a"]
+
+
+def test_ids_duplicados():
+    conceptos = [_concepto("cp_1", "raiz"), _concepto("a"), _concepto("a")]
+    reporte = analizar_mapa(conceptos, [_rel("cp_1", "a")])
+    assert reporte.ids_duplicados == ["a"]
+    assert not reporte.es_valido
+
+
+def test_profundidad_por_el_camino_mas_largo_con_nodo_compartido():
+    # "d" se cierra por una rama corta antes de llegar por la larga
+    conceptos = [_concepto("cp_1", "raiz")] + [_concepto(x) for x in "abcd"]
+    relaciones = [_rel("cp_1", "d"), _rel("cp_1", "a"), _rel("a", "b"), _rel("b", "c"), _rel("c", "d")]
+    reporte = analizar_mapa(conceptos, relaciones)
+    assert reporte.profundidad == 5
+    assert reporte.ciclos == []
+
+
+def test_cadena_de_5000_sin_recursion():
+    conceptos, relaciones = bench_grafo_mapa._cadena(5000)
+    reporte = analizar_mapa(conceptos, relaciones)
+    assert reporte.es_valido
+    assert reporte.profundidad == 5000
+    assert reporte.huerfanos == []
+
+
+def test_cadena_de_5000_con_ciclo_al_final():
+    conceptos, relaciones = bench_grafo_mapa._cadena(5000)
+    relaciones.append(_rel("c_4999", "c_1"))
+    reporte = analizar_mapa(conceptos, relaciones)
+    assert reporte.ciclos == [("c_4999", "c_1")]
+
+
+def test_profundidad_suficiente():
+    plano = [_concepto("cp_1", "raiz")] + [_concepto(f"x{i}") for i in range(5)]
+    assert analizar_mapa(plano, []).profundidad_suficiente()
+    chico = [_concepto("cp_1", "raiz"), _concepto("a")]
+    assert not analizar_mapa(chico, [_rel("cp_1", "a")]).profundidad_suficiente()
+
+
+def test_tiene_ciclo():
+    assert tiene_ciclo({"a": ["b"], "b": ["c"], "c": ["a"]}, "a")
+    assert not tiene_ciclo({"a": ["b", "c"], "b": ["c"], "c": []}, "a")
+    cadena = {i: [i + 1] for i in range(5000)}
+    assert not tiene_ciclo(cadena, 0)
+
+
+def test_benchmark_corre():
+    bench_grafo_mapa.main(repeticiones=1)
@@ -0,0 +1,323 @@
+# app/services/trabajos.py
+"""
+Cola de trabajos en segundo plano respaldada por Postgres.
+
+Las generaciones largas (crear guion, infografía, materiales) se encolan en la
+tabla `trabajo` y las ejecutan workers asyncio dentro del mismo proceso. El
+request HTTP solo inserta la fila y responde con el id del trabajo.
+
+- Toma de trabajos con `FOR UPDATE SKIP LOCKED`: varios workers (y varios
+  procesos de uvicorn) comparten la tabla sin tomar dos veces el mismo trabajo.
+- Reintentos con backoff exponencial: un trabajo fallido vuelve a 'pendiente'
+  con `disponible_en` desplazado TRABAJOS_BACKOFF * 2^(intento-1) segundos.
+- Reanudación tras reinicio: un trabajo 'en_proceso' cuyo lease
+  (TRABAJOS_LEASE segundos) venció se considera abandonado y se vuelve a tomar.
+- Latido: mientras el handler corre, el lease se renueva cada TRABAJOS_LATIDO
+  segundos, así un trabajo largo no lo toma otro worker. El dueño del lease
+  es el intento que lo tomó (`intentos`): si otro lo retomó, el latido cancela
+  el handler y el estado final no se escribe.
+
+Estados: pendiente → en_proceso → completado | error
+"""
+import asyncio
+import json
+import os
+
+TRABAJOS_WORKERS = int(os.getenv("TRABAJOS_WORKERS", "2"))
+TRABAJOS_MAX_INTENTOS = int(os.getenv("TRABAJOS_MAX_INTENTOS", "3"))
+TRABAJOS_BACKOFF = float(os.getenv("TRABAJOS_BACKOFF", "10"))       # segundos
+TRABAJOS_LEASE = int(os.getenv("TRABAJOS_LEASE", "900"))            # segundos
+TRABAJOS_POLL = float(os.getenv("TRABAJOS_POLL", "2"))              # segundos
+TRABAJOS_LATIDO = float(os.getenv("TRABAJOS_LATIDO", str(TRABAJOS_LEASE / 3)))   # segundos
+
+# Las escrituras del worker solo valen si el intento sigue siendo dueño del lease
+_LEASE_PROPIO = "id = %s AND estado = 'en_proceso' AND intentos = %s"
+
+
+class ColaTrabajos:
+    def __init__(self, conectar=None, workers=TRABAJOS_WORKERS):
+        self.conectar = conectar
+        self.workers = workers
+        self._handlers = {}          # tipo -> async fn(payload) -> dict
+        self._tareas = []
+        self._despertar = None       # asyncio.Event (se crea al iniciar, dentro del loop)
+        self._loop = None            # loop de los workers (encolar llega desde el threadpool)
+        self._detenido = False
+        self._tabla_lista = False
+
+    def configurar(self, conectar):
+        """Registra la función que abre conexiones a Postgres (connect_db)."""
+        self.conectar = conectar
+
+    def registrar(self, tipo, fn):
+        """Asocia un tipo de trabajo con la corrutina que lo ejecuta."""
+        self._handlers[tipo] = fn
+
+    # ------------------------------------------------------------------
+    # Acceso a BD (psycopg2 es bloqueante: los workers lo llaman vía to_thread)
+    # ------------------------------------------------------------------
+    def _asegurar_tabla(self, cursor):
+        if self._tabla_lista:
+            return
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS trabajo (
+                id              BIGSERIAL PRIMARY KEY,
+                tipo            TEXT NOT NULL,
+                payload         JSONB NOT NULL DEFAULT '{}'::jsonb,
+                estado          TEXT NOT NULL DEFAULT 'pendiente',
+                intentos        INT NOT NULL DEFAULT 0,
+                max_intentos    INT NOT NULL DEFAULT 3,
+                resultado       JSONB,
+                error           TEXT,
+                disponible_en   TIMESTAMPTZ NOT NULL DEFAULT now(),
+                bloqueado_en    TIMESTAMPTZ,
+                creado_en       TIMESTAMPTZ NOT NULL DEFAULT now(),
+                actualizado_en  TIMESTAMPTZ NOT NULL DEFAULT now()
+            )
+        """)
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_trabajo_cola
+            ON trabajo (disponible_en)
+            WHERE estado IN ('pendiente', 'en_proceso')
+        """)
+        self._tabla_lista = True
+
+    def _ejecutar(self, fn):
+        conn = None
+        try:
+            conn = self.conectar()
+            cursor = conn.cursor()
+            self._asegurar_tabla(cursor)
+            resultado = fn(cursor)
+            conn.commit()
+            cursor.close()
+            return resultado
+        except Exception:
+            if conn:
+                conn.rollback()
+            raise
+        finally:
+            if conn:
+                conn.close()
+
+    def encolar(self, tipo, payload, max_intentos=TRABAJOS_MAX_INTENTOS):
+        """Inserta un trabajo y retorna su id."""
+        def _insertar(cursor):
+            cursor.execute("""
+                INSERT INTO trabajo (tipo, payload, max_intentos)
+                VALUES (%s, %s, %s)
+                RETURNING id
+            """, (tipo, json.dumps(payload, ensure_ascii=False), max_intentos))
+            return cursor.fetchone()["id"]
+
+        trabajo_id = self._ejecutar(_insertar)
+        print(f"📨 Trabajo {trabajo_id} encolado ({tipo})")
+        # asyncio.Event no es thread-safe: el set se agenda en el loop de los workers
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._despertar.set)
+        return trabajo_id
+
+    def encolar_en(self, cursor, tipo, payload, max_intentos=TRABAJOS_MAX_INTENTOS):
+        """
+        Inserta un trabajo con el cursor del llamador: queda en su misma
+        transacción (outbox) y solo existe si el llamador hace commit. Los
+        workers lo toman en la siguiente vuelta (TRABAJOS_POLL).
+        """
+        self._asegurar_tabla(cursor)
+        cursor.execute("""
+            INSERT INTO trabajo (tipo, payload, max_intentos)
+            VALUES (%s, %s, %s)
+            RETURNING id
+        """, (tipo, json.dumps(payload, ensure_ascii=False), max_intentos))
+        return cursor.fetchone()["id"]
+
+    def obtener(self, trabajo_id, con_resultado=False):
+        columnas = "id, tipo, payload, estado, intentos, max_intentos, error, disponible_en, creado_en, actualizado_en"
+        if con_resultado:
+            columnas += ", resultado"
+
+        def _leer(cursor):
+            cursor.execute(f"SELECT {columnas} FROM trabajo WHERE id = %s", (trabajo_id,))
+            return cursor.fetchone()
+
+        return self._ejecutar(_leer)
+
+    def _tomar(self):
+        """Toma el siguiente trabajo disponible (o uno con el lease vencido)."""
+        tipos = list(self._handlers)
+
+        def _tomar_sql(cursor):
+            # Trabajos abandonados que ya agotaron sus intentos no se reintentan
+            cursor.execute("""
+                UPDATE trabajo
+                SET estado = 'error', error = 'Lease vencido sin más intentos', actualizado_en = now()
+                WHERE estado = 'en_proceso'
+                  AND bloqueado_en < now() - make_interval(secs => %s)
+                  AND intentos >= max_intentos
+            """, (TRABAJOS_LEASE,))
+
+            cursor.execute("""
+                UPDATE trabajo
+                SET estado = 'en_proceso',
+                    intentos = intentos + 1,
+                    bloqueado_en = now(),
+                    actualizado_en = now()
+                WHERE id = (
+                    SELECT id FROM trabajo
+                    WHERE tipo = ANY(%s)
+                      AND (
+                        (estado = 'pendiente' AND disponible_en <= now())
+                        OR (estado = 'en_proceso' AND bloqueado_en < now() - make_interval(secs => %s))
+                      )
+                    ORDER BY disponible_en
+                    FOR UPDATE SKIP LOCKED
+                    LIMIT 1
+                )
+                RETURNING id, tipo, payload, intentos, max_intentos
+            """, (tipos, TRABAJOS_LEASE))
+            return cursor.fetchone()
+
+        return self._ejecutar(_tomar_sql)
+
+    def _renovar(self, trabajo):
+        """Extiende el lease. False si otro worker ya retomó el trabajo."""
+        def _sql(cursor):
+            cursor.execute(f"""
+                UPDATE trabajo
+                SET bloqueado_en = now()
+                WHERE {_LEASE_PROPIO}
+            """, (trabajo["id"], trabajo["intentos"]))
+            return cursor.rowcount > 0
+
+        return self._ejecutar(_sql)
+
+    def _completar(self, trabajo, resultado):
+        def _sql(cursor):
+            cursor.execute(f"""
+                UPDATE trabajo
+                SET estado = 'completado', resultado = %s, error = NULL, actualizado_en = now()
+                WHERE {_LEASE_PROPIO}
+            """, (json.dumps(resultado, ensure_ascii=False, default=str), trabajo["id"], trabajo["intentos"]))
+            return cursor.rowcount > 0
+
+        return self._ejecutar(_sql)
+
+    def _fallar(self, trabajo, error, reintentar=True):
+        intentos = trabajo["intentos"]
+        if reintentar and intentos < trabajo["max_intentos"]:
+            espera = TRABAJOS_BACKOFF * (2 ** (intentos - 1))
+
+            def _sql(cursor):
+                cursor.execute(f"""
+                    UPDATE trabajo
+                    SET estado = 'pendiente',
+                        error = %s,
+                        disponible_en = now() + make_interval(secs => %s),
+                        actualizado_en = now()
+                    WHERE {_LEASE_PROPIO}
+                """, (error, espera, trabajo["id"], trabajo["intentos"]))
+
+            print(f"🔁 Trabajo {trabajo['id']} falló (intento {intentos}), reintento en {espera:.0f}s: {error}")
+        else:
+            def _sql(cursor):
+                cursor.execute(f"""
+                    UPDATE trabajo
+                    SET estado = 'error', error = %s, actualizado_en = now()
+                    WHERE {_LEASE_PROPIO}
+                """, (error, trabajo["id"], trabajo["intentos"]))
+
+            print(f"❌ Trabajo {trabajo['id']} falló definitivamente: {error}")
+
+        self._ejecutar(_sql)
+
+    # ------------------------------------------------------------------
+    # Workers
+    # ------------------------------------------------------------------
+    async def _latir(self, trabajo, tarea):
+        """Renueva el lease mientras corre `tarea`; la cancela si se perdió."""
+        while True:
+            await asyncio.sleep(TRABAJOS_LATIDO)
+            try:
+                vigente = await asyncio.to_thread(self._renovar, trabajo)
+            except Exception as e:
+                print(f"⚠️ Trabajo {trabajo['id']}: no se pudo renovar el lease: {e}")
+                continue
+            if not vigente:
+                print(f"⚠️ Trabajo {trabajo['id']}: lease tomado por otro worker, se cancela este intento")
+                trabajo["lease_perdido"] = True
+                tarea.cancel()
+                return
+
+    async def _procesar(self, trabajo):
+        handler = self._handlers[trabajo["tipo"]]
+        payload = trabajo["payload"]
+        if isinstance(payload, str):
+            payload = json.loads(payload)
+
+        print(f"⚙️ Trabajo {trabajo['id']} ({trabajo['tipo']}) - intento {trabajo['intentos']}")
+        tarea = asyncio.ensure_future(handler(payload))
+        latido = asyncio.create_task(self._latir(trabajo, tarea))
+        try:
+            resultado = await tarea
+        except asyncio.CancelledError:
+            if not trabajo.get("lease_perdido"):
+                raise
+            return
+        except Exception as e:
+            # Errores 4xx (HTTPException) son del input: reintentar no los arregla
+            status_code = getattr(e, "status_code", None)
+            detalle = getattr(e, "detail", None) or str(e)
+            reintentar = not (status_code and 400 <= status_code < 500)
+            await asyncio.to_thread(self._fallar, trabajo, str(detalle), reintentar)
+            return
+        finally:
+            latido.cancel()
+
+        if not await asyncio.to_thread(self._completar, trabajo, resultado):
+            print(f"⚠️ Trabajo {trabajo['id']}: terminó sin el lease, resultado descartado")
+            return
+        print(f"✅ Trabajo {trabajo['id']} ({trabajo['tipo']}) completado")
+
+    async def _worker(self, numero):
+        while not self._detenido:
+            try:
+                trabajo = await asyncio.to_thread(self._tomar)
+            except Exception as e:
+                print(f"⚠️ Worker {numero}: no se pudo leer la cola: {e}")
+                trabajo = None
+
+            if trabajo is None:
+                self._despertar.clear()
+                try:
+                    await asyncio.wait_for(self._despertar.wait(), timeout=TRABAJOS_POLL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            try:
+                await self._procesar(trabajo)
+            except Exception as e:
+                # Si ni siquiera se pudo registrar el resultado, el lease lo recupera
+                print(f"⚠️ Worker {numero}: error registrando trabajo {trabajo['id']}: {e}")
+
+    async def iniciar(self):
+        if self.conectar is None or self._tareas:
+            return
+        self._detenido = False
+        self._despertar = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+        self._tareas = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        print(f"🧵 Cola de trabajos iniciada con {self.workers} workers ({', '.join(self._handlers)})")
+
+    async def detener(self):
+        self._detenido = True
+        self._loop = None
+        for tarea in self._tareas:
+            tarea.cancel()
+        await asyncio.gather(*self._tareas, return_exceptions=True)
+        self._tareas = []
+        print("🧵 Cola de trabajos detenida")
+
+
+# Instancia única por proceso (main.py registra los handlers y la inicia al arrancar)
+cola_trabajos = ColaTrabajos()
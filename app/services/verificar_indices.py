@@ -0,0 +1,294 @@
+# app/services/verificar_indices.py
+"""
+Chequeo de regresión de índices con EXPLAIN ANALYZE sobre datos sembrados.
+
+    python -m app.services.verificar_indices [--escala 2]
+
+En un schema temporal de la BD de DATABASE_URL (se borra al terminar):
+    1) aplica 0001 (esquema sin índices), siembra un dataset sintético y
+       mide las consultas frecuentes: línea base;
+    2) aplica el resto de las migraciones (índices), ANALYZE y las vuelve a
+       medir.
+Cada consulta debe resolverse con un índice sobre su tabla principal (ningún
+Seq Scan sobre ella). Si alguna no, el comando sale con código 1: sirve para
+CI o antes de desplegar un cambio de migraciones o de una consulta.
+
+Las consultas son las mismas de app/main.py; si se cambia una consulta
+frecuente allá, se actualiza aquí.
+"""
+import argparse
+import json
+import os
+import sys
+
+from app.services.migraciones import migraciones
+from app.services.planificacion_json import SQL_EVALUACION_FORMATIVA
+from app.services.pool_bd import pool_bd
+
+SCHEMA = f"verificacion_indices_{os.getpid()}"
+
+# ======================================================================
+# Dataset sintético (escala 1 ≈ 10.000 usuarios, 200.000 notificaciones)
+# ======================================================================
+SIEMBRA = """
+INSERT INTO usuario (nombre, tipo, clave, correo, direccion, numero_cel)
+SELECT 'Usuario ' || g, CASE WHEN g % 20 = 0 THEN 2 ELSE 1 END,
+       'x', 'usuario' || g || '@correo.cl', 'Calle ' || g, '+569' || g
+FROM generate_series(1, {usuarios}) g;
+
+INSERT INTO curso (nombre) SELECT 'Curso ' || g FROM generate_series(1, {cursos}) g;
+
+INSERT INTO usuario_curso (id_usuario, id_curso)
+SELECT u, 1 + (u * 7 + k * 13) % {cursos}
+FROM generate_series(1, {usuarios}) u, generate_series(1, 4) k;
+
+INSERT INTO unidad (nombre, id_curso, assistant_id, vector_id)
+SELECT 'Unidad ' || g, 1 + g % {cursos}, 'asst_' || g, 'vs_' || g
+FROM generate_series(1, {unidades}) g;
+
+INSERT INTO actividad (titulo, descripcion, id_unidad, estado, fecha_inicio, fecha_cierre, hora_inicio, hora_cierre)
+SELECT 'Actividad ' || g, repeat('descripción ', 10), 1 + g % {unidades}, 1 + g % 3,
+       current_date - g % 60, current_date + g % 30, '08:00', '23:59'
+FROM generate_series(1, {unidades} * 5) g;
+
+INSERT INTO respuesta (archivo, feedback, id_usuario, id_actividad, fecha)
+SELECT 'archivo_' || g || '.pdf', NULL, 1 + g % {usuarios}, 1 + g % ({unidades} * 5),
+       now() - (g % 5000) * interval '1 minute'
+FROM generate_series(1, {unidades} * 25) g;
+
+INSERT INTO notificacion (titulo, comentario, fecha, hora, leido, id_usuario, id_curso, id_actividad)
+SELECT 'Notificación ' || g, repeat('comentario ', 5), current_date - g % 90,
+       make_time(g % 24, g % 60, 0), CASE WHEN g % 10 = 0 THEN 0 ELSE 1 END,
+       1 + g % {usuarios}, 1 + g % {cursos}, 1 + g % ({unidades} * 5)
+FROM generate_series(1, {usuarios} * 20) g;
+
+INSERT INTO corpus (titulo, material, id_unidad)
+SELECT 'Corpus ' || g, repeat('material ', 60), 1 + g % {unidades}
+FROM generate_series(1, {unidades} * 2) g;
+
+INSERT INTO foro (titulo, descripcion, fecha, hora, id_usuario, id_unidad)
+SELECT 'Foro ' || g, repeat('descripción ', 10), current_date - g % 90,
+       make_time(g % 24, g % 60, 0), 1 + g % {usuarios}, 1 + g % {unidades}
+FROM generate_series(1, {unidades} * 3) g;
+
+INSERT INTO respuesta_foro (comentario, fecha, hora, id_usuario, id_foro)
+SELECT repeat('comentario ', 5), current_date - g % 90, make_time(g % 24, g % 60, 0),
+       1 + g % {usuarios}, 1 + g % ({unidades} * 3)
+FROM generate_series(1, {unidades} * 15) g;
+
+INSERT INTO guion_clase (titulo, ra, contenido, id_unidad)
+SELECT 'Guion ' || g, 'RA ' || g, repeat('contenido ', 20), 1 + g % {unidades}
+FROM generate_series(1, {unidades} * 3) g;
+
+INSERT INTO planificacion (id_guion_clase, titulo, metadata)
+SELECT g, 'Planificación ' || g, '{{}}' FROM generate_series(1, {unidades} * 3) g;
+
+INSERT INTO resumen (id_guion_clase, tema_principal, ideas_principales, conclusion, version)
+SELECT g, 'Tema ' || g, '[]', repeat('conclusión ', 20), v
+FROM generate_series(1, {unidades} * 3) g, generate_series(1, 3) v;
+
+INSERT INTO mapa_conceptual (id_guion_clase, titulo, conceptos, relaciones, version)
+SELECT g, 'Mapa ' || g, repeat('[]', 50), '[]', v
+FROM generate_series(1, {unidades} * 3) g, generate_series(1, 3) v;
+
+INSERT INTO flashcard (id_guion_clase, cards, version)
+SELECT g, repeat('[]', 100), v
+FROM generate_series(1, {unidades} * 3) g, generate_series(1, 3) v;
+
+INSERT INTO glosario (id_guion_clase, terminos, version)
+SELECT g, repeat('[]', 100), v
+FROM generate_series(1, {unidades} * 3) g, generate_series(1, 3) v;
+
+INSERT INTO infografia (id_guion_clase, titulo, imagen_url, version)
+SELECT g, 'Infografía ' || g, 'https://example.com/' || g || '.png', v
+FROM generate_series(1, {unidades} * 3) g, generate_series(1, 3) v;
+"""
+
+# ======================================================================
+# Consultas frecuentes: (nombre, tabla principal, SQL, parámetros)
+# ======================================================================
+CONSULTAS = [
+    ("cursos_de_usuario", "usuario_curso", """
+        SELECT c.id, c.nombre
+        FROM curso c
+        JOIN usuario_curso uc ON c.id = uc.id_curso
+        WHERE uc.id_usuario = %s
+    """, (7,)),
+    ("usuarios_de_curso", "usuario_curso", """
+        SELECT u.id AS usuario_id, u.nombre AS usuario_nombre, u.tipo, u.correo, u.direccion, u.numero_cel
+        FROM usuario u
+        JOIN usuario_curso uc ON u.id = uc.id_usuario
+        JOIN curso c ON uc.id_curso = c.id
+        WHERE c.id = %s
+    """, (7,)),
+    ("unidades_de_curso", "unidad",
+        "SELECT id, nombre FROM unidad WHERE id_curso = %s", (7,)),
+    ("actividades_de_unidad", "actividad",
+        "SELECT id, titulo, descripcion, estado, fecha_inicio, fecha_cierre, hora_inicio, hora_cierre FROM actividad WHERE id_unidad = %s", (7,)),
+    ("transiciones_de_actividades", "actividad", """
+        SELECT id, titulo, estado, inicio_en, cierre_en FROM actividad
+        WHERE (estado = 2 AND inicio_en <= now()::timestamp + interval '6 hours')
+           OR (estado IN (1, 2) AND cierre_en <= now()::timestamp + interval '30 hours')
+    """, ()),
+    ("respuestas_de_actividad", "respuesta", """
+        SELECT respuesta.id, respuesta.archivo, respuesta.feedback, respuesta.fecha, usuario.nombre AS nombre_usuario, actividad.id_unidad, unidad.id_curso
+        FROM respuesta
+        JOIN usuario ON respuesta.id_usuario = usuario.id
+        JOIN actividad ON respuesta.id_actividad = actividad.id
+        JOIN unidad ON actividad.id_unidad = unidad.id
+        WHERE respuesta.id_actividad = %s
+        ORDER BY usuario.nombre ASC, respuesta.fecha DESC, respuesta.id DESC
+    """, (7,)),
+    ("respuestas_usuario_actividad", "respuesta",
+        "SELECT id, archivo, feedback, fecha FROM respuesta WHERE id_usuario = %s AND id_actividad = %s ORDER BY fecha DESC", (8, 8)),
+    ("notificaciones_de_usuario", "notificacion", """
+        SELECT notificacion.id, notificacion.titulo, notificacion.comentario,
+               notificacion.fecha, notificacion.hora, notificacion.leido,
+               notificacion.id_actividad, actividad.titulo AS actividad_titulo
+        FROM notificacion
+        LEFT JOIN actividad ON notificacion.id_actividad = actividad.id
+        WHERE notificacion.id_usuario = %s
+        ORDER BY notificacion.fecha DESC, notificacion.hora DESC, notificacion.id DESC
+        LIMIT 51
+    """, (7,)),
+    ("notificaciones_pagina_siguiente", "notificacion", """
+        SELECT notificacion.id, notificacion.titulo, notificacion.fecha, notificacion.hora
+        FROM notificacion
+        WHERE notificacion.id_usuario = %s
+          AND ((notificacion.fecha < %s::date)
+               OR (notificacion.fecha = %s::date AND notificacion.hora < %s::time)
+               OR (notificacion.fecha = %s::date AND notificacion.hora = %s::time AND notificacion.id < %s::int))
+        ORDER BY notificacion.fecha DESC, notificacion.hora DESC, notificacion.id DESC
+        LIMIT 51
+    """, (7, "2024-06-01", "2024-06-01", "12:00", "2024-06-01", "12:00", 10 ** 9)),
+    ("notificaciones_no_leidas", "notificacion", """
+        SELECT EXISTS (
+            SELECT 1
+            FROM notificacion
+            WHERE id_usuario = %s AND leido = 0
+        ) AS tiene_no_leidas
+    """, (7,)),
+    ("foros_de_unidad", "foro", """
+        SELECT foro.id, foro.titulo, foro.descripcion, foro.fecha, foro.hora,
+            foro.id_usuario, usuario.nombre AS nombre_usuario, usuario.tipo AS tipo_usuario
+        FROM foro
+        JOIN usuario ON foro.id_usuario = usuario.id
+        WHERE foro.id_unidad = %s
+        ORDER BY foro.fecha DESC, foro.hora DESC, foro.id DESC
+        LIMIT 51
+    """, (7,)),
+    ("corpus_de_unidad", "corpus",
+        "SELECT corpus.id, corpus.titulo, corpus.material FROM corpus WHERE corpus.id_unidad = %s", (7,)),
+    ("material_estudio", "material_estudio", """
+        SELECT contenido, metadata, version, actualizado_en
+        FROM material_estudio WHERE guion_id = %s AND tipo = %s
+    """, (7, "resumen")),
+    ("estado_material_estudio", "material_estudio", """
+        SELECT version, actualizado_en, contenido->>'titulo' AS titulo, contenido->>'imagen_url' AS imagen_url
+        FROM material_estudio WHERE guion_id = %s AND tipo = %s
+    """, (7, "infografia")),
+    ("evaluacion_formativa", "planificacion", SQL_EVALUACION_FORMATIVA,
+        {"guion_id": 7, "momento": "inicio", "tipo": "diagnostica"}),
+]
+
+
+def _nodos(plan):
+    yield plan
+    for hijo in plan.get("Plans", []):
+        yield from _nodos(hijo)
+
+
+def medir(cursor, sql, parametros, tabla):
+    """EXPLAIN ANALYZE de una consulta: (ms, accesos a `tabla`, usa_indice)."""
+    cursor.execute("EXPLAIN (ANALYZE, FORMAT JSON) " + sql, parametros)
+    fila = cursor.fetchone()
+    explain = fila["QUERY PLAN"] if isinstance(fila, dict) else fila[0]
+    if isinstance(explain, str):
+        explain = json.loads(explain)
+    resultado = explain[0]
+    accesos = [
+        nodo["Node Type"] + (f" ({nodo['Index Name']})" if nodo.get("Index Name") else "")
+        for nodo in _nodos(resultado["Plan"])
+        if nodo.get("Relation Name") == tabla
+    ]
+    usa_indice = bool(accesos) and not any(a.startswith("Seq Scan") for a in accesos)
+    return resultado["Execution Time"], accesos, usa_indice
+
+
+def _medir_todas(cursor, omitir_faltantes=False):
+    resultados = {}
+    for nombre, tabla, sql, parametros in CONSULTAS:
+        cursor.execute("SAVEPOINT medir")
+        try:
+            resultados[nombre] = medir(cursor, sql, parametros, tabla)
+        except Exception:
+            # Antes de migrar faltan las columnas que agregan las migraciones (p. ej. actividad.cierre_en)
+            if not omitir_faltantes:
+                raise
+            cursor.execute("ROLLBACK TO SAVEPOINT medir")
+            resultados[nombre] = (None, [], False)
+    return resultados
+
+
+def verificar(escala=1):
+    """Corre el chequeo completo. Retorna la lista de consultas que no usan índice."""
+    usuarios = 10000 * escala
+    tamanos = {"usuarios": usuarios, "cursos": usuarios // 25, "unidades": usuarios // 2}
+
+    conn = pool_bd.conectar_directo()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"CREATE SCHEMA {SCHEMA}")
+        cursor.execute(f"SET search_path TO {SCHEMA}")
+        conn.commit()
+
+        migraciones.aplicar(conn, hasta="0001")
+        print(f"🌱 Sembrando dataset (escala {escala}: {usuarios} usuarios)...")
+        cursor.execute(SIEMBRA.format(**tamanos))
+        conn.commit()
+        conn.autocommit = True
+        cursor.execute("ANALYZE")
+        conn.autocommit = False
+        antes = _medir_todas(cursor, omitir_faltantes=True)
+        conn.rollback()
+
+        migraciones.aplicar(conn)
+        conn.autocommit = True
+        cursor.execute("ANALYZE")
+        conn.autocommit = False
+        despues = _medir_todas(cursor)
+        conn.rollback()
+    finally:
+        conn.rollback()
+        conn.autocommit = True
+        cursor.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        cursor.close()
+        conn.close()
+
+    regresiones = []
+    print(f"\n{'consulta':<30} {'sin índices':>12} {'con índices':>12}  acceso")
+    for nombre, _, _, _ in CONSULTAS:
+        ms_antes = antes[nombre][0]
+        ms_despues, accesos, usa_indice = despues[nombre]
+        marca = "✅" if usa_indice else "❌"
+        columna_antes = f"{ms_antes:>9.2f} ms" if ms_antes is not None else f"{'-':>12}"
+        print(f"{nombre:<30} {columna_antes} {ms_despues:>9.2f} ms  {marca} {', '.join(accesos)}")
+        if not usa_indice:
+            regresiones.append(nombre)
+    return regresiones
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--escala", type=int, default=1, help="multiplicador del dataset sembrado")
+    argumentos = parser.parse_args()
+
+    load_dotenv()
+    pool_bd.configurar(os.getenv("DATABASE_URL"))
+    regresiones = verificar(argumentos.escala)
+    if regresiones:
+        print(f"\n❌ {len(regresiones)} consultas sin índice: {', '.join(regresiones)}")
+        sys.exit(1)
+    print("\n✅ Todas las consultas frecuentes usan índice")
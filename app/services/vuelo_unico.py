@@ -0,0 +1,173 @@
+# app/services/vuelo_unico.py
+"""
+Single-flight para generaciones: llamadas concurrentes idénticas comparten
+UNA sola generación (un thread, un run, una escritura en BD).
+
+Dos niveles:
+    1) En el proceso: la primera llamada crea la tarea y las siguientes con la
+       misma clave esperan esa misma tarea.
+    2) Entre workers de uvicorn: advisory lock de Postgres sobre un hash de la
+       clave. El worker que obtiene el lock genera; los demás esperan a que lo
+       suelte y leen el resultado ya guardado (la misma función con
+       accion="obtener"), sin volver a generar.
+
+Con accion="obtener" primero se consulta `existe`: si el material ya está
+guardado se devuelve sin tomar el lock (una lectura, sin costo extra). Si no
+existe, obtener también genera y pasa por los dos niveles, igual que
+regenerar; por eso `accion` no entra en la clave y un obtener que llega
+mientras corre un regenerar (o al revés) espera esa misma generación.
+
+Uso (entre @app.get y la función):
+
+    @app.get("/planificacion/{guion_id}/resumen")
+    @una_sola_generacion("resumen", existe=material_guardado)
+    async def generar_resumen(guion_id: int, accion: str = ...):
+"""
+import asyncio
+import functools
+import hashlib
+import inspect
+import json
+import os
+
+VUELO_UNICO_ESPERA_MAX = float(os.getenv("VUELO_UNICO_ESPERA_MAX", "600"))   # segundos
+VUELO_UNICO_INTERVALO = float(os.getenv("VUELO_UNICO_INTERVALO", "0.5"))      # segundos
+
+
+def _clave_lock(clave):
+    """Clave bigint (con signo) para pg_advisory_lock a partir de un string."""
+    return int.from_bytes(hashlib.sha256(clave.encode("utf-8")).digest()[:8], "big", signed=True)
+
+
+class VueloUnico:
+    def __init__(self, conectar=None):
+        self.conectar = conectar
+        self._en_vuelo = {}          # clave -> asyncio.Task
+        self.compartidas_proceso = 0
+        self.compartidas_bd = 0
+        self.generadas = 0
+
+    def configurar(self, conectar):
+        """Registra la función que abre conexiones a Postgres (connect_db)."""
+        self.conectar = conectar
+
+    async def ejecutar(self, clave, generar, leer_existente, entre_workers=True):
+        """
+        Ejecuta `generar()` una sola vez por clave. Si otro worker ya la está
+        generando, espera a que termine y retorna `leer_existente()`. Con
+        entre_workers=False solo se comparte dentro del proceso.
+        """
+        tarea = self._en_vuelo.get(clave)
+        if tarea is not None:
+            self.compartidas_proceso += 1
+            print(f"🔗 Generación en curso compartida (proceso): {clave}")
+            return await asyncio.shield(tarea)
+
+        if entre_workers:
+            tarea = asyncio.create_task(self._con_lock(clave, generar, leer_existente))
+        else:
+            tarea = asyncio.create_task(generar())
+        self._en_vuelo[clave] = tarea
+        tarea.add_done_callback(lambda _: self._en_vuelo.pop(clave, None))
+        return await asyncio.shield(tarea)
+
+    async def _con_lock(self, clave, generar, leer_existente):
+        if self.conectar is None:
+            self.generadas += 1
+            return await generar()
+
+        lock = _clave_lock(clave)
+        try:
+            conn = await asyncio.to_thread(self.conectar)
+            conn.autocommit = True
+        except Exception as e:
+            print(f"⚠️ Vuelo único sin BD ({e}), generando sin lock")
+            self.generadas += 1
+            return await generar()
+
+        def _intentar_lock():
+            cursor = conn.cursor()
+            cursor.execute("SELECT pg_try_advisory_lock(%s) AS ok", (lock,))
+            ok = cursor.fetchone()["ok"]
+            cursor.close()
+            return ok
+
+        def _soltar_lock():
+            cursor = conn.cursor()
+            cursor.execute("SELECT pg_advisory_unlock(%s)", (lock,))
+            cursor.close()
+
+        try:
+            if await asyncio.to_thread(_intentar_lock):
+                try:
+                    self.generadas += 1
+                    return await generar()
+                finally:
+                    await asyncio.to_thread(_soltar_lock)
+
+            # Otro worker está generando lo mismo: esperar a que suelte el lock
+            print(f"🔗 Generación en curso en otro worker, esperando: {clave}")
+            esperado = 0.0
+            while esperado < VUELO_UNICO_ESPERA_MAX:
+                await asyncio.sleep(VUELO_UNICO_INTERVALO)
+                esperado += VUELO_UNICO_INTERVALO
+                if await asyncio.to_thread(_intentar_lock):
+                    await asyncio.to_thread(_soltar_lock)
+                    break
+            else:
+                print(f"⚠️ Vuelo único: espera máxima alcanzada para {clave}, leyendo lo existente")
+
+            self.compartidas_bd += 1
+            return await leer_existente()
+        finally:
+            conn.close()
+
+    def estadisticas(self):
+        return {
+            "en_vuelo": len(self._en_vuelo),
+            "generadas": self.generadas,
+            "compartidas_proceso": self.compartidas_proceso,
+            "compartidas_bd": self.compartidas_bd,
+        }
+
+
+# Instancia única por proceso (main.py le pasa connect_db al arrancar)
+vuelo_unico = VueloUnico()
+
+
+def una_sola_generacion(tipo, existe=None):
+    """
+    Decorador para endpoints generadores. La clave es (tipo, argumentos de la
+    llamada sin `accion`), así que `guion_id` y el resto de parámetros entran
+    en ella. `existe(tipo, valores)` (async) dice si ya hay algo guardado que
+    accion="obtener" pueda devolver sin generar. Los seguidores en otros
+    workers leen con accion="obtener".
+    """
+    def decorador(fn):
+        firma = inspect.signature(fn)
+
+        @functools.wraps(fn)
+        async def envoltura(*args, **kwargs):
+            argumentos = firma.bind(*args, **kwargs)
+            argumentos.apply_defaults()
+            valores = dict(argumentos.arguments)
+
+            if valores.get("accion", "obtener") == "obtener" and existe is not None:
+                if await existe(tipo, valores):
+                    return await fn(**valores)
+
+            clave = f"{tipo}:" + json.dumps(
+                {k: v for k, v in valores.items() if k != "accion"}, sort_keys=True, default=str
+            )
+
+            async def generar():
+                return await fn(**valores)
+
+            async def leer_existente():
+                return await fn(**{**valores, "accion": "obtener"})
+
+            return await vuelo_unico.ejecutar(clave, generar, leer_existente)
+
+        return envoltura
+
+    return decorador